@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+#   Copyright 2020 Red Hat, Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+"""Compare the accelerated and the default mode of run_ansible_playbook.
+
+A set of containers is started with podman (or docker) and used as the
+inventory of a playbook running many small tasks, which is dominated by
+the module shipping cost like the config-download playbooks. The playbook
+is run several times in each mode and the durations are reported.
+
+    tools/ansible-accelerated-benchmark.py --hosts 4 --tasks 50 --runs 3
+"""
+
+import argparse
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import time
+import uuid
+
+import yaml
+
+from tripleoclient import utils
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runtime', default='podman',
+                        choices=['podman', 'docker'],
+                        help='Container runtime used for the inventory.')
+    parser.add_argument('--image', default='registry.access.redhat.com/'
+                                           'ubi8/python-36',
+                        help='Container image, it must provide python.')
+    parser.add_argument('--hosts', type=int, default=4,
+                        help='Number of containers in the inventory.')
+    parser.add_argument('--tasks', type=int, default=50,
+                        help='Number of tasks of the playbook.')
+    parser.add_argument('--runs', type=int, default=3,
+                        help='Number of runs of the playbook in each mode.')
+    parser.add_argument('--keep', action='store_true',
+                        help='Keep the containers once done.')
+    return parser.parse_args()
+
+
+def _playbook(path, tasks):
+    steps = list()
+    for i in range(tasks):
+        steps.extend([
+            {'name': 'Command {}'.format(i),
+             'command': 'true',
+             'changed_when': False},
+            {'name': 'File {}'.format(i),
+             'file': {'path': '/tmp/benchmark-{}'.format(i),
+                      'state': 'touch',
+                      'modification_time': 'preserve',
+                      'access_time': 'preserve'}}
+        ])
+    with open(path, 'w') as f:
+        f.write(yaml.safe_dump(
+            [{'hosts': 'all', 'gather_facts': False, 'tasks': steps}],
+            default_flow_style=False
+        ))
+
+
+def _run(args, inventory, workdir, accelerated):
+    durations = list()
+    for i in range(args.runs):
+        with utils.TempDirs() as tmp:
+            start = time.time()
+            utils.run_ansible_playbook(
+                playbook=os.path.join(workdir, 'benchmark.yaml'),
+                inventory=inventory,
+                workdir=tmp,
+                ansible_cfg=os.path.join(workdir, 'ansible.cfg'),
+                gathering_policy='explicit',
+                forks=args.hosts,
+                quiet=True,
+                accelerated=accelerated
+            )
+            durations.append(time.time() - start)
+    return durations
+
+
+def main():
+    args = _parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    prefix = 'tripleo-benchmark-{}'.format(uuid.uuid4().hex[:8])
+    hosts = ['{}-{}'.format(prefix, i) for i in range(args.hosts)]
+    if not utils.get_ansible_accelerated_strategy():
+        print('No accelerated strategy is usable, both modes will run with'
+              ' the default strategy.')
+
+    try:
+        for host in hosts:
+            subprocess.check_call(
+                [args.runtime, 'run', '--detach', '--name', host,
+                 args.image, 'sleep', 'infinity'],
+                stdout=subprocess.DEVNULL
+            )
+        inventory = {
+            'all': {
+                'hosts': dict([(i, None) for i in hosts]),
+                'vars': {
+                    'ansible_connection': args.runtime,
+                    'ansible_python_interpreter': '/usr/bin/python3'
+                }
+            }
+        }
+        with utils.TempDirs(chdir=False) as workdir:
+            _playbook(os.path.join(workdir, 'benchmark.yaml'), args.tasks)
+            with open(os.path.join(workdir, 'ansible.cfg'), 'w') as f:
+                f.write('[defaults]\ninternal_poll_interval = 0.01\n')
+            results = [
+                ('default', _run(args, inventory, workdir, False)),
+                ('accelerated', _run(args, inventory, workdir, True))
+            ]
+    finally:
+        if not args.keep:
+            subprocess.call(
+                [args.runtime, 'rm', '--force'] + hosts,
+                stdout=subprocess.DEVNULL
+            )
+
+    print('{} hosts, {} tasks, {} runs'.format(
+        args.hosts, args.tasks * 2, args.runs))
+    for mode, durations in results:
+        print('{:<12} median {:8.2f}s  min {:8.2f}s  max {:8.2f}s'.format(
+            mode,
+            statistics.median(durations),
+            min(durations),
+            max(durations)
+        ))
+    print('speedup: {:.2f}x'.format(
+        statistics.median(results[0][1]) / statistics.median(results[1][1])
+    ))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+#   Copyright 2020 Red Hat, Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+"""Compare the rewrites of the template links on a tripleo-heat-templates tree.
+
+The links of every YAML file of the tree are rewritten with the previous
+implementation, which loads and dumps each template, and with
+utils.replace_links_in_template_contents, which only rewrites the links
+in place. Two passes are run: one where no file holds a link to replace
+and one where every get_file and type link of the tree is replaced. Each
+pass is run several times, the durations are reported and the rewritten
+templates of both implementations are checked to be the same documents.
+
+    tools/link-rewrite-benchmark.py --runs 3 ~/tripleo-heat-templates
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import yaml
+
+from tripleoclient import constants
+from tripleoclient import utils
+from tripleoclient import yaml_utils
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('templates', nargs='?',
+                        default=constants.TRIPLEO_HEAT_TEMPLATES,
+                        help='Directory of the templates.')
+    parser.add_argument('--runs', type=int, default=3,
+                        help='Number of runs of each pass.')
+    return parser.parse_args()
+
+
+def _yaml_files(templates):
+    contents = list()
+    for root, dirs, files in os.walk(templates):
+        for name in sorted(files):
+            if name.endswith(('.yaml', '.yml')):
+                with open(os.path.join(root, name), 'r') as f:
+                    contents.append(f.read())
+    return contents
+
+
+def _links(template_part, links):
+    if isinstance(template_part, dict):
+        for key, value in template_part.items():
+            if (key in utils.TEMPLATE_LINK_KEYS and
+                    isinstance(value, str) and '::' not in value):
+                links.add(value)
+            else:
+                _links(value, links)
+    elif isinstance(template_part, list):
+        for value in template_part:
+            _links(value, links)
+
+
+def _round_trip(contents, link_replacement):
+    try:
+        template = yaml_utils.safe_load(contents)
+    except yaml.YAMLError:
+        return contents
+    if not (isinstance(template, dict) and
+            template.get('heat_template_version')):
+        return contents
+    template = utils.replace_links_in_template(template, link_replacement)
+    return yaml_utils.safe_dump(template)
+
+
+def _rewrite(func, contents, link_replacement):
+    return [func(i, link_replacement) for i in contents]
+
+
+def _run(runs, func, *args):
+    durations = list()
+    for i in range(runs):
+        start = time.time()
+        func(*args)
+        durations.append(time.time() - start)
+    return durations
+
+
+def _load(contents):
+    try:
+        return yaml_utils.safe_load(contents)
+    except yaml.YAMLError:
+        return contents
+
+
+def main():
+    args = _parse_args()
+    contents = _yaml_files(args.templates)
+    if not contents:
+        print('No YAML file found in {}'.format(args.templates))
+        return 1
+
+    links = set()
+    for i in contents:
+        template = _load(i)
+        if isinstance(template, dict):
+            _links(template, links)
+
+    passes = [
+        ('no link', {'file:///no/such/template.yaml': 'template.yaml'}),
+        ('all links', {i: 'user-files/' + i for i in links})
+    ]
+    print('{} files, {:.1f} MiB, {} links, {} runs'.format(
+        len(contents), sum(len(i) for i in contents) / 1024.0 / 1024.0,
+        len(links), args.runs
+    ))
+    for pass_name, link_replacement in passes:
+        expected = _rewrite(_round_trip, contents, link_replacement)
+        result = _rewrite(utils.replace_links_in_template_contents,
+                          contents, link_replacement)
+        mismatches = sum(1 for i, j in zip(expected, result)
+                         if _load(i) != _load(j))
+        results = [
+            ('round trip', _run(args.runs, _rewrite, _round_trip,
+                                contents, link_replacement)),
+            ('in place', _run(args.runs, _rewrite,
+                              utils.replace_links_in_template_contents,
+                              contents, link_replacement))
+        ]
+        print('{}: {} mismatches'.format(pass_name, mismatches))
+        baseline = statistics.median(results[0][1])
+        for name, durations in results:
+            median = statistics.median(durations)
+            print('  {:<12} median {:8.3f}s  min {:8.3f}s  max {:8.3f}s'
+                  '  speedup {:6.1f}x'.format(
+                      name, median, min(durations), max(durations),
+                      baseline / median))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+#   Copyright 2020 Red Hat, Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+"""Compare the YAML loaders on a tripleo-heat-templates tree.
+
+Every YAML file of the tree is parsed with the pure Python loader, with
+the loader used by tripleoclient.yaml_utils and then again through the
+memoized yaml_utils.load_file, as done when a file is read several times
+during a command. Each pass is run several times and the durations are
+reported.
+
+    tools/yaml-benchmark.py --runs 3 ~/tripleo-heat-templates
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import yaml
+
+from tripleoclient import constants
+from tripleoclient import yaml_utils
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('templates', nargs='?',
+                        default=constants.TRIPLEO_HEAT_TEMPLATES,
+                        help='Directory of the templates.')
+    parser.add_argument('--runs', type=int, default=3,
+                        help='Number of runs of each pass.')
+    return parser.parse_args()
+
+
+def _yaml_files(templates):
+    paths = list()
+    for root, dirs, files in os.walk(templates):
+        for name in files:
+            if name.endswith(('.yaml', '.yml')):
+                paths.append(os.path.join(root, name))
+    return sorted(paths)
+
+
+def _load(paths, loader):
+    for path in paths:
+        with open(path, 'r') as f:
+            yaml.load(f, Loader=loader)
+
+
+def _load_memoized(paths):
+    for path in paths:
+        yaml_utils.load_file(path)
+
+
+def _run(runs, func, *args):
+    durations = list()
+    for i in range(runs):
+        start = time.time()
+        func(*args)
+        durations.append(time.time() - start)
+    return durations
+
+
+def main():
+    args = _parse_args()
+    paths = _yaml_files(args.templates)
+    if not paths:
+        print('No YAML file found in {}'.format(args.templates))
+        return 1
+
+    # Files which are not valid YAML documents, e.g. jinja templates, are
+    # not part of the comparison.
+    valid = list()
+    for path in paths:
+        try:
+            _load([path], yaml_utils.SafeLoader)
+            valid.append(path)
+        except yaml.YAMLError:
+            pass
+
+    yaml_utils.clear_cache()
+    _load_memoized(valid)
+    results = [
+        ('SafeLoader', _run(args.runs, _load, valid, yaml.SafeLoader)),
+        (yaml_utils.SafeLoader.__name__,
+         _run(args.runs, _load, valid, yaml_utils.SafeLoader)),
+        ('load_file', _run(args.runs, _load_memoized, valid))
+    ]
+
+    print('{} files, {:.1f} MiB, {} runs'.format(
+        len(valid),
+        sum(os.path.getsize(i) for i in valid) / 1024.0 / 1024.0,
+        args.runs
+    ))
+    baseline = statistics.median(results[0][1])
+    for name, durations in results:
+        median = statistics.median(durations)
+        print('{:<14} median {:8.3f}s  min {:8.3f}s  max {:8.3f}s'
+              '  speedup {:6.1f}x'.format(
+                  name, median, min(durations), max(durations),
+                  baseline / median))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
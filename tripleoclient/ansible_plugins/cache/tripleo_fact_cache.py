@@ -0,0 +1,103 @@
+#   Copyright 2020 Red Hat, Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+import os
+
+from ansible.errors import AnsibleError
+from ansible.parsing.ajson import AnsibleJSONDecoder
+from ansible.parsing.ajson import AnsibleJSONEncoder
+from ansible.plugins.cache import BaseCacheModule
+
+from tripleoclient import fact_cache
+
+
+DOCUMENTATION = '''
+    cache: tripleo_fact_cache
+    short_description: Facts of all the hosts in a single SQLite database.
+    description:
+        - This cache stores the facts of all the hosts in one SQLite
+          database, with a per host expiration and a bounded number of
+          hosts. The least recently used hosts are evicted first.
+    options:
+      _uri:
+        required: True
+        description:
+          - Path of the SQLite database.
+        env:
+          - name: ANSIBLE_CACHE_PLUGIN_CONNECTION
+        ini:
+          - key: fact_caching_connection
+            section: defaults
+      _timeout:
+        default: 86400
+        description: Expiration timeout, in seconds, of the facts of a host.
+        env:
+          - name: ANSIBLE_CACHE_PLUGIN_TIMEOUT
+        ini:
+          - key: fact_caching_timeout
+            section: defaults
+        type: integer
+      _max_hosts:
+        default: 0
+        description: Maximum number of hosts stored, 0 for no limit.
+        env:
+          - name: TRIPLEO_FACT_CACHE_MAX_HOSTS
+        type: integer
+'''
+
+
+class CacheModule(BaseCacheModule):
+    """A caching module backed by a SQLite database."""
+
+    def __init__(self, *args, **kwargs):
+        super(CacheModule, self).__init__(*args, **kwargs)
+        path = self.get_option('_uri')
+        if not path:
+            raise AnsibleError(
+                "error, 'tripleo_fact_cache' cache plugin requires the "
+                "'fact_caching_connection' config option to be set (to a "
+                "writeable file path)"
+            )
+        self._db = fact_cache.FactCache(
+            path=os.path.expanduser(os.path.expandvars(path)),
+            timeout=int(self.get_option('_timeout')),
+            max_hosts=int(self.get_option('_max_hosts')),
+            encoder=AnsibleJSONEncoder,
+            decoder=AnsibleJSONDecoder
+        )
+
+    def get(self, key):
+        value = self._db.get(key)
+        if value is None:
+            raise KeyError
+        return value
+
+    def set(self, key, value):
+        self._db.set(key, value)
+
+    def keys(self):
+        return self._db.keys()
+
+    def contains(self, key):
+        return self._db.contains(key)
+
+    def delete(self, key):
+        self._db.delete(key)
+
+    def flush(self):
+        self._db.flush()
+
+    def copy(self):
+        return self._db.copy()
@@ -0,0 +1,278 @@
+#   Copyright 2020 Red Hat, Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+import datetime
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import stat
+import subprocess
+import tarfile
+import tempfile
+
+
+LOG = logging.getLogger(__name__ + ".utils")
+
+ARCHIVE_FORMAT_NONE = 'none'
+
+# Archive formats: the file extension, the multi-threaded compressors tried
+# in order, with the option setting their number of threads, and the tarfile
+# mode used when none of them is installed.
+ARCHIVE_FORMATS = {
+    'bzip2': ('.tar.bzip2', [('lbzip2', '-n{}'), ('pbzip2', '-p{}')],
+              'w:bz2'),
+    'gzip': ('.tar.gz', [('pigz', '-p{}')], 'w:gz'),
+    'xz': ('.tar.xz', [('xz', '-T{}')], 'w:xz'),
+    'zstd': ('.tar.zst', [('zstd', '-T{}')], None),
+}
+
+# Version of the manifests of the artifact store.
+MANIFEST_VERSION = 1
+
+
+def _compressor(archive_format, threads):
+    for command, threads_option in ARCHIVE_FORMATS[archive_format][1]:
+        path = shutil.which(command)
+        if path:
+            return [path, '-c', threads_option.format(threads)]
+
+
+def write_archive(filename, archive_format, paths, tar_filter=None,
+                  threads=0):
+    """Write a compressed tarball of directories.
+
+    The tarball is compressed by a multi-threaded compressor when one is
+    installed for the archive format, with tarfile otherwise.
+
+    :param filename: Path of the tarball.
+    :type filename: String
+
+    :param archive_format: One of the ARCHIVE_FORMATS.
+    :type archive_format: String
+
+    :param paths: The directories to archive.
+    :type paths: List
+
+    :param tar_filter: Filter of the tarball members, see TarFile.add.
+    :type tar_filter: Function
+
+    :param threads: Number of compression threads, all the CPUs when 0.
+    :type threads: Integer
+
+    :raises RuntimeError: When no compressor is available for the format or
+                          the compressor fails.
+    """
+
+    command = _compressor(archive_format,
+                          threads or multiprocessing.cpu_count())
+    if not command:
+        mode = ARCHIVE_FORMATS[archive_format][2]
+        if not mode:
+            raise RuntimeError('No %s compressor found' % archive_format)
+        with tarfile.open(filename, mode) as tf:
+            for path in paths:
+                tf.add(path, recursive=True, filter=tar_filter)
+        return
+
+    LOG.debug('Compressing %s with %s', filename, ' '.join(command))
+    with open(filename, 'wb') as f:
+        process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=f,
+                                   bufsize=0)
+        try:
+            with tarfile.open(fileobj=process.stdin, mode='w|') as tf:
+                for path in paths:
+                    tf.add(path, recursive=True, filter=tar_filter)
+        except BrokenPipeError:
+            # the compressor exited, its exit code is reported below
+            pass
+        finally:
+            process.stdin.close()
+            returncode = process.wait()
+    if returncode:
+        raise RuntimeError('%s failed with exit code %d'
+                           % (command[0], returncode))
+
+
+class ArtifactStore(object):
+    """Content addressed store of the deployment artifacts.
+
+    The files are stored once in ``objects``, named after the SHA-256 of
+    their contents, and each stored run records a manifest in ``manifests``
+    listing its directories, files and symbolic links. The files which did
+    not change between deployments are only stored once.
+    """
+
+    def __init__(self, path, max_manifests=0):
+        """Initialize the artifact store.
+
+        :param path: Directory of the store.
+        :type path: String
+
+        :param max_manifests: Maximum number of manifests kept, the oldest
+                              manifests and the files only they reference
+                              are removed. 0 disables the removal.
+        :type max_manifests: Integer
+        """
+
+        self.path = path
+        self.max_manifests = max_manifests
+        self.objects_dir = os.path.join(path, 'objects')
+        self.manifests_dir = os.path.join(path, 'manifests')
+
+    def _object_path(self, digest):
+        return os.path.join(self.objects_dir, digest[:2], digest)
+
+    @staticmethod
+    def _digest(path):
+        sha = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                sha.update(chunk)
+        return sha.hexdigest()
+
+    def _add_object(self, path):
+        digest = self._digest(path)
+        object_path = self._object_path(digest)
+        if not os.path.exists(object_path):
+            object_dir = os.path.dirname(object_path)
+            if not os.path.exists(object_dir):
+                os.makedirs(object_dir)
+            fd, tmp = tempfile.mkstemp(prefix='.', dir=object_dir)
+            try:
+                with os.fdopen(fd, 'wb') as f, open(path, 'rb') as source:
+                    shutil.copyfileobj(source, f)
+                os.rename(tmp, object_path)
+            except Exception:
+                os.remove(tmp)
+                raise
+        return digest
+
+    def _entries(self, path, arcname):
+        yield {'path': os.path.normpath(arcname), 'type': 'directory',
+               'mode': stat.S_IMODE(os.lstat(path).st_mode)}
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            rel_root = os.path.join(arcname, os.path.relpath(root, path))
+            for name in dirs + sorted(files):
+                full_path = os.path.join(root, name)
+                entry = {'path': os.path.normpath(os.path.join(rel_root,
+                                                               name))}
+                st = os.lstat(full_path)
+                if stat.S_ISLNK(st.st_mode):
+                    entry.update(type='symlink',
+                                 target=os.readlink(full_path))
+                elif stat.S_ISDIR(st.st_mode):
+                    entry.update(type='directory',
+                                 mode=stat.S_IMODE(st.st_mode))
+                elif stat.S_ISREG(st.st_mode):
+                    entry.update(type='file', size=st.st_size,
+                                 mode=stat.S_IMODE(st.st_mode),
+                                 sha256=self._add_object(full_path))
+                else:
+                    continue
+                yield entry
+
+    def add(self, name, paths):
+        """Store directories and record their manifest.
+
+        :param name: Name of the manifest.
+        :type name: String
+
+        :param paths: The directories to store, mapped to their path in the
+                      manifest.
+        :type paths: Dictionary
+
+        :returns: The path of the manifest.
+        """
+
+        manifest = {
+            'version': MANIFEST_VERSION,
+            'name': name,
+            'created': datetime.datetime.utcnow().isoformat(),
+            'entries': []
+        }
+        for path, arcname in sorted(paths.items()):
+            manifest['entries'].extend(self._entries(path, arcname))
+
+        if not os.path.exists(self.manifests_dir):
+            os.makedirs(self.manifests_dir)
+        manifest_path = os.path.join(self.manifests_dir, name + '.json')
+        fd, tmp = tempfile.mkstemp(prefix='.', dir=self.manifests_dir)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(manifest, f, indent=1, sort_keys=True)
+        os.rename(tmp, manifest_path)
+        LOG.debug('Stored %d artifacts in %s', len(manifest['entries']),
+                  manifest_path)
+        self._prune(manifest_path)
+        return manifest_path
+
+    def _prune(self, keep):
+        if not self.max_manifests:
+            return
+        manifests = sorted(
+            (os.path.join(self.manifests_dir, i)
+             for i in os.listdir(self.manifests_dir)
+             if i.endswith('.json') and not i.startswith('.')),
+            key=os.path.getmtime, reverse=True)
+        removed = [i for i in manifests[self.max_manifests:] if i != keep]
+        if not removed:
+            return
+        for path in removed:
+            LOG.debug('Removing artifacts manifest %s', path)
+            os.remove(path)
+
+        referenced = set()
+        for path in set(manifests) - set(removed):
+            with open(path) as f:
+                referenced.update(i['sha256'] for i in json.load(f)['entries']
+                                  if i['type'] == 'file')
+        for root, dirs, files in os.walk(self.objects_dir):
+            for name in files:
+                if name not in referenced and not name.startswith('.'):
+                    os.remove(os.path.join(root, name))
+
+    def extract(self, manifest_path, dest):
+        """Restore the artifacts of a manifest.
+
+        :param manifest_path: Path of the manifest, see `add`.
+        :type manifest_path: String
+
+        :param dest: Directory the artifacts are restored in.
+        :type dest: String
+        """
+
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        directories = []
+        for entry in manifest['entries']:
+            path = os.path.join(dest, entry['path'])
+            if entry['type'] == 'directory':
+                if not os.path.isdir(path):
+                    os.makedirs(path)
+                directories.append((path, entry['mode']))
+                continue
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            if entry['type'] == 'symlink':
+                os.symlink(entry['target'], path)
+            else:
+                shutil.copyfile(self._object_path(entry['sha256']), path)
+                os.chmod(path, entry['mode'])
+        # read-only directories are only restored once filled
+        for path, mode in reversed(directories):
+            os.chmod(path, mode)
@@ -17,7 +17,10 @@ import copy
 
 from osc_lib.i18n import _
 from oslo_config import cfg
+from tripleoclient.artifact_archive import ARCHIVE_FORMAT_NONE
+from tripleoclient.artifact_archive import ARCHIVE_FORMATS
 from tripleoclient.config.base import BaseConfig
+from tripleoclient.constants import ARTIFACT_ARCHIVE_FORMAT
 from tripleoclient.constants import DEFAULT_HEAT_CONTAINER
 
 NETCONFIG_TAGS_EXAMPLE = """
@@ -114,6 +117,24 @@ class StandaloneConfig(BaseConfig):
         _base_opts = super(StandaloneConfig, self).get_base_opts()
         _opts = [
             # deployment options
+            cfg.StrOpt('artifact_archive_format',
+                       default=ARTIFACT_ARCHIVE_FORMAT,
+                       choices=[ARCHIVE_FORMAT_NONE] + sorted(ARCHIVE_FORMATS),
+                       help=_(
+                           'Compression of the tarball of the deployment '
+                           'artifacts. The tarball is compressed with '
+                           'multiple threads when lbzip2 or pbzip2, pigz, xz '
+                           'or zstd is installed. "none" does not create the '
+                           'tarball.')
+                       ),
+            cfg.BoolOpt('artifact_store',
+                        default=False,
+                        help=_(
+                            'Also store the deployment artifacts in '
+                            '~/.tripleo/artifacts, which keeps a single copy '
+                            'of the files unchanged between deployments and '
+                            'records a manifest of each run.')
+                        ),
             cfg.StrOpt('deployment_user',
                        help=_(
                            'User used to run openstack undercloud install '
@@ -33,6 +33,9 @@ OVERCLOUD_NETWORKS_FILE = "network_data.yaml"
 STANDALONE_NETWORKS_FILE = "/dev/null"
 UNDERCLOUD_NETWORKS_FILE = "network_data_undercloud.yaml"
 ANSIBLE_HOSTS_FILENAME = "hosts.yaml"
+# Fork count of a run and the reasons of its choice, in the ansible-runner
+# artifacts of the run.
+ANSIBLE_FORKS_FILENAME = "forks.json"
 ANSIBLE_CWL = "tripleo_dense,tripleo_profile_tasks,tripleo_states"
 CONTAINER_IMAGE_PREPARE_LOG_FILE = "container_image_prepare.log"
 DEFAULT_CONTAINER_REGISTRY = "quay.io"
@@ -104,6 +107,108 @@ DEFAULT_WORK_DIR = os.path.join(os.environ.get('HOME', '~/'),
 ANSIBLE_INVENTORY = os.path.join(DEFAULT_WORK_DIR,
                                  '{}/tripleo-ansible-inventory.yaml')
 
+# Directory, within the default working directory of a stack, holding the
+# data recorded by the client about its runs. It is not committed to the
+# config-download git repository.
+STACK_RUN_DATA_DIR = 'tripleo-run-data'
+# Newline delimited JSON stream of the ansible task timings of a run.
+ANSIBLE_TIMING_FILE = 'ansible-timing-{}.ndjson'
+# Maximum number of the steps run, concurrently with config-download, once
+# the overcloud stack is deployed.
+POST_STACK_MAX_WORKERS = 2
+# JSON report of the wall and CPU time of the phases of a deployment.
+PHASE_PROFILE_FILE = 'deploy-phases-{}.json'
+# Compressed newline delimited JSON archive of the ansible-runner events of
+# a run, its index and the uncompressed size of its compressed blocks.
+ANSIBLE_EVENTS_FILE = 'ansible-events-{}.ndjson.gz'
+ANSIBLE_EVENTS_INDEX = '{}.index.json'
+ANSIBLE_EVENTS_BLOCK_SIZE = 1024 * 1024
+# Fork counts of the runs of the playbooks of a stack and their durations.
+ANSIBLE_FORKS_HISTORY_FILE = 'ansible-forks.json'
+# Number of runs kept per playbook in the fork history.
+ANSIBLE_FORKS_HISTORY_SIZE = 10
+# Status of the playbooks of the last failed multi-playbook run, used to
+# resume it.
+PLAYBOOK_CHECKPOINT_FILE = 'playbook-checkpoint.json'
+# Environment of the last provisioning of the baremetal nodes of a stack.
+BAREMETAL_DEPLOYED_ENV_FILE = 'baremetal-deployed.yaml'
+
+# Ansible fork scheduling. The number of forks, based on the number of CPUs
+# or on the fastest recorded run, is bounded by ANSIBLE_FORKS_MAX, the number
+# of targeted hosts, the available memory, based on the estimated memory
+# (MiB) used by one ansible worker, and the sshd connection limits.
+ANSIBLE_FORKS_PER_CPU = 4
+ANSIBLE_FORKS_MAX = 100
+ANSIBLE_FORK_MEMORY = 64
+SSHD_CONFIG = '/etc/ssh/sshd_config'
+
+# Maximum number of independent playbooks run concurrently by
+# run_ansible_playbook_graph.
+ANSIBLE_PLAYBOOK_MAX_PARALLEL = 4
+
+# Strategy plugins used by the accelerated mode of run_ansible_playbook, in
+# order of preference, as (python package, plugin directory, strategy).
+# These strategies also replace the connection plugins of the hosts.
+ANSIBLE_ACCELERATED_STRATEGIES = [
+    ('ansible_mitogen', 'plugins/strategy', 'mitogen_linear'),
+]
+
+# Ansible fact cache shared by the ansible runs of the client. The facts of
+# all the hosts are stored in a single SQLite database, within ~/.tripleo, by
+# the tripleo_fact_cache cache plugin. The facts of a host expire after
+# ANSIBLE_FACT_CACHE_TIMEOUT seconds and the least recently used hosts are
+# evicted once ANSIBLE_FACT_CACHE_MAX_HOSTS hosts are stored.
+ANSIBLE_FACT_CACHE_PLUGIN = 'tripleo_fact_cache'
+ANSIBLE_FACT_CACHE_PLUGIN_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    'ansible_plugins',
+    'cache'
+)
+ANSIBLE_FACT_CACHE_FILE = 'fact_cache.sqlite'
+ANSIBLE_FACT_CACHE_TIMEOUT = 7200
+ANSIBLE_FACT_CACHE_MAX_HOSTS = 10000
+# Cache of the processed Heat environment files, stored within ~/.tripleo.
+# The least recently used environments are evicted once
+# ENVIRONMENT_CACHE_MAX_ENTRIES environments are stored.
+ENVIRONMENT_CACHE_FILE = 'environment_cache.sqlite'
+ENVIRONMENT_CACHE_MAX_ENTRIES = 2000
+# Cache of the stack data built from the validations of the stacks by Heat,
+# stored within ~/.tripleo. The entries expire after STACK_DATA_CACHE_TIMEOUT
+# seconds, as the validation also depends on the Heat service, and the least
+# recently used entries are evicted once STACK_DATA_CACHE_MAX_ENTRIES entries
+# are stored.
+STACK_DATA_CACHE_FILE = 'stack_data_cache.sqlite'
+STACK_DATA_CACHE_TIMEOUT = 86400
+STACK_DATA_CACHE_MAX_ENTRIES = 20
+# Parameter schemas of the templates directories, used to check the
+# environments without Heat, stored within ~/.tripleo. The least recently
+# used schemas are removed once PARAMETER_SCHEMA_CACHE_MAX_ENTRIES schemas
+# are stored.
+PARAMETER_SCHEMA_CACHE_DIR = 'parameter_schemas'
+PARAMETER_SCHEMA_CACHE_MAX_ENTRIES = 5
+# Renderings of the jinja2 templates, stored within ~/.tripleo. The least
+# recently used renderings are evicted once TEMPLATE_RENDER_CACHE_MAX_ENTRIES
+# renderings are stored. The templates left to render are spread over at
+# most TEMPLATE_RENDER_MAX_WORKERS processes.
+TEMPLATE_RENDER_CACHE_FILE = 'render_cache.sqlite'
+TEMPLATE_RENDER_CACHE_MAX_ENTRIES = 5000
+TEMPLATE_RENDER_MAX_WORKERS = 4
+# Templates trees rendered with the roles and networks of the deployments,
+# stored within ~/.tripleo. The least recently used trees are removed once
+# TEMPLATE_WORKSPACE_MAX_ENTRIES trees are stored.
+TEMPLATE_WORKSPACE_DIR = 'rendered_templates'
+TEMPLATE_WORKSPACE_MAX_ENTRIES = 3
+# Compression of the tarballs of the deployment artifacts, and the content
+# addressed store of the artifacts within ~/.tripleo. The files only
+# referenced by the oldest runs are removed once ARTIFACT_STORE_MAX_MANIFESTS
+# runs are stored.
+ARTIFACT_ARCHIVE_FORMAT = 'bzip2'
+ARTIFACT_STORE_DIR = 'artifacts'
+ARTIFACT_STORE_MAX_MANIFESTS = 20
+# Parameters generated for every deployment, which are not part of the
+# fingerprint of the last deployed stack nor of the stack data cache keys.
+STACK_FINGERPRINT_IGNORED_PARAMETERS = ['DeployIdentifier']
+
 ANSIBLE_VALIDATION_DIR = (
     os.path.join(DEFAULT_VALIDATIONS_LEGACY_BASEDIR, 'playbooks')
     if os.path.exists(os.path.join(DEFAULT_VALIDATIONS_LEGACY_BASEDIR,
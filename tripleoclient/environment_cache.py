@@ -0,0 +1,166 @@
+#   Copyright 2020 Red Hat, Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+import hashlib
+import json
+import logging
+import os
+
+from heatclient.common import utils as heat_utils
+from six.moves.urllib import parse
+from six.moves.urllib import request
+
+from tripleoclient import sqlite_cache
+
+
+LOG = logging.getLogger(__name__ + ".utils")
+
+# Placeholder of the templates directory URL in the stored entries. The
+# templates are copied to a new directory for every deployment, the
+# entries are rebased on the current directory when they are loaded.
+THT_ROOT = '{tht_root}'
+
+
+class EnvironmentCache(sqlite_cache.SQLiteCache):
+    """Processed Heat environments stored in a single SQLite database.
+
+    An entry holds the `files` and `env` returned by heatclient's
+    `process_environment_and_files` for an environment file. It is keyed
+    by the content of the environment file, its path relative to the
+    templates directory and the `include_env_in_files` flag, and is only
+    returned while none of the files it references changed, see
+    `sqlite_cache.SQLiteCache`.
+    """
+
+    TABLE = 'environments'
+    DESCRIPTION = 'environment cache'
+
+    @staticmethod
+    def _root_url(tht_root):
+        return heat_utils.normalise_file_path_to_url(tht_root) + '/'
+
+    @staticmethod
+    def _url_path(url):
+        url = parse.urlparse(url)
+        if url.scheme != 'file':
+            return
+        return request.url2pathname(url.path)
+
+    @staticmethod
+    def _file_hash(path):
+        sha = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                sha.update(chunk)
+        return sha.hexdigest()
+
+    def _key(self, env_path, tht_root, include_env_in_files):
+        env_path = os.path.abspath(env_path)
+        tht_root = os.path.abspath(tht_root)
+        location = env_path
+        if env_path.startswith(tht_root + '/'):
+            location = os.path.join(THT_ROOT, env_path[len(tht_root) + 1:])
+        sha = hashlib.sha256()
+        sha.update(self._file_hash(env_path).encode('utf-8'))
+        sha.update(b'\0')
+        sha.update(location.encode('utf-8'))
+        sha.update(b'\0')
+        sha.update(b'1' if include_env_in_files else b'0')
+        return sha.hexdigest()
+
+    def _unchanged(self, dependencies):
+        for url, size, mtime, digest in dependencies:
+            path = self._url_path(url)
+            try:
+                stat = os.stat(path)
+                if stat.st_size != size:
+                    return False
+                if stat.st_mtime != mtime and self._file_hash(path) != digest:
+                    return False
+            except (IOError, OSError):
+                return False
+        return True
+
+    def get(self, env_path, tht_root, include_env_in_files=False):
+        """Return the processed files and env of an environment file.
+
+        :returns: Tuple with the files and the env || None when the
+                  environment is unknown or one of its files changed.
+        """
+
+        if not os.path.isfile(env_path):
+            return
+        try:
+            key = self._key(env_path, tht_root, include_env_in_files)
+        except (IOError, OSError) as e:
+            LOG.warning('Unable to read the environment cache: {}'.format(e))
+            return
+        data = super(EnvironmentCache, self).get(key)
+        if data is None:
+            return
+        root_url = json.dumps(self._root_url(tht_root))[1:-1]
+        data = json.loads(data.replace(THT_ROOT + '/', root_url))
+        if not self._unchanged(data['dependencies']):
+            LOG.debug('Environment {} changed since it was cached'.format(
+                env_path))
+            return
+        files = dict([
+            (k, v[1].encode('utf-8') if v[0] else v[1])
+            for k, v in data['files'].items()
+        ])
+        return files, data['env']
+
+    def set(self, env_path, tht_root, files, env,
+            include_env_in_files=False):
+        """Store the processed files and env of an environment file.
+
+        Environments referencing files which are not local are not
+        stored.
+        """
+
+        if not os.path.isfile(env_path):
+            return
+        try:
+            key = self._key(env_path, tht_root, include_env_in_files)
+            dependencies = list()
+            for url in files:
+                path = self._url_path(url)
+                if not path:
+                    return
+                stat = os.stat(path)
+                dependencies.append(
+                    [url, stat.st_size, stat.st_mtime, self._file_hash(path)]
+                )
+        except (IOError, OSError) as e:
+            LOG.warning('Unable to update the environment cache: {}'.format(e))
+            return
+        try:
+            # heatclient returns the content of the files as bytes.
+            data = json.dumps({
+                'dependencies': dependencies,
+                'files': dict([
+                    (k, [True, v.decode('utf-8')]) if isinstance(v, bytes)
+                    else (k, [False, v]) for k, v in files.items()
+                ]),
+                'env': env
+            })
+        except (TypeError, ValueError):
+            return
+        if json.loads(data)['env'] != env:
+            # Not a JSON document, e.g. maps with integer keys.
+            return
+        root_url = json.dumps(self._root_url(tht_root))[1:-1]
+        super(EnvironmentCache, self).set(
+            key, data.replace(root_url, THT_ROOT + '/'))
@@ -0,0 +1,110 @@
+#   Copyright 2020 Red Hat, Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+import json
+import time
+
+from tripleoclient import sqlite_cache
+
+
+class FactCache(sqlite_cache.SQLiteCache):
+    """Ansible facts of all the hosts stored in a single SQLite database.
+
+    The facts of a host are stored as a JSON document, keyed by host name,
+    see `sqlite_cache.SQLiteCache`. The facts read or stored by the
+    process are also kept in memory until they expire.
+    """
+
+    TABLE = 'facts'
+    DESCRIPTION = 'fact cache'
+
+    def __init__(self, path, timeout=0, max_hosts=0, encoder=None,
+                 decoder=None):
+        """Initialize the fact cache.
+
+        :param path: Path of the SQLite database.
+        :type path: String
+
+        :param timeout: Time, in seconds, after which the facts of a host
+                        expire. 0 disables the expiration.
+        :type timeout: Integer
+
+        :param max_hosts: Maximum number of hosts stored. 0 disables the
+                          eviction.
+        :type max_hosts: Integer
+
+        :param encoder: JSON encoder class used to store the facts.
+        :type encoder: Object
+
+        :param decoder: JSON decoder class used to load the facts.
+        :type decoder: Object
+        """
+
+        super(FactCache, self).__init__(path, timeout=timeout,
+                                        max_entries=max_hosts)
+        self.encoder = encoder
+        self.decoder = decoder
+        self._cache = dict()
+
+    def _reset(self):
+        self._cache = dict()
+
+    def _dumps(self, value):
+        return json.dumps(value, cls=self.encoder, sort_keys=True)
+
+    def _loads(self, data):
+        return json.loads(data, cls=self.decoder)
+
+    def _expired(self, created):
+        return self.timeout and created < time.time() - self.timeout
+
+    @staticmethod
+    def _timestamp(julian_day):
+        return (julian_day - 2440587.5) * 86400
+
+    def get(self, host):
+        """Return the facts of a host, or None if unknown or expired."""
+
+        if host in self._cache:
+            created, facts = self._cache[host]
+            if not self._expired(created):
+                return facts
+            del self._cache[host]
+        entry = self.fetch([host]).get(host)
+        if entry is None:
+            return
+        self._cache[host] = (self._timestamp(entry[0]), entry[1])
+        return entry[1]
+
+    def set(self, host, facts):
+        """Store the facts of a host and evict the expired hosts."""
+
+        super(FactCache, self).set(host, facts)
+        self._cache[host] = (time.time(), facts)
+
+    def delete(self, host):
+        self._cache.pop(host, None)
+        super(FactCache, self).delete(host)
+
+    def flush(self):
+        self._cache = dict()
+        super(FactCache, self).flush()
+
+    def copy(self):
+        return dict([(i, self.get(i)) for i in self.keys()])
+
+    def close(self):
+        super(FactCache, self).close()
+        self._cache = dict()
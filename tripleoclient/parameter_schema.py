@@ -0,0 +1,190 @@
+#   Copyright 2020 Red Hat, Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+import collections
+import gzip
+import hashlib
+import json
+import logging
+import os
+import tempfile
+
+import yaml
+
+from tripleoclient import yaml_utils
+
+
+LOG = logging.getLogger(__name__ + ".utils")
+
+# Version of the stored schemas, to be increased when their format changes.
+SCHEMA_VERSION = 1
+
+# Directories of a templates tree which do not hold templates.
+EXCLUDED_DIRS = ['.git', 'ci', 'doc', 'releasenotes', 'tools', 'zuul.d']
+
+
+def template_paths(tht_root):
+    """Return the paths of the YAML files of a templates directory."""
+
+    paths = []
+    for root, dirs, files in os.walk(tht_root):
+        if root == tht_root:
+            dirs[:] = [d for d in dirs if d not in EXCLUDED_DIRS]
+        dirs.sort()
+        for name in sorted(files):
+            if name.endswith(('.yaml', '.yml')):
+                paths.append(os.path.join(root, name))
+    return paths
+
+
+def build_schema(tht_root, paths=None):
+    """Build the parameter schema of a templates directory.
+
+    The schema has the format of the flattened resource tree of a stack,
+    see `resource_tree.ResourceTree`, with all the templates of the
+    directory instead of the templates of a stack: the parameters, with
+    their type, default and tags, by name and the parameter groups of
+    each template, by path. A parameter defined in several templates
+    gets the type and the default of the first one and the tags of all.
+
+    :param tht_root: The templates directory.
+    :type tht_root: String
+
+    :param paths: The YAML files of the directory, see `template_paths`.
+    :type paths: List
+
+    :returns: dictionary of the resources and the parameters
+    """
+
+    resources = collections.OrderedDict()
+    parameters = collections.OrderedDict()
+    for path in paths or template_paths(tht_root):
+        try:
+            template = yaml_utils.load_file(path)
+        except (IOError, OSError, yaml.YAMLError):
+            # e.g. jinja2 templates
+            continue
+        if (not isinstance(template, dict) or
+                'heat_template_version' not in template):
+            continue
+        name = os.path.relpath(path, tht_root)
+        for param_name, param in (template.get('parameters') or {}).items():
+            if not isinstance(param, dict):
+                continue
+            entry = parameters.setdefault(param_name, {'name': param_name})
+            entry.setdefault('type', param.get('type'))
+            if 'default' in param:
+                entry.setdefault('default', param['default'])
+            for tag in param.get('tags') or []:
+                tags = entry.setdefault('tags', [])
+                if tag not in tags:
+                    tags.append(tag)
+        if template.get('parameter_groups'):
+            resources[name] = {
+                'id': name,
+                'name': name,
+                'parameter_groups': template['parameter_groups']
+            }
+    return {'resources': resources, 'parameters': parameters}
+
+
+class ParameterSchemaCache(object):
+    """Parameter schemas stored as compressed JSON files.
+
+    A schema is keyed by the paths and the content of the YAML files of
+    the templates directory, so a rendered copy of a templates tree gets
+    the schema of the tree. Only the most recently used schemas are kept.
+
+    Errors are logged and handled as cache misses, the schema is then
+    built from the templates.
+    """
+
+    def __init__(self, path, max_entries=0):
+        """Initialize the parameter schema cache.
+
+        :param path: Directory of the stored schemas.
+        :type path: String
+
+        :param max_entries: Maximum number of schemas stored, the least
+                            recently used schemas are removed. 0 disables
+                            the removal.
+        :type max_entries: Integer
+        """
+
+        self.path = path
+        self.max_entries = max_entries
+
+    @staticmethod
+    def key(tht_root, paths):
+        sha = hashlib.sha256()
+        sha.update(str(SCHEMA_VERSION).encode('utf-8'))
+        for path in paths:
+            sha.update(b'\0')
+            sha.update(os.path.relpath(path, tht_root).encode('utf-8'))
+            sha.update(b'\0')
+            with open(path, 'rb') as f:
+                sha.update(f.read())
+        return sha.hexdigest()
+
+    def _read(self, key):
+        path = os.path.join(self.path, key + '.json.gz')
+        if not os.path.isfile(path):
+            return
+        with gzip.open(path, 'rb') as f:
+            schema = json.loads(f.read().decode('utf-8'))
+        os.utime(path, None)
+        return schema
+
+    def _write(self, key, schema):
+        if not os.path.exists(self.path):
+            os.makedirs(self.path)
+        data = json.dumps(schema, separators=(',', ':'), default=str)
+        fd, tmp_path = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            with gzip.GzipFile(fileobj=f, mode='wb') as gz:
+                gz.write(data.encode('utf-8'))
+        os.rename(tmp_path, os.path.join(self.path, key + '.json.gz'))
+        if self.max_entries:
+            stored = sorted(
+                (os.path.join(self.path, i) for i in os.listdir(self.path)
+                 if i.endswith('.json.gz')),
+                key=os.path.getmtime, reverse=True)
+            for path in stored[self.max_entries:]:
+                os.remove(path)
+
+    def get(self, tht_root):
+        """Return the parameter schema of a templates directory.
+
+        The schema is built, and stored, when not found.
+        """
+
+        paths = template_paths(tht_root)
+        key = None
+        try:
+            key = self.key(tht_root, paths)
+            schema = self._read(key)
+            if schema is not None:
+                return schema
+        except Exception as e:
+            LOG.warning('Unable to read the parameter schema cache: '
+                        '{}'.format(e))
+        schema = build_schema(tht_root, paths)
+        if key:
+            try:
+                self._write(key, schema)
+            except Exception as e:
+                LOG.warning('Unable to update the parameter schema cache: '
+                            '{}'.format(e))
+        return schema
@@ -0,0 +1,168 @@
+#   Copyright 2020 Red Hat, Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+import contextlib
+import datetime
+import json
+import os
+import tempfile
+import time
+
+from prettytable import PrettyTable
+
+
+# Version of the phase profile reports.
+REPORT_VERSION = 1
+
+
+def _children_cpu_time():
+    times = os.times()
+    return times.children_user + times.children_system
+
+
+class PhaseProfiler(object):
+    """Wall and CPU time of the phases of a command.
+
+    The phases are nested: a phase started while another one is running is
+    recorded as one of its sub-phases. The CPU time of a phase is the time
+    spent by the client process, the CPU time of its child processes, like
+    ansible-playbook, is recorded apart once they exited.
+    """
+
+    def __init__(self, enabled=True):
+        """Initialize the profiler.
+
+        :param enabled: Whether the phases are recorded, the phases of a
+                        disabled profiler cost nothing.
+        :type enabled: Boolean
+        """
+
+        self.enabled = enabled
+        self.phases = []
+        self._running = []
+        if enabled:
+            self._started = datetime.datetime.utcnow()
+            self._start = self._times()
+
+    @staticmethod
+    def _times():
+        return time.time(), time.process_time(), _children_cpu_time()
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """Record the time spent in a phase.
+
+        :param name: Name of the phase.
+        :type name: String
+        """
+
+        if not self.enabled:
+            yield
+            return
+
+        record = {
+            'name': name,
+            'started': datetime.datetime.utcnow().isoformat(),
+            'status': 'successful',
+            'phases': []
+        }
+        (self._running[-1]['phases'] if self._running
+         else self.phases).append(record)
+        self._running.append(record)
+        start = self._times()
+        try:
+            yield
+        except BaseException:
+            record['status'] = 'failed'
+            raise
+        finally:
+            self._running.pop()
+            record.update(self._elapsed(start))
+
+    def _elapsed(self, start):
+        end = self._times()
+        return {
+            'wall': round(end[0] - start[0], 3),
+            'cpu': round(end[1] - start[1], 3),
+            'children_cpu': round(end[2] - start[2], 3)
+        }
+
+    def report(self):
+        """Return the report of the recorded phases."""
+
+        report = {
+            'version': REPORT_VERSION,
+            'started': self._started.isoformat(),
+            'phases': self.phases
+        }
+        report.update(self._elapsed(self._start))
+        return report
+
+    def write(self, path, report=None):
+        """Write the JSON report of the recorded phases.
+
+        :param path: Path of the report.
+        :type path: String
+
+        :param report: The report to write, the report of the recorded
+                       phases when not set.
+        :type report: Dictionary
+        """
+
+        dirname = os.path.dirname(os.path.abspath(path))
+        if not os.path.exists(dirname):
+            os.makedirs(dirname)
+        fd, tmp = tempfile.mkstemp(prefix='.', dir=dirname)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(report or self.report(), f, indent=2, sort_keys=True)
+        os.rename(tmp, path)
+
+    def table(self, report=None):
+        """Return the summary table of the recorded phases.
+
+        :param report: The report to summarize, the report of the recorded
+                       phases when not set.
+        :type report: Dictionary
+        """
+
+        report = report or self.report()
+        table = PrettyTable(['Phase', 'Wall (s)', 'CPU (s)',
+                             'Children CPU (s)', '% of total'])
+        table.align['Phase'] = 'l'
+        for column in table.field_names[1:]:
+            table.align[column] = 'r'
+
+        def add_rows(phases, depth):
+            for phase in phases:
+                table.add_row([
+                    '  ' * depth + phase['name'] +
+                    (' (failed)' if phase['status'] == 'failed' else ''),
+                    '%.1f' % phase['wall'],
+                    '%.1f' % phase['cpu'],
+                    '%.1f' % phase['children_cpu'],
+                    '%.1f' % (100.0 * phase['wall'] / report['wall']
+                              if report['wall'] else 0)
+                ])
+                add_rows(phase['phases'], depth + 1)
+
+        add_rows(report['phases'], 0)
+        table.add_row(['Total', '%.1f' % report['wall'],
+                       '%.1f' % report['cpu'],
+                       '%.1f' % report['children_cpu'], '100.0'])
+        return table
+
+
+# Profiler of the code called without one.
+DISABLED = PhaseProfiler(enabled=False)
@@ -0,0 +1,157 @@
+#   Copyright 2020 Red Hat, Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+import collections
+
+
+ROLE_COUNT_SUFFIX = 'Count'
+
+
+class ResourceTree(object):
+    """Indexes of the flattened resource tree of a stack.
+
+    The resource tree is the `heat_resource_tree` of the stack data built
+    by `utils.build_stack_data`: the resources and the parameters of the
+    stack and of its nested stacks, by id and by name. Each index is built
+    in a single pass over the tree when first used.
+    """
+
+    def __init__(self, heat_resource_tree=None):
+        """Initialize the resource tree.
+
+        :param heat_resource_tree: The flattened resource tree.
+        :type heat_resource_tree: Dictionary
+        """
+
+        heat_resource_tree = heat_resource_tree or {}
+        self.resources = heat_resource_tree.get('resources') or {}
+        self.parameters = heat_resource_tree.get('parameters') or {}
+        self._parameters_by_tag = None
+        self._parameter_groups_by_label = None
+        self._role_counts = None
+        self._root = None
+
+    @classmethod
+    def from_stack_data(cls, stack_data):
+        """Return the resource tree of stack data."""
+
+        return cls((stack_data or {}).get('heat_resource_tree'))
+
+    def get_parameter(self, name):
+        """Return a parameter by name || None."""
+
+        return self.parameters.get(name)
+
+    @property
+    def parameters_by_tag(self):
+        """The names of the parameters, by tag."""
+
+        if self._parameters_by_tag is None:
+            self._parameters_by_tag = collections.defaultdict(list)
+            for name, parameter in self.parameters.items():
+                for tag in parameter.get('tags') or []:
+                    self._parameters_by_tag[tag].append(name)
+        return self._parameters_by_tag
+
+    def get_tagged_parameters(self, tag):
+        """Return the names of the parameters with a tag."""
+
+        return self.parameters_by_tag.get(tag, [])
+
+    @property
+    def parameter_groups_by_label(self):
+        """The parameter groups of all the resources, by label."""
+
+        if self._parameter_groups_by_label is None:
+            self._parameter_groups_by_label = collections.defaultdict(list)
+            for resource in self.resources.values():
+                for group in resource.get('parameter_groups') or []:
+                    self._parameter_groups_by_label[
+                        group.get('label')].append(group)
+        return self._parameter_groups_by_label
+
+    def get_grouped_parameters(self, label):
+        """Return the names of the parameters of the groups with a label."""
+
+        names = collections.OrderedDict()
+        for group in self.parameter_groups_by_label.get(label, []):
+            for name in group.get('parameters') or []:
+                names[name] = None
+        return list(names)
+
+    @property
+    def role_counts(self):
+        """The default count of each role, from its <role>Count parameter."""
+
+        if self._role_counts is None:
+            self._role_counts = collections.OrderedDict()
+            for name, parameter in self.parameters.items():
+                if (name.endswith(ROLE_COUNT_SUFFIX) and
+                        len(name) > len(ROLE_COUNT_SUFFIX)):
+                    role = name[:-len(ROLE_COUNT_SUFFIX)]
+                    try:
+                        self._role_counts[role] = int(
+                            parameter.get('default') or 0)
+                    except (TypeError, ValueError):
+                        # not a role count, e.g. a string parameter
+                        continue
+        return self._role_counts
+
+    def get_role_count(self, role):
+        """Return the default count of a role, 0 if unknown."""
+
+        return self.role_counts.get(role, 0)
+
+    @property
+    def root(self):
+        """The resource of the stack || None if the tree is empty."""
+
+        if self._root is None:
+            nested_ids = set()
+            for resource in self.resources.values():
+                nested_ids.update(resource.get('resources') or [])
+            for resource_id, resource in self.resources.items():
+                if resource_id not in nested_ids:
+                    self._root = resource
+                    break
+        return self._root
+
+    def get_nested_resources(self, resource):
+        """Yield the resources of the nested stack of a resource."""
+
+        for nested_id in resource.get('resources') or []:
+            nested = self.resources.get(nested_id)
+            if nested is not None:
+                yield nested
+
+    def walk(self, resource=None):
+        """Yield a resource and all its nested resources, depth first.
+
+        The nested resources are only looked up as the walk reaches them.
+
+        :param resource: The resource to start from, the root by default.
+        :type resource: Dictionary
+        """
+
+        if resource is None:
+            resource = self.root
+            if resource is None:
+                return
+        stack = [resource]
+        while stack:
+            resource = stack.pop()
+            yield resource
+            stack.extend(reversed(list(
+                self.get_nested_resources(resource))))
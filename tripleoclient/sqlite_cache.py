@@ -0,0 +1,254 @@
+#   Copyright 2020 Red Hat, Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+import logging
+import os
+import sqlite3
+import zlib
+
+
+LOG = logging.getLogger(__name__ + ".utils")
+
+# Maximum number of keys of a query, below the maximum number of SQLite
+# host parameters.
+MAX_QUERY_KEYS = 500
+
+
+def create_private_file(path):
+    """Create a file only readable by its owner, and its directory.
+
+    The file is not truncated when it exists, its mode is reset.
+    """
+
+    path_dir = os.path.dirname(os.path.abspath(path))
+    if not os.path.exists(path_dir):
+        os.makedirs(path_dir, mode=0o700)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT, 0o600)
+    try:
+        os.fchmod(fd, 0o600)
+    finally:
+        os.close(fd)
+
+
+class SQLiteCache(object):
+    """Text entries stored in a single SQLite database.
+
+    An entry is stored compressed in the `TABLE` table, indexed by its
+    key. The entries expire `timeout` seconds after they were stored and,
+    once more than `max_entries` entries are stored, the least recently
+    used entries are evicted. Subclasses encode their keys and values,
+    see `_dumps` and `_loads`.
+
+    The database connection is opened lazily and is reopened when used
+    from a forked process. Errors are logged and handled as cache misses,
+    the cache never fails its users.
+    """
+
+    # Table of the entries.
+    TABLE = 'entries'
+
+    # Name of the cache in the logged errors.
+    DESCRIPTION = 'cache'
+
+    def __init__(self, path, timeout=0, max_entries=0):
+        """Initialize the cache.
+
+        :param path: Path of the SQLite database.
+        :type path: String
+
+        :param timeout: Time, in seconds, after which an entry expires. 0
+                        disables the expiration.
+        :type timeout: Integer
+
+        :param max_entries: Maximum number of entries stored, the least
+                            recently used entries are evicted. 0 disables
+                            the eviction.
+        :type max_entries: Integer
+        """
+
+        self.path = path
+        self.timeout = timeout
+        self.max_entries = max_entries
+        self._conn = None
+        self._pid = None
+
+    @property
+    def conn(self):
+        if self._conn is None or self._pid != os.getpid():
+            create_private_file(self.path)
+            self._conn = sqlite3.connect(self.path, timeout=30)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            with self._conn:
+                self._conn.execute(
+                    'CREATE TABLE IF NOT EXISTS {0} ('
+                    'key TEXT PRIMARY KEY, '
+                    'data BLOB NOT NULL, '
+                    'created REAL NOT NULL, '
+                    'accessed REAL NOT NULL)'.format(self.TABLE)
+                )
+                self._conn.execute(
+                    'CREATE INDEX IF NOT EXISTS {0}_accessed '
+                    'ON {0} (accessed)'.format(self.TABLE)
+                )
+            self._pid = os.getpid()
+            self._reset()
+        return self._conn
+
+    def _reset(self):
+        """Called when the database connection is (re)opened."""
+
+    def _dumps(self, value):
+        """Return the text stored for a value."""
+
+        return value
+
+    def _loads(self, data):
+        """Return the value of a stored text."""
+
+        return data
+
+    def _unexpired(self, query, args=()):
+        if self.timeout:
+            query += " {} created >= julianday('now') - ?".format(
+                'AND' if 'WHERE' in query else 'WHERE')
+            args += (self.timeout / 86400.0,)
+        return query, args
+
+    def fetch(self, keys):
+        """Return the unexpired entries of keys.
+
+        :returns: Tuple with the creation time, as a julian day, and the
+                  value of the entries, by key.
+        """
+
+        entries = {}
+        try:
+            keys = list(keys)
+            for i in range(0, len(keys), MAX_QUERY_KEYS):
+                chunk = keys[i:i + MAX_QUERY_KEYS]
+                query, args = self._unexpired(
+                    'SELECT key, data, created FROM {} WHERE key IN ({})'
+                    .format(self.TABLE, ','.join('?' * len(chunk))),
+                    tuple(chunk)
+                )
+                for key, data, created in self.conn.execute(query, args):
+                    entries[key] = (created, self._loads(
+                        zlib.decompress(data).decode('utf-8')))
+            if entries:
+                with self.conn:
+                    self.conn.executemany(
+                        "UPDATE {} SET accessed = julianday('now')"
+                        ' WHERE key = ?'.format(self.TABLE),
+                        [(key,) for key in entries]
+                    )
+        except Exception as e:
+            LOG.warning('Unable to read the {}: {}'.format(
+                self.DESCRIPTION, e))
+            return {}
+        return entries
+
+    def get_many(self, keys):
+        """Return the unexpired values of keys, by key."""
+
+        return dict((k, v[1]) for k, v in self.fetch(keys).items())
+
+    def get(self, key):
+        """Return the value of a key || None when unknown or expired."""
+
+        return self.get_many([key]).get(key)
+
+    def set_many(self, values):
+        """Store values, by key, and evict the expired entries."""
+
+        if not values:
+            return
+        try:
+            rows = [(key, sqlite3.Binary(zlib.compress(
+                self._dumps(value).encode('utf-8'))))
+                for key, value in values.items()]
+            with self.conn:
+                self.conn.executemany(
+                    'INSERT OR REPLACE INTO {}'
+                    ' (key, data, created, accessed)'
+                    " VALUES (?, ?, julianday('now'), julianday('now'))"
+                    .format(self.TABLE),
+                    rows
+                )
+                if self.timeout:
+                    self.conn.execute(
+                        "DELETE FROM {} WHERE created < julianday('now') - ?"
+                        .format(self.TABLE),
+                        (self.timeout / 86400.0,)
+                    )
+                if self.max_entries:
+                    self.conn.execute(
+                        'DELETE FROM {0} WHERE key NOT IN ('
+                        'SELECT key FROM {0} ORDER BY accessed DESC'
+                        ' LIMIT ?)'.format(self.TABLE),
+                        (self.max_entries,)
+                    )
+        except Exception as e:
+            LOG.warning('Unable to update the {}: {}'.format(
+                self.DESCRIPTION, e))
+
+    def set(self, key, value):
+        """Store the value of a key and evict the expired entries."""
+
+        self.set_many({key: value})
+
+    def keys(self):
+        """Return the keys of the unexpired entries."""
+
+        try:
+            query, args = self._unexpired(
+                'SELECT key FROM {}'.format(self.TABLE))
+            return [i[0] for i in self.conn.execute(
+                query + ' ORDER BY key', args)]
+        except Exception as e:
+            LOG.warning('Unable to read the {}: {}'.format(
+                self.DESCRIPTION, e))
+            return []
+
+    def contains(self, key):
+        try:
+            query, args = self._unexpired(
+                'SELECT 1 FROM {} WHERE key = ?'.format(self.TABLE), (key,))
+            return self.conn.execute(query, args).fetchone() is not None
+        except Exception as e:
+            LOG.warning('Unable to read the {}: {}'.format(
+                self.DESCRIPTION, e))
+            return False
+
+    def delete(self, key):
+        try:
+            with self.conn:
+                self.conn.execute(
+                    'DELETE FROM {} WHERE key = ?'.format(self.TABLE), (key,))
+        except Exception as e:
+            LOG.warning('Unable to update the {}: {}'.format(
+                self.DESCRIPTION, e))
+
+    def flush(self):
+        try:
+            with self.conn:
+                self.conn.execute('DELETE FROM {}'.format(self.TABLE))
+        except Exception as e:
+            LOG.warning('Unable to update the {}: {}'.format(
+                self.DESCRIPTION, e))
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
@@ -0,0 +1,211 @@
+#   Copyright 2020 Red Hat, Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+import hashlib
+import json
+import logging
+
+from heatclient.common import utils as heat_utils
+
+from tripleoclient import constants
+from tripleoclient import environment_cache
+from tripleoclient import sqlite_cache
+
+
+LOG = logging.getLogger(__name__ + ".utils")
+
+THT_ROOT = environment_cache.THT_ROOT
+
+
+class StackDataCache(sqlite_cache.SQLiteCache):
+    """Stack data built from the validation of a stack by Heat.
+
+    An entry holds the stack data returned by `utils.build_stack_data`,
+    i.e. the environment parameters and the flattened resource tree, and
+    is keyed by a hash of the template, the files and the environment
+    files which were validated. The entries are kept in memory for the
+    command and, when a path is given, stored in a single SQLite database
+    for the next commands, see `sqlite_cache.SQLiteCache`.
+
+    The templates are copied to a new directory for every deployment, the
+    URLs within it are stored relative to it, see
+    `environment_cache.THT_ROOT`, and the parameters generated for every
+    deployment, see `constants.STACK_FINGERPRINT_IGNORED_PARAMETERS`, are
+    not part of the key.
+    """
+
+    TABLE = 'stack_data'
+    DESCRIPTION = 'stack data cache'
+
+    def __init__(self, path=None, timeout=0, max_entries=0):
+        """Initialize the stack data cache.
+
+        :param path: Path of the SQLite database, the entries are only kept
+                     in memory when not set.
+        :type path: String
+
+        :param timeout: Number of seconds after which a stored entry is no
+                        longer returned. 0 disables the expiration.
+        :type timeout: Integer
+
+        :param max_entries: Maximum number of entries stored, the least
+                            recently used entries are evicted. 0 disables
+                            the eviction.
+        :type max_entries: Integer
+        """
+
+        super(StackDataCache, self).__init__(path, timeout=timeout,
+                                             max_entries=max_entries)
+        self._entries = dict()
+
+    def _loads(self, data):
+        # only the JSON documents are returned
+        json.loads(data)
+        return data
+
+    @staticmethod
+    def _root_url(tht_root):
+        if not tht_root:
+            return
+        return heat_utils.normalise_file_path_to_url(tht_root) + '/'
+
+    @staticmethod
+    def _update(sha, value, root_url):
+        if isinstance(value, bytes):
+            if root_url:
+                value = value.replace(root_url.encode('utf-8'),
+                                      THT_ROOT.encode('utf-8') + b'/')
+            sha.update(value)
+        else:
+            value = json.dumps(value, sort_keys=True, default=str)
+            if root_url:
+                value = value.replace(json.dumps(root_url)[1:-1],
+                                      THT_ROOT + '/')
+            sha.update(value.encode('utf-8'))
+        sha.update(b'\0')
+
+    @staticmethod
+    def _without_ignored_parameters(content):
+        try:
+            env = json.loads(content)
+            parameters = env.get('parameter_defaults') or {}
+        except (AttributeError, TypeError, ValueError):
+            return content
+        for name in constants.STACK_FINGERPRINT_IGNORED_PARAMETERS:
+            if name in parameters:
+                parameters[name] = None
+        return env
+
+    @classmethod
+    def ignored_parameters(cls, files, env_files):
+        """Return the ignored parameters set by the environment files.
+
+        :param files: The files of the stack, by URL.
+        :type files: Dictionary
+
+        :param env_files: The environment files, in order of precedence.
+        :type env_files: List
+
+        :returns: The values of the parameters, by name.
+        """
+
+        parameters = dict()
+        for url in env_files or []:
+            try:
+                env = json.loads((files or {}).get(url))
+                defaults = env.get('parameter_defaults') or {}
+            except (AttributeError, TypeError, ValueError):
+                continue
+            for name in constants.STACK_FINGERPRINT_IGNORED_PARAMETERS:
+                if name in defaults:
+                    parameters[name] = defaults[name]
+        return parameters
+
+    @classmethod
+    def key(cls, template, files, env_files, tht_root=None):
+        """Return the key of a validation.
+
+        :param template: The stack template.
+        :type template: Dictionary
+
+        :param files: The files of the stack, by URL.
+        :type files: Dictionary
+
+        :param env_files: The environment files, in order of precedence.
+        :type env_files: List
+
+        :param tht_root: The templates directory.
+        :type tht_root: String
+        """
+
+        root_url = cls._root_url(tht_root)
+        env_files = list(env_files or [])
+        sha = hashlib.sha256()
+        cls._update(sha, template, root_url)
+        for name in sorted(files or {}):
+            content = files[name]
+            if name in env_files:
+                content = cls._without_ignored_parameters(content)
+            cls._update(sha, name, root_url)
+            cls._update(sha, content, root_url)
+        cls._update(sha, env_files, root_url)
+        return sha.hexdigest()
+
+    def get(self, key, tht_root=None):
+        """Return the stack data of a validation.
+
+        :param tht_root: The templates directory the stack data is rebased
+                         on.
+        :type tht_root: String
+
+        :returns: The stack data || None when the validation is unknown or
+                  expired.
+        """
+
+        data = self._entries.get(key)
+        if data is None and self.path:
+            data = super(StackDataCache, self).get(key)
+            if data is not None:
+                self._entries[key] = data
+        if data is None:
+            return
+        root_url = self._root_url(tht_root)
+        if root_url:
+            data = data.replace(THT_ROOT + '/', json.dumps(root_url)[1:-1])
+        return json.loads(data)
+
+    def set(self, key, stack_data, tht_root=None):
+        """Store the stack data of a validation.
+
+        Stack data which is not a JSON document is not stored.
+
+        :param tht_root: The templates directory of the stack data.
+        :type tht_root: String
+        """
+
+        try:
+            data = json.dumps(stack_data)
+        except (TypeError, ValueError):
+            return
+        if json.loads(data) != stack_data:
+            # Not a JSON document, e.g. maps with integer keys.
+            return
+        root_url = self._root_url(tht_root)
+        if root_url:
+            data = data.replace(json.dumps(root_url)[1:-1], THT_ROOT + '/')
+        self._entries[key] = data
+        if not self.path:
+            return
+        super(StackDataCache, self).set(key, data)
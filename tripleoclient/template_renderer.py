@@ -0,0 +1,393 @@
+#   Copyright 2020 Red Hat, Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+"""Rendering of the jinja2 templates of a tripleo-heat-templates tree.
+
+The templates are rendered like tools/process-templates.py of the tree
+does, within the client process, when the script of the tree is one of the
+`KNOWN_PROCESS_TEMPLATES`:
+
+* `*.role.j2.yaml` templates are rendered once per role,
+* `*.network.j2.yaml` templates are rendered once per enabled network,
+* other `*.j2.yaml` templates are rendered once with all the roles and
+  networks.
+
+Each rendering is keyed by the template, the data it is rendered with and
+the templates it includes, so the renderings which did not change since a
+previous deployment are read from a `RenderCache`, and the others can be
+spread over several worker processes.
+"""
+
+import collections
+from concurrent import futures
+import hashlib
+import json
+import logging
+import os
+import shutil
+
+import jinja2
+from jinja2 import meta
+
+from tripleoclient import sqlite_cache
+from tripleoclient import yaml_utils
+
+
+LOG = logging.getLogger(__name__ + ".utils")
+
+# Version of the renderer, to be increased when the rendering changes.
+RENDERER_VERSION = 1
+
+# Network data files used when none is given, relative to the templates.
+DEFAULT_NETWORK_DATA_FILES = [
+    'network-data-samples/default-network-isolation.yaml',
+    'network_data.yaml'
+]
+
+# Minimum number of renderings to spread over worker processes.
+PARALLEL_MIN_RENDERINGS = 32
+
+# Script rendering the templates of a tree, relative to the templates.
+PROCESS_TEMPLATES_SCRIPT = 'tools/process-templates.py'
+
+# SHA-256 digests of the process-templates.py scripts the templates are
+# rendered like, the templates of a tree with another script are rendered
+# by the script itself.
+KNOWN_PROCESS_TEMPLATES = frozenset([
+    # tripleo-heat-templates 18.0.0
+    '95e663c3a63ad56d67acac3cb94fda51a1be0c878dbde8ab76ca4902f3fa6162',
+])
+
+
+class RenderCache(sqlite_cache.SQLiteCache):
+    """Rendered templates stored in a single SQLite database.
+
+    A rendering is keyed by the template, the data it is rendered with and
+    the templates it includes, see `sqlite_cache.SQLiteCache`.
+    """
+
+    TABLE = 'renderings'
+    DESCRIPTION = 'render cache'
+
+
+def _environment(search_path):
+    return jinja2.Environment(
+        loader=jinja2.loaders.FileSystemLoader(search_path))
+
+
+def _render(template_data, search_path, j2_data_list):
+    """Render a template with each data, run by the worker processes."""
+
+    template = _environment(search_path).from_string(template_data)
+    return [template.render(**j2_data) for j2_data in j2_data_list]
+
+
+def _referenced_sources(env, source, seen):
+    """Yield the sources of the templates included by a template."""
+
+    for name in meta.find_referenced_templates(env.parse(source)):
+        if name is None:
+            # dynamic reference, the rendering can not be keyed
+            raise ValueError('dynamic template reference')
+        if name in seen:
+            continue
+        seen.add(name)
+        try:
+            included = env.loader.get_source(env, name)[0]
+        except jinja2.TemplateNotFound:
+            # fails the rendering, which is not stored
+            raise ValueError('template %s not found' % name)
+        yield name, included
+        for item in _referenced_sources(env, included, seen):
+            yield item
+
+
+def _template_hash(template_data, search_path):
+    """Hash a template and the templates it includes.
+
+    :returns: the hash object || None when the included templates can not
+              be known.
+    """
+
+    sha = hashlib.sha256()
+    sha.update(str(RENDERER_VERSION).encode('utf-8'))
+    sha.update(template_data.encode('utf-8'))
+    try:
+        env = _environment(search_path)
+        for name, source in _referenced_sources(env, template_data, set()):
+            sha.update(b'\0')
+            sha.update(name.encode('utf-8'))
+            sha.update(b'\0')
+            sha.update(source.encode('utf-8'))
+    except (ValueError, jinja2.TemplateError):
+        return
+    return sha
+
+
+def _key(template_hash, j2_data):
+    """Return the key of the rendering of a template with data."""
+
+    sha = template_hash.copy()
+    sha.update(b'\0')
+    sha.update(json.dumps(j2_data, sort_keys=True,
+                          default=str).encode('utf-8'))
+    return sha.hexdigest()
+
+
+def _load(path):
+    with open(path) as f:
+        return yaml_utils.safe_load(f)
+
+
+def _set_tags_based_on_role_name(role_data, log):
+    for role in role_data:
+        role['tags'] = role.get('tags', [])
+        role_name = role.get('name', str())
+
+        tags = []
+        if (role_name.startswith(('Compute', 'HciCeph',
+                                  'DistributedCompute'))):
+            tags.append('compute')
+        if role_name.startswith('Ceph'):
+            tags.append('ceph')
+        if role_name.startswith('ComputeOvsDpdk'):
+            tags.append('ovsdpdk')
+        if role_name.startswith(('ObjectStorage', 'BlockStorage', 'Ceph')):
+            tags.append('storage')
+        for tag in tags:
+            if tag not in role['tags']:
+                role['tags'].append(tag)
+                log.warning("DEPRECATED: Role '%s' without the '%s' tag "
+                            "detected, the tag was added automatically. "
+                            "Please add the '%s' tag in roles data.",
+                            role_name, tag, tag)
+
+
+def _copy(src, dst_dir):
+    dst = os.path.join(dst_dir, os.path.basename(src))
+    if os.path.exists(dst) and os.path.samefile(src, dst):
+        return
+    shutil.copy(src, dst)
+
+
+def is_known_process_templates(template_path):
+    """Return whether the templates tree is rendered like its own script.
+
+    :param template_path: The templates directory.
+    :type template_path: String
+
+    :returns: True when the process-templates.py script of the tree is one
+              of the `KNOWN_PROCESS_TEMPLATES`.
+    """
+
+    path = os.path.join(template_path, PROCESS_TEMPLATES_SCRIPT)
+    try:
+        with open(path, 'rb') as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+    except (IOError, OSError):
+        return False
+    return digest in KNOWN_PROCESS_TEMPLATES
+
+
+def default_network_data(template_path):
+    """Return the network data file of a templates tree."""
+
+    for name in DEFAULT_NETWORK_DATA_FILES:
+        path = os.path.join(template_path, name)
+        if os.path.exists(path):
+            return path
+    return os.path.join(template_path, DEFAULT_NETWORK_DATA_FILES[0])
+
+
+def process_templates(template_path, roles_data_path, network_data_path,
+                      output_dir=None, templates_root=None, cache=None,
+                      workers=1, log=None):
+    """Render the jinja2 templates of a templates tree.
+
+    :param template_path: The templates directory to render.
+    :type template_path: String
+
+    :param roles_data_path: Path of the roles data file.
+    :type roles_data_path: String
+
+    :param network_data_path: Path of the network data file.
+    :type network_data_path: String
+
+    :param output_dir: Directory the templates are rendered to, the
+                       templates directory when not set. The other files
+                       of the directory are copied to it.
+    :type output_dir: String
+
+    :param templates_root: Directory the included templates are searched in
+                           after the directory of the rendered template,
+                           the templates directory when not set.
+    :type templates_root: String
+
+    :param cache: Renderings of the previous deployments.
+    :type cache: RenderCache
+
+    :param workers: Maximum number of worker processes rendering the
+                    templates.
+    :type workers: Integer
+
+    :returns: the number of rendered files and of renderings from the
+              cache.
+    """
+
+    log = log or LOG
+    output_dir = output_dir or template_path
+    templates_root = templates_root or template_path
+
+    role_data = _load(roles_data_path)
+    network_data = _load(network_data_path) or []
+    # Set internal network index key for each network, network resources
+    # are created with a tag tripleo_net_idx
+    for idx, network in enumerate(network_data):
+        network['idx'] = idx
+
+    j2_excludes = {}
+    j2_excludes_path = os.path.join(template_path, 'j2_excludes.yaml')
+    if os.path.exists(j2_excludes_path):
+        j2_excludes = _load(j2_excludes_path) or {}
+    excluded = set(j2_excludes.get('name') or [])
+
+    if not os.path.isdir(output_dir):
+        if os.path.exists(output_dir):
+            raise RuntimeError('Output dir %s is not a directory'
+                               % output_dir)
+        os.mkdir(output_dir)
+
+    _set_tags_based_on_role_name(role_data, log)
+    r_map = dict((r.get('name'), r) for r in role_data)
+
+    n_map = {}
+    for n in network_data:
+        if n.get('enabled') is not False:
+            n_map[n.get('name')] = n
+            if not n.get('name_lower'):
+                n['name_lower'] = n.get('name').lower()
+        else:
+            log.debug('Skipping %s network: network is disabled',
+                      n.get('name'))
+
+    # (output path, template, data) of each rendering
+    renderings = []
+    for subdir, dirs, files in os.walk(template_path):
+        dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+        files = sorted(f for f in files if not f.startswith('.'))
+        rel_dir = os.path.relpath(subdir, template_path)
+        out_dir = os.path.normpath(os.path.join(output_dir, rel_dir))
+        if not os.path.exists(out_dir):
+            os.mkdir(out_dir)
+
+        for f in files:
+            file_path = os.path.join(subdir, f)
+            if f.endswith('.role.j2.yaml'):
+                with open(file_path) as j2_template:
+                    template_data = j2_template.read()
+                for role in r_map:
+                    out_f = '%s-%s' % (
+                        role.lower(), f.replace('.role.j2.yaml', '.yaml'))
+                    if 'network/config' in file_path:
+                        out_f = '%s.yaml' % role.lower()
+                    if os.path.join(rel_dir, out_f) in excluded:
+                        log.debug('Skipping rendering of %s', out_f)
+                        continue
+                    if '{{role.name}}' in template_data:
+                        j2_data = {'role': r_map[role],
+                                   'networks': network_data}
+                    else:
+                        # Backwards compatibility with templates that
+                        # specify {{role}} vs {{role.name}}
+                        j2_data = {'role': role, 'networks': network_data}
+                    renderings.append((os.path.join(out_dir, out_f),
+                                       template_data, j2_data))
+            elif f.endswith('.network.j2.yaml'):
+                with open(file_path) as j2_template:
+                    template_data = j2_template.read()
+                for network in n_map:
+                    out_f = f.replace('.network.j2.yaml', '.yaml')
+                    if subdir.endswith('ports'):
+                        out_f = out_f.replace('port',
+                                              n_map[network]['name_lower'])
+                    else:
+                        out_f = out_f.replace('network',
+                                              n_map[network]['name_lower'])
+                    if os.path.join(rel_dir, out_f) in excluded:
+                        log.debug('Skipping rendering of %s', out_f)
+                        continue
+                    renderings.append((os.path.join(out_dir, out_f),
+                                       template_data,
+                                       {'network': n_map[network]}))
+            elif f.endswith('.j2.yaml'):
+                with open(file_path) as j2_template:
+                    template_data = j2_template.read()
+                renderings.append((
+                    os.path.join(out_dir, f.replace('.j2.yaml', '.yaml')),
+                    template_data,
+                    {'roles': role_data, 'networks': network_data}))
+            elif out_dir != subdir:
+                # including the *.j2 templates, which are searched for
+                # in the directory of the rendered templates
+                _copy(file_path, out_dir)
+
+    # the renderings of a template share its compilation and hash
+    groups = collections.OrderedDict()
+    for i, (out_path, template_data, _) in enumerate(renderings):
+        search_path = (os.path.dirname(out_path), templates_root)
+        groups.setdefault((template_data, search_path), []).append(i)
+
+    keys = [None] * len(renderings)
+    for (template_data, search_path), indexes in groups.items():
+        template_hash = _template_hash(template_data, list(search_path))
+        if template_hash is not None:
+            for i in indexes:
+                keys[i] = _key(template_hash, renderings[i][2])
+    cached = {}
+    if cache is not None:
+        cached = cache.get_many(set(k for k in keys if k))
+
+    stale = {}
+    for group, indexes in groups.items():
+        indexes = [i for i in indexes if keys[i] not in cached]
+        if indexes:
+            stale[group] = indexes
+    stale_count = sum(len(i) for i in stale.values())
+
+    results = {}
+    if workers > 1 and stale_count >= PARALLEL_MIN_RENDERINGS:
+        with futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            jobs = [(indexes, executor.submit(
+                _render, template_data, list(search_path),
+                [renderings[i][2] for i in indexes]))
+                for (template_data, search_path), indexes in stale.items()]
+            for indexes, job in jobs:
+                results.update(zip(indexes, job.result()))
+    else:
+        for (template_data, search_path), indexes in stale.items():
+            results.update(zip(indexes, _render(
+                template_data, list(search_path),
+                [renderings[i][2] for i in indexes])))
+
+    for i, (out_path, _, _) in enumerate(renderings):
+        rendered = results[i] if i in results else cached[keys[i]]
+        log.debug('Rendering j2 template to file: %s', out_path)
+        with open(out_path, 'w') as out_f:
+            out_f.write(rendered)
+
+    if cache is not None:
+        cache.set_many(dict((keys[i], rendered)
+                            for i, rendered in results.items() if keys[i]))
+    return len(renderings), len(renderings) - stale_count
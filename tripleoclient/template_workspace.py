@@ -0,0 +1,153 @@
+#   Copyright 2020 Red Hat, Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+
+
+LOG = logging.getLogger(__name__ + ".utils")
+
+# Version of the rendered trees, to be increased when the rendering changes.
+WORKSPACE_VERSION = 1
+
+
+class TemplateWorkspace(object):
+    """Templates trees rendered with the roles and networks of a deployment.
+
+    A rendered tree is stored in a directory of the workspace named after a
+    hash of the templates tree, the roles data file and the network data
+    file it was rendered from. Deployments with the same inputs copy the
+    stored tree instead of rendering the jinja2 templates again. Only the
+    most recently used trees are kept.
+
+    The deployments write their own files in their copy of the templates,
+    so the stored trees are copied and not linked.
+    """
+
+    def __init__(self, path, max_entries=0):
+        """Initialize the templates workspace.
+
+        :param path: Directory of the rendered trees.
+        :type path: String
+
+        :param max_entries: Maximum number of rendered trees stored, the
+                            least recently used trees are removed. 0
+                            disables the removal.
+        :type max_entries: Integer
+        """
+
+        self.path = path
+        self.max_entries = max_entries
+
+    @staticmethod
+    def _update(sha, path):
+        if os.path.islink(path):
+            sha.update(b'l')
+            sha.update(os.readlink(path).encode('utf-8'))
+        else:
+            sha.update(b'f')
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    sha.update(chunk)
+        sha.update(b'\0')
+
+    @classmethod
+    def key(cls, templates, roles_file=None, networks_file=None):
+        """Return the key of a rendered tree.
+
+        :param templates: The templates directory.
+        :type templates: String
+
+        :param roles_file: Path of the roles data file, the roles data
+                           file of the templates when not set.
+        :type roles_file: String
+
+        :param networks_file: Path of the network data file, the network
+                              data file of the templates when not set.
+        :type networks_file: String
+        """
+
+        sha = hashlib.sha256()
+        sha.update(str(WORKSPACE_VERSION).encode('utf-8'))
+        for root, dirs, files in os.walk(templates):
+            dirs.sort()
+            rel_root = os.path.relpath(root, templates)
+            for name in dirs:
+                # symbolic links to directories are copied as links
+                if os.path.islink(os.path.join(root, name)):
+                    sha.update(os.path.join(rel_root, name).encode('utf-8'))
+                    cls._update(sha, os.path.join(root, name))
+            for name in sorted(files):
+                sha.update(os.path.join(rel_root, name).encode('utf-8'))
+                sha.update(b'\0')
+                cls._update(sha, os.path.join(root, name))
+        for name, path in (('roles', roles_file),
+                           ('networks', networks_file)):
+            if path:
+                sha.update(name.encode('utf-8'))
+                cls._update(sha, os.path.abspath(path))
+        return sha.hexdigest()
+
+    def _prune(self, keep):
+        if not self.max_entries:
+            return
+        entries = sorted(
+            (os.path.join(self.path, i) for i in os.listdir(self.path)
+             if not i.startswith('.')),
+            key=os.path.getmtime, reverse=True)
+        for path in entries[self.max_entries:]:
+            if path != keep:
+                LOG.debug('Removing rendered templates %s', path)
+                shutil.rmtree(path, ignore_errors=True)
+
+    def get(self, key, build):
+        """Return the rendered tree of a key, rendering it when not stored.
+
+        :param key: The key of the rendered tree, see `key`.
+        :type key: String
+
+        :param build: Called with the directory to render the tree to, which
+                      does not exist yet, when the tree is not stored.
+        :type build: Function
+
+        :returns: The directory of the rendered tree.
+        """
+
+        rendered = os.path.join(self.path, key)
+        if os.path.isdir(rendered):
+            LOG.debug('Using the rendered templates %s', rendered)
+            os.utime(rendered, None)
+            return rendered
+
+        if not os.path.exists(self.path):
+            os.makedirs(self.path)
+        staging = tempfile.mkdtemp(prefix='.', dir=self.path)
+        try:
+            staging_root = os.path.join(staging, 'tripleo-heat-templates')
+            build(staging_root)
+            try:
+                os.rename(staging_root, rendered)
+            except OSError:
+                # rendered by a concurrent deployment
+                if not os.path.isdir(rendered):
+                    raise
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+        LOG.debug('Stored the rendered templates in %s', rendered)
+        self._prune(rendered)
+        return rendered
@@ -25,7 +25,9 @@ class TestStandaloneConfig(base.TestCase):
 
     def test_get_base_opts(self):
         ret = self.config.get_base_opts()
-        expected = ['cleanup',
+        expected = ['artifact_archive_format',
+                    'artifact_store',
+                    'cleanup',
                     'container_cli',
                     'container_healthcheck_disabled',
                     'container_images_file',
@@ -89,7 +91,9 @@ class TestStandaloneConfig(base.TestCase):
 
     def test_get_opts(self):
         ret = self.config.get_opts()
-        expected = ['cleanup',
+        expected = ['artifact_archive_format',
+                    'artifact_store',
+                    'cleanup',
                     'container_cli',
                     'container_healthcheck_disabled',
                     'container_images_file',
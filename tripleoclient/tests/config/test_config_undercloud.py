@@ -26,6 +26,8 @@ class TestUndercloudConfig(base.TestCase):
     def test_get_base_opts(self):
         ret = self.config.get_base_opts()
         expected = ['additional_architectures',
+                    'artifact_archive_format',
+                    'artifact_store',
                     'auth_token_lifetime',
                     'certificate_generation_ca',
                     'clean_nodes',
@@ -82,6 +84,8 @@ class TestUndercloudConfig(base.TestCase):
     def test_get_opts(self):
         ret = self.config.get_opts()
         expected = ['additional_architectures',
+                    'artifact_archive_format',
+                    'artifact_store',
                     'auth_token_lifetime',
                     'certificate_generation_ca',
                     'clean_nodes',
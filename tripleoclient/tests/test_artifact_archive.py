@@ -0,0 +1,205 @@
+#   Copyright 2020 Red Hat, Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+import json
+import mock
+import os
+import shutil
+import tarfile
+import tempfile
+
+from unittest import TestCase
+
+from tripleoclient import artifact_archive
+from tripleoclient import utils
+
+
+class ArtifactsTestCase(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.output_dir = os.path.join(self.tmp, 'output')
+        self.tht_dir = os.path.join(self.output_dir, 'tripleo-heat-templates')
+        self._write(self.tht_dir, 'overcloud.yaml', 'overcloud')
+        self._write(self.tht_dir, 'puppet/role.yaml', 'role')
+        os.symlink('overcloud.yaml', os.path.join(self.tht_dir, 'link.yaml'))
+        self.ansible_dir = os.path.join(self.tmp, 'ansible')
+        self._write(self.ansible_dir, 'inventory.yaml', 'inventory')
+
+    def _write(self, path, name, content):
+        path = os.path.join(path, name)
+        if not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def _read(self, path, name):
+        with open(os.path.join(path, name)) as f:
+            return f.read()
+
+
+class TestWriteArchive(ArtifactsTestCase):
+    def _members(self, filename):
+        with tarfile.open(filename) as tf:
+            return sorted(tf.getnames())
+
+    @mock.patch('shutil.which', return_value=None)
+    def test_tarfile(self, mock_which):
+        filename = os.path.join(self.tmp, 'artifacts.tar.gz')
+        artifact_archive.write_archive(filename, 'gzip', [self.tht_dir])
+        mock_which.assert_called_once_with('pigz')
+        self.assertIn(self.tht_dir[1:] + '/puppet/role.yaml',
+                      self._members(filename))
+
+    @mock.patch('shutil.which', return_value=None)
+    def test_no_compressor(self, mock_which):
+        self.assertRaises(RuntimeError, artifact_archive.write_archive,
+                          os.path.join(self.tmp, 'artifacts.tar.zst'),
+                          'zstd', [self.tht_dir])
+
+    @mock.patch('shutil.which', side_effect=lambda i: '/usr/bin/' + i)
+    def test_compressor(self, mock_which):
+        self.assertEqual(['/usr/bin/xz', '-c', '-T4'],
+                         artifact_archive._compressor('xz', 4))
+        self.assertEqual(['/usr/bin/lbzip2', '-c', '-n2'],
+                         artifact_archive._compressor('bzip2', 2))
+
+    @mock.patch('tripleoclient.artifact_archive._compressor',
+                return_value=['cat'])
+    def test_external_compressor(self, mock_compressor):
+        filename = os.path.join(self.tmp, 'artifacts.tar')
+
+        def remove_leading_path(info):
+            info.name = info.name.replace(self.output_dir[1:] + '/', '')
+            return info
+
+        artifact_archive.write_archive(filename, 'zstd',
+                                       [self.tht_dir, self.ansible_dir],
+                                       tar_filter=remove_leading_path,
+                                       threads=3)
+        mock_compressor.assert_called_once_with('zstd', 3)
+        members = self._members(filename)
+        self.assertIn('tripleo-heat-templates/link.yaml', members)
+        self.assertIn(self.ansible_dir[1:] + '/inventory.yaml', members)
+
+    @mock.patch('tripleoclient.artifact_archive._compressor',
+                return_value=['false'])
+    def test_external_compressor_failed(self, mock_compressor):
+        self.assertRaises(RuntimeError, artifact_archive.write_archive,
+                          os.path.join(self.tmp, 'artifacts.tar.zst'),
+                          'zstd', [self.tht_dir])
+
+
+class TestArtifactStore(ArtifactsTestCase):
+    def setUp(self):
+        super(TestArtifactStore, self).setUp()
+        self.store = artifact_archive.ArtifactStore(
+            os.path.join(self.tmp, 'store'))
+
+    def _objects(self):
+        return sorted(name for root, dirs, files
+                      in os.walk(self.store.objects_dir) for name in files)
+
+    def _add(self, name):
+        return self.store.add(name, {self.tht_dir: 'tripleo-heat-templates',
+                                     self.ansible_dir: 'ansible'})
+
+    def test_add(self):
+        manifest_path = self._add('first')
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        entries = {i['path']: i for i in manifest['entries']}
+        self.assertEqual(
+            ['ansible', 'ansible/inventory.yaml', 'tripleo-heat-templates',
+             'tripleo-heat-templates/link.yaml',
+             'tripleo-heat-templates/overcloud.yaml',
+             'tripleo-heat-templates/puppet',
+             'tripleo-heat-templates/puppet/role.yaml'],
+            sorted(entries))
+        self.assertEqual({'path': 'tripleo-heat-templates/link.yaml',
+                          'type': 'symlink', 'target': 'overcloud.yaml'},
+                         entries['tripleo-heat-templates/link.yaml'])
+        self.assertEqual(3, len(self._objects()))
+
+    def test_dedupe(self):
+        self._add('first')
+        self._write(self.tht_dir, 'puppet/role.yaml', 'changed')
+        self._add('second')
+        self.assertEqual(4, len(self._objects()))
+        self.assertEqual(['first.json', 'second.json'],
+                         sorted(os.listdir(self.store.manifests_dir)))
+
+    def test_extract(self):
+        manifest_path = self._add('first')
+        self._write(self.tht_dir, 'overcloud.yaml', 'changed')
+        dest = os.path.join(self.tmp, 'dest')
+        self.store.extract(manifest_path, dest)
+        tht_dir = os.path.join(dest, 'tripleo-heat-templates')
+        self.assertEqual('overcloud', self._read(tht_dir, 'link.yaml'))
+        self.assertTrue(os.path.islink(os.path.join(tht_dir, 'link.yaml')))
+        self.assertEqual('role', self._read(tht_dir, 'puppet/role.yaml'))
+        self.assertEqual('inventory',
+                         self._read(dest, 'ansible/inventory.yaml'))
+
+    def test_prune(self):
+        self.store.max_manifests = 1
+        first = self._add('first')
+        os.utime(first, (0, 0))
+        self._write(self.tht_dir, 'overcloud.yaml', 'changed')
+        self._add('second')
+        self.assertEqual(['second.json'],
+                         os.listdir(self.store.manifests_dir))
+        self.assertEqual(3, len(self._objects()))
+
+
+class TestArchiveDeployArtifacts(ArtifactsTestCase):
+    def setUp(self):
+        super(TestArchiveDeployArtifacts, self).setUp()
+        home = mock.patch('tripleoclient.constants.CLOUD_HOME_DIR', self.tmp)
+        home.start()
+        self.addCleanup(home.stop)
+        self.log = mock.Mock()
+
+    @mock.patch('tripleoclient.artifact_archive.write_archive', autospec=True)
+    def test_archive(self, mock_write):
+        filename = utils.archive_deploy_artifacts(
+            self.log, 'undercloud', self.tht_dir, self.ansible_dir,
+            self.output_dir, archive_format='xz')
+        self.assertTrue(filename.startswith(
+            os.path.join(self.tmp, 'undercloud-install-')))
+        self.assertTrue(filename.endswith('.tar.xz'))
+        mock_write.assert_called_once_with(
+            filename, 'xz', [self.tht_dir, self.ansible_dir],
+            tar_filter=mock.ANY)
+
+    @mock.patch('tripleoclient.artifact_archive.write_archive', autospec=True,
+                side_effect=RuntimeError('No zstd compressor found'))
+    def test_archive_failed(self, mock_write):
+        utils.archive_deploy_artifacts(
+            self.log, 'undercloud', self.tht_dir, archive_format='zstd')
+        self.assertTrue(self.log.warning.called)
+
+    @mock.patch('tripleoclient.artifact_archive.write_archive', autospec=True)
+    def test_store(self, mock_write):
+        store = mock.Mock()
+        self.assertIsNone(utils.archive_deploy_artifacts(
+            self.log, 'undercloud', self.tht_dir, self.ansible_dir,
+            self.output_dir, archive_format='none', store=store))
+        mock_write.assert_not_called()
+        store.add.assert_called_once_with(mock.ANY, {
+            self.tht_dir: 'tripleo-heat-templates',
+            self.ansible_dir: self.ansible_dir[1:]
+        })
@@ -0,0 +1,142 @@
+#   Copyright 2020 Red Hat, Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+import mock
+import os
+import shutil
+import tempfile
+
+from heatclient.common import template_utils
+from unittest import TestCase
+
+from tripleoclient import environment_cache
+from tripleoclient import utils
+
+
+class TestEnvironmentCache(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.cache = environment_cache.EnvironmentCache(
+            path=os.path.join(self.tmp, 'cache', 'environments.sqlite'),
+            max_entries=10
+        )
+        self.addCleanup(self.cache.close)
+        self.tht_root = self._templates('templates-0')
+
+    def _write(self, path, content):
+        with open(path, 'w') as f:
+            f.write(content)
+
+    def _templates(self, name):
+        tht_root = os.path.join(self.tmp, name)
+        os.makedirs(os.path.join(tht_root, 'environments'))
+        self._write(os.path.join(tht_root, 'environments', 'env.yaml'),
+                    'resource_registry:\n'
+                    '  OS::TripleO::Foo: ../foo.yaml\n'
+                    'parameter_defaults:\n'
+                    '  Foo: bar\n')
+        self._write(os.path.join(tht_root, 'foo.yaml'),
+                    'heat_template_version: rocky\n'
+                    'resources:\n'
+                    '  config:\n'
+                    '    type: OS::Heat::Value\n'
+                    '    properties:\n'
+                    '      value: {get_file: foo.sh}\n')
+        self._write(os.path.join(tht_root, 'foo.sh'), 'echo foo\n')
+        return tht_root
+
+    def _env(self, tht_root):
+        return os.path.join(tht_root, 'environments', 'env.yaml')
+
+    def _process(self, tht_root):
+        files, env = template_utils.process_environment_and_files(
+            env_path=self._env(tht_root))
+        self.cache.set(self._env(tht_root), tht_root, files, env)
+        return files, env
+
+    def test_get_unknown(self):
+        self.assertIsNone(self.cache.get(self._env(self.tht_root),
+                                         self.tht_root))
+
+    def test_private_database(self):
+        self._process(self.tht_root)
+        self.assertEqual(0o600, os.stat(self.cache.path).st_mode & 0o777)
+        self.assertEqual(
+            0o700, os.stat(os.path.dirname(self.cache.path)).st_mode & 0o777)
+
+    def test_set_get(self):
+        files, env = self._process(self.tht_root)
+        self.assertEqual(
+            (files, env),
+            self.cache.get(self._env(self.tht_root), self.tht_root)
+        )
+        self.assertIsNone(self.cache.get(self._env(self.tht_root),
+                                         self.tht_root,
+                                         include_env_in_files=True))
+
+    def test_rebase(self):
+        self._process(self.tht_root)
+        tht_root = os.path.join(self.tmp, 'templates-1')
+        shutil.copytree(self.tht_root, tht_root)
+        expected = template_utils.process_environment_and_files(
+            env_path=self._env(tht_root))
+        self.assertEqual(
+            expected,
+            self.cache.get(self._env(tht_root), tht_root)
+        )
+
+    def test_referenced_file_changed(self):
+        self._process(self.tht_root)
+        self._write(os.path.join(self.tht_root, 'foo.sh'), 'echo bar\n')
+        self.assertIsNone(self.cache.get(self._env(self.tht_root),
+                                         self.tht_root))
+
+    def test_environment_changed(self):
+        self._process(self.tht_root)
+        self._write(self._env(self.tht_root),
+                    'parameter_defaults:\n  Foo: baz\n')
+        self.assertIsNone(self.cache.get(self._env(self.tht_root),
+                                         self.tht_root))
+
+    def test_same_content_rewritten(self):
+        files, env = self._process(self.tht_root)
+        path = os.path.join(self.tht_root, 'foo.sh')
+        self._write(path, 'echo foo\n')
+        os.utime(path, (0, 0))
+        self.assertEqual(
+            (files, env),
+            self.cache.get(self._env(self.tht_root), self.tht_root)
+        )
+
+    def test_not_json(self):
+        self.cache.set(self._env(self.tht_root), self.tht_root, {},
+                       {'parameter_defaults': {'Foo': {1: 'one'}}})
+        self.assertIsNone(self.cache.get(self._env(self.tht_root),
+                                         self.tht_root))
+
+    def test_process_multiple_environments(self):
+        expected = utils.process_multiple_environments(
+            [self._env(self.tht_root)], self.tht_root, self.tht_root,
+            cache=self.cache)
+        with mock.patch('heatclient.common.template_utils.'
+                        'process_environment_and_files') as mock_process:
+            self.assertEqual(
+                expected,
+                utils.process_multiple_environments(
+                    [self._env(self.tht_root)], self.tht_root,
+                    self.tht_root, cache=self.cache)
+            )
+            mock_process.assert_not_called()
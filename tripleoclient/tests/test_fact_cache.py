@@ -0,0 +1,95 @@
+#   Copyright 2020 Red Hat, Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+import mock
+import os
+import shutil
+import tempfile
+
+from unittest import TestCase
+
+from tripleoclient import fact_cache
+
+
+class TestFactCache(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.path = os.path.join(self.tmp, 'cache', 'facts.sqlite')
+        self.cache = fact_cache.FactCache(path=self.path, timeout=60,
+                                          max_hosts=2)
+        self.addCleanup(self.cache.close)
+
+    def _reopen(self):
+        self.cache.close()
+        return fact_cache.FactCache(path=self.path, timeout=60, max_hosts=2)
+
+    def test_set_get(self):
+        facts = {'ansible_hostname': 'node-0', 'ansible_processor_vcpus': 4}
+        self.cache.set('node-0', facts)
+        self.assertEqual(facts, self.cache.get('node-0'))
+        self.assertIsNone(self.cache.get('node-1'))
+        cache = self._reopen()
+        self.assertEqual(facts, cache.get('node-0'))
+        self.assertEqual(['node-0'], cache.keys())
+        self.assertTrue(cache.contains('node-0'))
+        self.assertFalse(cache.contains('node-1'))
+
+    def _age(self, cache, host, seconds):
+        with cache.conn:
+            cache.conn.execute(
+                'UPDATE facts SET created = created - ?,'
+                ' accessed = accessed - ? WHERE key = ?',
+                (seconds / 86400.0, seconds / 86400.0, host))
+
+    def test_expiration(self):
+        self.cache.set('node-0', {'a': 1})
+        self.cache.set('node-1', {'b': 2})
+        self._age(self.cache, 'node-0', 70)
+        self._age(self.cache, 'node-1', 40)
+        cache = self._reopen()
+        self.assertIsNone(cache.get('node-0'))
+        self.assertFalse(cache.contains('node-0'))
+        self.assertEqual(['node-1'], cache.keys())
+        self.assertEqual({'b': 2}, cache.get('node-1'))
+        cache.close()
+
+    def test_eviction(self):
+        for i in range(3):
+            self.cache.set('node-{}'.format(i), {'i': i})
+            self._age(self.cache, 'node-{}'.format(i), 10 - i)
+        self.assertEqual(['node-1', 'node-2'], self.cache.keys())
+        # node-1 is used, node-2 becomes the least recently used host.
+        cache = self._reopen()
+        cache.get('node-1')
+        cache.set('node-3', {'i': 3})
+        self.assertEqual(['node-1', 'node-3'], cache.keys())
+        cache.close()
+
+    def test_delete_flush(self):
+        self.cache.set('node-0', {'a': 1})
+        self.cache.set('node-1', {'b': 2})
+        self.cache.delete('node-0')
+        self.assertEqual({'node-1': {'b': 2}}, self.cache.copy())
+        self.cache.flush()
+        self.assertEqual([], self.cache.keys())
+        self.assertIsNone(self.cache.get('node-1'))
+
+    def test_forked_process(self):
+        self.cache.set('node-0', {'a': 1})
+        conn = self.cache.conn
+        with mock.patch('os.getpid', return_value=-1):
+            self.assertIsNot(conn, self.cache.conn)
+            self.assertEqual({'a': 1}, self.cache.get('node-0'))
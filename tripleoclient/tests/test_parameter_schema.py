@@ -0,0 +1,136 @@
+#   Copyright 2020 Red Hat, Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+import mock
+import os
+import shutil
+import tempfile
+
+from unittest import TestCase
+
+from tripleoclient import parameter_schema
+from tripleoclient import resource_tree
+
+
+class TestParameterSchema(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.tht_root = os.path.join(self.tmp, 'tht')
+        self.cache_dir = os.path.join(self.tmp, 'cache')
+        self._write('overcloud.yaml', (
+            "heat_template_version: rocky\n"
+            "parameters:\n"
+            "  ControllerCount:\n"
+            "    type: number\n"
+            "    default: 1\n"
+            "  Foo:\n"
+            "    type: string\n"
+            "    default: foo\n"
+            "    tags:\n"
+            "      - role_specific\n"))
+        self._write('deployment/bar.yaml', (
+            "heat_template_version: rocky\n"
+            "parameters:\n"
+            "  Foo:\n"
+            "    type: json\n"
+            "    default: bar\n"
+            "    tags:\n"
+            "      - other\n"
+            "  Bar:\n"
+            "    type: string\n"
+            "parameter_groups:\n"
+            "  - label: deprecated\n"
+            "    parameters:\n"
+            "      - Bar\n"))
+        self._write('environments/env.yaml', (
+            "parameter_defaults:\n"
+            "  Baz: baz\n"))
+        self._write('overcloud.j2.yaml', (
+            "{% for role in roles %}\n"
+            "  {{role.name}}Count: 1\n"
+            "{% endfor %}\n"))
+        self._write('tools/tool.yaml', (
+            "heat_template_version: rocky\n"
+            "parameters:\n"
+            "  Tool:\n"
+            "    type: string\n"))
+
+    def _write(self, name, content):
+        path = os.path.join(self.tht_root, name)
+        if not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as f:
+            f.write(content)
+
+    def _cache(self, **kwargs):
+        return parameter_schema.ParameterSchemaCache(self.cache_dir, **kwargs)
+
+    def test_build_schema(self):
+        schema = parameter_schema.build_schema(self.tht_root)
+        self.assertEqual(['ControllerCount', 'Foo', 'Bar'],
+                         list(schema['parameters']))
+        self.assertEqual({'name': 'Foo', 'type': 'string', 'default': 'foo',
+                          'tags': ['role_specific', 'other']},
+                         schema['parameters']['Foo'])
+        self.assertEqual({'name': 'Bar', 'type': 'string'},
+                         schema['parameters']['Bar'])
+        self.assertEqual(['deployment/bar.yaml'], list(schema['resources']))
+
+        tree = resource_tree.ResourceTree(schema)
+        self.assertEqual(['Bar'], tree.get_grouped_parameters('deprecated'))
+        self.assertEqual(['Foo'], tree.get_tagged_parameters('role_specific'))
+        self.assertEqual(1, tree.get_role_count('Controller'))
+
+    def test_get(self):
+        schema = self._cache().get(self.tht_root)
+        self.assertEqual(parameter_schema.build_schema(self.tht_root),
+                         schema)
+        self.assertEqual(1, len(os.listdir(self.cache_dir)))
+        with mock.patch.object(parameter_schema, 'build_schema') as mock_b:
+            self.assertEqual(schema, self._cache().get(self.tht_root))
+            mock_b.assert_not_called()
+
+    def test_get_copy(self):
+        schema = self._cache().get(self.tht_root)
+        copy_root = os.path.join(self.tmp, 'copy')
+        shutil.copytree(self.tht_root, copy_root)
+        with mock.patch.object(parameter_schema, 'build_schema') as mock_b:
+            self.assertEqual(schema, self._cache().get(copy_root))
+            mock_b.assert_not_called()
+
+    def test_get_changed(self):
+        self._cache().get(self.tht_root)
+        self._write('deployment/baz.yaml', (
+            "heat_template_version: rocky\n"
+            "parameters:\n"
+            "  Baz:\n"
+            "    type: string\n"))
+        schema = self._cache().get(self.tht_root)
+        self.assertIn('Baz', schema['parameters'])
+        self.assertEqual(2, len(os.listdir(self.cache_dir)))
+
+    def test_max_entries(self):
+        cache = self._cache(max_entries=1)
+        cache.get(self.tht_root)
+        self._write('deployment/baz.yaml', 'heat_template_version: rocky\n')
+        cache.get(self.tht_root)
+        self.assertEqual(1, len(os.listdir(self.cache_dir)))
+
+    def test_unwritable(self):
+        with open(self.cache_dir, 'w'):
+            pass
+        schema = self._cache().get(self.tht_root)
+        self.assertIn('Foo', schema['parameters'])
@@ -0,0 +1,104 @@
+#   Copyright 2020 Red Hat, Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+import json
+import mock
+import os
+import shutil
+import tempfile
+
+from unittest import TestCase
+
+from tripleoclient import phase_profiler
+
+
+class TestPhaseProfiler(TestCase):
+    def setUp(self):
+        self.times = [(0, 0, 0)]
+        times = mock.patch.object(phase_profiler.PhaseProfiler, '_times',
+                                  side_effect=self._times)
+        times.start()
+        self.addCleanup(times.stop)
+        self.profiler = phase_profiler.PhaseProfiler()
+
+    def _times(self):
+        # every call takes 10s of wall time, 2s of CPU time and 1s of CPU
+        # time of the child processes
+        wall, cpu, children_cpu = self.times[-1]
+        self.times.append((wall + 10, cpu + 2, children_cpu + 1))
+        return self.times[-1]
+
+    def test_phases(self):
+        with self.profiler.phase('Deploy templates'):
+            with self.profiler.phase('Render templates'):
+                pass
+            with self.profiler.phase('Heat stack'):
+                pass
+        with self.profiler.phase('Config download'):
+            pass
+
+        report = self.profiler.report()
+        self.assertEqual(90, report['wall'])
+        deploy, config_download = report['phases']
+        self.assertEqual('Deploy templates', deploy['name'])
+        self.assertEqual(
+            {'wall': 50, 'cpu': 10, 'children_cpu': 5},
+            {k: deploy[k] for k in ('wall', 'cpu', 'children_cpu')})
+        self.assertEqual(['Render templates', 'Heat stack'],
+                         [i['name'] for i in deploy['phases']])
+        self.assertEqual(10, deploy['phases'][0]['wall'])
+        self.assertEqual('Config download', config_download['name'])
+        self.assertEqual('successful', config_download['status'])
+
+    def test_failed_phase(self):
+        def fail():
+            with self.profiler.phase('Heat stack'):
+                raise RuntimeError()
+
+        self.assertRaises(RuntimeError, fail)
+        self.assertEqual('failed',
+                         self.profiler.report()['phases'][0]['status'])
+        with self.profiler.phase('Postconfig'):
+            pass
+        self.assertEqual(2, len(self.profiler.report()['phases']))
+
+    def test_disabled(self):
+        profiler = phase_profiler.PhaseProfiler(enabled=False)
+        with profiler.phase('Deploy templates'):
+            pass
+        self.assertEqual([], profiler.phases)
+
+    def test_write(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        with self.profiler.phase('Deploy templates'):
+            pass
+        path = os.path.join(tmp, 'run-data', 'profile.json')
+        self.profiler.write(path)
+        with open(path) as f:
+            report = json.load(f)
+        self.assertEqual(phase_profiler.REPORT_VERSION, report['version'])
+        self.assertEqual(['Deploy templates'],
+                         [i['name'] for i in report['phases']])
+
+    def test_table(self):
+        with self.profiler.phase('Deploy templates'):
+            with self.profiler.phase('Render templates'):
+                pass
+        rows = str(self.profiler.table()).splitlines()
+        self.assertIn('Deploy templates', rows[3])
+        self.assertIn('|   Render templates', rows[4])
+        self.assertIn('20.0 |', rows[4])
+        self.assertIn('Total', rows[5])
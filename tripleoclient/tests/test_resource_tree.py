@@ -0,0 +1,123 @@
+#   Copyright 2020 Red Hat, Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+from unittest import TestCase
+
+from tripleo_common.utils import stack as stack_utils
+
+from tripleoclient import resource_tree
+
+
+class TestResourceTree(TestCase):
+    def setUp(self):
+        validate = {
+            'Description': 'Root',
+            'Parameters': {
+                'ControllerCount': {'Default': 1, 'Type': 'Number'},
+                'ComputeCount': {'Default': 0, 'Type': 'Number'},
+                'Count': {'Default': 3, 'Type': 'Number'},
+                'Foo': {'Type': 'String', 'Tags': ['role_specific']}
+            },
+            'NestedParameters': {
+                'Controller': {
+                    'Type': 'OS::TripleO::Controller',
+                    'Parameters': {
+                        'Foo': {'Type': 'String',
+                                'Tags': ['role_specific']},
+                        'Bar': {'Type': 'String',
+                                'Tags': ['role_specific', 'other']}
+                    },
+                    'ParameterGroups': [
+                        {'label': 'deprecated',
+                         'parameters': ['Bar', 'Baz']}
+                    ],
+                    'NestedParameters': {
+                        'ControllerServices': {
+                            'Type': 'OS::TripleO::Services',
+                            'ParameterGroups': [
+                                {'label': 'other',
+                                 'parameters': ['Foo']},
+                                {'label': 'deprecated',
+                                 'parameters': ['Baz', 'Qux']}
+                            ]
+                        }
+                    }
+                },
+                'Compute': {'Type': 'OS::TripleO::Compute'}
+            }
+        }
+        self.flattened = {'resources': {}, 'parameters': {}}
+        stack_utils._flat_it(self.flattened, 'Root', validate)
+        self.tree = resource_tree.ResourceTree(self.flattened)
+
+    def test_empty(self):
+        for tree in (resource_tree.ResourceTree(),
+                     resource_tree.ResourceTree.from_stack_data({}),
+                     resource_tree.ResourceTree.from_stack_data(None)):
+            self.assertIsNone(tree.root)
+            self.assertEqual([], list(tree.walk()))
+            self.assertEqual([], tree.get_tagged_parameters('role_specific'))
+            self.assertEqual([], tree.get_grouped_parameters('deprecated'))
+            self.assertEqual(0, tree.get_role_count('Controller'))
+
+    def test_from_stack_data(self):
+        tree = resource_tree.ResourceTree.from_stack_data(
+            {'heat_resource_tree': self.flattened})
+        self.assertIs(self.flattened['parameters'], tree.parameters)
+        self.assertIs(self.flattened['resources'], tree.resources)
+
+    def test_get_parameter(self):
+        self.assertEqual('Number',
+                         self.tree.get_parameter('ControllerCount')['type'])
+        self.assertIsNone(self.tree.get_parameter('Missing'))
+
+    def test_tagged_parameters(self):
+        self.assertEqual(['Foo', 'Bar'],
+                         self.tree.get_tagged_parameters('role_specific'))
+        self.assertEqual(['Bar'], self.tree.get_tagged_parameters('other'))
+        self.assertEqual([], self.tree.get_tagged_parameters('missing'))
+
+    def test_grouped_parameters(self):
+        self.assertEqual(
+            ['Bar', 'Baz', 'Qux'],
+            sorted(self.tree.get_grouped_parameters('deprecated')))
+        self.assertEqual(['Foo'], self.tree.get_grouped_parameters('other'))
+        self.assertEqual(2, len(
+            self.tree.parameter_groups_by_label['deprecated']))
+
+    def test_role_counts(self):
+        self.assertEqual({'Controller': 1, 'Compute': 0},
+                         dict(self.tree.role_counts))
+        self.assertEqual(1, self.tree.get_role_count('Controller'))
+        self.assertEqual(0, self.tree.get_role_count('Compute'))
+        self.assertEqual(0, self.tree.get_role_count('Missing'))
+
+    def test_role_counts_not_a_number(self):
+        self.flattened['parameters'].update({
+            'NodeCount': {'default': 'all', 'type': 'String'},
+            'PoolCount': {'default': ['1'], 'type': 'CommaDelimitedList'}})
+        tree = resource_tree.ResourceTree(self.flattened)
+        self.assertEqual({'Controller': 1, 'Compute': 0},
+                         dict(tree.role_counts))
+
+    def test_walk(self):
+        self.assertEqual('Root', self.tree.root['name'])
+        self.assertEqual(
+            ['Root', 'Controller', 'ControllerServices', 'Compute'],
+            [r['name'] for r in self.tree.walk()])
+        controller = [r for r in self.tree.get_nested_resources(
+            self.tree.root)][0]
+        self.assertEqual(['Controller', 'ControllerServices'],
+                         [r['name'] for r in self.tree.walk(controller)])
@@ -0,0 +1,72 @@
+#   Copyright 2020 Red Hat, Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+import mock
+import os
+import shutil
+import tempfile
+
+from unittest import TestCase
+
+from tripleoclient import sqlite_cache
+
+
+class TestSQLiteCache(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.path = os.path.join(self.tmp, 'cache', 'entries.sqlite')
+        self.cache = sqlite_cache.SQLiteCache(self.path, max_entries=2)
+        self.addCleanup(self.cache.close)
+
+    def test_set_get_many(self):
+        self.cache.set_many({'a': 'foo', 'b': 'bar'})
+        self.assertEqual({'a': 'foo', 'b': 'bar'},
+                         self.cache.get_many(['a', 'b', 'c']))
+        self.assertEqual(0o600, os.stat(self.path).st_mode & 0o777)
+
+    @mock.patch.object(sqlite_cache, 'MAX_QUERY_KEYS', 1)
+    def test_get_many_chunked(self):
+        self.cache.set_many({'a': 'foo', 'b': 'bar'})
+        self.assertEqual({'a': 'foo', 'b': 'bar'},
+                         self.cache.get_many(['a', 'b']))
+
+    def test_least_recently_used(self):
+        self.cache.set_many({'a': 'foo', 'b': 'bar'})
+        with self.cache.conn:
+            self.cache.conn.execute(
+                "UPDATE entries SET accessed = julianday('now') - 1")
+        self.cache.get('a')
+        self.cache.set('c', 'baz')
+        self.assertEqual(['a', 'c'], self.cache.keys())
+
+    def test_expired(self):
+        cache = sqlite_cache.SQLiteCache(self.path, timeout=60)
+        self.addCleanup(cache.close)
+        cache.set_many({'a': 'foo', 'b': 'bar'})
+        with cache.conn:
+            cache.conn.execute(
+                "UPDATE entries SET created = julianday('now') - 1"
+                " WHERE key = 'a'")
+        self.assertEqual({'b': 'bar'}, cache.get_many(['a', 'b']))
+        self.assertFalse(cache.contains('a'))
+
+    def test_unreadable(self):
+        os.makedirs(self.path)
+        with mock.patch.object(sqlite_cache.LOG, 'warning') as mock_warning:
+            self.cache.set('a', 'foo')
+            self.assertIsNone(self.cache.get('a'))
+            self.assertEqual([], self.cache.keys())
+        self.assertEqual(3, mock_warning.call_count)
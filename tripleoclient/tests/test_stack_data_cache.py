@@ -0,0 +1,211 @@
+#   Copyright 2020 Red Hat, Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+import mock
+import os
+import shutil
+import tempfile
+
+from unittest import TestCase
+
+from tripleoclient import stack_data_cache
+from tripleoclient import utils
+
+
+class TestStackDataCache(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.path = os.path.join(self.tmp, 'cache', 'stack_data.sqlite')
+        self.cache = self._cache()
+        self.template = {'heat_template_version': 'rocky',
+                         'resources': {'Foo': {'type': 'OS::Foo'}}}
+        self.files = {'file:///tht/foo.yaml': 'foo',
+                      'file:///tht/env.yaml': b'env'}
+        self.env_files = ['file:///tht/env.yaml']
+        self.stack_data = {
+            'environment_parameters': {'FooCount': 1},
+            'heat_resource_tree': {
+                'resources': {'Root': {'id': 'Root', 'parameters': []}},
+                'parameters': {'FooCount': {'default': 1}}
+            }
+        }
+
+    def _cache(self, **kwargs):
+        cache = stack_data_cache.StackDataCache(path=self.path, **kwargs)
+        self.addCleanup(cache.close)
+        return cache
+
+    def _key(self):
+        return self.cache.key(self.template, self.files, self.env_files)
+
+    def test_key(self):
+        key = self._key()
+        self.assertEqual(key, stack_data_cache.StackDataCache.key(
+            dict(self.template), dict(reversed(list(self.files.items()))),
+            list(self.env_files)))
+        self.files['file:///tht/foo.yaml'] = 'bar'
+        self.assertNotEqual(key, self._key())
+        self.assertNotEqual(key, self.cache.key(self.template, self.files,
+                                                self.env_files[::-1] + ['x']))
+
+    def test_key_templates_directory(self):
+        files = {'file:///tmp/tht-0/foo.yaml': 'foo',
+                 'file:///tmp/tht-0/env.yaml':
+                     '{"parameter_defaults": {"DeployIdentifier": 1}}'}
+        env_files = ['file:///tmp/tht-0/env.yaml']
+        key = self.cache.key(self.template, files, env_files, '/tmp/tht-0')
+        files = {'file:///tmp/tht-1/foo.yaml': 'foo',
+                 'file:///tmp/tht-1/env.yaml':
+                     '{"parameter_defaults": {"DeployIdentifier": 2}}'}
+        env_files = ['file:///tmp/tht-1/env.yaml']
+        self.assertEqual(key, self.cache.key(self.template, files,
+                                             env_files, '/tmp/tht-1'))
+        self.assertNotEqual(key, self.cache.key(self.template, files,
+                                                env_files))
+        files['file:///tmp/tht-1/env.yaml'] = '{"parameter_defaults": {}}'
+        self.assertNotEqual(key, self.cache.key(self.template, files,
+                                                env_files, '/tmp/tht-1'))
+
+    def test_ignored_parameters(self):
+        files = {
+            'file:///tht/env.yaml':
+                '{"parameter_defaults": {"DeployIdentifier": 1}}',
+            'file:///tht/user.yaml':
+                '{"parameter_defaults": {"DeployIdentifier": 2, "Foo": 3}}',
+            'file:///tht/foo.yaml': 'foo'
+        }
+        self.assertEqual(
+            {'DeployIdentifier': 2},
+            self.cache.ignored_parameters(files, ['file:///tht/env.yaml',
+                                                  'file:///tht/foo.yaml',
+                                                  'file:///tht/user.yaml']))
+
+    def test_get_unknown(self):
+        self.assertIsNone(self.cache.get(self._key()))
+
+    def test_set_get(self):
+        self.cache.set(self._key(), self.stack_data)
+        stack_data = self.cache.get(self._key())
+        self.assertEqual(self.stack_data, stack_data)
+        stack_data['heat_resource_tree']['parameters'].clear()
+        self.assertEqual(self.stack_data, self.cache.get(self._key()))
+
+    def test_persisted(self):
+        self.cache.set(self._key(), self.stack_data)
+        self.assertEqual(self.stack_data, self._cache().get(self._key()))
+
+    def test_rebased(self):
+        self.stack_data['environment_parameters']['FooFile'] = (
+            'file:///tmp/tht-0/foo.yaml')
+        self.cache.set(self._key(), self.stack_data, '/tmp/tht-0')
+        self.assertEqual(self.stack_data,
+                         self.cache.get(self._key(), '/tmp/tht-0'))
+        self.assertEqual(
+            'file:///tmp/tht-1/foo.yaml',
+            self._cache().get(self._key(), '/tmp/tht-1')[
+                'environment_parameters']['FooFile'])
+
+    def test_private_database(self):
+        self.cache.set(self._key(), self.stack_data)
+        self.assertEqual(0o600, os.stat(self.path).st_mode & 0o777)
+
+    def test_memory(self):
+        cache = stack_data_cache.StackDataCache()
+        cache.set(self._key(), self.stack_data)
+        self.assertEqual(self.stack_data, cache.get(self._key()))
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_expired(self):
+        self.cache.set(self._key(), self.stack_data)
+        self.cache.conn.execute(
+            "UPDATE stack_data SET created = created - 2 * 86400")
+        self.cache.conn.commit()
+        self.assertEqual(self.stack_data, self._cache().get(self._key()))
+        self.assertIsNone(self._cache(timeout=86400).get(self._key()))
+
+    def test_max_entries(self):
+        cache = self._cache(max_entries=2)
+        for i in range(3):
+            cache.set(str(i), self.stack_data)
+        self.assertEqual(2, cache.conn.execute(
+            'SELECT COUNT(*) FROM stack_data').fetchone()[0])
+        self.assertIsNone(self._cache().get('0'))
+
+    def test_not_json(self):
+        self.cache.set(self._key(), {'heat_resource_tree': {1: 'foo'}})
+        self.cache.set('other', {'heat_resource_tree': mock.Mock()})
+        self.assertIsNone(self.cache.get(self._key()))
+        self.assertIsNone(self.cache.get('other'))
+
+    def test_unreadable(self):
+        os.makedirs(self.path)
+        self.cache.set(self._key(), self.stack_data)
+        self.assertEqual(self.stack_data, self.cache.get(self._key()))
+        self.assertIsNone(self._cache().get(self._key()))
+
+
+class TestBuildStackData(TestCase):
+    def setUp(self):
+        self.clients = mock.Mock()
+        self.clients.orchestration.stacks.validate.return_value = {
+            'Description': 'Root',
+            'Environment': {'parameter_defaults': {'FooCount': 2}},
+            'Parameters': {'FooCount': {'Default': 2, 'Type': 'Number'}},
+            'NestedParameters': {}
+        }
+        self.template = {'heat_template_version': 'rocky'}
+        self.files = {'file:///tht/env.yaml': 'env'}
+        self.env_files = ['file:///tht/env.yaml']
+
+    def _build(self, cache=None):
+        return utils.build_stack_data(self.clients, 'overcloud',
+                                      self.template, self.files,
+                                      self.env_files, cache=cache)
+
+    def test_build_stack_data(self):
+        stack_data = self._build()
+        self.assertEqual({'FooCount': 2},
+                         stack_data['environment_parameters'])
+        self.assertIn('FooCount',
+                      stack_data['heat_resource_tree']['parameters'])
+        self.clients.orchestration.stacks.validate.assert_called_once_with(
+            template=self.template, files=self.files,
+            environment_files=self.env_files, show_nested=True)
+
+    def test_build_stack_data_cached(self):
+        cache = stack_data_cache.StackDataCache()
+        stack_data = self._build(cache)
+        self.assertEqual(stack_data, self._build(cache))
+        self.clients.orchestration.stacks.validate.assert_called_once()
+        self.files['file:///tht/env.yaml'] = 'changed'
+        self.assertEqual(stack_data['environment_parameters'],
+                         self._build(cache)['environment_parameters'])
+        self.assertEqual(
+            2, self.clients.orchestration.stacks.validate.call_count)
+
+    def test_build_stack_data_new_deploy_identifier(self):
+        cache = stack_data_cache.StackDataCache()
+        self.clients.orchestration.stacks.validate.return_value[
+            'Environment']['parameter_defaults']['DeployIdentifier'] = 1
+        self.files['file:///tht/env.yaml'] = (
+            '{"parameter_defaults": {"DeployIdentifier": 1}}')
+        self._build(cache)
+        self.files['file:///tht/env.yaml'] = (
+            '{"parameter_defaults": {"DeployIdentifier": 2}}')
+        stack_data = self._build(cache)
+        self.clients.orchestration.stacks.validate.assert_called_once()
+        self.assertEqual({'FooCount': 2, 'DeployIdentifier': 2},
+                         stack_data['environment_parameters'])
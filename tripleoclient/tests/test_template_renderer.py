@@ -0,0 +1,240 @@
+#   Copyright 2020 Red Hat, Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+import hashlib
+import jinja2
+import mock
+import os
+import shutil
+import tempfile
+
+from unittest import TestCase
+
+from tripleoclient import exceptions
+from tripleoclient import template_renderer
+from tripleoclient import utils
+
+
+class TestProcessTemplates(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.tht = os.path.join(self.tmp, 'tht')
+        self.cache = template_renderer.RenderCache(
+            os.path.join(self.tmp, 'render_cache.sqlite'))
+        self.addCleanup(self.cache.close)
+
+        self._write('roles_data.yaml', (
+            "- name: Controller\n"
+            "- name: Compute\n"
+            "  tags: [other]\n"))
+        self._write('network_data.yaml', (
+            "- name: InternalApi\n"
+            "- name: Tenant\n"
+            "  name_lower: tenant_net\n"
+            "- name: Management\n"
+            "  enabled: false\n"))
+        self._write('j2_excludes.yaml', (
+            "name:\n"
+            "  - puppet/compute-excluded.yaml\n"))
+        self._write('overcloud.j2.yaml', (
+            "{% for role in roles %}"
+            "{{role.name}}: {{role.tags|join(',')}}\n"
+            "{% endfor %}"
+            "{% for network in networks %}"
+            "{{network.name}}: {{network.idx}}\n"
+            "{% endfor %}"))
+        self._write('puppet/role.role.j2.yaml',
+                    "role: {{role.name}}\nnetworks: {{networks|length}}\n")
+        self._write('puppet/legacy.role.j2.yaml', "role: {{role}}\n")
+        self._write('puppet/excluded.role.j2.yaml', "role: {{role}}\n")
+        self._write('network/ports/port.network.j2.yaml',
+                    "{% include 'port.j2' %}")
+        self._write('network/ports/port.j2',
+                    "port: {{network.name_lower}}\n")
+        self._write('network/network.network.j2.yaml',
+                    "network: {{network.name}}\n")
+        self._write('environments/env.yaml', "parameter_defaults: {}\n")
+        self._write('.hidden/hidden.j2.yaml', "hidden\n")
+
+    def _write(self, name, content):
+        path = os.path.join(self.tht, name)
+        if not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as f:
+            f.write(content)
+
+    def _read(self, name, root=None):
+        with open(os.path.join(root or self.tht, name)) as f:
+            return f.read()
+
+    def _process(self, **kwargs):
+        kwargs.setdefault('cache', self.cache)
+        kwargs.setdefault('log', mock.Mock())
+        return template_renderer.process_templates(
+            self.tht, os.path.join(self.tht, 'roles_data.yaml'),
+            os.path.join(self.tht, 'network_data.yaml'), **kwargs)
+
+    def _assert_rendered(self, root=None):
+        self.assertEqual(
+            'Controller: \nCompute: other,compute\n'
+            'InternalApi: 0\nTenant: 1\nManagement: 2\n',
+            self._read('overcloud.yaml', root))
+        self.assertEqual('role: Controller\nnetworks: 3',
+                         self._read('puppet/controller-role.yaml', root))
+        self.assertEqual('role: Compute',
+                         self._read('puppet/compute-legacy.yaml', root))
+        self.assertTrue(os.path.exists(os.path.join(
+            root or self.tht, 'puppet/controller-excluded.yaml')))
+        self.assertFalse(os.path.exists(os.path.join(
+            root or self.tht, 'puppet/compute-excluded.yaml')))
+        self.assertEqual('port: internalapi',
+                         self._read('network/ports/internalapi.yaml', root))
+        self.assertEqual('port: tenant_net',
+                         self._read('network/ports/tenant_net.yaml', root))
+        self.assertEqual('network: Tenant',
+                         self._read('network/tenant_net.yaml', root))
+        self.assertFalse(os.path.exists(os.path.join(
+            root or self.tht, 'network/management.yaml')))
+        self.assertFalse(os.path.exists(os.path.join(
+            root or self.tht, '.hidden/hidden.yaml')))
+
+    def test_process_templates(self):
+        self.assertEqual((10, 0), self._process())
+        self._assert_rendered()
+
+    def test_output_dir(self):
+        output_dir = os.path.join(self.tmp, 'out')
+        self.assertEqual((10, 0), self._process(output_dir=output_dir))
+        self._assert_rendered(output_dir)
+        self.assertEqual('parameter_defaults: {}\n',
+                         self._read('environments/env.yaml', output_dir))
+        self.assertFalse(os.path.exists(
+            os.path.join(self.tht, 'overcloud.yaml')))
+
+    def test_cached(self):
+        self._process()
+        os.remove(os.path.join(self.tht, 'overcloud.yaml'))
+        with mock.patch.object(template_renderer, '_render') as mock_render:
+            self.assertEqual((10, 10), self._process())
+            mock_render.assert_not_called()
+        self._assert_rendered()
+
+    def test_stale(self):
+        self._process()
+        self._write('roles_data.yaml', (
+            "- name: Controller\n"
+            "- name: Compute\n"
+            "  tags: [other, more]\n"))
+        # overcloud.yaml and the Compute role template, the legacy role
+        # templates are only rendered with the role names
+        self.assertEqual((10, 8), self._process())
+        self.assertEqual('Controller: \nCompute: other,more,compute\n'
+                         'InternalApi: 0\nTenant: 1\nManagement: 2\n',
+                         self._read('overcloud.yaml'))
+
+    def test_stale_include(self):
+        self._process()
+        self._write('network/ports/port.j2', "new: {{network.name}}\n")
+        self.assertEqual((10, 8), self._process())
+        self.assertEqual('new: Tenant',
+                         self._read('network/ports/tenant_net.yaml'))
+
+    def test_parallel(self):
+        with mock.patch.object(template_renderer,
+                               'PARALLEL_MIN_RENDERINGS', 1):
+            self.assertEqual((10, 0), self._process(cache=None, workers=2))
+        self._assert_rendered()
+
+    def test_render_error(self):
+        self._write('broken.j2.yaml', "{% if %}")
+        self.assertRaises(jinja2.TemplateError, self._process)
+
+    def test_default_network_data(self):
+        self.assertEqual(
+            os.path.join(self.tht, 'network_data.yaml'),
+            template_renderer.default_network_data(self.tht))
+        self._write('network-data-samples/default-network-isolation.yaml',
+                    '[]')
+        self.assertEqual(
+            os.path.join(self.tht, 'network-data-samples',
+                         'default-network-isolation.yaml'),
+            template_renderer.default_network_data(self.tht))
+
+    def test_is_known_process_templates(self):
+        self.assertFalse(
+            template_renderer.is_known_process_templates(self.tht))
+        self._write('tools/process-templates.py', '# a script\n')
+        self.assertFalse(
+            template_renderer.is_known_process_templates(self.tht))
+        with mock.patch.object(
+                template_renderer, 'KNOWN_PROCESS_TEMPLATES',
+                frozenset([hashlib.sha256(b'# a script\n').hexdigest()])):
+            self.assertTrue(
+                template_renderer.is_known_process_templates(self.tht))
+
+
+class TestJinjaRenderFiles(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        cache = mock.patch(
+            'tripleoclient.utils.get_render_cache',
+            return_value=template_renderer.RenderCache(
+                os.path.join(self.tmp, 'render_cache.sqlite')))
+        cache.start()
+        self.addCleanup(cache.stop)
+        self.log = mock.Mock()
+
+    @mock.patch('tripleoclient.template_renderer.'
+                'is_known_process_templates', return_value=True)
+    @mock.patch('tripleoclient.template_renderer.process_templates',
+                autospec=True, return_value=(2, 1))
+    def test_jinja_render_files(self, mock_process, mock_known):
+        utils.jinja_render_files(self.log, '/tht', '/work',
+                                 roles_file='/roles.yaml',
+                                 base_path='/tht-copy')
+        mock_process.assert_called_once_with(
+            '/tht-copy', '/roles.yaml',
+            '/tht-copy/network-data-samples/default-network-isolation.yaml',
+            output_dir=None, templates_root='/tht', cache=mock.ANY,
+            workers=mock.ANY, log=self.log)
+
+    @mock.patch('tripleoclient.template_renderer.'
+                'is_known_process_templates', return_value=True)
+    def test_jinja_render_files_error(self, mock_known):
+        self.assertRaises(exceptions.DeploymentError,
+                          utils.jinja_render_files, self.log, self.tmp,
+                          self.tmp)
+
+    @mock.patch('tripleoclient.utils.run_command_and_log', autospec=True,
+                return_value=0)
+    @mock.patch('tripleoclient.template_renderer.process_templates',
+                autospec=True)
+    def test_jinja_render_files_unknown_script(self, mock_process,
+                                               mock_run):
+        tools = os.path.join(self.tmp, 'tools')
+        os.mkdir(tools)
+        with open(os.path.join(tools, 'process-templates.py'), 'w') as f:
+            f.write('# a newer script\n')
+        utils.jinja_render_files(self.log, self.tmp, '/work',
+                                 roles_file='/roles.yaml',
+                                 base_path='/tht-copy')
+        self.assertFalse(mock_process.called)
+        mock_run.assert_called_once_with(
+            self.log,
+            [mock.ANY, os.path.join(tools, 'process-templates.py'),
+             '--roles-data', '/roles.yaml', '-p', '/tht-copy'],
+            '/work')
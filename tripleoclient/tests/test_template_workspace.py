@@ -0,0 +1,134 @@
+#   Copyright 2020 Red Hat, Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+import mock
+import os
+import shutil
+import tempfile
+
+from unittest import TestCase
+
+from tripleoclient import exceptions
+from tripleoclient import template_workspace
+from tripleoclient import utils
+
+
+class TestTemplateWorkspace(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.templates = os.path.join(self.tmp, 'tht')
+        self.workspace = template_workspace.TemplateWorkspace(
+            os.path.join(self.tmp, 'workspace'))
+        self._write(self.templates, 'overcloud.j2.yaml', 'foo')
+        self._write(self.templates, 'roles_data.yaml', 'roles')
+        os.symlink('overcloud.j2.yaml',
+                   os.path.join(self.templates, 'link.yaml'))
+        self.log = mock.Mock()
+
+        render = mock.patch('tripleoclient.utils.jinja_render_files',
+                            autospec=True, side_effect=self._render)
+        self.mock_render = render.start()
+        self.addCleanup(render.stop)
+
+    def _write(self, path, name, content):
+        path = os.path.join(path, name)
+        if not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def _read(self, path, name):
+        with open(os.path.join(path, name)) as f:
+            return f.read()
+
+    def _render(self, log, templates, working_dir, roles_file=None,
+                networks_file=None, base_path=None, output_dir=None):
+        self._write(working_dir, 'overcloud.yaml',
+                    self._read(working_dir, 'overcloud.j2.yaml') + ' rendered')
+
+    def _render_templates(self, name, **kwargs):
+        dest = os.path.join(self.tmp, name, 'tripleo-heat-templates')
+        utils.render_templates(self.log, self.templates, dest,
+                               workspace=self.workspace, **kwargs)
+        return dest
+
+    def test_key(self):
+        key = self.workspace.key(self.templates)
+        copy = os.path.join(self.tmp, 'copy')
+        shutil.copytree(self.templates, copy, symlinks=True)
+        self.assertEqual(key, self.workspace.key(copy))
+
+        roles_file = self._write(self.tmp, 'roles.yaml', 'roles')
+        self.assertNotEqual(key, self.workspace.key(self.templates,
+                                                    roles_file=roles_file))
+        self._write(self.templates, 'overcloud.j2.yaml', 'bar')
+        self.assertNotEqual(key, self.workspace.key(self.templates))
+
+    def test_render_templates(self):
+        dest = self._render_templates('first')
+        self.assertEqual('foo rendered', self._read(dest, 'overcloud.yaml'))
+        self.assertTrue(os.path.islink(os.path.join(dest, 'link.yaml')))
+        self.assertEqual(1, self.mock_render.call_count)
+
+        dest = self._render_templates('second')
+        self.assertEqual('foo rendered', self._read(dest, 'overcloud.yaml'))
+        self.assertEqual(1, self.mock_render.call_count)
+        self.assertEqual(1, len(os.listdir(self.workspace.path)))
+
+        # the deployments do not modify the stored tree
+        self._write(dest, 'overcloud.yaml', 'changed')
+        dest = self._render_templates('third')
+        self.assertEqual('foo rendered', self._read(dest, 'overcloud.yaml'))
+
+    def test_render_templates_changed(self):
+        self._render_templates('first')
+        self._write(self.templates, 'overcloud.j2.yaml', 'bar')
+        dest = self._render_templates('second')
+        self.assertEqual('bar rendered', self._read(dest, 'overcloud.yaml'))
+        self.assertEqual(2, self.mock_render.call_count)
+        self.assertEqual(2, len(os.listdir(self.workspace.path)))
+
+    def test_render_templates_roles_file(self):
+        roles_file = self._write(self.tmp, 'roles.yaml', 'roles')
+        self._render_templates('first', roles_file=roles_file)
+        self._render_templates('second', roles_file=roles_file)
+        self.assertEqual(1, self.mock_render.call_count)
+        self._write(self.tmp, 'roles.yaml', 'other roles')
+        self._render_templates('third', roles_file=roles_file)
+        self.assertEqual(2, self.mock_render.call_count)
+
+    def test_max_entries(self):
+        self.workspace.max_entries = 1
+        self._render_templates('first')
+        self._write(self.templates, 'overcloud.j2.yaml', 'bar')
+        self._render_templates('second')
+        self.assertEqual([self.workspace.key(self.templates)],
+                         os.listdir(self.workspace.path))
+
+    def test_render_failed(self):
+        self.mock_render.side_effect = exceptions.DeploymentError()
+        self.assertRaises(exceptions.DeploymentError,
+                          self._render_templates, 'first')
+        self.assertEqual([], os.listdir(self.workspace.path))
+
+    def test_no_workspace(self):
+        dest = os.path.join(self.tmp, 'dest')
+        utils.render_templates(self.log, self.templates, dest)
+        self.assertEqual('foo rendered', self._read(dest, 'overcloud.yaml'))
+        self.mock_render.assert_called_once_with(
+            self.log, self.templates, dest, None, None, dest)
+        self.assertFalse(os.path.exists(self.workspace.path))
@@ -16,18 +16,23 @@
 
 import ansible_runner
 import argparse
+import copy
 import datetime
+import json
 import logging
 import mock
 import os
 import os.path
 import shutil
+import six
 import socket
 import subprocess
 import tempfile
+import threading
 
 import sys
 
+from heatclient.common import template_utils
 from heatclient import exc as hc_exc
 
 from uuid import uuid4
@@ -252,6 +257,990 @@ class TestRunAnsiblePlaybook(TestCase):
         )
 
 
+class TestRunAnsiblePlaybookCheckpoint(TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.workdir)
+        self.orig_workdir = utils.constants.DEFAULT_WORK_DIR
+        utils.constants.DEFAULT_WORK_DIR = self.workdir
+        self.addCleanup(setattr, utils.constants, 'DEFAULT_WORK_DIR',
+                        self.orig_workdir)
+        for play in ('one.yaml', 'two.yaml', 'three.yaml'):
+            with open(os.path.join(self.workdir, play), 'w') as f:
+                f.write('- hosts: localhost\n')
+
+    def _play_start(self, handler, index, play):
+        handler({
+            'event': 'playbook_on_play_start',
+            'event_data': {
+                'play': 'TripleO multi-playbook [{}]: {}'.format(index, play)
+            }
+        })
+
+    def _path(self, play):
+        return os.path.join(self.workdir, play)
+
+    def _imports(self):
+        with open(self._path('tripleo-multi-playbook.yaml')) as f:
+            return [i for i in yaml.safe_load(f) if 'import_playbook' in i]
+
+    def _run_playbooks_failed(self, mock_runner, checkpoint):
+        inventory = self._path('inventory.yaml')
+        with open(inventory, 'w') as f:
+            f.write(yaml.safe_dump({'all': {'hosts': {'node-0': {}}}}))
+
+        def _run():
+            handler = mock_runner.call_args[1]['event_handler']
+            self._play_start(handler, 0, 'one.yaml')
+            self._play_start(handler, 1, 'two.yaml')
+            handler({
+                'event': 'runner_on_unreachable',
+                'event_data': {}
+            })
+            return fakes.fake_ansible_runner_run_return(rc=4)
+
+        mock_runner.return_value.run.side_effect = _run
+        self.assertRaises(
+            RuntimeError,
+            utils.run_ansible_playbook,
+            playbook=['one.yaml', 'two.yaml', 'three.yaml'],
+            workdir=self.workdir,
+            inventory=inventory,
+            extra_vars={'global': True},
+            checkpoint=checkpoint
+        )
+        mock_runner.return_value.run.side_effect = None
+        mock_runner.return_value.run.return_value = \
+            fakes.fake_ansible_runner_run_return()
+
+    @mock.patch('ansible_runner.runner_config.RunnerConfig')
+    @mock.patch('ansible_runner.Runner')
+    def test_run_playbooks_resume(self, mock_runner, mock_config):
+        checkpoint = self._path('tripleo-run-data/checkpoint.json')
+        self._run_playbooks_failed(mock_runner, checkpoint)
+        self.assertEqual(0o600, os.stat(checkpoint).st_mode & 0o777)
+        with open(checkpoint) as f:
+            data = json.load(f)
+        self.assertEqual(
+            ['successful', 'failed', 'skipped'],
+            [i['status'] for i in data['playbooks']]
+        )
+        self.assertEqual({'all': {'hosts': {'node-0': {}}}},
+                         data['inventory'])
+        self.assertEqual({'global': True}, data['extra_vars'])
+        self.assertIn('inputs', data)
+
+        results = utils.run_ansible_playbook(
+            playbook=['one.yaml', 'two.yaml', 'three.yaml'],
+            inventory=None,
+            workdir=self.workdir,
+            checkpoint=checkpoint,
+            resume=True
+        )
+        self.assertEqual(
+            [self._path('two.yaml'), self._path('three.yaml')],
+            [i['import_playbook'] for i in self._imports()]
+        )
+        self.assertEqual(
+            {'global': True},
+            mock_config.call_args[1]['extravars']
+        )
+        self.assertEqual(
+            ['one.yaml', 'two.yaml', 'three.yaml'],
+            [os.path.basename(i['playbook']) for i in results]
+        )
+        self.assertEqual(['successful'] * 3, [i['status'] for i in results])
+        self.assertFalse(os.path.exists(checkpoint))
+
+    @mock.patch('tripleoclient.utils.LOG')
+    @mock.patch('ansible_runner.runner_config.RunnerConfig')
+    @mock.patch('ansible_runner.Runner')
+    def test_run_playbooks_resume_current_inputs(self, mock_runner,
+                                                 mock_config, mock_log):
+        checkpoint = self._path('tripleo-run-data/checkpoint.json')
+        self._run_playbooks_failed(mock_runner, checkpoint)
+        utils.run_ansible_playbook(
+            playbook=['one.yaml', 'two.yaml', 'three.yaml'],
+            workdir=self.workdir,
+            inventory='other,',
+            extra_vars={'global': False},
+            checkpoint=checkpoint,
+            resume=True
+        )
+        self.assertEqual(
+            {'global': False},
+            mock_config.call_args[1]['extravars']
+        )
+        warnings = [i[0][0] for i in mock_log.warning.call_args_list]
+        self.assertEqual(2, len(warnings))
+        self.assertIn('extra_vars', warnings[0])
+        self.assertIn('inventory', warnings[1])
+
+    @mock.patch('ansible_runner.runner_config.RunnerConfig')
+    @mock.patch('ansible_runner.Runner')
+    def test_run_playbooks_resume_inputs_changed(self, mock_runner,
+                                                 mock_config):
+        checkpoint = self._path('tripleo-run-data/checkpoint.json')
+        self._run_playbooks_failed(mock_runner, checkpoint)
+        os.mkdir(self._path('group_vars'))
+        with open(self._path('group_vars/Compute'), 'w') as f:
+            f.write('foo: bar\n')
+        results = utils.run_ansible_playbook(
+            playbook=['one.yaml', 'two.yaml', 'three.yaml'],
+            inventory=None,
+            workdir=self.workdir,
+            checkpoint=checkpoint,
+            resume=True
+        )
+        self.assertEqual(
+            [self._path('one.yaml'), self._path('two.yaml'),
+             self._path('three.yaml')],
+            [i['import_playbook'] for i in self._imports()]
+        )
+        self.assertEqual(['successful'] * 3, [i['status'] for i in results])
+
+    @mock.patch('ansible_runner.runner_config.RunnerConfig')
+    @mock.patch('ansible_runner.Runner')
+    def test_run_playbooks_no_checkpoint(self, mock_runner, mock_config):
+        mock_runner.return_value.run.return_value = \
+            fakes.fake_ansible_runner_run_return()
+        utils.run_ansible_playbook(
+            playbook=['one.yaml', 'two.yaml'],
+            inventory='localhost,',
+            workdir=self.workdir
+        )
+        with open(self._path('tripleo-multi-playbook.yaml')) as f:
+            self.assertEqual(
+                [{'import_playbook': self._path('one.yaml')},
+                 {'import_playbook': self._path('two.yaml')}],
+                yaml.safe_load(f))
+
+    def test_playbook_inputs_hash(self):
+        inputs = utils.get_playbook_inputs_hash(
+            ['one.yaml'], self.workdir, exclude=[self._path('run-data')])
+        os.mkdir(self._path('.git'))
+        os.mkdir(self._path('run-data'))
+        for path in ('.git/index', 'run-data/events.json', '.hidden'):
+            with open(self._path(path), 'w') as f:
+                f.write('changed\n')
+        self.assertEqual(inputs, utils.get_playbook_inputs_hash(
+            ['one.yaml'], self.workdir, exclude=[self._path('run-data')]))
+        with open(self._path('three.yaml'), 'a') as f:
+            f.write('- hosts: all\n')
+        self.assertNotEqual(inputs, utils.get_playbook_inputs_hash(
+            ['one.yaml'], self.workdir, exclude=[self._path('run-data')]))
+
+    def test_checkpoint_offset(self):
+        data = {'playbooks': [
+            {'playbook': '/tmp/a/one.yaml', 'status': 'successful'},
+            {'playbook': '/tmp/a/two.yaml', 'status': 'running'},
+            {'playbook': '/tmp/a/three.yaml', 'status': 'pending'}
+        ]}
+        self.assertEqual(1, utils.get_playbook_checkpoint_offset(
+            data, ['/tmp/b/one.yaml', 'two.yaml', 'three.yaml']))
+        self.assertIsNone(utils.get_playbook_checkpoint_offset(
+            data, ['one.yaml', 'three.yaml']))
+        self.assertIsNone(utils.get_playbook_checkpoint_offset(
+            None, ['one.yaml']))
+        data['inputs'] = 'abc'
+        self.assertEqual(1, utils.get_playbook_checkpoint_offset(
+            data, ['one.yaml', 'two.yaml', 'three.yaml'], inputs='abc'))
+        self.assertIsNone(utils.get_playbook_checkpoint_offset(
+            data, ['one.yaml', 'two.yaml', 'three.yaml'], inputs='def'))
+
+
+class TestRunAnsiblePlaybookPaths(TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.workdir)
+        self.orig_workdir = utils.constants.DEFAULT_WORK_DIR
+        utils.constants.DEFAULT_WORK_DIR = self.workdir
+        self.addCleanup(setattr, utils.constants, 'DEFAULT_WORK_DIR',
+                        self.orig_workdir)
+        with open(os.path.join(self.workdir, 'play.yaml'), 'w') as f:
+            f.write('- hosts: localhost\n')
+
+    def _roles_path(self, **kwargs):
+        with mock.patch('ansible_runner.Runner') as mock_runner, \
+                mock.patch('ansible_runner.runner_config.RunnerConfig') \
+                as mock_config:
+            mock_runner.return_value.run.return_value = \
+                fakes.fake_ansible_runner_run_return()
+            utils.run_ansible_playbook(
+                playbook='play.yaml',
+                inventory='localhost,',
+                workdir=self.workdir,
+                **kwargs
+            )
+        return mock_config.call_args[1]['envvars'][
+            'ANSIBLE_ROLES_PATH'].split(':')
+
+    @mock.patch('os.getcwd', return_value='/tmp/process-cwd')
+    def test_run_default_cwd(self, mock_getcwd):
+        paths = self._roles_path()
+        self.assertEqual(2, paths.count(os.path.join(self.workdir, 'roles')))
+        self.assertNotIn('/tmp/process-cwd/roles', paths)
+
+    @mock.patch('os.getcwd', return_value='/tmp/process-cwd')
+    def test_run_cwd(self, mock_getcwd):
+        paths = self._roles_path(cwd='/home/stack/plays')
+        self.assertIn(os.path.join(self.workdir, 'roles'), paths)
+        self.assertIn('/home/stack/plays/roles', paths)
+        self.assertNotIn('/tmp/process-cwd/roles', paths)
+
+    def test_run_forks_artifact(self):
+        history = os.path.join(self.workdir, 'forks-history.json')
+        artifacts = list()
+
+        def _config(**kwargs):
+            with open(os.path.join(kwargs['artifact_dir'],
+                                   utils.constants.ANSIBLE_FORKS_FILENAME)) \
+                    as f:
+                artifacts.append(json.load(f))
+            return mock.MagicMock()
+
+        with mock.patch('ansible_runner.Runner') as mock_runner, \
+                mock.patch('ansible_runner.runner_config.RunnerConfig',
+                           side_effect=_config):
+            mock_runner.return_value.run.return_value = \
+                fakes.fake_ansible_runner_run_return()
+            utils.run_ansible_playbook(
+                playbook='play.yaml',
+                inventory='node-0,node-1,node-2',
+                workdir=self.workdir,
+                forks=2,
+                forks_history=history
+            )
+        self.assertEqual(
+            [{'forks': 2, 'hosts': 3, 'reasons': ['requested: 2']}],
+            artifacts)
+        # The requested fork count is recorded for the next runs.
+        run = utils.load_ansible_forks_history(history)['play.yaml'][0]
+        self.assertEqual((2, 3), (run['forks'], run['hosts']))
+
+
+class TestRunAnsiblePlaybookGraph(TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.workdir)
+        self.inventory = {
+            'Controller': {'hosts': {'ctrl-0': {}}},
+            'Compute': {'hosts': {'cmpt-0': {}}},
+            'CephStorage': {'hosts': {'ceph-0': {}}}
+        }
+        self.started = list()
+        self.lock = threading.Lock()
+
+    def _run(self, failed=None, wait=None):
+        events = dict()
+
+        def _run(**kwargs):
+            name = kwargs['playbook']
+            with self.lock:
+                self.started.append(name)
+                events.setdefault(name, threading.Event()).set()
+            # Block until the playbooks expected to run concurrently
+            # were started.
+            for other in (wait or dict()).get(name, list()):
+                with self.lock:
+                    event = events.setdefault(other, threading.Event())
+                self.assertTrue(event.wait(5))
+            if name == failed:
+                raise RuntimeError('Ansible execution failed')
+        return _run
+
+    @mock.patch('tripleoclient.utils.run_ansible_playbook', autospec=True)
+    def test_run_graph(self, mock_run):
+        mock_run.side_effect = self._run(
+            wait={'ceph.yaml': ['compute.yaml'],
+                  'compute.yaml': ['ceph.yaml']}
+        )
+        results = utils.run_ansible_playbook_graph(
+            playbooks=[
+                'prepare.yaml',
+                {'playbook': 'ceph.yaml', 'hosts': 'CephStorage',
+                 'requires': ['prepare.yaml'],
+                 'extra_vars': {'foo': 'bar'}},
+                {'playbook': 'compute.yaml', 'hosts': 'Compute:Controller',
+                 'requires': ['prepare.yaml']},
+                'finish.yaml'
+            ],
+            workdir=self.workdir,
+            inventory=self.inventory,
+            extra_vars={'global': True},
+            forks=5
+        )
+        self.assertEqual(
+            [{'playbook': i, 'status': 'successful'} for i in (
+                'prepare.yaml', 'ceph.yaml', 'compute.yaml', 'finish.yaml')],
+            results
+        )
+        self.assertEqual('prepare.yaml', self.started[0])
+        self.assertEqual('finish.yaml', self.started[-1])
+        calls = dict([(i[1]['playbook'], i[1])
+                      for i in mock_run.call_args_list])
+        self.assertEqual(
+            {'global': True, 'foo': 'bar'},
+            calls['ceph.yaml']['extra_vars']
+        )
+        self.assertTrue(calls['ceph.yaml']['parallel_run'])
+        self.assertEqual(5, calls['ceph.yaml']['forks'])
+        self.assertNotEqual(
+            calls['ceph.yaml']['workdir'],
+            calls['compute.yaml']['workdir']
+        )
+
+    @mock.patch('tripleoclient.utils.run_ansible_playbook', autospec=True)
+    def test_run_graph_disjoint_hosts(self, mock_run):
+        mock_run.side_effect = self._run(
+            wait={'ceph.yaml': ['compute.yaml'],
+                  'compute.yaml': ['ceph.yaml']}
+        )
+        utils.run_ansible_playbook_graph(
+            playbooks=[
+                {'playbook': 'ceph.yaml', 'hosts': 'CephStorage'},
+                {'playbook': 'compute.yaml', 'hosts': 'Compute'},
+                {'playbook': 'controller.yaml', 'hosts': 'Controller'},
+                {'playbook': 'all.yaml', 'hosts': 'Compute:Controller'}
+            ],
+            workdir=self.workdir,
+            inventory=self.inventory,
+            forks=5
+        )
+        self.assertEqual('all.yaml', self.started[-1])
+
+    @mock.patch('tripleoclient.utils.run_ansible_playbook', autospec=True)
+    def test_run_graph_failed(self, mock_run):
+        mock_run.side_effect = self._run(failed='ceph.yaml')
+        with self.assertRaises(RuntimeError) as e:
+            utils.run_ansible_playbook_graph(
+                playbooks=[
+                    {'playbook': 'ceph.yaml', 'hosts': 'CephStorage'},
+                    {'playbook': 'compute.yaml', 'hosts': 'Compute'},
+                    {'playbook': 'after-ceph.yaml',
+                     'requires': ['ceph.yaml']}
+                ],
+                workdir=self.workdir,
+                inventory=self.inventory,
+                forks=5
+            )
+        self.assertIn('ceph.yaml (failed)', str(e.exception))
+        self.assertIn('compute.yaml (successful)', str(e.exception))
+        self.assertIn('after-ceph.yaml (pending)', str(e.exception))
+        self.assertNotIn('after-ceph.yaml', self.started)
+
+    @mock.patch('tripleoclient.utils.run_ansible_playbook', autospec=True)
+    def test_run_graph_unknown_requirement(self, mock_run):
+        self.assertRaises(
+            RuntimeError,
+            utils.run_ansible_playbook_graph,
+            playbooks=[
+                {'playbook': 'one.yaml', 'requires': ['two.yaml']},
+                'two.yaml'
+            ],
+            workdir=self.workdir
+        )
+        mock_run.assert_not_called()
+
+    @mock.patch('tripleoclient.utils.get_ansible_forks',
+                return_value=(9, 3, ['cpu: 9']))
+    @mock.patch('tripleoclient.utils.run_ansible_playbook', autospec=True)
+    def test_run_graph_shared_forks(self, mock_run, mock_forks):
+        utils.run_ansible_playbook_graph(
+            playbooks=[
+                {'playbook': 'one.yaml', 'hosts': 'Compute'},
+                {'playbook': 'two.yaml', 'hosts': 'Controller'}
+            ],
+            workdir=self.workdir,
+            inventory=self.inventory
+        )
+        self.assertEqual(
+            [4, 4], [i[1]['forks'] for i in mock_run.call_args_list]
+        )
+        mock_run.reset_mock()
+        utils.run_ansible_playbook_graph(
+            playbooks=['one.yaml', 'two.yaml'],
+            workdir=self.workdir,
+            inventory=self.inventory
+        )
+        self.assertNotIn('forks', mock_run.call_args[1])
+
+    @mock.patch('tripleoclient.utils.run_ansible_playbook', autospec=True)
+    def test_run_graph_tags(self, mock_run):
+        utils.run_ansible_playbook_graph(
+            playbooks=[
+                {'playbook': 'one.yaml', 'tags': 'one'},
+                'two.yaml'
+            ],
+            workdir=self.workdir,
+            tags='all',
+            forks=5
+        )
+        calls = dict([(i[1]['playbook'], i[1]['tags'])
+                      for i in mock_run.call_args_list])
+        self.assertEqual({'one.yaml': 'one', 'two.yaml': 'all'}, calls)
+
+
+class TestPrewarmSshConnections(TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.workdir)
+
+    def _events(self, results):
+        def _run(**kwargs):
+            for host, event in results:
+                kwargs['event_handler']({
+                    'event': event,
+                    'event_data': {'host': host}
+                })
+        return _run
+
+    @mock.patch('tripleoclient.utils.run_ansible_playbook', autospec=True)
+    def test_prewarm(self, mock_playbook):
+        mock_playbook.side_effect = self._events([
+            ('node-0', 'runner_on_ok'),
+            ('node-2', 'runner_on_unreachable'),
+            ('node-1', 'runner_on_unreachable')
+        ])
+        unreachable = utils.prewarm_ssh_connections(
+            inventory='node-0,node-1,node-2',
+            workdir=self.workdir,
+            limit_hosts='Compute',
+            forks=2
+        )
+        self.assertEqual(['node-1', 'node-2'], unreachable)
+        kwargs = mock_playbook.call_args[1]
+        self.assertEqual('Compute', kwargs['limit_hosts'])
+        self.assertEqual(2, kwargs['forks'])
+        with open(kwargs['playbook']) as f:
+            play = yaml.safe_load(f)[0]
+        self.assertTrue(play['ignore_unreachable'])
+        self.assertFalse(play['gather_facts'])
+
+    @mock.patch('tripleoclient.utils.run_ansible_playbook', autospec=True)
+    def test_prewarm_all_unreachable(self, mock_playbook):
+        mock_playbook.side_effect = self._events([
+            ('node-0', 'runner_on_unreachable')
+        ])
+        self.assertRaises(
+            RuntimeError,
+            utils.prewarm_ssh_connections,
+            inventory='node-0,',
+            workdir=self.workdir
+        )
+
+
+class TestTaskTimingStream(TestCase):
+    def setUp(self):
+        self.stream = six.StringIO()
+        self.event_handler = mock.Mock(return_value=True)
+        self.timing = utils.TaskTimingStream(
+            stream=self.stream,
+            event_handler=self.event_handler
+        )
+
+    def _records(self):
+        return [json.loads(i) for i in self.stream.getvalue().splitlines()]
+
+    def test_task_records(self):
+        events = [
+            {'event': 'playbook_on_task_start',
+             'event_data': {'task': 'Ping', 'task_uuid': 'a'}},
+            {'event': 'runner_on_start',
+             'created': '2020-01-01T00:00:00',
+             'event_data': {'host': 'node-0', 'task': 'Ping',
+                            'task_uuid': 'a'}},
+            {'event': 'runner_on_ok',
+             'created': '2020-01-01T00:00:03',
+             'event_data': {'host': 'node-0', 'task': 'Ping',
+                            'task_uuid': 'a', 'role': 'common',
+                            'play': 'Deploy', 'res': {'changed': True},
+                            'start': '2020-01-01T00:00:00.5',
+                            'end': '2020-01-01T00:00:02.5',
+                            'duration': 2.0}},
+            {'event': 'runner_on_start',
+             'created': '2020-01-01T00:00:04',
+             'event_data': {'host': 'node-1', 'task': 'Ping',
+                            'task_uuid': 'a'}},
+            {'event': 'runner_on_failed',
+             'created': '2020-01-01T00:00:05',
+             'event_data': {'host': 'node-1', 'task': 'Ping',
+                            'task_uuid': 'a', 'ignore_errors': True}},
+            {'event': 'runner_on_unreachable',
+             'created': '2020-01-01T00:00:06',
+             'event_data': {'host': 'node-2', 'task': 'Ping',
+                            'task_uuid': 'a'}}
+        ]
+        for event in events:
+            self.assertTrue(self.timing(event))
+
+        self.assertEqual(len(events), self.event_handler.call_count)
+        records = self._records()
+        self.assertEqual(3, len(records))
+        self.assertEqual(
+            {'host': 'node-0', 'play': 'Deploy', 'role': 'common',
+             'task': 'Ping', 'start': '2020-01-01T00:00:00.5',
+             'end': '2020-01-01T00:00:02.5', 'duration': 2.0,
+             'status': 'changed'},
+            records[0]
+        )
+        self.assertEqual('ignored', records[1]['status'])
+        self.assertEqual('2020-01-01T00:00:04', records[1]['start'])
+        self.assertEqual('2020-01-01T00:00:05', records[1]['end'])
+        self.assertEqual('unreachable', records[2]['status'])
+        self.assertIsNone(records[2]['start'])
+
+    def test_file_stream(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        path = os.path.join(tmp, 'timings', 'run.ndjson')
+        timing = utils.TaskTimingStream(stream=path)
+        self.assertTrue(timing({
+            'event': 'runner_on_skipped',
+            'event_data': {'host': 'node-0', 'task': 'Ping'}
+        }))
+        timing.close()
+        with open(path) as f:
+            self.assertEqual('skipped', json.loads(f.read())['status'])
+
+
+class TestTaskTimingCompare(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+
+    def _record(self, host, task, duration, role=None):
+        return {'host': host, 'task': task, 'role': role, 'play': 'Deploy',
+                'duration': duration, 'status': 'ok'}
+
+    def test_timing_runs(self):
+        run_dir = os.path.join(self.tmp, 'tripleo-run-data')
+        os.makedirs(run_dir)
+        for run in ('20200102000000', '20200101000000'):
+            with open(os.path.join(
+                    run_dir, 'ansible-timing-{}.ndjson'.format(run)),
+                    'w') as f:
+                f.write(json.dumps(self._record('node-0', 'Ping', 1)) +
+                        '\n{"host": "node-0", "ta')
+        runs = utils.get_task_timing_runs(self.tmp)
+        self.assertEqual(
+            ['20200101000000', '20200102000000'], [i[0] for i in runs]
+        )
+        self.assertEqual(
+            [self._record('node-0', 'Ping', 1)],
+            utils.load_task_timings(runs[0][1])
+        )
+
+    def test_compare(self):
+        before = [
+            self._record('node-0', 'Ping', 1.0),
+            self._record('node-1', 'Ping', 2.0),
+            self._record('node-0', 'Install', 10.0, role='packages'),
+            self._record('node-0', 'Install', 5.0, role='packages'),
+            self._record('node-0', 'Removed', 3.0)
+        ]
+        after = [
+            self._record('node-0', 'Ping', 1.0),
+            self._record('node-1', 'Ping', 2.5),
+            self._record('node-0', 'Install', 20.0, role='packages'),
+            self._record('node-1', 'Install', 1.0, role='packages'),
+            self._record('node-1', 'Added', 4.0)
+        ]
+        self.assertEqual(
+            [('packages : Install', 15.0, 20.0, 5.0),
+             ('Added', 0, 4.0, 4.0),
+             ('Ping', 2.0, 2.5, 0.5),
+             ('Removed', 3.0, 0, -3.0)],
+            utils.compare_task_timings(before, after)
+        )
+        self.assertEqual(
+            [('node-1', 2.0, 7.5, 5.5), ('node-0', 19.0, 21.0, 2.0)],
+            utils.compare_task_timings(before, after, group_by='host')
+        )
+        self.assertEqual(
+            [('packages', 15.0, 20.0, 5.0), ('Deploy', 4.0, 6.5, 2.5)],
+            utils.compare_task_timings(before, after, group_by='role')
+        )
+
+
+class TestRunnerEventArchive(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.path = os.path.join(self.tmp, 'run', 'events.ndjson.gz')
+        self.event_handler = mock.Mock(return_value=True)
+        archive = utils.RunnerEventArchive(
+            path=self.path,
+            event_handler=self.event_handler,
+            block_size=256
+        )
+        self.events = [{'event': 'playbook_on_start', 'event_data': {}}]
+        for host in ('node-0', 'node-1', 'node-2'):
+            for task in ('Ping', 'Deploy'):
+                event = 'runner_on_ok'
+                if host == 'node-1' and task == 'Deploy':
+                    event = 'runner_on_failed'
+                self.events.append({
+                    'event': event,
+                    'stdout': 'x' * 64,
+                    'event_data': {'host': host, 'task': task}
+                })
+        self.events.append({
+            'event': 'runner_on_failed',
+            'event_data': {'host': 'node-2', 'task': 'Check',
+                           'ignore_errors': True}
+        })
+        for event in self.events:
+            self.assertTrue(archive(event))
+        archive.close()
+
+    def test_archive(self):
+        self.assertEqual(len(self.events), self.event_handler.call_count)
+        with open(self.path + '.index.json') as f:
+            index = json.load(f)
+        self.assertGreater(len(index['blocks']), 1)
+        self.assertEqual(self.events, utils.load_runner_events(self.path))
+
+    def test_load_by_host_and_task(self):
+        self.assertEqual(
+            [i for i in self.events
+             if i['event_data'].get('host') == 'node-2'],
+            utils.load_runner_events(self.path, host='node-2')
+        )
+        self.assertEqual(
+            ['node-0', 'node-1', 'node-2'],
+            [i['event_data']['host']
+             for i in utils.load_runner_events(self.path, task='Deploy')]
+        )
+        self.assertEqual(
+            [],
+            utils.load_runner_events(self.path, host='node-0', task='Check')
+        )
+
+    def test_load_failures(self):
+        failures = utils.load_runner_events(self.path, failures=True)
+        self.assertEqual(1, len(failures))
+        self.assertEqual('node-1', failures[0]['event_data']['host'])
+
+
+class TestAnsibleInventoryHosts(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+
+    def test_get_inventory_hosts(self):
+        self.assertEqual(
+            set(['node-0', 'node-1']),
+            utils.get_inventory_hosts('node-0, node-1,')
+        )
+        inventory = {
+            'all': {'children': {'Controller': {}, 'Compute': {}}},
+            'Controller': {'hosts': {'ctrl-0': {}, 'ctrl-1': {}}},
+            'Compute': {'hosts': {'cmpt-0': {}},
+                        'children': {'Extra': {'hosts': ['extra-0']}}},
+            'Undercloud': {'hosts': {'undercloud': {}}}
+        }
+        self.assertEqual(
+            set(['ctrl-0', 'ctrl-1', 'cmpt-0', 'extra-0', 'undercloud']),
+            utils.get_inventory_hosts(inventory)
+        )
+        path = os.path.join(self.tmp, 'inventory.yaml')
+        with open(path, 'w') as f:
+            f.write(yaml.safe_dump(inventory))
+        self.assertEqual(5, len(utils.get_inventory_hosts(path)))
+        self.assertIsNone(utils.get_inventory_hosts('/no/such/inventory'))
+
+    def test_resolve_inventory_hosts(self):
+        inventory = {
+            'overcloud': {'children': {'Controller': {}, 'Compute': {}}},
+            'Controller': {'hosts': {'ctrl-0': {}, 'ctrl-1': {}}},
+            'Compute': {'hosts': {'cmpt-0': {}}},
+            'Undercloud': {'hosts': {'undercloud': {}}}
+        }
+        self.assertEqual(
+            set(['ctrl-0', 'ctrl-1', 'cmpt-0']),
+            utils.get_inventory_groups(inventory)['overcloud']
+        )
+        self.assertEqual(
+            set(['ctrl-1', 'cmpt-0']),
+            utils.resolve_inventory_hosts(
+                inventory, 'overcloud:!ctrl-0')
+        )
+        self.assertEqual(
+            set(['ctrl-0', 'cmpt-0', 'undercloud']),
+            utils.resolve_inventory_hosts(inventory, '!ctrl-1')
+        )
+        self.assertIsNone(
+            utils.resolve_inventory_hosts(inventory, 'overcloud:&Compute')
+        )
+        self.assertIsNone(utils.resolve_inventory_hosts(inventory, 'ctrl-*'))
+
+
+    def test_get_sshd_limits(self):
+        path = os.path.join(self.tmp, 'sshd_config')
+        with open(path, 'w') as f:
+            f.write('# MaxStartups 1\nUseDNS no\nMaxStartups 10:30:60\n'
+                    'MaxSessions 20 # per connection\nMaxSessions 5\n'
+                    'Match User stack\n  MaxSessions 2\n')
+        self.assertEqual({'MaxStartups': 60, 'MaxSessions': 20},
+                         utils.get_sshd_limits(path))
+        with open(path, 'w') as f:
+            f.write('UseDNS no\nMaxSessions 0\n')
+        self.assertEqual({}, utils.get_sshd_limits(path))
+        self.assertEqual({}, utils.get_sshd_limits('/no/such/file'))
+
+
+class TestAnsibleForks(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.history = os.path.join(self.tmp, 'forks.json')
+        cpu = mock.patch('multiprocessing.cpu_count', return_value=8)
+        cpu.start()
+        self.addCleanup(cpu.stop)
+        memory = mock.patch(
+            'psutil.virtual_memory',
+            return_value=mock.Mock(available=64 * 1024 * 1024 * 1024)
+        )
+        self.memory = memory.start()
+        self.addCleanup(memory.stop)
+        sshd = mock.patch('tripleoclient.utils.get_sshd_limits',
+                          return_value={})
+        self.mock_sshd = sshd.start()
+        self.addCleanup(sshd.stop)
+
+    def test_forks_cpu(self):
+        forks, hosts, _ = utils.get_ansible_forks(
+            inventory=','.join(['node-{}'.format(i) for i in range(50)])
+        )
+        self.assertEqual(32, forks)
+        self.assertEqual(50, hosts)
+
+    def test_forks_hosts_and_limit(self):
+        inventory = 'node-0,node-1,node-2,node-3'
+        self.assertEqual(
+            4, utils.get_ansible_forks(inventory=inventory)[0])
+        self.assertEqual(
+            2, utils.get_ansible_forks(
+                inventory=inventory, limit_hosts='node-0:node-1')[0])
+        self.assertEqual(
+            3, utils.get_ansible_forks(
+                inventory=inventory, limit_hosts='Compute:!node-0')[0])
+
+    def test_forks_memory(self):
+        self.memory.return_value = mock.Mock(available=200 * 1024 * 1024)
+        forks, _, reasons = utils.get_ansible_forks(inventory='a,b,c,d,e')
+        self.assertEqual(3, forks)
+        self.assertIn('memory: 3', reasons)
+
+    def test_forks_sshd(self):
+        self.mock_sshd.return_value = {'MaxStartups': 60, 'MaxSessions': 2}
+        forks, _, reasons = utils.get_ansible_forks(inventory='a,b,c,d,e')
+        self.assertEqual(2, forks)
+        self.assertIn('MaxSessions: 2', reasons)
+        self.assertEqual(
+            5, utils.get_ansible_forks(
+                inventory='a,b,c,d,e', connection='local')[0])
+
+    def test_forks_history(self):
+        inventory = ','.join(['node-{}'.format(i) for i in range(20)])
+        for forks, duration, rc in ((20, 30.0, 0), (10, 20.0, 0),
+                                    (5, 10.0, 2)):
+            utils.record_ansible_forks(
+                history_file=self.history,
+                playbook='deploy.yaml',
+                forks=forks,
+                hosts=20,
+                duration=duration,
+                rc=rc
+            )
+        forks, _, reasons = utils.get_ansible_forks(
+            inventory=inventory,
+            playbook='deploy.yaml',
+            history_file=self.history
+        )
+        self.assertEqual(10, forks)
+        self.assertIn('history: 10', reasons)
+        self.assertNotIn('cpu: 32', reasons)
+        # The history of another host count is not used.
+        self.assertEqual(
+            19, utils.get_ansible_forks(
+                inventory=inventory,
+                limit_hosts='!node-0',
+                playbook='deploy.yaml',
+                history_file=self.history
+            )[0]
+        )
+
+    def test_forks_history_above_cpu(self):
+        inventory = ','.join(['node-{}'.format(i) for i in range(50)])
+        for forks, duration in ((32, 30.0), (48, 20.0)):
+            utils.record_ansible_forks(
+                history_file=self.history,
+                playbook='deploy.yaml',
+                forks=forks,
+                hosts=50,
+                duration=duration,
+                rc=0
+            )
+        self.assertEqual(
+            48, utils.get_ansible_forks(
+                inventory=inventory,
+                playbook='deploy.yaml',
+                history_file=self.history
+            )[0]
+        )
+        # The recorded fork count is still bounded by the memory.
+        self.memory.return_value = mock.Mock(available=2560 * 1024 * 1024)
+        self.assertEqual(
+            40, utils.get_ansible_forks(
+                inventory=inventory,
+                playbook='deploy.yaml',
+                history_file=self.history
+            )[0]
+        )
+
+    def test_record_history_size(self):
+        for i in range(15):
+            utils.record_ansible_forks(
+                history_file=self.history,
+                playbook='deploy.yaml',
+                forks=i,
+                hosts=1,
+                duration=1,
+                rc=0
+            )
+        history = utils.load_ansible_forks_history(self.history)
+        self.assertEqual(10, len(history['deploy.yaml']))
+        self.assertEqual(14, history['deploy.yaml'][-1]['forks'])
+
+
+class TestAnsibleAcceleratedStrategy(TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.workdir)
+        self.orig_workdir = utils.constants.DEFAULT_WORK_DIR
+        utils.constants.DEFAULT_WORK_DIR = self.workdir
+        self.addCleanup(setattr, utils.constants, 'DEFAULT_WORK_DIR',
+                        self.orig_workdir)
+        with open(os.path.join(self.workdir, 'play.yaml'), 'w') as f:
+            f.write('- hosts: localhost\n')
+        self.plugin = mock.Mock(
+            __file__='/usr/lib/ansible_mitogen/plugins/strategy/'
+                     'mitogen_linear.py'
+        )
+
+    @mock.patch('importlib.import_module')
+    def test_get_strategy(self, mock_import):
+        mock_import.return_value = self.plugin
+        self.assertEqual(
+            ('/usr/lib/ansible_mitogen/plugins/strategy', 'mitogen_linear'),
+            utils.get_ansible_accelerated_strategy()
+        )
+        mock_import.assert_called_once_with(
+            'ansible_mitogen.plugins.strategy.mitogen_linear'
+        )
+
+    @mock.patch('importlib.import_module',
+                side_effect=ImportError('No module named ansible_mitogen'))
+    def test_get_strategy_missing(self, mock_import):
+        self.assertIsNone(utils.get_ansible_accelerated_strategy())
+
+    def _run(self, mock_runner, mock_config, accelerated,
+             playbook='play.yaml', **kwargs):
+        mock_runner.return_value.run.return_value = \
+            fakes.fake_ansible_runner_run_return()
+        utils.run_ansible_playbook(
+            playbook=playbook,
+            inventory='localhost,',
+            workdir=self.workdir,
+            accelerated=accelerated,
+            **kwargs
+        )
+        return mock_config.call_args[1]['envvars']
+
+    @mock.patch('importlib.import_module')
+    @mock.patch('ansible_runner.runner_config.RunnerConfig')
+    @mock.patch('ansible_runner.Runner')
+    def test_run_accelerated(self, mock_runner, mock_config, mock_import):
+        mock_import.return_value = self.plugin
+        env = self._run(mock_runner, mock_config, accelerated=True)
+        self.assertEqual('mitogen_linear', env['ANSIBLE_STRATEGY'])
+        plugins = env['ANSIBLE_STRATEGY_PLUGINS'].split(':')
+        self.assertEqual('/usr/lib/ansible_mitogen/plugins/strategy',
+                         plugins[0])
+        self.assertIn('/usr/share/ansible/tripleo-plugins/strategy', plugins)
+
+    @mock.patch('importlib.import_module')
+    @mock.patch('ansible_runner.runner_config.RunnerConfig')
+    @mock.patch('ansible_runner.Runner')
+    def test_run_accelerated_ansible_cfg(self, mock_runner, mock_config,
+                                         mock_import):
+        mock_import.return_value = self.plugin
+        ansible_cfg = os.path.join(self.workdir, 'ansible.cfg')
+        with open(ansible_cfg, 'w') as f:
+            f.write('[defaults]\nstrategy_plugins = /opt/strategy\n')
+        env = self._run(mock_runner, mock_config, accelerated=True,
+                        ansible_cfg=ansible_cfg)
+        self.assertEqual(
+            '/usr/lib/ansible_mitogen/plugins/strategy:/opt/strategy',
+            env['ANSIBLE_STRATEGY_PLUGINS']
+        )
+
+    @mock.patch('importlib.import_module')
+    @mock.patch('ansible_runner.runner_config.RunnerConfig')
+    @mock.patch('ansible_runner.Runner')
+    def test_run_accelerated_play_strategy(self, mock_runner, mock_config,
+                                           mock_import):
+        mock_import.return_value = self.plugin
+        with open(os.path.join(self.workdir, 'steps.yaml'), 'w') as f:
+            f.write('- hosts: all\n  strategy: tripleo_free\n')
+        with open(os.path.join(self.workdir, 'deploy.yaml'), 'w') as f:
+            f.write('- hosts: localhost\n'
+                    '- import_playbook: steps.yaml\n')
+        with mock.patch.object(utils.LOG, 'warning') as mock_warning:
+            env = self._run(mock_runner, mock_config, accelerated=True,
+                            playbook='deploy.yaml')
+        self.assertNotIn('ANSIBLE_STRATEGY', env)
+        self.assertNotIn('ANSIBLE_STRATEGY_PLUGINS', env)
+        self.assertIn('tripleo_free', mock_warning.call_args[0][0])
+        self.assertIn('no effect', mock_warning.call_args[0][0])
+
+    def test_get_playbook_strategies(self):
+        with open(os.path.join(self.workdir, 'steps.yaml'), 'w') as f:
+            f.write('- hosts: all\n  strategy: tripleo_linear\n'
+                    '- import_playbook: steps.yaml\n'
+                    '- import_playbook: "{{ playbook }}"\n')
+        self.assertEqual(
+            set(['tripleo_linear']),
+            utils.get_playbook_strategies(
+                os.path.join(self.workdir, 'steps.yaml')
+            )
+        )
+        self.assertEqual(
+            set(),
+            utils.get_playbook_strategies(
+                os.path.join(self.workdir, 'play.yaml')
+            )
+        )
+
+    @mock.patch('importlib.import_module', side_effect=ImportError)
+    @mock.patch('ansible_runner.runner_config.RunnerConfig')
+    @mock.patch('ansible_runner.Runner')
+    def test_run_accelerated_fallback(self, mock_runner, mock_config,
+                                      mock_import):
+        env = self._run(mock_runner, mock_config, accelerated=True)
+        self.assertNotIn('ANSIBLE_STRATEGY_PLUGINS', env)
+
+    @mock.patch('importlib.import_module')
+    @mock.patch('ansible_runner.runner_config.RunnerConfig')
+    @mock.patch('ansible_runner.Runner')
+    def test_run_default(self, mock_runner, mock_config, mock_import):
+        env = self._run(mock_runner, mock_config, accelerated=False)
+        self.assertNotIn('ANSIBLE_STRATEGY_PLUGINS', env)
+        mock_import.assert_not_called()
+
+
 class TestRunCommandAndLog(TestCase):
     def setUp(self):
         self.mock_logger = mock.Mock(spec=logging.Logger)
@@ -1053,6 +2042,75 @@ class TestReplaceLinks(TestCase):
             utils.replace_links_in_template_contents(
                 source, self.link_replacement))
 
+    def test_replace_links_keeps_formatting(self):
+        source = (
+            'heat_template_version: rocky\n'
+            '# comment\n'
+            'resources:\n'
+            '  config:\n'
+            '    type: \'file:///usr/share/extra-templates/my.yml\'\n'
+            '    properties:\n'
+            '      config: {get_file: "file:///home/stack/test.sh"}\n'
+            '      other: [get_file, file:///home/stack/test.sh]\n'
+            '  script:\n'
+            '    properties:\n'
+            '      config: {get_file: file:///home/stack/test.sh}\n'
+            '    type: OS::Heat::SoftwareConfig\n'
+        )
+        expected = (
+            'heat_template_version: rocky\n'
+            '# comment\n'
+            'resources:\n'
+            '  config:\n'
+            '    type: \'user-files/usr/share/extra-templates/my.yml\'\n'
+            '    properties:\n'
+            '      config: {get_file: "user-files/home/stack/test.sh"}\n'
+            '      other: [get_file, file:///home/stack/test.sh]\n'
+            '  script:\n'
+            '    properties:\n'
+            '      config: {get_file: user-files/home/stack/test.sh}\n'
+            '    type: OS::Heat::SoftwareConfig\n'
+        )
+        self.assertEqual(expected, utils.replace_links_in_template_contents(
+            source, self.link_replacement))
+
+    def test_replace_links_quotes_links(self):
+        self.link_replacement['file:///home/stack/test.sh'] = 'a, b.sh'
+        source = (
+            'heat_template_version: rocky\n'
+            'resources:\n'
+            '  config: {get_file: file:///home/stack/test.sh}\n'
+        )
+        result = utils.replace_links_in_template_contents(
+            source, self.link_replacement)
+        self.assertIn('{get_file: "a, b.sh"}', result)
+        self.assertEqual({'get_file': 'a, b.sh'},
+                         yaml.safe_load(result)['resources']['config'])
+
+    def test_replace_links_alias(self):
+        source = (
+            'heat_template_version: rocky\n'
+            'parameters:\n'
+            '  script: &script file:///home/stack/test.sh\n'
+            'resources:\n'
+            '  config: {get_file: *script}\n'
+        )
+        result = yaml.safe_load(utils.replace_links_in_template_contents(
+            source, self.link_replacement))
+        self.assertEqual({'get_file': 'user-files/home/stack/test.sh'},
+                         result['resources']['config'])
+
+    @mock.patch('yaml.parse')
+    def test_replace_links_no_link(self, mock_parse):
+        source = (
+            'heat_template_version: rocky\n'
+            'resources:\n'
+            '  config: {get_file: script.sh}\n'
+        )
+        self.assertIs(source, utils.replace_links_in_template_contents(
+            source, self.link_replacement))
+        mock_parse.assert_not_called()
+
     def test_relative_link_replacement(self):
         current_dir = 'user-files/home/stack'
         expected = {
@@ -1249,8 +2307,8 @@ class ProcessMultipleEnvironments(TestCase):
                 'parse', autospec=True, return_value=dict())
     @mock.patch('heatclient.common.template_format.'
                 'parse', autospec=True, return_value=dict())
-    @mock.patch('yaml.safe_dump', autospec=True)
-    @mock.patch('yaml.safe_load', autospec=True)
+    @mock.patch('tripleoclient.yaml_utils.safe_dump', autospec=True)
+    @mock.patch('tripleoclient.yaml_utils.safe_load', autospec=True)
     @mock.patch('six.moves.builtins.open')
     @mock.patch('tempfile.NamedTemporaryFile', autospec=True)
     def test_rewrite_env_files(self,
@@ -1294,6 +2352,287 @@ class ProcessMultipleEnvironments(TestCase):
         mock_yaml_dump.assert_has_calls([mock.call(rewritten_env,
                                         default_flow_style=False)])
 
+    @mock.patch('heatclient.common.template_utils.'
+                'process_environment_and_files', autospec=True)
+    def test_provenance(self, mock_hc_process):
+        envs = {
+            '/twd/templates/abs.yaml': {
+                'parameter_defaults': {'Foo': 1, 'Bar': {'a': 1}},
+                'resource_registry': {'OS::Foo': 'foo.yaml'}
+            },
+            '../outside.yaml': {
+                'parameter_defaults': {'Bar': {'b': 2}, 'Baz': 3}
+            }
+        }
+        mock_hc_process.side_effect = lambda env_path, **kwargs: (
+            {}, envs[env_path])
+        provenance = {}
+
+        _, env = utils.process_multiple_environments(
+            ['/tmp/thtroot/abs.yaml', '../outside.yaml'],
+            self.tht_root, self.user_tht_root, provenance=provenance)
+
+        self.assertEqual({
+            'parameter_defaults': {'Foo': 1, 'Bar': {'a': 1, 'b': 2},
+                                   'Baz': 3},
+            'resource_registry': {'OS::Foo': 'foo.yaml'}
+        }, env)
+        self.assertEqual({
+            'parameter_defaults': {'Foo': '/tmp/thtroot/abs.yaml',
+                                   'Bar': '../outside.yaml',
+                                   'Baz': '../outside.yaml'},
+            'resource_registry': {'OS::Foo': '/tmp/thtroot/abs.yaml'}
+        }, provenance)
+
+
+class TestMergeEnvironments(TestCase):
+
+    def _deep_update(self, environments):
+        merged = {}
+        for _, env in copy.deepcopy(environments):
+            merged = template_utils.deep_update(merged, env)
+        return merged
+
+    def test_merge(self):
+        environments = [
+            ('a.yaml', {'parameter_defaults': {'Foo': {'a': [1], 'b': 2},
+                                               'Bar': None,
+                                               'Baz': 'baz'}}),
+            ('b.yaml', {'parameter_defaults': {'Foo': {'b': 3, 'c': 4},
+                                               'Bar': {'a': 1}},
+                        'resource_registry': {'OS::Foo': 'foo.yaml'}}),
+            ('c.yaml', {'parameter_defaults': {'Foo': None,
+                                               'Baz': {}}}),
+            ('d.yaml', None)
+        ]
+        merged = utils.merge_environments(environments)
+        self.assertEqual({
+            'parameter_defaults': {'Foo': {'a': [1], 'b': 3, 'c': 4},
+                                   'Bar': {'a': 1},
+                                   'Baz': 'baz'},
+            'resource_registry': {'OS::Foo': 'foo.yaml'}
+        }, merged)
+        self.assertEqual(self._deep_update(environments[:3]), merged)
+        self.assertEqual({'a': [1], 'b': 2},
+                         environments[0][1]['parameter_defaults']['Foo'])
+
+    def test_provenance(self):
+        provenance = {}
+        utils.merge_environments([
+            ('a.yaml', {'parameter_defaults': {'Foo': 1, 'Bar': {'a': 1}},
+                        'parameters': {'Baz': 1}}),
+            ('b.yaml', {'parameter_defaults': {'Bar': {'b': 1},
+                                               'Foo': None}}),
+            ('c.yaml', {'parameter_defaults': {'Bar': None}})
+        ], provenance)
+        self.assertEqual({
+            'parameter_defaults': {'Foo': 'b.yaml', 'Bar': 'b.yaml'},
+            'parameters': {'Baz': 'a.yaml'}
+        }, provenance)
+
+
+class TestEnvironmentIndex(TestCase):
+
+    def setUp(self):
+        self.index = utils.EnvironmentIndex()
+        self.index.add('a.yaml', {
+            'parameter_defaults': {'Foo': 1,
+                                   'Bar': {'NestedBar': [{'Baz': 1}]}},
+            'resource_registry': {'OS::TripleO::Services::Foo': 'foo.yaml'}
+        })
+        self.index.add('b.yaml', {
+            'parameter_defaults': {'Foo': 2},
+            'resource_registry': {
+                'OS::TripleO::Services::Foo': 'OS::Heat::None'}
+        })
+        self.index.add('c.yaml', None)
+
+    def test_environment(self):
+        self.assertEqual({
+            'parameter_defaults': {'Foo': 2,
+                                   'Bar': {'NestedBar': [{'Baz': 1}]}},
+            'resource_registry': {
+                'OS::TripleO::Services::Foo': 'OS::Heat::None'}
+        }, self.index.environment)
+        self.assertEqual('b.yaml',
+                         self.index.provenance['parameter_defaults']['Foo'])
+        self.assertEqual(2, self.index.get_parameter('Foo'))
+        self.assertEqual('x', self.index.get_parameter('Missing', 'x'))
+
+    def test_add_resets(self):
+        self.assertEqual(2, self.index.get_parameter('Foo'))
+        self.index.add('d.yaml', {'parameter_defaults': {'Foo': 3}})
+        self.assertEqual(3, self.index.get_parameter('Foo'))
+        self.assertEqual(['a.yaml', 'b.yaml', 'd.yaml'],
+                         self.index.parameter_keys['Foo'])
+
+    def test_parameter_keys(self):
+        self.assertEqual({'Foo': ['a.yaml', 'b.yaml'],
+                          'Bar': ['a.yaml'],
+                          'NestedBar': ['a.yaml'],
+                          'Baz': ['a.yaml']},
+                         dict(self.index.parameter_keys))
+
+    def test_get_resources(self):
+        self.assertEqual([('a.yaml', 'foo.yaml'),
+                          ('b.yaml', 'OS::Heat::None')],
+                         self.index.get_resources(
+                             'OS::TripleO::Services::Foo'))
+        self.assertEqual([], self.index.get_resources('OS::Missing'))
+
+    def test_environment_files(self):
+        with tempfile.NamedTemporaryFile(mode='w', suffix='.yaml') as f:
+            f.write('parameter_defaults:\n  Foo: bar\n')
+            f.flush()
+            index = utils.EnvironmentIndex([f.name, '/no/such/file.yaml'])
+            self.assertEqual([(f.name, {'parameter_defaults': {
+                'Foo': 'bar'}})], index.environments)
+
+    @mock.patch('tripleoclient.utils.prompt_user_for_confirmation',
+                return_value=True, autospec=True)
+    def test_check_deprecated_service_is_enabled(self, mock_prompt):
+        service = list(utils.constants.DEPRECATED_SERVICES.keys())[0]
+        index = utils.EnvironmentIndex()
+        index.add('a.yaml', {'resource_registry': {service: 'a.yaml'}})
+        index.add('b.yaml', {'resource_registry': {service: 'b.yaml'}})
+        index.add('c.yaml', {'resource_registry': {
+            service: 'OS::Heat::None'}})
+        # only the given environment files are checked
+        utils.check_deprecated_service_is_enabled(['c.yaml'], index=index)
+        mock_prompt.assert_not_called()
+        utils.check_deprecated_service_is_enabled(
+            ['a.yaml', 'b.yaml', 'c.yaml'], index=index)
+        mock_prompt.assert_called_once()
+
+    @mock.patch('tripleoclient.utils.prompt_user_for_confirmation',
+                return_value=False, autospec=True)
+    def test_check_deprecated_service_not_confirmed(self, mock_prompt):
+        service = list(utils.constants.DEPRECATED_SERVICES.keys())[0]
+        index = utils.EnvironmentIndex()
+        index.add('a.yaml', {'resource_registry': {service: 'a.yaml'}})
+        self.assertRaises(utils.oscexc.CommandError,
+                          utils.check_deprecated_service_is_enabled,
+                          ['a.yaml'], index=index)
+
+    @mock.patch('tripleoclient.utils.prompt_user_for_confirmation',
+                autospec=True)
+    def test_check_deprecated_service_disabled(self, mock_prompt):
+        index = utils.EnvironmentIndex()
+        for service in utils.constants.DEPRECATED_SERVICES:
+            index.add('a.yaml', {'resource_registry': {
+                service: 'OS::Heat::None'}})
+        index.add('b.yaml', {'resource_registry': None})
+        utils.check_deprecated_service_is_enabled(['a.yaml', 'b.yaml'],
+                                                  index=index)
+        mock_prompt.assert_not_called()
+
+
+class TestBuildFilesPayload(TestCase):
+
+    def setUp(self):
+        self.template = {
+            'resources': {'Foo': {'type': 'file:///tht/foo.yaml'}}
+        }
+        self.template_files = {
+            'file:///tht/foo.yaml': json.dumps({
+                'resources': {'Bar': {'properties': {
+                    'config': {'get_file': 'file:///tht/bar.sh'}}}}
+            }),
+            'file:///tht/bar.sh': 'echo bar',
+        }
+        self.env_files = {
+            'file:///tht/env.yaml': json.dumps({
+                'resource_registry': {'OS::Baz': 'file:///tht/baz.yaml'}
+            }),
+            'file:///tht/baz.yaml': '{"resources": {}}',
+            'file:///tht/qux.yaml': b'qux',
+        }
+
+    def test_unreferenced_files(self):
+        files = utils.build_files_payload(
+            self.template, self.template_files, self.env_files,
+            environment={'resource_registry': {
+                'OS::Qux': 'file:///tht/qux.yaml'}})
+        self.assertEqual(['file:///tht/bar.sh', 'file:///tht/foo.yaml',
+                          'file:///tht/qux.yaml'], sorted(files))
+        self.assertEqual(b'qux', files['file:///tht/qux.yaml'])
+
+    def test_environment_files(self):
+        files = utils.build_files_payload(
+            self.template, self.template_files, self.env_files,
+            environment_files=['file:///tht/env.yaml'])
+        self.assertEqual(['file:///tht/bar.sh', 'file:///tht/baz.yaml',
+                          'file:///tht/env.yaml', 'file:///tht/foo.yaml'],
+                         sorted(files))
+
+    def test_report(self):
+        self.env_files['file:///tht/other/foo.yaml'] = \
+            self.template_files['file:///tht/foo.yaml']
+        self.template['resources']['Other'] = {
+            'type': 'file:///tht/other/foo.yaml'}
+        log = mock.Mock()
+        utils.build_files_payload(self.template, self.template_files,
+                                  self.env_files, log=log)
+        self.assertEqual(
+            [mock.call('Files payload: %s: %d files, %.1f KiB',
+                       'file:///tht', 2, mock.ANY),
+             mock.call('Files payload: %s: %d files, %.1f KiB',
+                       'file:///tht/other', 1, mock.ANY)],
+            log.debug.call_args_list)
+        log.info.assert_called_once_with(
+            'Files payload: %d files, %.1f MiB, %.1f MiB of duplicated '
+            'contents. Not sending %d unreferenced files, %.1f MiB',
+            3, mock.ANY, mock.ANY, 3, mock.ANY)
+
+
+class TestStackFingerprint(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        patcher = mock.patch(
+            'tripleoclient.utils.get_stack_fingerprint_file',
+            return_value=os.path.join(self.tmp_dir, 'fingerprint.yaml'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.stack = mock.Mock(id='stack-id', stack_name='overcloud',
+                               stack_status='UPDATE_COMPLETE',
+                               updated_time='2020-01-01T00:00:00Z')
+
+    def _fingerprint(self, tht_root, deploy_identifier, foo='foo'):
+        root = 'file://%s/' % tht_root
+        template = {'resources': {'Foo': {'type': root + 'foo.yaml'}}}
+        files = {
+            root + 'foo.yaml': json.dumps({'resources': {}}),
+            root + 'params.yaml': json.dumps({
+                'parameter_defaults': {'DeployIdentifier': deploy_identifier,
+                                       'Foo': foo}}),
+            root + 'script.sh': b'echo ' + root.encode('utf-8')
+        }
+        return utils.build_stack_fingerprint(
+            template, files, [root + 'params.yaml'], tht_root)
+
+    def test_build_stack_fingerprint(self):
+        fingerprint = self._fingerprint('/tmp/tht-1', 1)
+        self.assertEqual(fingerprint, self._fingerprint('/tmp/tht-2', 2))
+        self.assertNotEqual(fingerprint,
+                            self._fingerprint('/tmp/tht-1', 1, foo='bar'))
+
+    def test_check_stack_fingerprint(self):
+        self.assertFalse(utils.check_stack_fingerprint(self.stack, 'abc'))
+        utils.update_stack_fingerprint(self.stack, 'abc')
+        self.assertTrue(utils.check_stack_fingerprint(self.stack, 'abc'))
+        self.assertFalse(utils.check_stack_fingerprint(self.stack, 'def'))
+
+        self.stack.stack_status = 'UPDATE_FAILED'
+        self.assertFalse(utils.check_stack_fingerprint(self.stack, 'abc'))
+        self.stack.stack_status = 'UPDATE_COMPLETE'
+        self.stack.updated_time = '2020-01-02T00:00:00Z'
+        self.assertFalse(utils.check_stack_fingerprint(self.stack, 'abc'))
+        self.stack.updated_time = '2020-01-01T00:00:00Z'
+        self.stack.id = 'other-stack-id'
+        self.assertFalse(utils.check_stack_fingerprint(self.stack, 'abc'))
+
 
 class GetTripleoAnsibleInventory(TestCase):
 
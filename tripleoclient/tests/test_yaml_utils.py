@@ -0,0 +1,94 @@
+#   Copyright 2020 Red Hat, Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+import mock
+import os
+import shutil
+import tempfile
+import yaml
+
+from unittest import TestCase
+
+from tripleoclient import yaml_utils
+
+
+class TestYamlUtils(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.addCleanup(yaml_utils.clear_cache)
+        self.path = os.path.join(self.tmp, 'env.yaml')
+        self._write('parameter_defaults:\n  Foo: bar\n  Bar: [1, 2]\n')
+
+    def _write(self, content):
+        with open(self.path, 'w') as f:
+            f.write(content)
+
+    def test_loader(self):
+        if hasattr(yaml, 'CSafeLoader'):
+            self.assertIs(yaml.CSafeLoader, yaml_utils.SafeLoader)
+            self.assertIs(yaml.CSafeDumper, yaml_utils.SafeDumper)
+        else:
+            self.assertIs(yaml.SafeLoader, yaml_utils.SafeLoader)
+            self.assertIs(yaml.SafeDumper, yaml_utils.SafeDumper)
+
+    def test_safe_load(self):
+        self.assertEqual({'Foo': ['bar', 1]},
+                         yaml_utils.safe_load('Foo: [bar, 1]\n'))
+        self.assertRaises(yaml.constructor.ConstructorError,
+                          yaml_utils.safe_load,
+                          '!!python/object/apply:os.system [id]\n')
+
+    def test_safe_dump(self):
+        data = {'b': [1, {'c': 'd'}], 'a': 'x' * 100, 'e': None}
+        self.assertEqual(
+            yaml.safe_dump(data, default_flow_style=False),
+            yaml_utils.safe_dump(data, default_flow_style=False)
+        )
+        self.assertEqual(data, yaml_utils.safe_load(
+            yaml_utils.safe_dump(data)))
+
+    def test_load_file_memoized(self):
+        expected = {'parameter_defaults': {'Foo': 'bar', 'Bar': [1, 2]}}
+        with mock.patch('tripleoclient.yaml_utils.safe_load',
+                        wraps=yaml_utils.safe_load) as mock_load:
+            self.assertEqual(expected, yaml_utils.load_file(self.path))
+            self.assertEqual(expected, yaml_utils.load_file(self.path))
+            self.assertEqual(1, mock_load.call_count)
+
+    def test_load_file_copy(self):
+        data = yaml_utils.load_file(self.path)
+        data['parameter_defaults']['Bar'].append(3)
+        self.assertEqual([1, 2],
+                         yaml_utils.load_file(self.path)[
+                             'parameter_defaults']['Bar'])
+
+    def test_load_file_changed(self):
+        yaml_utils.load_file(self.path)
+        self._write('parameter_defaults:\n  Foo: baz\n')
+        self.assertEqual({'parameter_defaults': {'Foo': 'baz'}},
+                         yaml_utils.load_file(self.path))
+
+    def test_load_file_missing(self):
+        self.assertRaises(IOError, yaml_utils.load_file,
+                          os.path.join(self.tmp, 'missing.yaml'))
+
+    def test_clear_cache(self):
+        yaml_utils.load_file(self.path)
+        yaml_utils.clear_cache()
+        with mock.patch('tripleoclient.yaml_utils.safe_load',
+                        return_value={}) as mock_load:
+            self.assertEqual({}, yaml_utils.load_file(self.path))
+            mock_load.assert_called_once()
@@ -20,7 +20,6 @@ from osc_lib.tests import utils
 from tripleoclient import constants
 from tripleoclient.tests import fakes
 from tripleoclient.v1 import overcloud_backup
-from unittest.mock import call
 
 
 class TestOvercloudBackup(utils.TestCommand):
@@ -145,14 +144,17 @@ class TestOvercloudBackup(utils.TestCommand):
             extra_vars={}
         )
 
-    @mock.patch('tripleoclient.utils.run_ansible_playbook', autospec=True)
+    @mock.patch('tripleoclient.utils.run_ansible_playbook_graph',
+                autospec=True)
     def test_overcloud_backup_setup_nfs_rear_with_inventory(self,
-                                                            mock_playbook):
+                                                            mock_graph):
         arglist = [
             '--setup-nfs',
             '--setup-rear',
             '--inventory',
-            '/tmp/test_inventory.yaml'
+            '/tmp/test_inventory.yaml',
+            '--extra-vars',
+            '{"tripleo_controller_group_name": "ctrl"}'
         ]
         verifylist = []
 
@@ -160,24 +162,20 @@ class TestOvercloudBackup(utils.TestCommand):
 
         self.cmd.take_action(parsed_args)
 
-        calls = [call(workdir=mock.ANY,
-                      playbook='prepare-nfs-backup.yaml',
-                      inventory=parsed_args.inventory,
-                      tags='bar_setup_nfs_server',
-                      skip_tags=None,
-                      playbook_dir=constants.ANSIBLE_TRIPLEO_PLAYBOOKS,
-                      verbosity=3,
-                      extra_vars={}),
-                 call(workdir=mock.ANY,
-                      playbook='prepare-overcloud-backup.yaml',
-                      inventory=parsed_args.inventory,
-                      tags='bar_setup_rear',
-                      skip_tags=None,
-                      playbook_dir=constants.ANSIBLE_TRIPLEO_PLAYBOOKS,
-                      verbosity=3,
-                      extra_vars={})]
-
-        mock_playbook.assert_has_calls(calls)
+        mock_graph.assert_called_once_with(
+            playbooks=[{'playbook': 'prepare-nfs-backup.yaml',
+                        'hosts': 'BackupNode',
+                        'tags': 'bar_setup_nfs_server'},
+                       {'playbook': 'prepare-overcloud-backup.yaml',
+                        'hosts': 'ctrl',
+                        'tags': 'bar_setup_rear'}],
+            workdir=mock.ANY,
+            playbook_dir=constants.ANSIBLE_TRIPLEO_PLAYBOOKS,
+            inventory=parsed_args.inventory,
+            skip_tags=None,
+            verbosity=3,
+            extra_vars={'tripleo_controller_group_name': 'ctrl'}
+        )
 
     @mock.patch('tripleoclient.utils.run_ansible_playbook',
                 autospec=True)
@@ -18,6 +18,7 @@ import os
 import shutil
 import six
 import tempfile
+import threading
 import yaml
 
 import mock
@@ -26,7 +27,11 @@ from osc_lib import exceptions as oscexc
 from osc_lib.tests import utils
 
 from tripleoclient import constants
+from tripleoclient import environment_cache
+from tripleoclient import stack_data_cache
 from tripleoclient import exceptions
+from tripleoclient import phase_profiler
+from tripleoclient import utils as plugin_utils
 from tripleoclient.tests.fixture_data import deployment
 from tripleoclient.tests.v1.overcloud_deploy import fakes
 from tripleoclient.v1 import overcloud_deploy
@@ -52,6 +57,31 @@ class TestDeployOvercloud(fakes.TestDeployOvercloud):
         history_patcher.start()
         self.addCleanup(history_patcher.stop)
 
+        env_cache = mock.patch(
+            'tripleoclient.utils.get_environment_cache',
+            return_value=environment_cache.EnvironmentCache(
+                os.path.join(self.tmp_dir.path, 'environment_cache.sqlite')))
+        env_cache.start()
+        self.addCleanup(env_cache.stop)
+
+        stack_data_cache_patcher = mock.patch(
+            'tripleoclient.utils.get_stack_data_cache',
+            return_value=stack_data_cache.StackDataCache())
+        stack_data_cache_patcher.start()
+        self.addCleanup(stack_data_cache_patcher.stop)
+
+        # Render the templates in the temporary tree of each deployment
+        workspace_patcher = mock.patch(
+            'tripleoclient.utils.get_template_workspace', return_value=None)
+        workspace_patcher.start()
+        self.addCleanup(workspace_patcher.stop)
+
+        # Mock the stack fingerprint to avoid leaking files
+        fingerprint_patcher = mock.patch(
+            'tripleoclient.utils.update_stack_fingerprint', autospec=True)
+        self.mock_update_fingerprint = fingerprint_patcher.start()
+        self.addCleanup(fingerprint_patcher.stop)
+
         self.real_shutil = shutil.rmtree
 
         self.uuid1_value = "uuid"
@@ -89,6 +119,12 @@ class TestDeployOvercloud(fakes.TestDeployOvercloud):
         mock_run_command.start()
         self.addCleanup(mock_run_command.stop)
 
+        # Mock the rendering of the temporary templates
+        render_patcher = mock.patch(
+            'tripleoclient.utils.jinja_render_files', autospec=True)
+        render_patcher.start()
+        self.addCleanup(render_patcher.stop)
+
         # Mock playbook runner
         playbook_runner = mock.patch(
             'tripleoclient.utils.run_ansible_playbook',
@@ -593,7 +629,8 @@ class TestDeployOvercloud(fakes.TestDeployOvercloud):
                               env, run_validations,
                               roles_file,
                               env_files_tracker=None,
-                              deployment_options=None):
+                              deployment_options=None,
+                              force_stack_update=False):
             assertEqual(
                 {'parameter_defaults': {},
                  'resource_registry': {
@@ -680,7 +717,8 @@ class TestDeployOvercloud(fakes.TestDeployOvercloud):
             self.cmd, {}, 'overcloud',
             '/fake/path/' + constants.OVERCLOUD_YAML_NAME, {},
             ['~/overcloud-env.json'], 1, '/fake/path', {}, False,
-            None, deployment_options=None, env_files_tracker=None)
+            None, deployment_options=None, env_files_tracker=None,
+            force_stack_update=False)
 
     @mock.patch('tripleoclient.v1.overcloud_deploy.DeployOvercloud.'
                 '_heat_deploy', autospec=True)
@@ -731,6 +769,162 @@ class TestDeployOvercloud(fakes.TestDeployOvercloud):
         self.assertFalse(utils_fixture.mock_deploy_tht.called)
         self.assertFalse(mock_create_tempest_deployer_input.called)
 
+    @mock.patch('tripleoclient.utils.process_multiple_environments',
+                autospec=True)
+    @mock.patch('tripleoclient.utils.check_deprecated_service_is_enabled',
+                autospec=True)
+    def test_process_environments_checks(self, mock_check_deprecated,
+                                         mock_process_env):
+        def _process_env(env_files, tht_root, user_tht_root, **kwargs):
+            for env_file in env_files:
+                kwargs['index'].add(
+                    env_file, {'parameter_defaults': {'Foo': env_file}})
+            return {}, kwargs['index'].environment
+
+        mock_process_env.side_effect = _process_env
+        arglist = ['--templates', '-e', '/home/stack/env.yaml']
+        verifylist = [
+            ('environment_files', ['/home/stack/env.yaml']),
+        ]
+        parsed_args = self.check_parser(self.cmd, arglist, verifylist)
+
+        _, _, env_index = self.cmd._process_environments(
+            parsed_args, '/tmp/tht', '/usr/share/tht',
+            parameter_env_files=['/tmp/tht/parameters.yaml'])
+
+        # The user environment files are checked with the index of all the
+        # merged environments, which is only built once.
+        mock_process_env.assert_called_once()
+        mock_check_deprecated.assert_called_once_with(
+            ['/home/stack/env.yaml'], index=env_index)
+        self.assertEqual('/home/stack/env.yaml',
+                         env_index.get_parameter('Foo'))
+
+    @mock.patch('tripleoclient.v1.overcloud_deploy.DeployOvercloud.'
+                '_update_parameters', autospec=True,
+                return_value={'NtpServer': 'ntp.example.com'})
+    @mock.patch('tripleoclient.utils.process_multiple_environments',
+                autospec=True)
+    @mock.patch('shutil.rmtree', autospec=True)
+    @mock.patch('tempfile.mkdtemp', autospec=True)
+    @mock.patch('tripleoclient.v1.overcloud_deploy.DeployOvercloud.'
+                '_deploy_tripleo_heat_templates_tmpdir', autospec=True)
+    def test_dry_run_explain_params(self, mock_deploy_tmpdir, mock_mkdtemp,
+                                    mock_rmtree, mock_process_env,
+                                    mock_update_params):
+        tmp = self.tmp_dir.path
+        tht_root = os.path.join(tmp, 'tripleo-heat-templates')
+        mock_mkdtemp.return_value = tmp
+        work_dir = mock.patch('tripleoclient.constants.DEFAULT_WORK_DIR',
+                              os.path.join(tmp, 'config-download'))
+        work_dir.start()
+        self.addCleanup(work_dir.stop)
+        run_data_dir = plugin_utils.get_stack_run_data_dir('overcloud')
+        os.makedirs(run_data_dir)
+        baremetal_env = os.path.join(run_data_dir, 'baremetal-deployed.yaml')
+        with open(baremetal_env, 'w') as f:
+            f.write('parameter_defaults: {ComputeCount: 2}\n')
+        param_env = os.path.join(tht_root, 'user-environments',
+                                 'tripleoclient-parameters.yaml')
+
+        def _process_env(env_files, tht_root, user_tht_root, **kwargs):
+            for env_file in env_files:
+                if env_file == '/home/stack/bar.yaml':
+                    env = {'parameter_defaults': {'Bar': 2},
+                           'resource_registry': {'OS::Foo': 'foo.yaml'}}
+                elif os.path.exists(env_file):
+                    env = plugin_utils.yaml_utils.load_file(env_file)
+                elif env_file.endswith(constants.DEFAULT_RESOURCE_REGISTRY):
+                    env = {'parameter_defaults': {'Foo': 1, 'Bar': 1}}
+                else:
+                    env = {}
+                kwargs['index'].add(env_file, env)
+            return {}, kwargs['index'].environment
+
+        mock_process_env.side_effect = _process_env
+        self.app.client_manager.orchestration.stacks.get.return_value = None
+        arglist = ['--templates', '/usr/share/tht', '--dry-run',
+                   '--explain-params', '-e', '/home/stack/bar.yaml',
+                   '--baremetal-deployment', '/home/stack/bm.yaml',
+                   '--deployed-server']
+        verifylist = [
+            ('dry_run', True),
+            ('explain_params', []),
+        ]
+        parsed_args = self.check_parser(self.cmd, arglist, verifylist)
+        self.cmd.app.stdout = six.StringIO()
+
+        with mock.patch('os.path.isfile', return_value=True):
+            self.cmd.take_action(parsed_args)
+
+        mock_deploy_tmpdir.assert_not_called()
+        self.assertFalse(self.mock_playbook.called)
+        mock_process_env.assert_called_once_with(
+            [os.path.join(tht_root, 'overcloud-resource-registry-puppet.yaml'),
+             baremetal_env, param_env,
+             os.path.join(tht_root, constants.DEPLOYED_SERVER_ENVIRONMENT),
+             '/home/stack/bar.yaml'],
+            tht_root, '/usr/share/tht',
+            env_files_tracker=None, cleanup=True,
+            cache=mock.ANY, index=mock.ANY)
+        mock_rmtree.assert_called_once_with(tmp)
+        rows = [i.split('|')[1:-1] for i in
+                self.cmd.app.stdout.getvalue().splitlines()[3:-1]]
+        self.assertEqual(
+            [['Bar', '/home/stack/bar.yaml'],
+             ['ComputeCount', baremetal_env],
+             ['Foo', '/usr/share/tht/overcloud-resource-registry-puppet.yaml'],
+             ['NtpServer',
+              '/usr/share/tht/user-environments/'
+              'tripleoclient-parameters.yaml']],
+            [[i[0].strip(), i[2].strip()] for i in rows])
+
+    @mock.patch('tripleoclient.workflows.deployment.deploy_without_plan',
+                autospec=True)
+    @mock.patch('tripleoclient.workflows.parameters.'
+                'check_deprecated_parameters', autospec=True)
+    @mock.patch('tripleoclient.utils.check_stack_fingerprint',
+                autospec=True, return_value=True)
+    @mock.patch('heatclient.common.template_utils.get_template_contents',
+                autospec=True, return_value=({}, {}))
+    @mock.patch('tripleo_common.update.check_neutron_mechanism_drivers',
+                return_value=None)
+    def test_heat_deploy_unchanged_stack(self, mock_check_drivers,
+                                         mock_get_template,
+                                         mock_check_fingerprint,
+                                         mock_check_params, mock_deploy):
+        self.cmd.clients = self.app.client_manager
+        stack = mock.Mock()
+        args = (stack, 'overcloud', '/tmp/tht/overcloud.yaml', {}, {}, 240,
+                '/tmp/tht', {}, False, None)
+        self.cmd._heat_deploy(*args, env_files_tracker=[])
+        mock_check_fingerprint.assert_called_once_with(stack, mock.ANY)
+        mock_check_params.assert_not_called()
+        mock_deploy.assert_not_called()
+
+        self.cmd._heat_deploy(*args, env_files_tracker=[],
+                              force_stack_update=True)
+        mock_check_fingerprint.assert_called_once()
+        mock_deploy.assert_called_once()
+        self.assertEqual(mock_check_fingerprint.call_args[0][1],
+                         self.cmd._stack_fingerprint)
+
+    def test_force_stack_update(self):
+        arglist = ['--templates', '--force-stack-update']
+        verifylist = [
+            ('force_stack_update', True),
+        ]
+        self.check_parser(self.cmd, arglist, verifylist)
+
+    def test_explain_params_without_dry_run(self):
+        arglist = ['--templates', '--explain-params', 'Foo']
+        verifylist = [
+            ('explain_params', ['Foo']),
+        ]
+        parsed_args = self.check_parser(self.cmd, arglist, verifylist)
+        self.assertRaises(oscexc.CommandError,
+                          self.cmd.take_action, parsed_args)
+
     @mock.patch('tripleoclient.utils.get_rc_params', autospec=True)
     @mock.patch('tripleo_common.utils.plan.generate_passwords',
                 return_value={})
@@ -1177,6 +1371,100 @@ class TestDeployOvercloud(fakes.TestDeployOvercloud):
             'DEPLOY_FAILED',
             fixture.mock_set_deployment_status.call_args[-1]['status'])
 
+    def _config_download_only(self, mock_rc_params):
+        clients = self.app.client_manager
+        orchestration_client = clients.orchestration
+        orchestration_client.stacks.get.return_value = fakes.create_tht_stack()
+        mock_rc_params.return_value = {'password': 'password',
+                                       'region': 'region1'}
+        arglist = ['--templates', '--config-download-only']
+        verifylist = [('config_download_only', True)]
+        return self.check_parser(self.cmd, arglist, verifylist)
+
+    @mock.patch('tripleoclient.workflows.deployment.get_horizon_url')
+    @mock.patch('tripleoclient.utils.get_rc_params', autospec=True)
+    @mock.patch('tripleoclient.utils.copy_clouds_yaml')
+    @mock.patch('tripleoclient.utils.create_tempest_deployer_input',
+                autospec=True)
+    @mock.patch('tripleoclient.utils.get_overcloud_endpoint', autospec=True)
+    def test_post_stack_steps_concurrent(
+            self, mock_overcloud_endpoint,
+            mock_create_tempest_deployer_input,
+            mock_copy, mock_rc_params, mock_horizon_url):
+        fixture = deployment.DeploymentWorkflowFixture()
+        self.useFixture(fixture)
+        parsed_args = self._config_download_only(mock_rc_params)
+
+        # the horizon URL is only returned once config-download started
+        config_download_started = threading.Event()
+
+        def get_horizon_url(stack):
+            if not config_download_started.wait(10):
+                raise RuntimeError('config-download waited for horizon')
+            return 'fake://url:12345'
+
+        mock_horizon_url.side_effect = get_horizon_url
+        fixture.mock_config_download.side_effect = \
+            lambda *args, **kwargs: config_download_started.set()
+
+        with mock.patch('sys.stdout', new_callable=six.StringIO) as stdout:
+            self.cmd.take_action(parsed_args)
+        self.assertIn('Overcloud Horizon Dashboard URL: fake://url:12345',
+                      stdout.getvalue())
+        self.assertEqual(
+            'DEPLOY_SUCCESS',
+            fixture.mock_set_deployment_status.call_args[-1]['status'])
+
+    @mock.patch('tripleoclient.workflows.deployment.get_horizon_url',
+                side_effect=exceptions.DeploymentError('no horizon'))
+    @mock.patch('tripleoclient.utils.get_rc_params', autospec=True)
+    @mock.patch('tripleoclient.utils.copy_clouds_yaml')
+    @mock.patch('tripleoclient.utils.create_tempest_deployer_input',
+                autospec=True)
+    @mock.patch('tripleoclient.utils.get_overcloud_endpoint', autospec=True)
+    def test_post_stack_step_fails(
+            self, mock_overcloud_endpoint,
+            mock_create_tempest_deployer_input,
+            mock_copy, mock_rc_params, mock_horizon_url):
+        fixture = deployment.DeploymentWorkflowFixture()
+        self.useFixture(fixture)
+        parsed_args = self._config_download_only(mock_rc_params)
+
+        with mock.patch('sys.stdout', new_callable=six.StringIO) as stdout:
+            self.assertRaisesRegex(exceptions.DeploymentError, 'no horizon',
+                                   self.cmd.take_action, parsed_args)
+        self.assertTrue(fixture.mock_config_download.called)
+        self.assertIn('Overcloud Horizon Dashboard URL: None',
+                      stdout.getvalue())
+        self.assertIn('Overcloud rc file: ', stdout.getvalue())
+        self.assertNotIn('Overcloud rc file: None', stdout.getvalue())
+        self.assertEqual(
+            'DEPLOY_FAILED',
+            fixture.mock_set_deployment_status.call_args[-1]['status'])
+
+    @mock.patch('tripleoclient.workflows.deployment.get_horizon_url')
+    @mock.patch('tripleoclient.utils.get_rc_params', autospec=True)
+    @mock.patch('tripleoclient.utils.copy_clouds_yaml')
+    @mock.patch('tripleoclient.utils.create_tempest_deployer_input',
+                autospec=True)
+    @mock.patch('tripleoclient.utils.get_overcloud_endpoint', autospec=True)
+    def test_overcloudrc_fails_before_config_download(
+            self, mock_overcloud_endpoint,
+            mock_create_tempest_deployer_input,
+            mock_copy, mock_rc_params, mock_horizon_url):
+        fixture = deployment.DeploymentWorkflowFixture()
+        self.useFixture(fixture)
+        parsed_args = self._config_download_only(mock_rc_params)
+        mock_rc_params.side_effect = exceptions.DeploymentError('no rc')
+
+        with mock.patch('sys.stdout', new_callable=six.StringIO):
+            self.assertRaisesRegex(exceptions.DeploymentError, 'no rc',
+                                   self.cmd.take_action, parsed_args)
+        self.assertFalse(fixture.mock_config_download.called)
+        self.assertEqual(
+            'DEPLOY_FAILED',
+            fixture.mock_set_deployment_status.call_args[-1]['status'])
+
     @mock.patch('tripleoclient.utils.get_rc_params', autospec=True)
     @mock.patch('tripleoclient.utils.copy_clouds_yaml')
     @mock.patch('tripleoclient.v1.overcloud_deploy.DeployOvercloud.'
@@ -1276,7 +1564,8 @@ class TestDeployOvercloud(fakes.TestDeployOvercloud):
                            ['192.168.0.1 uc.ctlplane.localhost uc.ctlplane'],
                         'CtlplaneNetworkAttributes': {}}, mock.ANY,
                        451, mock.ANY, mock.ANY, False, None,
-                       deployment_options={}, env_files_tracker=mock.ANY)],
+                       deployment_options={}, env_files_tracker=mock.ANY,
+                       force_stack_update=False)],
             mock_hd.mock_calls)
         self.assertIn(
             [mock.call(mock.ANY, mock.ANY, mock.ANY, 'ctlplane', None, None,
@@ -1284,7 +1573,8 @@ class TestDeployOvercloud(fakes.TestDeployOvercloud):
                        deployment_timeout=448,  # 451 - 3, total time left
                        in_flight_validations=False, limit_hosts=None,
                        skip_tags=None, tags=None, timeout=42, verbosity=3,
-                       forks=None)],
+                       forks=None, ssh_prewarm=False,
+                       accelerated=False)],
             fixture.mock_config_download.mock_calls)
         fixture.mock_config_download.assert_called()
         mock_copy.assert_called_once()
@@ -1338,7 +1628,10 @@ class TestDeployOvercloud(fakes.TestDeployOvercloud):
                 reproduce_command=True, skip_tags='opendev-validation',
                 ssh_user='tripleo-admin', tags=None,
                 timeout=240,
-                verbosity=3, workdir=mock.ANY, forks=None)],
+                verbosity=3, workdir=mock.ANY, forks=None,
+                timing_stream=mock.ANY, forks_history=mock.ANY,
+                checkpoint=None, resume=False, events_archive=mock.ANY,
+                accelerated=False)],
             utils_fixture2.mock_run_ansible_playbook.mock_calls)
 
     @mock.patch('tripleoclient.utils.write_user_environment', autospec=True)
@@ -1384,7 +1677,14 @@ class TestDeployOvercloud(fakes.TestDeployOvercloud):
         with open(env_path, 'w') as f:
             yaml.safe_dump(baremetal_deployed, f)
 
-        result = self.cmd._provision_baremetal(parsed_args, tht_root)
+        work_dir = self.tmp_dir.join('config-download')
+        with mock.patch('tripleoclient.constants.DEFAULT_WORK_DIR',
+                        work_dir):
+            result = self.cmd._provision_baremetal(parsed_args, tht_root)
+            self.assertEqual(
+                [os.path.join(work_dir, 'overcloud', 'tripleo-run-data',
+                              'baremetal-deployed.yaml')],
+                self.cmd._get_baremetal_env_files(parsed_args))
         self.cmd._unprovision_baremetal(parsed_args)
         self.assertEqual([env_path], result)
         self.mock_playbook.assert_has_calls([
@@ -1450,11 +1750,12 @@ class TestDeployOvercloud(fakes.TestDeployOvercloud):
         mock_warning = mock.MagicMock()
         mock_log = mock.MagicMock()
         mock_log.warning = mock_warning
-        env = {'parameter_defaults': {}}
+        env_index = plugin_utils.EnvironmentIndex()
+        env_index.add('env.yaml', {'parameter_defaults': {}})
 
         old_logger = self.cmd.log
         self.cmd.log = mock_log
-        self.cmd._check_limit_skiplist_warning(env)
+        self.cmd._check_limit_skiplist_warning(env_index)
         self.cmd.log = old_logger
         mock_warning.assert_not_called()
 
@@ -1462,11 +1763,13 @@ class TestDeployOvercloud(fakes.TestDeployOvercloud):
         mock_warning = mock.MagicMock()
         mock_log = mock.MagicMock()
         mock_log.warning = mock_warning
-        env = {'parameter_defaults': {'DeploymentServerBlacklist': []}}
+        env_index = plugin_utils.EnvironmentIndex()
+        env_index.add('env.yaml', {'parameter_defaults': {
+            'DeploymentServerBlacklist': []}})
 
         old_logger = self.cmd.log
         self.cmd.log = mock_log
-        self.cmd._check_limit_skiplist_warning(env)
+        self.cmd._check_limit_skiplist_warning(env_index)
         self.cmd.log = old_logger
         mock_warning.assert_not_called()
 
@@ -1474,11 +1777,13 @@ class TestDeployOvercloud(fakes.TestDeployOvercloud):
         mock_warning = mock.MagicMock()
         mock_log = mock.MagicMock()
         mock_log.warning = mock_warning
-        env = {'parameter_defaults': {'DeploymentServerBlacklist': ['a']}}
+        env_index = plugin_utils.EnvironmentIndex()
+        env_index.add('env.yaml', {'parameter_defaults': {
+            'DeploymentServerBlacklist': ['a']}})
 
         old_logger = self.cmd.log
         self.cmd.log = mock_log
-        self.cmd._check_limit_skiplist_warning(env)
+        self.cmd._check_limit_skiplist_warning(env_index)
         self.cmd.log = old_logger
         expected_message = ('[WARNING] DeploymentServerBlacklist is defined '
                             'and will be ignored because --limit has been '
@@ -1546,6 +1851,39 @@ class TestDeployOvercloud(fakes.TestDeployOvercloud):
         }
         self.assertEqual(expected, function(mock.ANY))
 
+    def test_write_phase_profile(self):
+        arglist = ['--templates', '--profile-phases',
+                   '--output-dir', '/tmp/output']
+        verifylist = [('profile_phases', True)]
+        parsed_args = self.check_parser(self.cmd, arglist, verifylist)
+        self.cmd._profiler = phase_profiler.PhaseProfiler()
+        with self.cmd._profiler.phase('Deploy templates'):
+            with self.cmd._profiler.phase('Render templates'):
+                pass
+
+        self.app.stdout = six.StringIO()
+        with mock.patch('tripleoclient.constants.DEFAULT_WORK_DIR',
+                        self.tmp_dir.path):
+            self.cmd._write_phase_profile(parsed_args)
+        self.assertIn('Render templates', self.app.stdout.getvalue())
+
+        run_data = os.path.join(self.tmp_dir.path, 'overcloud',
+                                constants.STACK_RUN_DATA_DIR)
+        reports = os.listdir(run_data)
+        self.assertEqual(1, len(reports))
+        with open(os.path.join(run_data, reports[0])) as f:
+            report = yaml.safe_load(f)
+        self.assertEqual(['Deploy templates'],
+                         [i['name'] for i in report['phases']])
+        self.assertEqual(['Render templates'],
+                         [i['name'] for i in report['phases'][0]['phases']])
+
+    def test_write_phase_profile_disabled(self):
+        parsed_args = self.check_parser(
+            self.cmd, ['--templates', '--output-dir', self.tmp_dir.path], [])
+        self.cmd._write_phase_profile(parsed_args)
+        self.assertEqual([], os.listdir(self.tmp_dir.path))
+
 
 class TestArgumentValidation(fakes.TestDeployOvercloud):
 
@@ -1608,3 +1946,62 @@ class TestGetDeploymentStatus(utils.TestCommand):
             '+------------+-------------------+\n')
 
         self.assertEqual(expected, self.cmd.app.stdout.getvalue())
+
+
+class TestCompareDeploymentTiming(utils.TestCommand):
+
+    def setUp(self):
+        super(TestCompareDeploymentTiming, self).setUp()
+        self.cmd = overcloud_deploy.CompareDeploymentTiming(self.app, None)
+        self.tmp_dir = self.useFixture(fixtures.TempDir()).path
+        self.run_dir = os.path.join(
+            self.tmp_dir, 'overcloud', constants.STACK_RUN_DATA_DIR)
+        os.makedirs(self.run_dir)
+        for run, duration in (('20200101000000', 10.0),
+                              ('20200102000000', 12.0),
+                              ('20200103000000', 30.0)):
+            path = os.path.join(
+                self.run_dir, constants.ANSIBLE_TIMING_FILE.format(run))
+            with open(path, 'w') as f:
+                for task, task_duration in (('Ping', 1.0),
+                                            ('Install', duration)):
+                    f.write(
+                        '{"host": "node-0", "task": "%s", "role": null, '
+                        '"play": "Deploy", "duration": %s}\n' %
+                        (task, task_duration))
+
+    def test_compare_last_runs(self):
+        parsed_args = self.check_parser(
+            self.cmd, ['--output-dir', self.tmp_dir],
+            [('plan', 'overcloud'), ('group_by', 'task')])
+        columns, rows = self.cmd.take_action(parsed_args)
+        self.assertEqual('Task', columns[0])
+        self.assertEqual(
+            [('Install', 12.0, 30.0, 18.0, 150.0),
+             ('Ping', 1.0, 1.0, 0.0, 0.0)],
+            rows
+        )
+
+    def test_compare_runs(self):
+        parsed_args = self.check_parser(
+            self.cmd, ['--output-dir', self.tmp_dir,
+                       '--after', '20200102000000', '--top', '1'],
+            [('after', '20200102000000'), ('top', 1)])
+        columns, rows = self.cmd.take_action(parsed_args)
+        self.assertEqual([('Install', 10.0, 12.0, 2.0, 20.0)], rows)
+
+    def test_compare_unknown_run(self):
+        parsed_args = self.check_parser(
+            self.cmd, ['--output-dir', self.tmp_dir,
+                       '--before', '20190101000000'],
+            [('before', '20190101000000')])
+        self.assertRaises(oscexc.CommandError,
+                          self.cmd.take_action, parsed_args)
+
+    def test_compare_single_run(self):
+        parsed_args = self.check_parser(
+            self.cmd, ['--output-dir', self.tmp_dir,
+                       '--after', '20200101000000'],
+            [('after', '20200101000000')])
+        self.assertRaises(oscexc.CommandError,
+                          self.cmd.take_action, parsed_args)
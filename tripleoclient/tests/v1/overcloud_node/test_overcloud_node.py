@@ -194,6 +194,7 @@ class TestDeleteNode(fakes.TestDeleteNode):
             ]
             parsed_args = self.check_parser(self.cmd, argslist, verifylist)
 
+            mock_playbook.return_value = []
             self.cmd.take_action(parsed_args)
 
         # Verify
@@ -262,7 +263,13 @@ class TestDeleteNode(fakes.TestDeleteNode):
                 extra_vars=None,
                 tags=None,
                 timeout=90,
-                forks=None
+                forks=None,
+                timing_stream=mock.ANY,
+                forks_history=mock.ANY,
+                checkpoint=None,
+                resume=False,
+                events_archive=mock.ANY,
+                accelerated=False
             ),
             mock.call(
                 inventory='localhost,',
@@ -47,7 +47,7 @@ class TestOvercloudUpdatePrepare(fakes.TestOvercloudUpdatePrepare):
     @mock.patch('tripleoclient.v1.overcloud_update.UpdatePrepare.log',
                 autospec=True)
     @mock.patch('os.path.abspath')
-    @mock.patch('yaml.safe_load')
+    @mock.patch('tripleoclient.yaml_utils.safe_load')
     @mock.patch('shutil.copytree', autospec=True)
     @mock.patch('six.moves.builtins.open')
     @mock.patch('tripleoclient.v1.overcloud_deploy.DeployOvercloud.'
@@ -80,7 +80,7 @@ class TestOvercloudUpdatePrepare(fakes.TestOvercloudUpdatePrepare):
                 return_value=True)
     @mock.patch('six.moves.builtins.open')
     @mock.patch('os.path.abspath')
-    @mock.patch('yaml.safe_load')
+    @mock.patch('tripleoclient.yaml_utils.safe_load')
     @mock.patch('shutil.copytree', autospec=True)
     @mock.patch('tripleoclient.v1.overcloud_deploy.DeployOvercloud.'
                 'take_action', autospec=True)
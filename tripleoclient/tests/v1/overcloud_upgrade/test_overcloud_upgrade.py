@@ -50,7 +50,7 @@ class TestOvercloudUpgradePrepare(fakes.TestOvercloudUpgradePrepare):
                 autospec=True)
     @mock.patch('tripleoclient.v1.overcloud_upgrade.UpgradePrepare.log',
                 autospec=True)
-    @mock.patch('yaml.safe_load')
+    @mock.patch('tripleoclient.yaml_utils.safe_load')
     @mock.patch('six.moves.builtins.open')
     def test_upgrade_out(self,
                          mock_open,
@@ -105,7 +105,7 @@ class TestOvercloudUpgradePrepare(fakes.TestOvercloudUpgradePrepare):
                 autospec=True)
     @mock.patch('tripleoclient.utils.prepend_environment', autospec=True)
     @mock.patch('six.moves.builtins.open')
-    @mock.patch('yaml.safe_load')
+    @mock.patch('tripleoclient.yaml_utils.safe_load')
     def test_upgrade_failed(self, mock_yaml, mock_open,
                             add_env, mock_get_stack, mock_overcloud_deploy,
                             mock_confirm, mock_usercheck):
@@ -138,6 +138,25 @@ class TestOvercloudUpgradePrepare(fakes.TestOvercloudUpgradePrepare):
         self.assertRaises(oscexc.CommandError,
                           self.cmd._heat_deploy, *argslist)
 
+    @mock.patch('tripleoclient.utils.check_deprecated_service_is_enabled',
+                autospec=True)
+    def test_upgrade_check_environments(self, mock_deprecated):
+        parsed_args = mock.Mock(environment_files=['/tmp/upgrade.yaml'])
+        env_index = mock.Mock(parameter_keys={
+            'ForbiddenParam': ['/tmp/upgrade.yaml'],
+            'DefaultParam': ['/tmp/tht/defaults.yaml']})
+        self.cmd.forbidden_params = ['ForbiddenParam', 'DefaultParam']
+        self.assertRaisesRegex(exceptions.BannedParameters,
+                               '\nForbiddenParam\n$',
+                               self.cmd._check_environments,
+                               parsed_args, env_index)
+        mock_deprecated.assert_not_called()
+
+        del env_index.parameter_keys['ForbiddenParam']
+        self.cmd._check_environments(parsed_args, env_index)
+        mock_deprecated.assert_called_once_with(
+            ['/tmp/upgrade.yaml'], index=env_index)
+
 
 class TestOvercloudUpgradeRun(fakes.TestOvercloudUpgradeRun):
 
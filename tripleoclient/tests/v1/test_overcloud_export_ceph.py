@@ -31,7 +31,7 @@ class TestOvercloudExportCeph(utils.TestCommand):
         self.mock_open = mock.mock_open()
 
     @mock.patch('os.path.exists')
-    @mock.patch('yaml.safe_dump')
+    @mock.patch('tripleoclient.yaml_utils.safe_dump')
     @mock.patch('tripleoclient.export.export_ceph')
     def test_export_ceph(self, mock_export_ceph,
                          mock_safe_dump,
@@ -23,6 +23,7 @@ import yaml
 from heatclient import exc as hc_exc
 from tripleo_common.image import kolla_builder
 
+from tripleoclient import environment_cache
 from tripleoclient import exceptions
 from tripleoclient.tests import fakes
 from tripleoclient.tests.v1.test_plugin import TestPluginV1
@@ -64,6 +65,19 @@ class TestDeployUndercloud(TestPluginV1):
         self.orc.stacks.create = mock.MagicMock(
             return_value={'stack': {'id': 'foo'}})
 
+        env_cache = mock.patch(
+            'tripleoclient.utils.get_environment_cache',
+            return_value=environment_cache.EnvironmentCache(
+                os.path.join(self.useFixture(fixtures.TempDir()).path,
+                             'environment_cache.sqlite')))
+        env_cache.start()
+        self.addCleanup(env_cache.stop)
+
+        check_params = mock.patch(
+            'tripleoclient.workflows.parameters.check_parameters_offline')
+        self.mock_check_params = check_params.start()
+        self.addCleanup(check_params.stop)
+
     @mock.patch('tripleoclient.v1.tripleo_deploy.Deploy._is_undercloud_deploy')
     @mock.patch('tripleoclient.utils.check_hostname')
     def test_run_preflight_checks(self, mock_check_hostname, mock_uc):
@@ -233,7 +247,7 @@ class TestDeployUndercloud(TestPluginV1):
     # TODO(cjeanner) drop once we have proper oslo.privsep
     @mock.patch('subprocess.check_call', autospec=True)
     @mock.patch('tripleo_common.utils.passwords.generate_passwords')
-    @mock.patch('yaml.safe_dump')
+    @mock.patch('tripleoclient.yaml_utils.safe_dump')
     def test_update_passwords_env_init(self, mock_dump, mock_pw, mock_cc,
                                        mock_exists, mock_chmod, mock_user):
         pw_dict = {"GeneratedPassword": 123}
@@ -257,7 +271,7 @@ class TestDeployUndercloud(TestPluginV1):
     # TODO(cjeanner) drop once we have proper oslo.privsep
     @mock.patch('subprocess.check_call', autospec=True)
     @mock.patch('tripleo_common.utils.passwords.generate_passwords')
-    @mock.patch('yaml.safe_dump')
+    @mock.patch('tripleoclient.yaml_utils.safe_dump')
     def test_update_passwords_env(self, mock_dump, mock_pw, mock_cc,
                                   mock_exists, mock_chmod, mock_user):
         pw_dict = {"GeneratedPassword": 123, "LegacyPass": "override me"}
@@ -301,7 +315,7 @@ class TestDeployUndercloud(TestPluginV1):
     # TODO(bogdando) drop once we have proper oslo.privsep
     @mock.patch('subprocess.check_call', autospec=True)
     @mock.patch('tripleo_common.utils.passwords.generate_passwords')
-    @mock.patch('yaml.safe_dump')
+    @mock.patch('tripleoclient.yaml_utils.safe_dump')
     def test_update_passwords_env_upgrade(self, mock_dump, mock_pw, mock_cc,
                                           mock_exists, mock_chmod, mock_user):
         pw_dict = {"GeneratedPassword": 123, "LegacyPass": "override me"}
@@ -397,6 +411,8 @@ class TestDeployUndercloud(TestPluginV1):
                       include_env_in_files=False),
             mock.call(env_path='../outside.yaml',
                       include_env_in_files=False)])
+        self.mock_check_params.assert_called_once_with(
+            '/twd/templates', mock.ANY, mock.ANY)
 
     @mock.patch('tripleoclient.utils.rel_or_abs_path')
     @mock.patch('heatclient.common.template_utils.'
@@ -411,8 +427,8 @@ class TestDeployUndercloud(TestPluginV1):
                 'parse', autospec=True, return_value=dict())
     @mock.patch('tripleoclient.v1.tripleo_deploy.Deploy.'
                 '_setup_heat_environments', autospec=True)
-    @mock.patch('yaml.safe_dump', autospec=True)
-    @mock.patch('yaml.safe_load', autospec=True)
+    @mock.patch('tripleoclient.yaml_utils.safe_dump', autospec=True)
+    @mock.patch('tripleoclient.yaml_utils.safe_load', autospec=True)
     @mock.patch('six.moves.builtins.open')
     @mock.patch('tempfile.NamedTemporaryFile', autospec=True)
     @mock.patch('tripleo_common.image.kolla_builder.'
@@ -487,8 +503,8 @@ class TestDeployUndercloud(TestPluginV1):
                 'parse', autospec=True, return_value=dict())
     @mock.patch('tripleoclient.v1.tripleo_deploy.Deploy.'
                 '_setup_heat_environments', autospec=True)
-    @mock.patch('yaml.safe_dump', autospec=True)
-    @mock.patch('yaml.safe_load', autospec=True)
+    @mock.patch('tripleoclient.yaml_utils.safe_dump', autospec=True)
+    @mock.patch('tripleoclient.yaml_utils.safe_load', autospec=True)
     @mock.patch('six.moves.builtins.open')
     @mock.patch('tempfile.NamedTemporaryFile', autospec=True)
     @mock.patch('tripleo_common.image.kolla_builder.'
@@ -612,8 +628,9 @@ class TestDeployUndercloud(TestPluginV1):
         self.assertEqual(expected, results)
 
     @mock.patch('time.time', return_value=123)
-    @mock.patch('yaml.safe_load', return_value={}, autospec=True)
-    @mock.patch('yaml.safe_dump', autospec=True)
+    @mock.patch('tripleoclient.yaml_utils.safe_load', return_value={},
+                autospec=True)
+    @mock.patch('tripleoclient.yaml_utils.safe_dump', autospec=True)
     @mock.patch('os.path.isfile', return_value=True)
     @mock.patch('six.moves.builtins.open')
     @mock.patch('tripleoclient.v1.tripleo_deploy.Deploy.'
@@ -624,8 +641,7 @@ class TestDeployUndercloud(TestPluginV1):
                 '_normalize_user_templates', return_value=[], autospec=True)
     @mock.patch('tripleoclient.utils.rel_or_abs_path', return_value={},
                 autospec=True)
-    @mock.patch('tripleoclient.utils.run_command_and_log', return_value=0,
-                autospec=True)
+    @mock.patch('tripleoclient.utils.jinja_render_files', autospec=True)
     def test_setup_heat_environments_dropin(
             self, mock_run, mock_paths, mock_norm, mock_update_pass_env,
             mock_process_hiera, mock_open, mock_os, mock_yaml_dump,
@@ -666,6 +682,25 @@ class TestDeployUndercloud(TestPluginV1):
         self.assertTrue(found_dropin)
         self.assertTrue(found_identifier)
 
+    def test_load_user_params(self):
+        tmpdir = self.useFixture(fixtures.TempDir()).path
+        envs = []
+        for name, params in (('a.yaml', {'Foo': 1, 'Bar': 1}),
+                             ('b.yaml', {'Bar': 2}),
+                             ('standalone-stack-vstate-dropin.yaml',
+                              {'Foo': 3})):
+            envs.append(os.path.join(tmpdir, name))
+            with open(envs[-1], 'w') as f:
+                yaml.safe_dump({'parameter_defaults': params}, f)
+
+        self.assertEqual({'Foo': 1, 'Bar': 2},
+                         self.cmd._load_user_params(envs))
+        env_index = self.cmd.user_env_index
+        self.cmd._load_user_params(envs)
+        self.assertIs(env_index, self.cmd.user_env_index)
+        self.assertEqual({'Foo': 1, 'Bar': 1},
+                         self.cmd._load_user_params(envs[:1]))
+
     @mock.patch('heatclient.common.template_utils.'
                 'process_environment_and_files', return_value=({}, {}),
                 autospec=True)
@@ -680,7 +715,7 @@ class TestDeployUndercloud(TestPluginV1):
     @mock.patch('tripleoclient.v1.tripleo_deploy.Deploy.'
                 '_update_passwords_env', autospec=True)
     @mock.patch('tripleoclient.utils.'
-                'run_command_and_log', autospec=True)
+                'jinja_render_files', autospec=True)
     @mock.patch('tripleoclient.v1.tripleo_deploy.Deploy.'
                 '_get_primary_role_name', autospec=True)
     def test_setup_heat_environments_default_plan_env(
@@ -712,7 +747,7 @@ class TestDeployUndercloud(TestPluginV1):
     @mock.patch('tripleoclient.v1.tripleo_deploy.Deploy.'
                 '_update_passwords_env', autospec=True)
     @mock.patch('tripleoclient.utils.'
-                'run_command_and_log', autospec=True)
+                'jinja_render_files', autospec=True)
     @mock.patch('tripleoclient.v1.tripleo_deploy.Deploy.'
                 '_get_primary_role_name', autospec=True)
     def test_setup_heat_environments_non_default_plan_env(
@@ -761,7 +796,6 @@ class TestDeployUndercloud(TestPluginV1):
         tht_render = os.path.join(tht_to, 'tripleo-heat-installer-templates')
         mock_update_pass_env.return_value = os.path.join(
             tht_render, 'passwords.yaml')
-        mock_run.return_value = 0
         original_abs = os.path.abspath
 
         # Stub abspath for default plan and envs to return the tht_render base
@@ -863,6 +897,7 @@ class TestDeployUndercloud(TestPluginV1):
             env
         )
 
+    @mock.patch('tripleoclient.utils.write_playbook_checkpoint')
     @mock.patch.object(
         ansible_runner.runner_config,
         'RunnerConfig',
@@ -929,7 +964,7 @@ class TestDeployUndercloud(TestPluginV1):
                                     mock_user, mock_cc, mock_chmod, mock_ac,
                                     mock_outputs, mock_copy, mock_cmdline,
                                     mock_chdir, mock_file_exists, mock_run,
-                                    mock_run_prepare):
+                                    mock_run_prepare, mock_checkpoint):
         parsed_args = self.check_parser(self.cmd,
                                         ['--local-ip', '127.0.0.1',
                                          '--templates', '/tmp/thtroot',
@@ -132,6 +132,8 @@ class TestUndercloudInstall(TestPluginV1):
         self.conf.config(templates='/usertht')
         self.conf.config(heat_native='false')
         self.conf.config(roles_file='foo/roles.yaml')
+        self.conf.config(artifact_archive_format='zstd')
+        self.conf.config(artifact_store=True)
         arglist = ['--no-validations', '--force-stack-update']
         verifylist = []
         parsed_args = self.check_parser(self.cmd, arglist, verifylist)
@@ -152,7 +154,8 @@ class TestUndercloudInstall(TestPluginV1):
              '--templates=/usertht',
              '--roles-file=foo/roles.yaml',
              '--networks-file=/usertht/network_data_undercloud.yaml',
-             '--heat-native=False', '-e',
+             '--heat-native=False', '--artifact-archive-format=zstd',
+             '--artifact-store', '-e',
              '/usertht/environments/undercloud.yaml', '-e',
              '/usertht/environments/use-dns-for-vips.yaml', '-e',
              '/usertht/environments/podman.yaml', '-e',
@@ -0,0 +1,68 @@
+#   Copyright 2020 Red Hat, Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+import mock
+
+from osc_lib.tests import utils
+
+from tripleoclient import constants
+from tripleoclient import exceptions
+from tripleoclient.tests import fakes
+from tripleoclient.v2 import tripleo_facts
+
+
+class TestWarmFacts(utils.TestCommand):
+
+    def setUp(self):
+        super(TestWarmFacts, self).setUp()
+
+        app_args = mock.Mock()
+        app_args.verbose_level = 1
+        self.app.options = fakes.FakeOptions()
+        self.cmd = tripleo_facts.WarmFacts(self.app, app_args)
+
+    @mock.patch('tripleoclient.yaml_utils.safe_dump', autospec=True)
+    @mock.patch('tripleoclient.utils.get_key', return_value='/key')
+    @mock.patch('os.path.exists', return_value=True)
+    @mock.patch('tripleoclient.utils.run_ansible_playbook', autospec=True)
+    def test_warm(self, mock_playbook, mock_exists, mock_key, mock_dump):
+        arglist = ['--stack', 'mystack', '--limit', 'node-0']
+        parsed_args = self.check_parser(self.cmd, arglist, [])
+        with mock.patch('six.moves.builtins.open'):
+            self.cmd.take_action(parsed_args)
+
+        mock_key.assert_called_once_with('mystack')
+        playbook_data = mock_dump.call_args[0][0]
+        self.assertEqual({}, playbook_data[0]['tasks'][0]['setup'])
+        mock_playbook.assert_called_once_with(
+            playbook=mock.ANY,
+            inventory=constants.ANSIBLE_INVENTORY.format('mystack'),
+            workdir=mock.ANY,
+            playbook_dir=mock.ANY,
+            ssh_user='tripleo-admin',
+            key='/key',
+            limit_hosts='node-0',
+            forks=None,
+            gathering_policy='explicit',
+            verbosity=3
+        )
+
+    @mock.patch('os.path.exists', return_value=False)
+    @mock.patch('tripleoclient.utils.run_ansible_playbook', autospec=True)
+    def test_warm_no_inventory(self, mock_playbook, mock_exists):
+        parsed_args = self.check_parser(self.cmd, [], [])
+        self.assertRaises(exceptions.InvalidConfiguration,
+                          self.cmd.take_action, parsed_args)
+        mock_playbook.assert_not_called()
@@ -122,3 +122,52 @@ class TestDeploymentWorkflows(utils.TestCommand):
             'timeout')
 
         self.assertEqual(3, mock_playbook.call_count)
+
+    @mock.patch('tripleoclient.constants.DEFAULT_WORK_DIR',
+                '/home/stack/config-download')
+    @mock.patch('tripleoclient.utils.run_ansible_playbook',
+                autospec=True)
+    def test_config_download_run_data(self, mock_playbook):
+        stack = mock.Mock()
+        stack.stack_name = 'stacktest'
+        stack.output_show.return_value = {'output': {'output_value': []}}
+        deployment.config_download(
+            mock.Mock(), mock.Mock(), stack, output_dir='/tmp/work',
+            ansible_playbook_name=['upgrade.yaml', 'deploy.yaml'])
+
+        kwargs = mock_playbook.call_args[1]
+        self.assertEqual(['/tmp/work/stacktest/upgrade.yaml',
+                          '/tmp/work/stacktest/deploy.yaml'],
+                         kwargs['playbook'])
+        for name in ('timing_stream', 'forks_history', 'checkpoint',
+                     'events_archive'):
+            self.assertTrue(kwargs[name].startswith(
+                '/home/stack/config-download/stacktest/tripleo-run-data/'))
+
+    @mock.patch('tripleoclient.utils.prewarm_ssh_connections',
+                autospec=True, return_value=['node-1', 'node-2'])
+    @mock.patch('tripleoclient.utils.run_ansible_playbook',
+                autospec=True)
+    def test_config_download_ssh_prewarm(self, mock_playbook, mock_prewarm):
+        log = mock.Mock()
+        stack = mock.Mock()
+        stack.stack_name = 'stacktest'
+        clients = mock.Mock()
+        deployment.config_download(
+            log, clients, stack, 'ssh_network', limit_hosts='Compute',
+            ssh_prewarm=True)
+
+        mock_prewarm.assert_called_once_with(
+            inventory=mock.ANY,
+            workdir=mock.ANY,
+            limit_hosts='Compute',
+            ssh_user='tripleo-admin',
+            key=mock.ANY,
+            ansible_timeout=600,
+            verbosity=0,
+            forks=None
+        )
+        self.assertEqual(
+            'Compute:!node-1:!node-2',
+            mock_playbook.call_args[1]['limit_hosts']
+        )
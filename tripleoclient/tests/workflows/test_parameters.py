@@ -73,7 +73,7 @@ class TestParameterWorkflows(utils.TestCommand):
         flatten.start()
         self.addCleanup(flatten.stop)
 
-    @mock.patch('yaml.safe_load')
+    @mock.patch('tripleoclient.yaml_utils.safe_load')
     @mock.patch("six.moves.builtins.open")
     @mock.patch('tripleoclient.utils.run_ansible_playbook', autospec=True)
     @mock.patch('tripleoclient.utils.get_tripleo_ansible_inventory',
@@ -117,7 +117,7 @@ class TestParameterWorkflows(utils.TestCommand):
         ]
         mock_playbook.assert_has_calls(calls, any_order=True)
 
-    @mock.patch('yaml.safe_load')
+    @mock.patch('tripleoclient.yaml_utils.safe_load')
     @mock.patch("six.moves.builtins.open")
     @mock.patch('tripleoclient.utils.run_ansible_playbook', autospec=True)
     @mock.patch('tripleoclient.utils.get_tripleo_ansible_inventory',
@@ -195,3 +195,99 @@ class TestParameterWorkflows(utils.TestCommand):
             **workflow_input
         )
         self.assertEqual(params, {"parameter_defaults": {}})
+
+    @mock.patch('tripleoclient.workflows.roles.get_roles_data',
+                autospec=True)
+    @mock.patch('tripleoclient.utils.build_stack_data', autospec=True)
+    def test_check_deprecated_parameters(self, mock_stack_data,
+                                         mock_roles_data):
+        mock_roles_data.return_value = [{'name': 'TestRole1'},
+                                        {'name': 'TestRole2'}]
+        mock_stack_data.return_value = {
+            'environment_parameters': {
+                'TestDeprecated1': 'foo',
+                'TestParameter1': 'foo',
+                'TestUnused': 'foo',
+                'TestRole1': 'TestParameter2'
+            },
+            'heat_resource_tree': {
+                'parameters': {
+                    'TestParameter1': {'name': 'TestParameter1'},
+                    'TestParameter2': {'name': 'TestParameter2',
+                                       'tags': ['role_specific']},
+                    'TestRole1Count': {'name': 'TestRole1Count',
+                                       'default': 1},
+                    'TestRole2Count': {'name': 'TestRole2Count',
+                                       'default': 0}
+                },
+                'resources': {
+                    'uuid': {
+                        'id': 'uuid',
+                        'name': 'Root',
+                        'parameter_groups': [
+                            {'label': 'deprecated',
+                             'parameters': ['TestDeprecated1',
+                                            'TestDeprecated2']}
+                        ]
+                    }
+                }
+            }
+        }
+
+        with mock.patch.object(parameters.LOG, 'warning') as mock_warning:
+            parameters.check_deprecated_parameters(
+                self.app.client_manager, 'overcloud', '/tht', {},
+                'roles_data.yaml', {}, [])
+
+        warnings = [c[0][0] for c in mock_warning.call_args_list]
+        self.assertEqual(3, len(warnings))
+        self.assertIn('deprecated and still defined. Deprecated parameters '
+                      'will be removed soon! TestDeprecated1', warnings[0])
+        self.assertIn('in use due to the service or deployment '
+                      'configuration. TestDeprecated1, TestUnused, TestRole1',
+                      warnings[1])
+        self.assertIn('role-specific inputs. TestParameter2', warnings[2])
+
+    @mock.patch('tripleoclient.utils.get_parameter_schema', autospec=True)
+    def test_check_parameters_offline(self, mock_schema):
+        mock_schema.return_value = {
+            'parameters': {
+                'TestParameter1': {'name': 'TestParameter1'},
+                'TestParameter2': {'name': 'TestParameter2',
+                                   'tags': ['role_specific']},
+                'TestRole1Count': {'name': 'TestRole1Count', 'default': 0},
+                'TestRole2Count': {'name': 'TestRole2Count', 'default': 0}
+            },
+            'resources': {
+                'deployment/foo.yaml': {
+                    'id': 'deployment/foo.yaml',
+                    'name': 'deployment/foo.yaml',
+                    'parameter_groups': [
+                        {'label': 'deprecated',
+                         'parameters': ['TestDeprecated1']}
+                    ]
+                }
+            }
+        }
+        env = {
+            'parameter_defaults': {
+                'TestDeprecated1': 'foo',
+                'TestParameter1': 'foo',
+                'TestRole1Count': 1,
+                'TestRole1': 'TestParameter2',
+                'TestRole2': 'TestParameter2'
+            }
+        }
+
+        with mock.patch.object(parameters.LOG, 'warning') as mock_warning:
+            parameters.check_parameters_offline(
+                '/tht', [{'name': 'TestRole1'}, {'name': 'TestRole2'}], env)
+
+        mock_schema.assert_called_once_with('/tht')
+        warnings = [c[0][0] for c in mock_warning.call_args_list]
+        self.assertEqual(3, len(warnings))
+        self.assertIn('will be removed soon! TestDeprecated1', warnings[0])
+        self.assertIn('configuration. TestDeprecated1, TestRole1, TestRole2',
+                      warnings[1])
+        self.assertTrue(warnings[2].endswith(
+            'role-specific inputs. TestParameter2'))
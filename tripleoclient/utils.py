@@ -20,18 +20,22 @@ try:
 except AttributeError:
     collectionsAbc = collections
 
+from concurrent import futures
 import csv
 import datetime
 import errno
 import getpass
 import glob
+import gzip
 import hashlib
+import importlib
 import logging
 
 import multiprocessing
 import netaddr
 import os
 import os.path
+import psutil
 import pwd
 import re
 import shutil
@@ -40,12 +44,12 @@ import six
 import socket
 import subprocess
 import sys
-import tarfile
 import tempfile
 import time
 import yaml
 
 import ansible_runner
+import jinja2
 
 from heatclient.common import event_utils
 from heatclient.common import template_utils
@@ -62,8 +66,16 @@ from six.moves.urllib import request
 
 from tripleo_common.utils import stack as stack_utils
 from tripleo_common import update
+from tripleoclient import artifact_archive
 from tripleoclient import constants
+from tripleoclient import environment_cache
 from tripleoclient import exceptions
+from tripleoclient import parameter_schema
+from tripleoclient import phase_profiler
+from tripleoclient import stack_data_cache
+from tripleoclient import template_renderer
+from tripleoclient import template_workspace
+from tripleoclient import yaml_utils
 
 
 LOG = logging.getLogger(__name__ + ".utils")
@@ -160,6 +172,447 @@ class TempDirs(object):
         LOG.info("Temporary directory [ %s ] cleaned up" % self.dir)
 
 
+class MultiPlaybookTracker(object):
+    """Track the imported playbooks of a multi-playbook execution."""
+
+    marker_prefix = 'TripleO multi-playbook'
+
+    def __init__(self, event_handler=None, on_progress=None):
+        """Track the progress of playbooks chained with import_playbook.
+
+        A marker play, which has no task and gathers no facts, is
+        inserted before every imported playbook added with a marker. When
+        used as the ansible-runner event handler, the tracker knows which
+        of those playbooks is running and attributes failures to it.
+
+        :param event_handler: Event handler to call for every event.
+        :type event_handler: Function
+
+        :param on_progress: Function called with the tracker every time an
+                            imported playbook starts.
+        :type on_progress: Function
+        """
+        self.event_handler = event_handler
+        self.on_progress = on_progress
+        self.playbooks = list()
+        self.markers = dict()
+        self.started = set()
+        self.failed = set()
+        self.current = None
+
+    def add(self, playbook, marker=True):
+        """Add a playbook and return the plays importing it.
+
+        :param playbook: Path of the playbook.
+        :type playbook: String
+
+        :param marker: Insert a marker play before the playbook, without it
+                       the progress of the playbook is not tracked.
+        :type marker: Boolean
+
+        :returns: List
+        """
+        index = len(self.playbooks)
+        self.playbooks.append(playbook)
+        plays = [{'import_playbook': playbook}]
+        if marker:
+            name = '{} [{}]: {}'.format(
+                self.marker_prefix,
+                index,
+                os.path.basename(playbook)
+            )
+            self.markers[name] = index
+            plays.insert(0, {
+                'name': name,
+                'hosts': 'localhost',
+                'gather_facts': False,
+                'tasks': []
+            })
+        return plays
+
+    def __call__(self, event):
+        event_type = event.get('event')
+        event_data = event.get('event_data', dict())
+        if event_type == 'playbook_on_play_start':
+            name = event_data.get('play', event_data.get('name'))
+            if name in self.markers:
+                self.current = self.markers[name]
+                self.started.add(self.current)
+                if self.on_progress:
+                    self.on_progress(self)
+        elif self.current is not None:
+            if event_type == 'runner_on_unreachable' or (
+                    event_type == 'runner_on_failed' and
+                    not event_data.get('ignore_errors')):
+                self.failed.add(self.current)
+
+        if self.event_handler:
+            return self.event_handler(event)
+        return True
+
+    def status(self, rc=0):
+        """Return the status of every tracked playbook.
+
+        :param rc: Return code of the ansible execution, None while the
+                   execution is still running.
+        :type rc: Integer
+
+        :returns: List of dictionaries with the playbook and its status.
+        """
+        results = list()
+        for index, playbook in enumerate(self.playbooks):
+            if index in self.failed:
+                status = 'failed'
+            elif rc is None:
+                if index == self.current:
+                    status = 'running'
+                elif index in self.started:
+                    status = 'successful'
+                else:
+                    status = 'pending'
+            elif rc != 0 and index == self.current and not self.failed:
+                status = 'failed'
+            elif index in self.started:
+                status = 'successful'
+            elif rc != 0 and self.current is None:
+                status = 'unknown'
+            elif rc != 0:
+                status = 'skipped'
+            else:
+                status = 'successful'
+            results.append({'playbook': playbook, 'status': status})
+        return results
+
+
+class TaskTimingStream(object):
+    """Stream the ansible task timings from ansible-runner events."""
+
+    result_events = {
+        'runner_on_ok': 'ok',
+        'runner_on_failed': 'failed',
+        'runner_on_skipped': 'skipped',
+        'runner_on_unreachable': 'unreachable'
+    }
+
+    def __init__(self, stream, event_handler=None):
+        """Write one JSON record per host and task as soon as it ends.
+
+        Every record is a JSON object, on its own line, with the host,
+        play, role, task, start, end, duration and status of a task
+        execution. The stream is flushed after each record so it can be
+        followed while the playbook is still running.
+
+        :param stream: Path of the file the records are appended to, or a
+                       file like object.
+        :type stream: String or Object
+
+        :param event_handler: Event handler to call for every event.
+        :type event_handler: Function
+        """
+        self.event_handler = event_handler
+        self.starts = dict()
+        if isinstance(stream, six.string_types):
+            makedirs(os.path.dirname(os.path.abspath(stream)))
+            self.stream = open(stream, 'a')
+            self.close_stream = True
+        else:
+            self.stream = stream
+            self.close_stream = False
+
+    def __call__(self, event):
+        event_type = event.get('event')
+        event_data = event.get('event_data', dict())
+        key = (event_data.get('task_uuid'), event_data.get('host'))
+        if event_type == 'runner_on_start':
+            self.starts[key] = event.get('created')
+        elif event_type in self.result_events:
+            status = self.result_events[event_type]
+            if status == 'ok' and event_data.get('res', {}).get('changed'):
+                status = 'changed'
+            elif status == 'failed' and event_data.get('ignore_errors'):
+                status = 'ignored'
+            record = {
+                'host': event_data.get('host'),
+                'play': event_data.get('play'),
+                'role': event_data.get('role'),
+                'task': event_data.get('task'),
+                'start': event_data.get('start', self.starts.get(key)),
+                'end': event_data.get('end', event.get('created')),
+                'duration': event_data.get('duration'),
+                'status': status
+            }
+            self.starts.pop(key, None)
+            self.stream.write(simplejson.dumps(record) + '\n')
+            self.stream.flush()
+
+        if self.event_handler:
+            return self.event_handler(event)
+        return True
+
+    def close(self):
+        if self.close_stream:
+            self.stream.close()
+
+
+class RunnerEventArchive(object):
+    """Archive the ansible-runner events of a run in a single file."""
+
+    failure_events = ('runner_on_failed', 'runner_on_unreachable')
+
+    def __init__(self, path, event_handler=None,
+                 block_size=constants.ANSIBLE_EVENTS_BLOCK_SIZE):
+        """Write every event as a JSON line of a gzip compressed file.
+
+        The events are compressed in blocks of about `block_size` bytes,
+        every block being a gzip member of the file. An index, written
+        next to the archive when it is closed, gives the offset and size of
+        every block and, by host and by task, the position of the events
+        within the blocks, so the events of a host or a task are read
+        without decompressing the whole archive. See `load_runner_events`.
+
+        :param path: Path of the archive.
+        :type path: String
+
+        :param event_handler: Event handler to call for every event.
+        :type event_handler: Function
+
+        :param block_size: Uncompressed size of the blocks.
+        :type block_size: Integer
+        """
+        self.path = path
+        self.event_handler = event_handler
+        self.block_size = block_size
+        makedirs(os.path.dirname(os.path.abspath(path)))
+        self.stream = open(path, 'wb')
+        self.buffer = list()
+        self.buffer_size = 0
+        self.index = {
+            'blocks': list(),
+            'hosts': dict(),
+            'tasks': dict(),
+            'failures': list()
+        }
+
+    def __call__(self, event):
+        event_type = event.get('event')
+        event_data = event.get('event_data', dict())
+        line = (simplejson.dumps(event, sort_keys=True) + '\n').encode(
+            'utf-8'
+        )
+        position = [len(self.index['blocks']), self.buffer_size, len(line)]
+        if event_data.get('host'):
+            self.index['hosts'].setdefault(
+                event_data['host'], list()).append(position)
+        if event_data.get('task'):
+            self.index['tasks'].setdefault(
+                event_data['task'], list()).append(position)
+        if event_type in self.failure_events and \
+                not event_data.get('ignore_errors'):
+            self.index['failures'].append(position)
+        self.buffer.append(line)
+        self.buffer_size += len(line)
+        if self.buffer_size >= self.block_size:
+            self._write_block()
+
+        if self.event_handler:
+            return self.event_handler(event)
+        return True
+
+    def _write_block(self):
+        if not self.buffer:
+            return
+        data = gzip.compress(b''.join(self.buffer))
+        self.index['blocks'].append([self.stream.tell(), len(data)])
+        self.stream.write(data)
+        self.stream.flush()
+        self.buffer = list()
+        self.buffer_size = 0
+
+    def close(self):
+        self._write_block()
+        self.stream.close()
+        with open(constants.ANSIBLE_EVENTS_INDEX.format(self.path), 'w') as f:
+            f.write(simplejson.dumps(self.index))
+
+
+def load_runner_events(path, host=None, task=None, failures=False):
+    """Return the events stored in an archive of ansible-runner events.
+
+    The archive index is used to only decompress the blocks holding the
+    requested events. Without any filter, all the events are returned.
+
+    :param path: Path of the archive written by `RunnerEventArchive`.
+    :type path: String
+
+    :param host: Only return the events of this host.
+    :type host: String
+
+    :param task: Only return the events of this task.
+    :type task: String
+
+    :param failures: Only return the failed and unreachable events.
+    :type failures: Boolean
+
+    :returns: List of events.
+    """
+
+    if not any([host, task, failures]):
+        with gzip.open(path, 'rb') as f:
+            return [simplejson.loads(i) for i in f]
+
+    with open(constants.ANSIBLE_EVENTS_INDEX.format(path), 'r') as f:
+        index = simplejson.load(f)
+
+    positions = None
+    for key, value in (('hosts', host), ('tasks', task)):
+        if value:
+            matches = set(tuple(i) for i in index[key].get(value, list()))
+            positions = matches if positions is None else positions & matches
+    if failures:
+        matches = set(tuple(i) for i in index['failures'])
+        positions = matches if positions is None else positions & matches
+
+    events = list()
+    blocks = dict()
+    with open(path, 'rb') as f:
+        for block, offset, size in sorted(positions):
+            if block not in blocks:
+                block_offset, block_size = index['blocks'][block]
+                f.seek(block_offset)
+                blocks[block] = gzip.decompress(f.read(block_size))
+            events.append(
+                simplejson.loads(blocks[block][offset:offset + size])
+            )
+    return events
+
+
+def get_stack_run_data_dir(stack_name, work_dir=None):
+    """Return the directory of the data recorded about the runs of a stack.
+
+    The stack working directory of the updates and upgrades is a temporary
+    directory, the data is kept in the default one unless another working
+    directory is given.
+
+    :param stack_name: Name of the stack.
+    :type stack_name: String
+
+    :param work_dir: Directory holding the stack working directories.
+    :type work_dir: String
+    """
+
+    return os.path.join(
+        work_dir or constants.DEFAULT_WORK_DIR,
+        stack_name,
+        constants.STACK_RUN_DATA_DIR
+    )
+
+
+def get_task_timing_runs(stack_work_dir):
+    """Return the runs with task timings of a stack, oldest first.
+
+    :param stack_work_dir: Working directory of the stack.
+    :type stack_work_dir: String
+
+    :returns: List of tuples with the run id and the timing file path.
+    """
+
+    prefix, suffix = constants.ANSIBLE_TIMING_FILE.split('{}')
+    runs = list()
+    for path in glob.glob(os.path.join(
+            stack_work_dir,
+            constants.STACK_RUN_DATA_DIR,
+            constants.ANSIBLE_TIMING_FILE.format('*'))):
+        name = os.path.basename(path)
+        runs.append((name[len(prefix):len(name) - len(suffix)], path))
+    return sorted(runs)
+
+
+def load_task_timings(path):
+    """Return the task timing records streamed by `TaskTimingStream`.
+
+    Incomplete lines, written by an interrupted run, are skipped.
+
+    :param path: Path of the timing file.
+    :type path: String
+
+    :returns: List of dictionaries.
+    """
+
+    records = list()
+    with open(path, 'r') as f:
+        for line in f:
+            try:
+                records.append(simplejson.loads(line))
+            except ValueError:
+                LOG.debug('Skipping invalid timing record: {}'.format(line))
+    return records
+
+
+def _task_timing_key(record, group_by):
+    if group_by == 'host':
+        return record.get('host')
+    elif group_by == 'role':
+        return record.get('role') or record.get('play')
+    if record.get('role'):
+        return '{} : {}'.format(record['role'], record.get('task'))
+    return record.get('task')
+
+
+def get_task_timing_durations(records, group_by='task'):
+    """Return the time spent in every task, role or host of a run.
+
+    The hosts run the tasks in parallel, the time spent in a task or a
+    role is the time spent in it by the slowest host. Repeated tasks, like
+    the tasks of the deployment steps, are added up.
+
+    :param records: Task timing records, see `load_task_timings`.
+    :type records: List
+
+    :param group_by: Either "task", "role" or "host".
+    :type group_by: String
+
+    :returns: Dictionary of durations in seconds.
+    """
+
+    durations = dict()
+    for record in records:
+        key = _task_timing_key(record, group_by)
+        hosts = durations.setdefault(key, dict())
+        hosts[record.get('host')] = (
+            hosts.get(record.get('host'), 0) + (record.get('duration') or 0)
+        )
+    return dict([(k, max(v.values())) for k, v in durations.items()])
+
+
+def compare_task_timings(before, after, group_by='task'):
+    """Rank the tasks, roles or hosts whose duration increased the most.
+
+    :param before: Task timing records of the reference run.
+    :type before: List
+
+    :param after: Task timing records of the compared run.
+    :type after: List
+
+    :param group_by: Either "task", "role" or "host".
+    :type group_by: String
+
+    :returns: List of tuples with the name, the duration before, the
+              duration after and the difference, largest increase first.
+    """
+
+    before = get_task_timing_durations(before, group_by=group_by)
+    after = get_task_timing_durations(after, group_by=group_by)
+    result = list()
+    for key in set(before) | set(after):
+        result.append((
+            key,
+            before.get(key, 0),
+            after.get(key, 0),
+            after.get(key, 0) - before.get(key, 0)
+        ))
+    return sorted(result, key=lambda i: (-i[3], str(i[0])))
+
+
 def _encode_envvars(env):
     """Encode a hash of values.
 
@@ -230,6 +683,658 @@ def playbook_verbosity(self):
             return self.app_args.verbose_level
 
 
+def _load_inventory(inventory):
+    """Return an ansible inventory as a dictionary or a set of hosts."""
+
+    if isinstance(inventory, six.string_types):
+        if os.path.isfile(inventory):
+            try:
+                inventory = yaml_utils.load_file(inventory)
+            except (IOError, yaml.YAMLError):
+                return
+        elif ',' in inventory:
+            return set([i.strip() for i in inventory.split(',')
+                        if i.strip()])
+        else:
+            return
+
+    if isinstance(inventory, dict):
+        return inventory
+
+
+def get_inventory_hosts(inventory):
+    """Return the set of hosts defined in an ansible inventory.
+
+    :param inventory: Either an inventory file, an inventory dictionary or a
+                      coma-separated list of hosts.
+    :type inventory: String or Dictionary
+
+    :returns: Set || None when the inventory can not be parsed.
+    """
+
+    groups = get_inventory_groups(inventory)
+    if groups is None:
+        return
+    hosts = set()
+    for group_hosts in groups.values():
+        hosts.update(group_hosts)
+    return hosts
+
+
+def get_inventory_groups(inventory):
+    """Return the hosts of every group defined in an ansible inventory.
+
+    The hosts of a group include the hosts of its children. A coma-separated
+    list of hosts is returned as the "ungrouped" group.
+
+    :param inventory: Either an inventory file, an inventory dictionary or a
+                      coma-separated list of hosts.
+    :type inventory: String or Dictionary
+
+    :returns: Dictionary of sets || None when the inventory can not be
+              parsed.
+    """
+
+    def _walk(groups, members, children):
+        if not isinstance(groups, dict):
+            return
+        for name, group in groups.items():
+            members.setdefault(name, set())
+            children.setdefault(name, set())
+            if not isinstance(group, dict):
+                continue
+            if isinstance(group.get('hosts'), (dict, list)):
+                members[name].update(group['hosts'])
+            if isinstance(group.get('children'), dict):
+                children[name].update(group['children'])
+                _walk(group['children'], members, children)
+
+    def _hosts(name, seen):
+        hosts = set(members[name])
+        for child in children[name] - seen:
+            hosts.update(_hosts(child, seen | set([name])))
+        return hosts
+
+    inventory = _load_inventory(inventory)
+    if inventory is None:
+        return
+    if isinstance(inventory, set):
+        return {'ungrouped': inventory}
+
+    members = dict()
+    children = dict()
+    _walk(inventory, members, children)
+    return dict([(i, _hosts(i, set([i]))) for i in members])
+
+
+def resolve_inventory_hosts(inventory, hosts):
+    """Return the hosts matched by a host pattern in an ansible inventory.
+
+    Only patterns made of host names, group names and their exclusions,
+    separated by "," or ":", are resolved.
+
+    :param inventory: Either an inventory file, an inventory dictionary or a
+                      coma-separated list of hosts.
+    :type inventory: String or Dictionary
+
+    :param hosts: Host pattern, as accepted by the ansible limit.
+    :type hosts: String
+
+    :returns: Set || None when the pattern can not be resolved.
+    """
+
+    groups = get_inventory_groups(inventory)
+    if groups is None:
+        return
+    all_hosts = set()
+    for group_hosts in groups.values():
+        all_hosts.update(group_hosts)
+
+    included = set()
+    excluded = set()
+    for item in re.split(',|:', hosts):
+        item = item.strip()
+        if not item:
+            continue
+        target = excluded if item.startswith('!') else included
+        name = item.lstrip('!')
+        if name in ('all', '*'):
+            target.update(all_hosts)
+        elif name in groups:
+            target.update(groups[name])
+        elif name in all_hosts:
+            target.add(name)
+        else:
+            # Intersections, wildcards, ranges or unknown names.
+            return
+    if not included:
+        included = all_hosts
+    return included - excluded
+
+
+def get_sshd_limits(sshd_config=constants.SSHD_CONFIG):
+    """Return the concurrent connection limits set in the sshd configuration.
+
+    The MaxStartups option, formatted as "start:rate:full" or as a single
+    number, bounds the pending unauthenticated connections, they are all
+    refused once "full" are pending. The MaxSessions option bounds the
+    sessions multiplexed over a connection, i.e. the ansible workers sharing
+    a ControlMaster connection. The options of Match blocks are ignored and,
+    like sshd does, the first value of an option is used.
+
+    :param sshd_config: Path of the sshd configuration file.
+    :type sshd_config: String
+
+    :returns: Dictionary with the limits set in the configuration, by
+              option name.
+    """
+
+    limits = dict()
+    try:
+        with open(sshd_config, 'r') as f:
+            for line in f:
+                option = line.split('#', 1)[0].split()
+                if not option:
+                    continue
+                name = option[0].lower()
+                if name == 'match':
+                    break
+                if len(option) < 2:
+                    continue
+                if name == 'maxstartups':
+                    limits.setdefault(
+                        'MaxStartups', int(option[1].split(':')[-1]))
+                elif name == 'maxsessions':
+                    limits.setdefault('MaxSessions', int(option[1]))
+    except (IOError, OSError, ValueError) as e:
+        LOG.debug('Unable to read the sshd limits: {}'.format(e))
+    # 0 disables the sessions, not the limit
+    return dict((k, v) for k, v in limits.items() if v > 0)
+
+
+def _limit_hosts(hosts, limit_hosts):
+    """Apply a limit to a set of hosts when it only names hosts."""
+
+    if not limit_hosts:
+        return hosts
+
+    items = [i.strip() for i in re.split(',|:', limit_hosts) if i.strip()]
+    excluded = set([i[1:] for i in items if i.startswith('!')])
+    included = set([i for i in items if not i.startswith('!')])
+    if not included or not included.issubset(hosts):
+        # Groups and patterns are not resolved, keep all hosts.
+        included = hosts
+    return included - excluded
+
+
+def load_ansible_forks_history(history_file):
+    """Return the fork history, keyed by playbook, stored in a file."""
+
+    if history_file and os.path.isfile(history_file):
+        try:
+            with open(history_file, 'r') as f:
+                return simplejson.load(f)
+        except (IOError, ValueError):
+            LOG.warning(
+                'Unable to read the ansible forks history {}'.format(
+                    history_file
+                )
+            )
+    return dict()
+
+
+def record_ansible_forks(history_file, playbook, forks, hosts, duration,
+                         rc):
+    """Store the fork count used for a playbook run and its duration.
+
+    :param history_file: Path of the fork history file.
+    :type history_file: String
+
+    :param playbook: Name of the playbook.
+    :type playbook: String
+
+    :param forks: Number of forks used.
+    :type forks: Integer
+
+    :param hosts: Number of targeted hosts.
+    :type hosts: Integer
+
+    :param duration: Duration of the run in seconds.
+    :type duration: Float
+
+    :param rc: Return code of the run.
+    :type rc: Integer
+    """
+
+    history = load_ansible_forks_history(history_file)
+    runs = history.setdefault(playbook, list())
+    runs.append({
+        'date': datetime.datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S'),
+        'forks': forks,
+        'hosts': hosts,
+        'duration': round(duration, 3),
+        'rc': rc
+    })
+    history[playbook] = runs[-constants.ANSIBLE_FORKS_HISTORY_SIZE:]
+    makedirs(os.path.dirname(os.path.abspath(history_file)))
+    with open(history_file, 'w') as f:
+        f.write(simplejson.dumps(history, indent=2, sort_keys=True))
+
+
+def get_ansible_host_count(inventory, limit_hosts=None):
+    """Return the number of hosts targeted by a playbook run.
+
+    :param inventory: Either an inventory file, an inventory dictionary or a
+                      coma-separated list of hosts.
+    :type inventory: String or Dictionary
+
+    :param limit_hosts: Limit applied to the playbook run.
+    :type limit_hosts: String
+
+    :returns: Integer || None when the inventory can not be parsed.
+    """
+
+    hosts = get_inventory_hosts(inventory)
+    if hosts:
+        return len(_limit_hosts(hosts, limit_hosts)) or len(hosts)
+
+
+def get_ansible_forks(inventory, limit_hosts=None, playbook=None,
+                      history_file=None, connection='smart'):
+    """Return the number of forks to use for a playbook run.
+
+    The number of forks is bounded by ANSIBLE_FORKS_MAX, the number of
+    targeted hosts, the memory available for the ansible workers and, for
+    ssh connections, the MaxStartups and MaxSessions limits set in the sshd
+    configuration of the undercloud, which the tasks delegated to the
+    undercloud connect to from every worker. Within those bounds, the fork
+    count of the fastest successful run of the same playbook against the
+    same number of hosts is reused when such runs were recorded, whether
+    the fork count was picked or requested, the number of CPUs multiplied
+    by ANSIBLE_FORKS_PER_CPU is used otherwise.
+
+    :param inventory: Either an inventory file, an inventory dictionary or a
+                      coma-separated list of hosts.
+    :type inventory: String or Dictionary
+
+    :param limit_hosts: Limit applied to the playbook run.
+    :type limit_hosts: String
+
+    :param playbook: Name of the playbook, used to look up the history.
+    :type playbook: String
+
+    :param history_file: Path of the fork history file.
+    :type history_file: String
+
+    :param connection: Ansible connection type.
+    :type connection: String
+
+    :returns: Tuple with the number of forks, the number of hosts (or None)
+              and the reasons of the choice.
+    """
+
+    limit = constants.ANSIBLE_FORKS_MAX
+    reasons = list()
+
+    host_count = get_ansible_host_count(inventory, limit_hosts)
+    if host_count:
+        reasons.append('hosts: {}'.format(host_count))
+        limit = min(limit, host_count)
+
+    try:
+        available = psutil.virtual_memory().available
+    except Exception as e:
+        LOG.warning('Unable to read the available memory: {}'.format(e))
+    else:
+        memory_forks = max(
+            int(available / (constants.ANSIBLE_FORK_MEMORY * 1024 * 1024)),
+            1
+        )
+        reasons.append('memory: {}'.format(memory_forks))
+        limit = min(limit, memory_forks)
+
+    if connection != 'local':
+        for name, value in sorted(get_sshd_limits().items()):
+            reasons.append('{}: {}'.format(name, value))
+            limit = min(limit, value)
+
+    forks = None
+    if playbook and host_count:
+        runs = [
+            i for i in load_ansible_forks_history(history_file).get(
+                playbook, list())
+            if i.get('rc') == 0 and i.get('hosts') == host_count
+        ]
+        if runs:
+            forks = min(runs, key=lambda i: i['duration'])['forks']
+            reasons.append('history: {}'.format(forks))
+    if not forks:
+        forks = multiprocessing.cpu_count() * constants.ANSIBLE_FORKS_PER_CPU
+        reasons.append('cpu: {}'.format(forks))
+
+    return max(min(forks, limit), 1), host_count, reasons
+
+
+def get_ansible_accelerated_strategy():
+    """Return the first usable strategy plugin of the accelerated mode.
+
+    A strategy plugin is usable when it is installed and can be loaded with
+    the installed version of ansible.
+
+    :returns: Tuple with the strategy plugin directory and the strategy
+              name || None when no strategy plugin is usable.
+    """
+
+    for package, plugin_dir, strategy in \
+            constants.ANSIBLE_ACCELERATED_STRATEGIES:
+        module = '.'.join([package] + plugin_dir.split('/') + [strategy])
+        try:
+            plugin = importlib.import_module(module)
+        except Exception as e:
+            LOG.debug(
+                'Ansible strategy plugin {} is not usable: {}'.format(
+                    module,
+                    e
+                )
+            )
+            continue
+        return os.path.dirname(os.path.abspath(plugin.__file__)), strategy
+
+
+def get_playbook_strategies(playbook, _seen=None):
+    """Return the strategies declared by the plays of a playbook.
+
+    Imported playbooks are followed, relative to the directory of the
+    playbook importing them. Playbooks which can not be read, or imports
+    which are templated, are skipped.
+
+    :param playbook: Path of the playbook.
+    :type playbook: String
+
+    :returns: Set
+    """
+
+    if _seen is None:
+        _seen = set()
+    playbook = os.path.abspath(playbook)
+    if playbook in _seen:
+        return set()
+    _seen.add(playbook)
+
+    try:
+        plays = yaml_utils.load_file(playbook)
+    except Exception as e:
+        LOG.debug('Unable to read the playbook {}: {}'.format(playbook, e))
+        return set()
+
+    strategies = set()
+    for play in plays if isinstance(plays, list) else list():
+        if not isinstance(play, dict):
+            continue
+        if play.get('strategy'):
+            strategies.add(play['strategy'])
+        imported = play.get('import_playbook')
+        if imported and '{{' not in imported:
+            strategies.update(
+                get_playbook_strategies(
+                    os.path.join(os.path.dirname(playbook), imported),
+                    _seen
+                )
+            )
+    return strategies
+
+
+def get_ansible_strategy_plugins(env):
+    """Return the strategy plugin path configured for an ansible run.
+
+    The path is taken from ANSIBLE_STRATEGY_PLUGINS, then from the
+    strategy_plugins of the ansible configuration file, then defaults to
+    the strategy plugin directories searched by the client.
+
+    :param env: Environment of the ansible run.
+    :type env: Dictionary
+
+    :returns: String
+    """
+
+    if env.get('ANSIBLE_STRATEGY_PLUGINS'):
+        return env['ANSIBLE_STRATEGY_PLUGINS']
+
+    ansible_cfg = env.get('ANSIBLE_CONFIG')
+    if ansible_cfg and os.path.isfile(ansible_cfg):
+        config = configparser.ConfigParser()
+        config.read(ansible_cfg)
+        if config.has_option('defaults', 'strategy_plugins'):
+            return config.get('defaults', 'strategy_plugins')
+
+    return os.path.expanduser(
+        '{}/.ansible/plugins/strategy:'
+        '/usr/share/ansible/tripleo-plugins/strategy:'
+        '/usr/share/ansible/plugins/strategy'.format(
+            constants.CLOUD_HOME_DIR
+        )
+    )
+
+
+def load_playbook_checkpoint(checkpoint):
+    """Return the checkpoint of a multi-playbook run, or None."""
+
+    if not checkpoint or not os.path.isfile(checkpoint):
+        return
+    try:
+        with open(checkpoint, 'r') as f:
+            return simplejson.load(f)
+    except (IOError, ValueError):
+        LOG.warning(
+            'Unable to read the playbook checkpoint {}'.format(checkpoint)
+        )
+
+
+def write_playbook_checkpoint(checkpoint, playbooks, **run):
+    """Record the status of the playbooks of a multi-playbook run.
+
+    :param checkpoint: Path of the checkpoint file.
+    :type checkpoint: String
+
+    :param playbooks: Playbooks of the run, every item is a dictionary with
+                      the playbook, its status and its extra vars.
+    :type playbooks: List
+
+    :param run: Inputs of the run, such as the inventory and the extra vars,
+                which are reused when the run is resumed.
+    :type run: Dictionary
+    """
+
+    data = dict(run)
+    data['playbooks'] = playbooks
+    makedirs(os.path.dirname(os.path.abspath(checkpoint)))
+    # The extra vars may hold secrets, the checkpoint is never readable by
+    # other users.
+    fd = os.open(checkpoint, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w') as f:
+        os.fchmod(fd, 0o600)
+        f.write(simplejson.dumps(data, indent=2, sort_keys=True))
+
+
+def remove_playbook_checkpoint(checkpoint):
+    """Remove the checkpoint of a multi-playbook run once completed."""
+
+    try:
+        os.remove(checkpoint)
+    except OSError as e:
+        if e.errno != errno.ENOENT:
+            raise
+
+
+def get_playbook_inputs_hash(playbooks, playbook_dir, exclude=None):
+    """Return a hash of the inputs of the playbooks of a run.
+
+    Besides the playbooks, the inputs are the files below the playbook
+    directory, where config-download writes the variables, the role data
+    and the tasks generated from the templates and the environment files,
+    and where the roles of the playbooks are searched first. Hidden
+    entries, such as the git repository of config-download, and the
+    excluded paths are skipped.
+
+    :param playbooks: Playbooks of the run, relative to the playbook
+                      directory or absolute.
+    :type playbooks: List
+
+    :param playbook_dir: Directory of the playbooks.
+    :type playbook_dir: String
+
+    :param exclude: Paths written by the runs, such as the directory of the
+                    checkpoint.
+    :type exclude: List
+
+    :returns: String
+    """
+
+    exclude = set([os.path.abspath(i) for i in exclude or []])
+    sha = hashlib.sha256()
+
+    def _update(path, name):
+        sha.update(name.encode('utf-8'))
+        sha.update(b'\0')
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                sha.update(chunk)
+        sha.update(b'\0')
+
+    for play in playbooks:
+        path = play
+        if not os.path.exists(path):
+            path = os.path.join(playbook_dir, play)
+        if os.path.isfile(path):
+            _update(path, os.path.basename(path))
+
+    playbook_dir = os.path.abspath(playbook_dir)
+    for root, dirs, files in os.walk(playbook_dir):
+        dirs[:] = sorted([
+            i for i in dirs if not i.startswith('.') and
+            os.path.join(root, i) not in exclude
+        ])
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            if name.startswith('.') or path in exclude or \
+                    not os.path.isfile(path):
+                continue
+            _update(path, os.path.relpath(path, playbook_dir))
+    return sha.hexdigest()
+
+
+def get_playbook_checkpoint_offset(checkpoint_data, playbooks, inputs=None):
+    """Return the number of playbooks completed by a checkpointed run.
+
+    The checkpoint only applies to the same sequence of playbooks, compared
+    by name, since the playbooks may be generated in a new directory for
+    every run, and, when given, to the same inputs.
+
+    :param checkpoint_data: Checkpoint returned by load_playbook_checkpoint.
+    :type checkpoint_data: Dictionary
+
+    :param playbooks: Playbooks of the run to resume.
+    :type playbooks: List
+
+    :param inputs: Hash of the inputs of the run to resume, see
+                   `get_playbook_inputs_hash`.
+    :type inputs: String
+
+    :returns: Integer || None when the checkpoint does not match.
+    """
+
+    if not checkpoint_data:
+        return
+    if inputs and checkpoint_data.get('inputs') != inputs:
+        return
+    recorded = checkpoint_data.get('playbooks', list())
+    if ([os.path.basename(i['playbook']) for i in recorded] !=
+            [os.path.basename(i) for i in playbooks]):
+        return
+    offset = 0
+    for item in recorded:
+        if item.get('status') != 'successful':
+            break
+        offset += 1
+    return offset
+
+
+def get_ansible_fact_cache():
+    """Return the path of the ansible fact cache database."""
+
+    return os.path.join(
+        os.path.expanduser('~'),
+        '.tripleo',
+        constants.ANSIBLE_FACT_CACHE_FILE
+    )
+
+
+def get_environment_cache():
+    """Return the cache of the processed Heat environment files."""
+
+    return environment_cache.EnvironmentCache(
+        path=os.path.join(
+            os.path.expanduser('~'),
+            '.tripleo',
+            constants.ENVIRONMENT_CACHE_FILE
+        ),
+        max_entries=constants.ENVIRONMENT_CACHE_MAX_ENTRIES
+    )
+
+
+def get_stack_data_cache():
+    """Return the cache of the stack data built from stack validations."""
+
+    return stack_data_cache.StackDataCache(
+        path=os.path.join(
+            os.path.expanduser('~'),
+            '.tripleo',
+            constants.STACK_DATA_CACHE_FILE
+        ),
+        timeout=constants.STACK_DATA_CACHE_TIMEOUT,
+        max_entries=constants.STACK_DATA_CACHE_MAX_ENTRIES
+    )
+
+
+def get_render_cache():
+    """Return the cache of the rendered jinja2 templates."""
+
+    return template_renderer.RenderCache(
+        path=os.path.join(
+            os.path.expanduser('~'),
+            '.tripleo',
+            constants.TEMPLATE_RENDER_CACHE_FILE
+        ),
+        max_entries=constants.TEMPLATE_RENDER_CACHE_MAX_ENTRIES
+    )
+
+
+def get_template_workspace():
+    """Return the workspace of the rendered templates trees."""
+
+    return template_workspace.TemplateWorkspace(
+        path=os.path.join(
+            os.path.expanduser('~'),
+            '.tripleo',
+            constants.TEMPLATE_WORKSPACE_DIR
+        ),
+        max_entries=constants.TEMPLATE_WORKSPACE_MAX_ENTRIES
+    )
+
+
+def get_parameter_schema(tht_root):
+    """Return the parameter schema of a templates directory."""
+
+    return parameter_schema.ParameterSchemaCache(
+        path=os.path.join(
+            os.path.expanduser('~'),
+            '.tripleo',
+            constants.PARAMETER_SCHEMA_CACHE_DIR
+        ),
+        max_entries=constants.PARAMETER_SCHEMA_CACHE_MAX_ENTRIES
+    ).get(tht_root)
+
+
 def run_ansible_playbook(playbook, inventory, workdir, playbook_dir=None,
                          connection='smart', output_callback='tripleo_dense',
                          ssh_user='root', key=None, module_path=None,
@@ -241,11 +1346,18 @@ def run_ansible_playbook(playbook, inventory, workdir, playbook_dir=None,
                          callback_whitelist=constants.ANSIBLE_CWL,
                          ansible_cfg=None, ansible_timeout=30,
                          reproduce_command=False,
-                         timeout=None, forks=None):
+                         timeout=None, forks=None, event_handler=None,
+                         timing_stream=None, forks_history=None,
+                         checkpoint=None, resume=False,
+                         events_archive=None, accelerated=False,
+                         cwd=None):
     """Simple wrapper for ansible-playbook.
 
-    :param playbook: Playbook filename.
-    :type playbook: String
+    :param playbook: Playbook filename. When a list is provided, the
+                     playbooks are executed in order using import_playbook.
+                     A list item is either a playbook filename or a
+                     dictionary with a `playbook` key.
+    :type playbook: String or List
 
     :param inventory: Either proper inventory file, or a coma-separated list.
     :type inventory: String
@@ -334,6 +1446,65 @@ def run_ansible_playbook(playbook, inventory, workdir, playbook_dir=None,
 
     :param timeout: Timeout for ansible to finish playbook execution (minutes).
     :type timeout: int
+
+    :param forks: Number of forks used by Ansible. When undefined a value
+                  is computed by `get_ansible_forks`. The fork count and the
+                  reasons of its choice are written in the runner artifacts,
+                  see `constants.ANSIBLE_FORKS_FILENAME`.
+    :type forks: int
+
+    :param event_handler: Callable invoked by ansible-runner with every
+                          event produced during the execution. The
+                          callable must return True for the event to be
+                          stored in the runner artifacts.
+    :type event_handler: Function
+
+    :param timing_stream: Path of a file, or a file like object, where the
+                          timing of every task is streamed as newline
+                          delimited JSON while the playbook is running.
+    :type timing_stream: String or Object
+
+    :param forks_history: Path of the file where the fork count and the
+                          duration of the run are recorded. The recorded
+                          runs are used to pick the fork count of the next
+                          runs of the same playbook.
+    :type forks_history: String
+
+    :param checkpoint: Path of the file where the status of every playbook
+                       of a multi-playbook execution, the inventory, the
+                       extra vars and a hash of the other inputs of the
+                       playbooks, see `get_playbook_inputs_hash`, are
+                       recorded while the playbooks run. The file is
+                       removed once all the playbooks succeeded. The marker
+                       plays tracking the playbooks are only inserted when
+                       it is set.
+    :type checkpoint: String
+
+    :param resume: Resume the multi-playbook execution recorded in the
+                   checkpoint from its first incomplete playbook. The
+                   recorded inventory, limit and extra vars are used when
+                   they are not given again. All the playbooks are run when
+                   their inputs changed since the checkpoint was recorded.
+    :type resume: Boolean
+
+    :param events_archive: Path of the file where all the ansible-runner
+                           events of the run are archived, see
+                           `RunnerEventArchive`.
+    :type events_archive: String
+
+    :param accelerated: Run the playbook with the accelerated strategy
+                        plugin, see `get_ansible_accelerated_strategy`.
+                        The default strategy is used when none is usable.
+    :type accelerated: Boolean
+
+    :param cwd: Directory whose plugin and role sub-directories are searched
+                after the ones of the working directory. The working
+                directory of the process is never read, the playbook may run
+                concurrently with code changing it (defaults to workdir).
+    :type cwd: String
+
+    :returns: List of dictionaries with the status of every playbook when
+              a list of playbooks is executed, None otherwise.
     """
 
     def _playbook_check(play):
@@ -351,7 +1522,7 @@ def run_ansible_playbook(playbook, inventory, workdir, playbook_dir=None,
                 if os.path.exists(inventory):
                     return inventory
             elif isinstance(inventory, dict):
-                inventory = yaml.safe_dump(
+                inventory = yaml_utils.safe_dump(
                     inventory,
                     default_flow_style=False
                 )
@@ -371,6 +1542,103 @@ def run_ansible_playbook(playbook, inventory, workdir, playbook_dir=None,
     if not playbook_dir:
         playbook_dir = workdir
 
+    completed = list()
+    checkpoint_run = None
+    if checkpoint and isinstance(playbook, (list, set)):
+        playbook = [i if isinstance(i, dict) else {'playbook': i}
+                    for i in playbook]
+        # The inventory may be regenerated before a resumed run, record its
+        # content rather than its path.
+        checkpoint_inventory = inventory
+        if isinstance(inventory, six.string_types) and \
+                os.path.isfile(inventory):
+            with open(inventory, 'r') as f:
+                checkpoint_inventory = f.read()
+            try:
+                inventory_data = yaml_utils.safe_load(checkpoint_inventory)
+            except yaml.YAMLError:
+                inventory_data = None
+            if isinstance(inventory_data, dict):
+                checkpoint_inventory = inventory_data
+        checkpoint_run = {
+            'inventory': checkpoint_inventory,
+            'limit_hosts': limit_hosts,
+            'extra_vars': extra_vars,
+            'extra_vars_file': extra_vars_file
+        }
+
+        # The playbooks and their inputs are regenerated before a resumed
+        # run, the completed playbooks are only skipped when they did not
+        # change.
+        checkpoint_inputs = get_playbook_inputs_hash(
+            [i['playbook'] for i in playbook],
+            playbook_dir,
+            exclude=[
+                os.path.dirname(os.path.abspath(checkpoint)),
+                os.path.join(workdir, 'env'),
+                os.path.join(workdir, 'tripleo-multi-playbook.yaml'),
+                os.path.join(workdir, 'ansible-playbook-command.sh'),
+                os.path.join(constants.DEFAULT_WORK_DIR, plan, 'ansible.cfg')
+            ]
+        )
+        checkpoint_data = None
+        if resume:
+            checkpoint_data = load_playbook_checkpoint(checkpoint)
+        offset = get_playbook_checkpoint_offset(
+            checkpoint_data,
+            [i['playbook'] for i in playbook],
+            inputs=checkpoint_inputs
+        )
+        if offset is not None:
+            # The recorded inputs are only reused when they are not given
+            # again, the inputs given to the resumed run take precedence.
+            for name, value in sorted(checkpoint_run.items()):
+                recorded = checkpoint_data.get(name)
+                if not value:
+                    checkpoint_run[name] = recorded
+                elif recorded and value != recorded:
+                    LOG.warning(
+                        'The {} of the resumed playbooks differs from the'
+                        ' one recorded in checkpoint {}, using the current'
+                        ' one'.format(name, checkpoint)
+                    )
+            if not inventory:
+                inventory = checkpoint_run['inventory']
+            limit_hosts = checkpoint_run['limit_hosts']
+            extra_vars = checkpoint_run['extra_vars']
+            extra_vars_file = checkpoint_run['extra_vars_file']
+            completed = [
+                {'playbook': i['playbook'], 'status': 'successful'}
+                for i in playbook[:offset]
+            ]
+            playbook = playbook[offset:]
+            LOG.info(
+                'Resuming the playbooks from checkpoint {}, completed'
+                ' playbooks: {}'.format(
+                    checkpoint,
+                    [i['playbook'] for i in completed]
+                )
+            )
+        elif resume:
+            LOG.warning(
+                'No checkpoint matching the playbooks and their inputs found'
+                ' in {}, running all the playbooks'.format(checkpoint)
+            )
+        checkpoint_run['inputs'] = checkpoint_inputs
+
+        if not playbook:
+            LOG.info('All the playbooks were completed, nothing to resume')
+            remove_playbook_checkpoint(checkpoint)
+            return completed
+
+    if isinstance(playbook, (list, set)):
+        playbook_name = ','.join(
+            [os.path.basename(i['playbook'] if isinstance(i, dict) else i)
+             for i in playbook]
+        )
+    else:
+        playbook_name = os.path.basename(playbook)
+
     # Ensure that the ansible-runner env exists
     runner_env = os.path.join(workdir, 'env')
     makedirs(runner_env)
@@ -378,28 +1646,56 @@ def run_ansible_playbook(playbook, inventory, workdir, playbook_dir=None,
     if extra_vars_file:
         runner_extra_vars = os.path.join(runner_env, 'extravars')
         with open(runner_extra_vars, 'w') as f:
-            f.write(yaml.safe_dump(extra_vars_file, default_flow_style=False))
+            f.write(yaml_utils.safe_dump(extra_vars_file,
+                                         default_flow_style=False))
 
     if timeout and timeout > 0:
         settings_file = os.path.join(runner_env, 'settings')
         timeout_value = timeout * 60
         if os.path.exists(settings_file):
             with open(settings_file, 'r') as f:
-                settings_object = yaml.safe_load(f.read())
+                settings_object = yaml_utils.safe_load(f.read())
                 settings_object['job_timeout'] = timeout_value
         else:
             settings_object = {'job_timeout': timeout_value}
 
         with open(settings_file, 'w') as f:
-            f.write(yaml.safe_dump(settings_object, default_flow_style=False))
+            f.write(yaml_utils.safe_dump(settings_object,
+                                         default_flow_style=False))
+
+    def _playbooks_status(rc):
+        return completed + tracker.status(rc=rc)
 
+    def _checkpoint(tracker):
+        write_playbook_checkpoint(
+            checkpoint,
+            _playbooks_status(rc=None),
+            **checkpoint_run
+        )
+
+    tracker = None
     if isinstance(playbook, (list, set)):
-        verified_playbooks = [_playbook_check(play=i) for i in playbook]
+        tracker = MultiPlaybookTracker(
+            event_handler=event_handler,
+            on_progress=_checkpoint if checkpoint_run else None
+        )
+        event_handler = tracker
+        multi_playbook = list()
+        for item in playbook:
+            if isinstance(item, dict):
+                item = item['playbook']
+            multi_playbook.extend(
+                tracker.add(
+                    playbook=_playbook_check(play=item),
+                    marker=checkpoint_run is not None
+                )
+            )
+        verified_playbooks = tracker.playbooks
         playbook = os.path.join(workdir, 'tripleo-multi-playbook.yaml')
         with open(playbook, 'w') as f:
             f.write(
-                yaml.safe_dump(
-                    [{'import_playbook': i} for i in verified_playbooks],
+                yaml_utils.safe_dump(
+                    multi_playbook,
                     default_flow_style=False
                 )
             )
@@ -431,19 +1727,34 @@ def run_ansible_playbook(playbook, inventory, workdir, playbook_dir=None,
                 limit_hosts
             )
         )
-    cwd = os.getcwd()
-    ansible_fact_path = os.path.join(
-        os.path.expanduser('~'),
-        '.tripleo',
-        'fact_cache'
-    )
-    makedirs(ansible_fact_path)
+    if not cwd:
+        cwd = workdir
+    ansible_fact_path = get_ansible_fact_cache()
+    makedirs(os.path.dirname(ansible_fact_path))
 
     if output_callback not in callback_whitelist.split(','):
         callback_whitelist = ','.join([callback_whitelist, output_callback])
 
-    if not forks:
-        forks = min(multiprocessing.cpu_count() * 4, 100)
+    if forks:
+        # the requested fork counts are recorded along the picked ones
+        host_count = None
+        if forks_history:
+            host_count = get_ansible_host_count(inventory, limit_hosts)
+        forks_reasons = ['requested: {}'.format(forks)]
+    else:
+        forks, host_count, forks_reasons = get_ansible_forks(
+            inventory=inventory,
+            limit_hosts=limit_hosts,
+            playbook=playbook_name,
+            history_file=forks_history,
+            connection=connection
+        )
+        LOG.info(
+            'Running ansible with {} forks, based on: {}'.format(
+                forks,
+                ', '.join(forks_reasons)
+            )
+        )
 
     env = dict()
     env['ANSIBLE_SSH_ARGS'] = (
@@ -566,7 +1877,13 @@ def run_ansible_playbook(playbook, inventory, workdir, playbook_dir=None,
     env['ANSIBLE_RETRY_FILES_ENABLED'] = False
     env['ANSIBLE_HOST_KEY_CHECKING'] = False
     env['ANSIBLE_TRANSPORT'] = connection
-    env['ANSIBLE_CACHE_PLUGIN_TIMEOUT'] = 7200
+    env['ANSIBLE_CACHE_PLUGINS'] = constants.ANSIBLE_FACT_CACHE_PLUGIN_DIR
+    env['ANSIBLE_CACHE_PLUGIN'] = constants.ANSIBLE_FACT_CACHE_PLUGIN
+    env['ANSIBLE_CACHE_PLUGIN_CONNECTION'] = ansible_fact_path
+    env['ANSIBLE_CACHE_PLUGIN_TIMEOUT'] = constants.ANSIBLE_FACT_CACHE_TIMEOUT
+    env['TRIPLEO_FACT_CACHE_MAX_HOSTS'] = (
+        constants.ANSIBLE_FACT_CACHE_MAX_HOSTS
+    )
 
     if connection == 'local':
         env['ANSIBLE_PYTHON_INTERPRETER'] = sys.executable
@@ -624,6 +1941,47 @@ def run_ansible_playbook(playbook, inventory, workdir, playbook_dir=None,
     elif 'ANSIBLE_CONFIG' not in env and ansible_cfg:
         env['ANSIBLE_CONFIG'] = ansible_cfg
 
+    if accelerated:
+        accelerated_strategy = get_ansible_accelerated_strategy()
+        playbook_strategies = get_playbook_strategies(playbook)
+        if 'ANSIBLE_STRATEGY' in env:
+            LOG.info(
+                'Running ansible with the strategy {} set in the'
+                ' environment'.format(env['ANSIBLE_STRATEGY'])
+            )
+        elif playbook_strategies:
+            # NOTE: Plays declaring their own strategy, like the tripleo_free
+            # and tripleo_linear plays of the deploy steps, ignore
+            # ANSIBLE_STRATEGY and their strategies can not be replaced.
+            LOG.warning(
+                'The playbook {} declares the strategies: {}, the'
+                ' accelerated strategy has no effect on it, running ansible'
+                ' with the strategies of the playbook'.format(
+                    playbook,
+                    ', '.join(sorted(playbook_strategies))
+                )
+            )
+        elif accelerated_strategy:
+            env['ANSIBLE_STRATEGY_PLUGINS'] = ':'.join(
+                [accelerated_strategy[0], get_ansible_strategy_plugins(env)]
+            )
+            env['ANSIBLE_STRATEGY'] = accelerated_strategy[1]
+            LOG.info(
+                'Running ansible with the accelerated strategy: {}'.format(
+                    accelerated_strategy[1]
+                )
+            )
+        else:
+            LOG.warning(
+                'No accelerated ansible strategy is usable, running ansible'
+                ' with the default strategy. Supported strategies: {}'.format(
+                    ', '.join(
+                        ['{} ({})'.format(i[2], i[0])
+                         for i in constants.ANSIBLE_ACCELERATED_STRATEGIES]
+                    )
+                )
+            )
+
     command_path = None
     with TempDirs(chdir=False) as ansible_artifact_path:
 
@@ -636,8 +1994,7 @@ def run_ansible_playbook(playbook, inventory, workdir, playbook_dir=None,
             'verbosity': verbosity,
             'quiet': quiet,
             'extravars': extra_vars,
-            'fact_cache': ansible_fact_path,
-            'fact_cache_type': 'jsonfile',
+            'fact_cache_type': constants.ANSIBLE_FACT_CACHE_PLUGIN,
             'artifact_dir': ansible_artifact_path,
             'rotate_artifacts': 256
         }
@@ -654,6 +2011,14 @@ def run_ansible_playbook(playbook, inventory, workdir, playbook_dir=None,
         if parallel_run:
             r_opts['directory_isolation_base_path'] = ansible_artifact_path
 
+        with open(os.path.join(ansible_artifact_path,
+                               constants.ANSIBLE_FORKS_FILENAME), 'w') as f:
+            f.write(simplejson.dumps({
+                'forks': forks,
+                'hosts': host_count,
+                'reasons': forks_reasons
+            }, indent=2))
+
         runner_config = ansible_runner.runner_config.RunnerConfig(**r_opts)
         runner_config.prepare()
         # NOTE(cloudnull): overload the output callback after prepare
@@ -664,7 +2029,35 @@ def run_ansible_playbook(playbook, inventory, workdir, playbook_dir=None,
         #                  made available to us, this line should be removed.
         runner_config.env['ANSIBLE_STDOUT_CALLBACK'] = \
             r_opts['envvars']['ANSIBLE_STDOUT_CALLBACK']
-        runner = ansible_runner.Runner(config=runner_config)
+
+        timing = None
+        if timing_stream:
+            timing = TaskTimingStream(
+                stream=timing_stream,
+                event_handler=event_handler
+            )
+            event_handler = timing
+            LOG.info(
+                'Streaming ansible task timings to: {}'.format(
+                    getattr(timing.stream, 'name', timing_stream)
+                )
+            )
+
+        archive = None
+        if events_archive:
+            archive = RunnerEventArchive(
+                path=events_archive,
+                event_handler=event_handler
+            )
+            event_handler = archive
+            LOG.info(
+                'Archiving ansible events to: {}'.format(events_archive)
+            )
+
+        runner = ansible_runner.Runner(
+            config=runner_config,
+            event_handler=event_handler
+        )
 
         if reproduce_command:
             command_path = os.path.join(
@@ -680,6 +2073,7 @@ def run_ansible_playbook(playbook, inventory, workdir, playbook_dir=None,
                 f.write('{} "$@"\n'.format(' '.join(runner_config.command)))
             os.chmod(command_path, 0o750)
 
+        start = time.time()
         try:
             status, rc = runner.run()
         finally:
@@ -689,6 +2083,30 @@ def run_ansible_playbook(playbook, inventory, workdir, playbook_dir=None,
             _log_path = r_opts['envvars']['ANSIBLE_LOG_PATH']
             if os.path.isfile(_log_path):
                 os.chown(_log_path, get_uid, -1)
+            if timing:
+                timing.close()
+            if archive:
+                archive.close()
+
+    if forks_history:
+        record_ansible_forks(
+            history_file=forks_history,
+            playbook=playbook_name,
+            forks=forks,
+            hosts=host_count,
+            duration=time.time() - start,
+            rc=rc
+        )
+
+    if checkpoint_run:
+        if rc == 0:
+            remove_playbook_checkpoint(checkpoint)
+        else:
+            write_playbook_checkpoint(
+                checkpoint,
+                _playbooks_status(rc=rc),
+                **checkpoint_run
+            )
 
     if rc != 0:
         err_msg = (
@@ -708,6 +2126,18 @@ def run_ansible_playbook(playbook, inventory, workdir, playbook_dir=None,
                 )
             )
 
+        if tracker:
+            err_msg += ', Playbooks: {}'.format(
+                ', '.join(
+                    ['{} ({})'.format(i['playbook'], i['status'])
+                     for i in _playbooks_status(rc=rc)]
+                )
+            )
+        if checkpoint_run:
+            err_msg += (
+                ', The playbooks can be resumed from: {}'.format(checkpoint)
+            )
+
         if not quiet:
             LOG.error(err_msg)
 
@@ -717,6 +2147,305 @@ def run_ansible_playbook(playbook, inventory, workdir, playbook_dir=None,
         'Ansible execution success. playbook: {}'.format(
             playbook))
 
+    if tracker:
+        return [
+            {'playbook': i['playbook'], 'status': i['status']}
+            for i in _playbooks_status(rc=rc)
+        ]
+
+
+def run_ansible_playbook_graph(playbooks, workdir, playbook_dir=None,
+                               inventory='localhost,', max_parallel=None,
+                               **kwargs):
+    """Run several playbooks, concurrently when they are independent.
+
+    Every item in ``playbooks`` is either a playbook name or a dictionary
+    with a ``playbook`` key and the optional keys:
+
+    * ``name``: name used to refer to the playbook (defaults to the
+      playbook file name).
+    * ``extra_vars``: variables of the playbook, merged over the
+      ``extra_vars`` argument.
+    * ``tags``: tags of the playbook, replacing the ``tags`` argument.
+    * ``requires``: names of the playbooks which must succeed before the
+      playbook runs.
+    * ``hosts``: host pattern of the hosts touched by the playbook.
+
+    When ``requires`` is undefined, a playbook depends on the playbooks
+    listed before it, except for the ones declaring ``hosts`` disjoint
+    from its own ``hosts``. Dependencies must be listed before the
+    playbooks requiring them.
+
+    Each playbook is run by its own ansible-runner execution, in its own
+    working directory with ``parallel_run`` directory isolation, as soon as
+    its dependencies succeeded. The playbooks depending on a failed
+    playbook are not run.
+
+    >>> run_ansible_playbook_graph(
+    ...     playbooks=[
+    ...         {'playbook': 'prepare-nfs-backup.yaml',
+    ...          'hosts': 'BackupNode',
+    ...          'tags': 'bar_setup_nfs_server'},
+    ...         {'playbook': 'prepare-overcloud-backup.yaml',
+    ...          'hosts': 'Controller',
+    ...          'tags': 'bar_setup_rear'}
+    ...     ],
+    ...     workdir='/tmp/work',
+    ...     playbook_dir='/usr/share/ansible/tripleo-playbooks',
+    ...     inventory='/home/stack/tripleo-inventory.yaml'
+    ... )
+
+    :param playbooks: Playbooks to execute.
+    :type playbooks: List
+
+    :param workdir: Location of the working directory.
+    :type workdir: String
+
+    :param playbook_dir: Location of the playbook directory.
+                         (defaults to workdir).
+    :type playbook_dir: String
+
+    :param inventory: Either proper inventory file, or a coma-separated list.
+                      (defaults to "localhost,").
+    :type inventory: String
+
+    :param max_parallel: Maximum number of playbooks run concurrently.
+                         (defaults to ANSIBLE_PLAYBOOK_MAX_PARALLEL).
+    :type max_parallel: Integer
+
+    :param kwargs: Any other argument accepted by `run_ansible_playbook`,
+                   applied to every playbook. When the number of forks is
+                   undefined, the forks computed by `get_ansible_forks` are
+                   shared by the concurrent runs. Files written by the runs
+                   (timing_stream, events_archive, checkpoint) can not be
+                   shared by concurrent runs.
+    :type kwargs: Dictionary
+
+    :returns: List of dictionaries with the playbook and its status.
+    :raises: RuntimeError when one of the playbooks failed. The error
+             message contains the status of every playbook.
+    """
+
+    if not playbook_dir:
+        playbook_dir = workdir
+    if not max_parallel:
+        max_parallel = constants.ANSIBLE_PLAYBOOK_MAX_PARALLEL
+    extra_vars = kwargs.pop('extra_vars', None) or dict()
+
+    items = list()
+    for index, item in enumerate(playbooks):
+        if not isinstance(item, dict):
+            item = {'playbook': item}
+        item = dict(item)
+        item.setdefault('name', os.path.basename(item['playbook']))
+        if item['name'] in [i['name'] for i in items]:
+            raise RuntimeError(
+                'Duplicate playbook name: {}'.format(item['name'])
+            )
+        item['workdir'] = os.path.join(workdir, 'playbook-{}'.format(index))
+        if item.get('hosts'):
+            item['host_set'] = resolve_inventory_hosts(
+                inventory=inventory,
+                hosts=item['hosts']
+            )
+        else:
+            item['host_set'] = None
+
+        if 'requires' in item:
+            item['requires'] = set(item['requires'] or list())
+            unknown = item['requires'] - set([i['name'] for i in items])
+            if unknown:
+                raise RuntimeError(
+                    'Playbook {} requires playbooks which are not listed'
+                    ' before it: {}'.format(
+                        item['name'],
+                        ', '.join(sorted(unknown))
+                    )
+                )
+        else:
+            item['requires'] = set([
+                i['name'] for i in items
+                if item['host_set'] is None or i['host_set'] is None or
+                item['host_set'] & i['host_set']
+            ])
+        items.append(item)
+
+    # Playbooks at the same depth of the graph are independent, the widest
+    # depth bounds the number of concurrent runs.
+    depth = dict()
+    for item in items:
+        depth[item['name']] = max(
+            [depth[i] + 1 for i in item['requires']] or [0]
+        )
+    parallel = min(
+        max_parallel,
+        max([list(depth.values()).count(i) for i in depth.values()] or [1])
+    )
+    if parallel > 1 and not kwargs.get('forks'):
+        forks, _, reasons = get_ansible_forks(
+            inventory=inventory,
+            limit_hosts=kwargs.get('limit_hosts'),
+            connection=kwargs.get('connection', 'smart')
+        )
+        kwargs['forks'] = max(forks // parallel, 1)
+        LOG.info(
+            'Ansible forks shared by {} concurrent playbooks: {} each'
+            ' ({})'.format(parallel, kwargs['forks'], ', '.join(reasons))
+        )
+
+    def _run(item):
+        run_vars = dict(extra_vars)
+        run_vars.update(item.get('extra_vars') or dict())
+        run_kwargs = dict(kwargs)
+        if 'tags' in item:
+            run_kwargs['tags'] = item['tags']
+        return run_ansible_playbook(
+            playbook=item['playbook'],
+            inventory=inventory,
+            workdir=item['workdir'],
+            playbook_dir=playbook_dir,
+            extra_vars=run_vars,
+            parallel_run=True,
+            **run_kwargs
+        )
+
+    status = collections.OrderedDict([(i['name'], 'pending') for i in items])
+    running = dict()
+    with futures.ThreadPoolExecutor(max_workers=parallel) as executor:
+        while True:
+            for item in items:
+                if status[item['name']] != 'pending':
+                    continue
+                if all([status[i] == 'successful'
+                        for i in item['requires']]):
+                    LOG.debug(
+                        'Starting playbook {}'.format(item['name'])
+                    )
+                    status[item['name']] = 'running'
+                    running[executor.submit(_run, item)] = item['name']
+            if not running:
+                break
+            done, _ = futures.wait(
+                running,
+                return_when=futures.FIRST_COMPLETED
+            )
+            for future in done:
+                name = running.pop(future)
+                try:
+                    future.result()
+                except Exception as e:
+                    status[name] = 'failed'
+                    LOG.error(
+                        'Playbook {} failed: {}'.format(name, e)
+                    )
+                else:
+                    status[name] = 'successful'
+
+    result = [
+        {'playbook': i['playbook'], 'status': status[i['name']]}
+        for i in items
+    ]
+    if any([i['status'] != 'successful' for i in result]):
+        err_msg = 'Ansible execution failed. Playbooks: {}'.format(
+            ', '.join(['{} ({})'.format(i['playbook'], i['status'])
+                       for i in result])
+        )
+        if not kwargs.get('quiet'):
+            LOG.error(err_msg)
+        raise RuntimeError(err_msg)
+
+    LOG.info(
+        'Ansible execution success. playbooks: {}'.format(
+            ', '.join([i['playbook'] for i in result])
+        )
+    )
+    return result
+
+
+def prewarm_ssh_connections(inventory, workdir, limit_hosts=None, **kwargs):
+    """Open the SSH connections to the inventory hosts ahead of a run.
+
+    A command is run on every host, with the SSH settings of
+    `run_ansible_playbook`, so the ControlMaster sockets of the hosts are
+    opened concurrently, bounded by the number of forks, and persisted for
+    the playbooks that follow. Unreachable hosts do not fail the run, they
+    are returned so they can be excluded from the next playbooks.
+
+    :param inventory: Either proper inventory file or a
+                      comma-separated list.
+    :type inventory: String
+
+    :param workdir: Location of the working directory.
+    :type workdir: String
+
+    :param limit_hosts: Limit the connections to these hosts.
+    :type limit_hosts: String
+
+    :param kwargs: Any other argument accepted by `run_ansible_playbook`.
+    :type kwargs: Dictionary
+
+    :returns: List of the unreachable hosts.
+    :raises: RuntimeError when none of the hosts is reachable.
+    """
+
+    reachable = set()
+    unreachable = set()
+
+    def _event_handler(event):
+        host = event.get('event_data', dict()).get('host')
+        if event.get('event') == 'runner_on_ok':
+            reachable.add(host)
+        elif event.get('event') == 'runner_on_unreachable':
+            unreachable.add(host)
+        return True
+
+    playbook = os.path.join(workdir, 'tripleo-ssh-prewarm.yaml')
+    with open(playbook, 'w') as f:
+        f.write(
+            yaml_utils.safe_dump(
+                [
+                    {
+                        'name': 'Open the SSH connections',
+                        'hosts': 'all',
+                        'gather_facts': False,
+                        'ignore_unreachable': True,
+                        'tasks': [
+                            {
+                                'name': 'Open the SSH control socket',
+                                'raw': 'true',
+                                'changed_when': False
+                            }
+                        ]
+                    }
+                ],
+                default_flow_style=False
+            )
+        )
+
+    run_ansible_playbook(
+        playbook=playbook,
+        inventory=inventory,
+        workdir=workdir,
+        playbook_dir=workdir,
+        limit_hosts=limit_hosts,
+        gathering_policy='explicit',
+        event_handler=_event_handler,
+        **kwargs
+    )
+
+    unreachable = sorted(unreachable - reachable)
+    if unreachable:
+        if not reachable:
+            raise RuntimeError(
+                'None of the hosts is reachable: {}'.format(
+                    ', '.join(unreachable)
+                )
+            )
+        LOG.warning(
+            'Unreachable hosts: {}'.format(', '.join(unreachable))
+        )
+    return unreachable
+
 
 def convert(data):
     """Recursively converts dictionary keys,values to strings."""
@@ -1398,7 +3127,7 @@ def parse_env_file(env_file, file_type=None):
     elif file_type == 'csv' or env_file.name.endswith('.csv'):
         nodes_config = _csv_to_nodes_dict(env_file)
     elif env_file.name.endswith('.yaml'):
-        nodes_config = yaml.safe_load(env_file)
+        nodes_config = yaml_utils.safe_load(env_file)
     else:
         raise exceptions.InvalidConfiguration(
             _("Invalid file extension for %s, must be json, yaml or csv") %
@@ -1447,6 +3176,12 @@ def prompt_user_for_confirmation(message, logger, positive_response='y'):
     return False
 
 
+# Keys of the Heat template values which are links to other files.
+TEMPLATE_LINK_KEYS = ('get_file', 'type')
+
+_PLAIN_LINK_RE = re.compile(r'^[A-Za-z0-9_./~][A-Za-z0-9_./~@+=:-]*$')
+
+
 def replace_links_in_template_contents(contents, link_replacement):
     """Replace get_file and type file links in Heat template contents
 
@@ -1455,13 +3190,41 @@ def replace_links_in_template_contents(contents, link_replacement):
     file paths according to link_replacement dict. (Key/value in
     link_replacement are from/to, respectively.)
 
+    The template is scanned as a stream of YAML events and only the
+    replaced links are rewritten, the rest of the contents is kept as
+    is. Contents without any of the links are not parsed.
+
     If the string contents don't look like a Heat template, return the
     contents unmodified.
     """
 
+    if not isinstance(contents, six.text_type):
+        return _replace_links_by_round_trip(contents, link_replacement)
+    if not any(link in contents for link in link_replacement):
+        return contents
+
+    try:
+        replacements = _find_link_replacements(contents, link_replacement)
+    except yaml.YAMLError:
+        return contents
+    if replacements is None:
+        # links which can not be rewritten in place, e.g. aliases
+        return _replace_links_by_round_trip(contents, link_replacement)
+
+    parts = []
+    position = 0
+    for start, end, value in replacements:
+        parts.append(contents[position:start])
+        parts.append(value)
+        position = end
+    parts.append(contents[position:])
+    return ''.join(parts)
+
+
+def _replace_links_by_round_trip(contents, link_replacement):
     template = {}
     try:
-        template = yaml.safe_load(contents)
+        template = yaml_utils.safe_load(contents)
     except yaml.YAMLError:
         return contents
 
@@ -1471,7 +3234,87 @@ def replace_links_in_template_contents(contents, link_replacement):
 
     template = replace_links_in_template(template, link_replacement)
 
-    return yaml.safe_dump(template)
+    return yaml_utils.safe_dump(template)
+
+
+def _format_link(link, style):
+    if style in (None, ''):
+        if (_PLAIN_LINK_RE.match(link) and
+                yaml_utils.safe_load(link) == link):
+            return link
+        style = '"'
+    if style == "'":
+        return "'%s'" % link.replace("'", "''")
+    return simplejson.dumps(link, ensure_ascii=False)
+
+
+def _find_link_replacements(contents, link_replacement):
+    """Find the links of a Heat template to replace.
+
+    :returns: list of (start, end, replacement) of the scalars to replace,
+              in order. The list is empty when the contents are not a
+              Heat template. None when a link can not be replaced in
+              place.
+    """
+
+    replacements = []
+    is_template = False
+    documents = 0
+    # [is mapping, expects a key, last key] for each open collection
+    stack = []
+    for event in yaml.parse(contents, Loader=yaml_utils.SafeLoader):
+        if isinstance(event, yaml.DocumentStartEvent):
+            documents += 1
+            if documents > 1:
+                # not a single template
+                return []
+            continue
+        if isinstance(event, yaml.CollectionEndEvent):
+            stack.pop()
+            continue
+        if not isinstance(event, yaml.NodeEvent):
+            continue
+
+        key = None
+        is_value = True
+        if stack and stack[-1][0]:
+            parent = stack[-1]
+            if parent[1]:
+                is_value = False
+                parent[2] = (event.value
+                             if isinstance(event, yaml.ScalarEvent)
+                             else None)
+            else:
+                key = parent[2]
+            parent[1] = not parent[1]
+
+        if is_value and key in TEMPLATE_LINK_KEYS:
+            if isinstance(event, yaml.AliasEvent):
+                return
+            if (isinstance(event, yaml.ScalarEvent) and
+                    event.value in link_replacement):
+                if (event.anchor or event.tag or
+                        event.style not in (None, '', '"', "'")):
+                    return
+                if (event.style in (None, '') and not isinstance(
+                        yaml_utils.safe_load(event.value),
+                        six.string_types)):
+                    continue
+                replacements.append((
+                    event.start_mark.index, event.end_mark.index,
+                    _format_link(link_replacement[event.value],
+                                 event.style)))
+        elif (is_value and key == 'heat_template_version' and
+                len(stack) == 1 and isinstance(event, yaml.ScalarEvent)):
+            is_template = bool(event.value)
+
+        if isinstance(event, yaml.CollectionStartEvent):
+            stack.append([isinstance(event, yaml.MappingStartEvent),
+                          True, None])
+
+    if not is_template:
+        return []
+    return replacements
 
 
 def replace_links_in_template(template_part, link_replacement):
@@ -1626,7 +3469,30 @@ def get_networks_file_path(networks_file, tht_root):
 
 
 def build_stack_data(clients, stack_name, template,
-                     files, env_files):
+                     files, env_files, cache=None, tht_root=None):
+    """Validate a stack and flatten its resource tree.
+
+    :param cache: Cache of the stack data, see `get_stack_data_cache`. The
+                  stack is only validated by Heat when the template, the
+                  files and the environment files are not in the cache.
+    :type cache: StackDataCache
+
+    :param tht_root: The templates directory, the cached stack data of the
+                     same templates in another directory is reused.
+    :type tht_root: String
+    """
+    if cache is not None:
+        key = cache.key(template, files, env_files, tht_root)
+        stack_data = cache.get(key, tht_root)
+        if stack_data is not None:
+            LOG.debug('Using the cached validation of stack %s', stack_name)
+            # the parameters generated for every deployment are not part
+            # of the key
+            if stack_data.get('environment_parameters') is not None:
+                stack_data['environment_parameters'].update(
+                    cache.ignored_parameters(files, env_files))
+            return stack_data
+
     orchestration_client = clients.orchestration
     fields = {
         'template': template,
@@ -1643,22 +3509,53 @@ def build_stack_data(clients, stack_name, template,
         flattened = {'resources': {}, 'parameters': {}}
         stack_utils._flat_it(flattened, 'Root', result)
         stack_data['heat_resource_tree'] = flattened
+        if cache is not None:
+            cache.set(key, stack_data, tht_root)
 
     return stack_data
 
 
+def get_artifact_store():
+    """Return the content addressed store of the deployment artifacts."""
+
+    return artifact_archive.ArtifactStore(
+        path=os.path.join(
+            constants.CLOUD_HOME_DIR,
+            '.tripleo',
+            constants.ARTIFACT_STORE_DIR
+        ),
+        max_manifests=constants.ARTIFACT_STORE_MAX_MANIFESTS
+    )
+
+
 def archive_deploy_artifacts(log, stack_name, tht_dir,
-                             ansible_dir=None, output_dir=None):
-    """Create a tarball of the temporary folders used"""
+                             ansible_dir=None, output_dir=None,
+                             archive_format=constants.ARTIFACT_ARCHIVE_FORMAT,
+                             store=None):
+    """Create a tarball of the temporary folders used
+
+    :param archive_format: Compression of the tarball, one of
+                           artifact_archive.ARCHIVE_FORMATS, or
+                           artifact_archive.ARCHIVE_FORMAT_NONE to not
+                           create a tarball.
+    :type archive_format: String
+
+    :param store: Store the folders are also added to, see
+                  `get_artifact_store`.
+    :type store: artifact_archive.ArtifactStore
+
+    :returns: The path of the tarball, None when no tarball is created.
+    """
     log.debug(_("Preserving deployment artifacts"))
 
     if not output_dir:
         output_dir = tht_dir
 
-    def get_tar_filename():
-        return '%s/%s-install-%s.tar.bzip2' % \
-           (constants.CLOUD_HOME_DIR, stack_name,
-            datetime.datetime.utcnow().strftime('%Y%m%d%H%M%S'))
+    name = '%s-install-%s' % (
+        stack_name, datetime.datetime.utcnow().strftime('%Y%m%d%H%M%S'))
+    paths = [tht_dir]
+    if ansible_dir:
+        paths.append(ansible_dir)
 
     def remove_leading_path(info):
         """Tar filter to remove output dir from path"""
@@ -1666,27 +3563,41 @@ def archive_deploy_artifacts(log, stack_name, tht_dir,
         info.name = info.name.replace(leading_path, '')
         return info
 
-    tar_filename = get_tar_filename()
+    if store:
+        def arcname(path):
+            if path.startswith(output_dir + '/') or path == output_dir:
+                return os.path.relpath(path, output_dir)
+            return path.lstrip('/')
+
+        try:
+            manifest = store.add(name, {i: arcname(i) for i in paths})
+            log.warning(_('Install artifacts are recorded in %s') % manifest)
+        except Exception as ex:
+            msg = _("Unable to store the artifacts, %s") % str(ex)
+            log.warning(msg)
+
+    if archive_format == artifact_archive.ARCHIVE_FORMAT_NONE:
+        return None
+
+    tar_filename = os.path.join(
+        constants.CLOUD_HOME_DIR,
+        name + artifact_archive.ARCHIVE_FORMATS[archive_format][0])
     try:
-        tf = tarfile.open(tar_filename, 'w:bz2')
-        tf.add(tht_dir, recursive=True, filter=remove_leading_path)
-        if ansible_dir:
-            tf.add(ansible_dir, recursive=True,
-                   filter=remove_leading_path)
-        tf.close()
+        artifact_archive.write_archive(tar_filename, archive_format, paths,
+                                       tar_filter=remove_leading_path)
     except Exception as ex:
         msg = _("Unable to create artifact tarball, %s") % str(ex)
         log.warning(msg)
     return tar_filename
 
 
-def jinja_render_files(log, templates, working_dir,
-                       roles_file=None, networks_file=None,
-                       base_path=None, output_dir=None):
+def _run_process_templates(log, templates, working_dir,
+                           roles_file=None, networks_file=None,
+                           base_path=None, output_dir=None):
     python_version = sys.version_info[0]
     python_cmd = "python{}".format(python_version)
     process_templates = os.path.join(
-        templates, 'tools/process-templates.py')
+        templates, template_renderer.PROCESS_TEMPLATES_SCRIPT)
     args = [python_cmd, process_templates]
 
     if roles_file:
@@ -1711,19 +3622,314 @@ def jinja_render_files(log, templates, working_dir,
         raise exceptions.DeploymentError(msg)
 
 
+def jinja_render_files(log, templates, working_dir,
+                       roles_file=None, networks_file=None,
+                       base_path=None, output_dir=None):
+    """Render the jinja2 templates of a templates tree.
+
+    When the process-templates.py script of the templates is a known one,
+    the templates are rendered within the process, see
+    `template_renderer.process_templates`, reusing the renderings of the
+    previous deployments which did not change. Otherwise the script of the
+    templates renders them.
+
+    :param log: Logger of the command.
+    :type log: Logger
+
+    :param templates: The templates directory the included templates are
+                      searched in.
+    :type templates: String
+
+    :param working_dir: The templates directory to render when base_path is
+                        not set.
+    :type working_dir: String
+    """
+
+    if not template_renderer.is_known_process_templates(templates):
+        log.info("Unknown %s script in %s, rendering the templates with it"
+                 % (template_renderer.PROCESS_TEMPLATES_SCRIPT, templates))
+        _run_process_templates(log, templates, working_dir, roles_file,
+                               networks_file, base_path, output_dir)
+        return
+
+    template_path = base_path or working_dir
+    if roles_file:
+        roles_file_path = get_roles_file_path(roles_file, base_path)
+    else:
+        roles_file_path = os.path.join(template_path,
+                                       constants.OVERCLOUD_ROLES_FILE)
+    if networks_file:
+        networks_file_path = get_networks_file_path(networks_file, base_path)
+    else:
+        networks_file_path = template_renderer.default_network_data(
+            template_path)
+
+    cache = get_render_cache()
+    try:
+        rendered, cached = template_renderer.process_templates(
+            template_path, roles_file_path, networks_file_path,
+            output_dir=output_dir, templates_root=templates, cache=cache,
+            workers=min(multiprocessing.cpu_count(),
+                        constants.TEMPLATE_RENDER_MAX_WORKERS),
+            log=log)
+    except (IOError, OSError, RuntimeError, yaml.YAMLError,
+            jinja2.TemplateError) as e:
+        msg = _("Problems generating templates.")
+        log.error("%s %s" % (msg, e))
+        raise exceptions.DeploymentError(msg)
+    finally:
+        cache.close()
+    log.info("Rendered %d templates, %d of them unchanged since a previous "
+             "deployment" % (rendered, cached))
+
+
+def render_templates(log, templates, dest, roles_file=None,
+                     networks_file=None, workspace=None, profiler=None):
+    """Copy a templates tree and render its jinja2 templates.
+
+    :param log: Logger of the command.
+    :type log: Logger
+
+    :param templates: The templates directory.
+    :type templates: String
+
+    :param dest: Directory the rendered templates are copied to, it must
+                 not exist.
+    :type dest: String
+
+    :param workspace: Rendered trees to reuse, see `get_template_workspace`.
+                      The templates are rendered in dest when not set.
+    :type workspace: TemplateWorkspace
+
+    :param profiler: Profiler recording the copy and the rendering of the
+                     templates.
+    :type profiler: PhaseProfiler
+    """
+
+    profiler = profiler or phase_profiler.DISABLED
+
+    def _render(path):
+        with profiler.phase('Copy templates'):
+            shutil.copytree(templates, path, symlinks=True)
+        with profiler.phase('Render jinja2 templates'):
+            jinja_render_files(log, templates, path, roles_file,
+                               networks_file, path)
+
+    if workspace is None:
+        _render(dest)
+        return
+
+    key = workspace.key(templates, roles_file, networks_file)
+    rendered = workspace.get(key, _render)
+    log.debug("Copying the rendered templates %s" % rendered)
+    with profiler.phase('Copy rendered templates'):
+        shutil.copytree(rendered, dest, symlinks=True)
+
+
+def _merge_environment(merged, env, source, provenance=None,
+                       sections=False):
+    for key, value in env.items():
+        if isinstance(value, collectionsAbc.Mapping):
+            current = merged.get(key)
+            if not isinstance(current, collectionsAbc.Mapping):
+                # Like deep_update, an empty mapping does not override a
+                # value.
+                if current is not None and not value:
+                    continue
+                current = {}
+            key_provenance = None
+            if sections and provenance is not None:
+                key_provenance = provenance.setdefault(key, {})
+            merged[key] = _merge_environment(current, value, source,
+                                             key_provenance)
+        elif value is None and isinstance(merged.get(key),
+                                          collectionsAbc.Mapping):
+            # Like deep_update, None does not override a mapping.
+            continue
+        else:
+            merged[key] = value
+            if sections and provenance is not None:
+                provenance.pop(key, None)
+        if provenance is not None and not sections:
+            provenance[key] = source
+    return merged
+
+
+def merge_environments(environments, provenance=None):
+    """Merge Heat environments in a single pass.
+
+    The environments are merged like heatclient's `deep_update` does,
+    while recording the environment file which set each value.
+
+    :param environments: Environments to merge, in order of precedence, as
+                         tuples of the environment file and the env.
+    :type environments: List
+
+    :param provenance: Updated with, for each section of the merged
+                       environment (parameter_defaults, resource_registry,
+                       ...), the environment file which set each of its
+                       keys last.
+    :type provenance: Dictionary
+
+    :returns: The merged environment
+    """
+
+    merged = {}
+    for source, env in environments:
+        _merge_environment(merged, env or {}, source, provenance,
+                           sections=True)
+    return merged
+
+
+def _get_all_keys(obj, keys):
+    if isinstance(obj, collectionsAbc.Mapping):
+        for key, value in obj.items():
+            keys.append(key)
+            _get_all_keys(value, keys)
+    elif isinstance(obj, list):
+        for value in obj:
+            _get_all_keys(value, keys)
+    return keys
+
+
+class EnvironmentIndex(object):
+    """Index of the parameters and resources of Heat environments.
+
+    The environments are added in order of precedence, either processed
+    or as environment files, which are only parsed once per command. The
+    merged environment and the indexes are built when first queried so
+    all the checks of a command share them.
+    """
+
+    def __init__(self, environment_files=None):
+        """Initialize the environment index.
+
+        :param environment_files: Environment files to add, the files
+                                  which do not exist are ignored.
+        :type environment_files: List
+        """
+
+        self.environments = []
+        self._reset()
+        for env_file in environment_files or []:
+            self.add_file(env_file)
+
+    def _reset(self):
+        self._environment = None
+        self._provenance = None
+        self._parameter_keys = None
+        self._resources = None
+
+    def add(self, env_file, env):
+        """Add a processed environment."""
+
+        self.environments.append((env_file, env or {}))
+        self._reset()
+
+    def add_file(self, env_file):
+        """Parse and add an environment file if it exists."""
+
+        if os.path.exists(env_file):
+            self.add(env_file, yaml_utils.load_file(env_file))
+
+    @property
+    def environment(self):
+        """The merged environment, see `merge_environments`."""
+
+        if self._environment is None:
+            self._provenance = {}
+            self._environment = merge_environments(self.environments,
+                                                   self._provenance)
+        return self._environment
+
+    @property
+    def provenance(self):
+        """The environment file which set each key of each section."""
+
+        if self._environment is None:
+            self.environment
+        return self._provenance
+
+    def get_parameter(self, name, default=None):
+        """Return the merged value of a parameter default."""
+
+        parameter_defaults = self.environment.get('parameter_defaults')
+        return (parameter_defaults or {}).get(name, default)
+
+    @property
+    def parameter_keys(self):
+        """The keys found at any depth of the parameter defaults.
+
+        :returns: dictionary of the keys with the environment files in
+                  which they are found.
+        """
+
+        if self._parameter_keys is None:
+            self._parameter_keys = collections.OrderedDict()
+            for env_file, env in self.environments:
+                if not isinstance(env, collectionsAbc.Mapping):
+                    continue
+                for key in _get_all_keys(env.get('parameter_defaults'), []):
+                    files = self._parameter_keys.setdefault(key, [])
+                    if env_file not in files:
+                        files.append(env_file)
+        return self._parameter_keys
+
+    def get_resources(self, name):
+        """Return the mappings of a resource type in all the environments.
+
+        :returns: list of tuples of the environment file and the resource
+                  type implementation.
+        """
+
+        if self._resources is None:
+            self._resources = dict()
+            for env_file, env in self.environments:
+                if not isinstance(env, collectionsAbc.Mapping):
+                    continue
+                registry = env.get('resource_registry')
+                if not isinstance(registry, collectionsAbc.Mapping):
+                    continue
+                for resource, value in registry.items():
+                    self._resources.setdefault(resource, []).append(
+                        (env_file, value))
+        return self._resources.get(name, [])
+
+
 def process_multiple_environments(created_env_files, tht_root,
                                   user_tht_root,
                                   env_files_tracker=None,
-                                  cleanup=True):
+                                  cleanup=True, cache=None,
+                                  provenance=None, index=None):
+    """Process and merge Heat environment files.
+
+    :param cache: Cache of the processed environment files, see
+                  `get_environment_cache`. The environments whose files
+                  did not change since they were cached are not processed
+                  again.
+    :type cache: EnvironmentCache
+
+    :param provenance: Updated with the environment file which set each
+                       key of the merged environment, see
+                       `merge_environments`.
+    :type provenance: Dictionary
+
+    :param index: Index the processed environments are added to, it
+                  provides the merged environment to the checks of the
+                  command.
+    :type index: EnvironmentIndex
+    """
     log = logging.getLogger(__name__ + ".process_multiple_environments")
     env_files = {}
-    localenv = {}
+    if index is None:
+        index = EnvironmentIndex()
     include_env_in_files = env_files_tracker is not None
     # Normalize paths for full match checks
     user_tht_root = os.path.normpath(user_tht_root)
     tht_root = os.path.normpath(tht_root)
     for env_path in created_env_files:
         log.debug("Processing environment files %s" % env_path)
+        user_env_path = env_path
         abs_env_path = os.path.abspath(env_path)
         if (abs_env_path.startswith(user_tht_root) and
             ((user_tht_root + '/') in env_path or
@@ -1736,8 +3942,21 @@ def process_multiple_environments(created_env_files, tht_root,
                       % (abs_env_path, new_env_path))
             env_path = new_env_path
         try:
-            files, env = template_utils.process_environment_and_files(
-                env_path=env_path, include_env_in_files=include_env_in_files)
+            cached = None
+            if cache:
+                cached = cache.get(
+                    env_path, tht_root,
+                    include_env_in_files=include_env_in_files)
+            if cached:
+                log.debug("Using the cached environment %s" % env_path)
+                files, env = cached
+            else:
+                files, env = template_utils.process_environment_and_files(
+                    env_path=env_path,
+                    include_env_in_files=include_env_in_files)
+                if cache:
+                    cache.set(env_path, tht_root, files, env,
+                              include_env_in_files=include_env_in_files)
             if env_files_tracker is not None:
                 env_files_tracker.append(
                     heat_utils.normalise_file_path_to_url(env_path))
@@ -1752,8 +3971,7 @@ def process_multiple_environments(created_env_files, tht_root,
                       % (six.text_type(ex), env_path))
             # Use the temporary path as it's possible the environment
             # itself was rendered via jinja.
-            with open(env_path, 'r') as f:
-                env_map = yaml.safe_load(f)
+            env_map = yaml_utils.load_file(env_path)
             env_registry = env_map.get('resource_registry', {})
             env_dirname = os.path.dirname(os.path.abspath(env_path))
             for rsrc, rsrc_path in six.iteritems(env_registry):
@@ -1785,7 +4003,8 @@ def process_multiple_environments(created_env_files, tht_root,
                                              delete=cleanup) as f:
                 log.debug("Rewriting %s environment to %s"
                           % (env_path, f.name))
-                f.write(yaml.safe_dump(env_map, default_flow_style=False))
+                f.write(yaml_utils.safe_dump(env_map,
+                                             default_flow_style=False))
                 f.flush()
                 files, env = template_utils.process_environment_and_files(
                     env_path=f.name, include_env_in_files=include_env_in_files)
@@ -1796,10 +4015,114 @@ def process_multiple_environments(created_env_files, tht_root,
             log.debug("Adding files %s for %s" % (files, env_path))
             env_files.update(files)
 
-        # 'env' can be a deeply nested dictionary, so a simple update is
-        # not enough
-        localenv = template_utils.deep_update(localenv, env)
-    return env_files, localenv
+        index.add(user_env_path, env)
+
+    # 'env' can be a deeply nested dictionary, so a simple update is not
+    # enough
+    if provenance is not None:
+        provenance.update(index.provenance)
+    return env_files, index.environment
+
+
+def _find_file_references(data, files, references):
+    pending = [data]
+    while pending:
+        obj = pending.pop()
+        if isinstance(obj, six.string_types):
+            if obj in files:
+                references.append(obj)
+        elif isinstance(obj, collectionsAbc.Mapping):
+            pending.extend(obj.keys())
+            pending.extend(obj.values())
+        elif isinstance(obj, list):
+            pending.extend(obj)
+    return references
+
+
+def _payload_size(content):
+    if isinstance(content, bytes):
+        return len(content)
+    return len(simplejson.dumps(content))
+
+
+def build_files_payload(template, template_files, env_files,
+                        environment=None, environment_files=None,
+                        log=None):
+    """Build the files sent to Heat with a stack create or update.
+
+    Only the files referenced by the template, the environment or the
+    environment files, directly or through the templates they reference,
+    are kept. The templates resolved by heatclient are JSON documents
+    whose references are URLs of the files, other files are not
+    searched for references.
+
+    :param template: The stack template.
+    :type template: Dictionary
+
+    :param template_files: The files of the template.
+    :type template_files: Dictionary
+
+    :param env_files: The files of the environments.
+    :type env_files: Dictionary
+
+    :param environment: The merged environment.
+    :type environment: Dictionary
+
+    :param environment_files: The URLs of the environment files, which
+                              Heat reads from the files.
+    :type environment_files: List
+
+    :param log: Logger the payload size per directory is reported to.
+    :type log: Logger
+
+    :returns: dictionary of the files
+    """
+    files = dict(template_files)
+    files.update(env_files)
+
+    references = _find_file_references(template, files, [])
+    _find_file_references(environment, files, references)
+    _find_file_references(environment_files, files, references)
+    payload = {}
+    while references:
+        url = references.pop()
+        if url in payload:
+            continue
+        content = payload[url] = files[url]
+        if (isinstance(content, six.string_types) and
+                content.startswith('{')):
+            try:
+                _find_file_references(simplejson.loads(content), files,
+                                      references)
+            except ValueError:
+                pass
+
+    if log:
+        directories = collections.defaultdict(lambda: [0, 0])
+        contents = collections.Counter()
+        for url, content in payload.items():
+            size = _payload_size(content)
+            directory = directories[os.path.dirname(url)]
+            directory[0] += 1
+            directory[1] += size
+            contents[(size, hashlib.sha1(
+                content if isinstance(content, bytes)
+                else content.encode('utf-8')).hexdigest())] += 1
+        for directory, (count, size) in sorted(directories.items()):
+            log.debug('Files payload: %s: %d files, %.1f KiB',
+                      directory, count, size / 1024.0)
+        duplicated = sum(size * (count - 1)
+                         for (size, _), count in contents.items())
+        dropped = [url for url in files if url not in payload]
+        log.info(
+            'Files payload: %d files, %.1f MiB, %.1f MiB of duplicated '
+            'contents. Not sending %d unreferenced files, %.1f MiB',
+            len(payload),
+            sum(d[1] for d in directories.values()) / 1048576.0,
+            duplicated / 1048576.0,
+            len(dropped),
+            sum(_payload_size(files[url]) for url in dropped) / 1048576.0)
+    return payload
 
 
 def parse_extra_vars(extra_var_strings):
@@ -1827,7 +4150,7 @@ def parse_extra_vars(extra_var_strings):
         invalid_yaml = False
 
         try:
-            parse_vars = yaml.safe_load(extra_var_string)
+            parse_vars = yaml_utils.safe_load(extra_var_string)
         except yaml.YAMLError:
             invalid_yaml = True
 
@@ -2027,8 +4350,7 @@ def fetch_roles_file(roles_file, tht_path=constants.TRIPLEO_HEAT_TEMPLATES):
     '''Fetch t-h-t roles data fromm roles_file abs path or rel to tht_path.'''
     if not roles_file:
         return None
-    with open(rel_or_abs_path(roles_file, tht_path)) as f:
-        return yaml.safe_load(f)
+    return yaml_utils.load_file(rel_or_abs_path(roles_file, tht_path))
 
 
 def load_config(osloconf, path):
@@ -2346,31 +4668,42 @@ def check_file_for_enabled_service(env_file):
 
     :raises CommandError: If the action is not confirmed
     """
-    if os.path.exists(env_file):
-        with open(env_file, "r") as f:
-            content = yaml.safe_load(f)
-        deprecated_services_enabled = []
-        for service in constants.DEPRECATED_SERVICES.keys():
-            try:
-                if content["resource_registry"][service] != "OS::Heat::None":
-                    LOG.warning("service " + service + " is enabled in "
-                                + str(env_file) + ". " +
-                                constants.DEPRECATED_SERVICES[service])
-                    deprecated_services_enabled.append(service)
-            except (KeyError, TypeError):
-                # ignore if content["resource_registry"] is empty
-                pass
-        if deprecated_services_enabled:
-            confirm = prompt_user_for_confirmation(
-                message="Do you still wish to continue with deployment [y/N]",
-                logger=LOG)
-            if not confirm:
-                raise oscexc.CommandError("Action not confirmed, exiting.")
+    check_deprecated_service_is_enabled([env_file])
+
+
+def check_deprecated_service_is_enabled(environment_files, index=None):
+    """Checks environment files for deprecated services.
+
+    See `check_file_for_enabled_service`, the user is asked once whether to
+    proceed when deprecated services are enabled in any of the files.
+
+    :param environment_files: The paths of the environment files
+    :type environment_files: List
 
+    :param index: Index of the environments, built from environment_files
+                  when not provided. Only the environments of
+                  environment_files are checked.
+    :type index: EnvironmentIndex
 
-def check_deprecated_service_is_enabled(environment_files):
-    for env_file in environment_files:
-        check_file_for_enabled_service(env_file)
+    :raises CommandError: If the action is not confirmed
+    """
+    if index is None:
+        index = EnvironmentIndex(environment_files)
+    deprecated_services_enabled = []
+    for service in constants.DEPRECATED_SERVICES.keys():
+        for env_file, value in index.get_resources(service):
+            if (value != "OS::Heat::None"
+                    and env_file in environment_files):
+                LOG.warning("service " + service + " is enabled in "
+                            + str(env_file) + ". " +
+                            constants.DEPRECATED_SERVICES[service])
+                deprecated_services_enabled.append(service)
+    if deprecated_services_enabled:
+        confirm = prompt_user_for_confirmation(
+            message="Do you still wish to continue with deployment [y/N]",
+            logger=LOG)
+        if not confirm:
+            raise oscexc.CommandError("Action not confirmed, exiting.")
 
 
 def reset_cmdline():
@@ -2476,10 +4809,102 @@ def get_status_yaml(stack_name):
     return status_yaml
 
 
+def get_stack_fingerprint_file(stack_name):
+    return os.path.join(
+        constants.CLOUD_HOME_DIR,
+        '%s-stack_fingerprint.yaml' % stack_name)
+
+
+def build_stack_fingerprint(template, files, env_files, tht_root):
+    """Return a fingerprint of the template, files and environments.
+
+    The templates directory is a new temporary directory for every
+    deployment, the URLs within it are made relative to it. The parameters
+    generated for every deployment, see
+    `constants.STACK_FINGERPRINT_IGNORED_PARAMETERS`, are ignored.
+
+    :param template: The stack template.
+    :type template: Dictionary
+
+    :param files: The files of the stack, by URL.
+    :type files: Dictionary
+
+    :param env_files: The URLs of the environment files.
+    :type env_files: List
+
+    :param tht_root: The templates directory.
+    :type tht_root: String
+
+    :returns: the fingerprint as a string
+    """
+    root_url = heat_utils.normalise_file_path_to_url(tht_root) + '/'
+    json_root_url = simplejson.dumps(root_url)[1:-1]
+    env_files = env_files or []
+
+    def _update(sha, value):
+        if isinstance(value, bytes):
+            value = value.replace(root_url.encode('utf-8'), b'')
+        else:
+            value = simplejson.dumps(value, sort_keys=True).replace(
+                json_root_url, '').encode('utf-8')
+        sha.update(value)
+        sha.update(b'\0')
+
+    sha = hashlib.sha256()
+    _update(sha, template)
+    for url in sorted(files):
+        content = files[url]
+        if url in env_files and isinstance(content, six.string_types):
+            try:
+                content = simplejson.loads(content)
+                for name in constants.STACK_FINGERPRINT_IGNORED_PARAMETERS:
+                    (content.get('parameter_defaults') or {}).pop(name, None)
+            except (AttributeError, ValueError):
+                pass
+        _update(sha, url)
+        _update(sha, content)
+    _update(sha, env_files)
+    return sha.hexdigest()
+
+
+def check_stack_fingerprint(stack, fingerprint):
+    """Check whether a stack was last deployed with a fingerprint.
+
+    The stack must be complete and must not have been updated since it
+    was deployed with the fingerprint, see `update_stack_fingerprint`.
+
+    :returns: True if the stack is unchanged
+    """
+    if not stack.stack_status.endswith('_COMPLETE'):
+        return False
+    try:
+        last = yaml_utils.load_file(
+            get_stack_fingerprint_file(stack.stack_name))
+    except (IOError, OSError, yaml.YAMLError):
+        return False
+    return (isinstance(last, dict) and
+            last.get('fingerprint') == fingerprint and
+            last.get('stack_id') == stack.id and
+            last.get('updated_time') == stack.updated_time)
+
+
+def update_stack_fingerprint(stack, fingerprint):
+    """Store the fingerprint of the last deployment of a stack."""
+
+    contents = yaml_utils.safe_dump(
+        {'fingerprint': fingerprint,
+         'stack_id': stack.id,
+         'updated_time': stack.updated_time},
+        default_flow_style=False)
+
+    with open(get_stack_fingerprint_file(stack.stack_name), 'w') as f:
+        f.write(contents)
+
+
 def update_deployment_status(stack_name, status):
     """Update the deployment status."""
 
-    contents = yaml.safe_dump(
+    contents = yaml_utils.safe_dump(
         {'deployment_status': status},
         default_flow_style=False)
 
@@ -2522,7 +4947,7 @@ def write_user_environment(env_map, abs_env_path, tht_root,
                            stack):
     # We write the env_map to the local /tmp tht_root and also
     # to the swift plan container.
-    contents = yaml.safe_dump(env_map, default_flow_style=False)
+    contents = yaml_utils.safe_dump(env_map, default_flow_style=False)
     user_env_path = build_user_env_path(abs_env_path, tht_root)
     LOG.debug("user_env_path=%s" % user_env_path)
     with open(user_env_path, 'w') as f:
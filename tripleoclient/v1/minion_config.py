@@ -235,6 +235,14 @@ def prepare_minion_deploy(upgrade=False, no_validations=False,
     else:
         deploy_args.append('--heat-native')
 
+    if CONF.get('artifact_archive_format',
+                constants.ARTIFACT_ARCHIVE_FORMAT) != \
+            constants.ARTIFACT_ARCHIVE_FORMAT:
+        deploy_args.append('--artifact-archive-format=%s'
+                           % CONF['artifact_archive_format'])
+    if CONF.get('artifact_store', False):
+        deploy_args.append('--artifact-store')
+
     if CONF.get('heat_container_image'):
         deploy_args.append('--heat-container-image=%s'
                            % CONF['heat_container_image'])
@@ -23,6 +23,7 @@ from osc_lib.i18n import _
 
 from tripleoclient import constants
 from tripleoclient import utils
+from tripleoclient import yaml_utils
 
 LOG = logging.getLogger(__name__ + ".BackupOvercloud")
 
@@ -114,10 +115,10 @@ class BackupOvercloud(command.Command):
             return {}
         elif os.path.exists(raw_extra_vars):
             with open(raw_extra_vars, 'r') as fp:
-                extra_vars = yaml.safe_load(fp.read())
+                extra_vars = yaml_utils.safe_load(fp.read())
         else:
             try:
-                extra_vars = yaml.safe_load(raw_extra_vars)
+                extra_vars = yaml_utils.safe_load(raw_extra_vars)
             except yaml.YAMLError as exc:
                 raise RuntimeError(
                     _('--extra-vars is not an existing file and cannot be '
@@ -137,24 +138,48 @@ class BackupOvercloud(command.Command):
                 'tripleo_backup_and_restore_nfs_server'
             ] = storage_ip
 
+        # Host groups of the setup playbooks, which may be overridden by the
+        # extra vars.
+        group_vars = extra_vars if isinstance(extra_vars, dict) else {}
+        setup_playbooks = list()
         if parsed_args.setup_nfs is True or parsed_args.init == 'nfs':
 
             LOG.debug(_('Setting up NFS Backup node'))
-            self._run_ansible_playbook(
-                              playbook='prepare-nfs-backup.yaml',
-                              inventory=parsed_args.inventory,
-                              tags='bar_setup_nfs_server',
-                              skip_tags=None,
-                              extra_vars=extra_vars
-                              )
+            setup_playbooks.append({
+                'playbook': 'prepare-nfs-backup.yaml',
+                'hosts': group_vars.get('nfs_server_group_name',
+                                        'BackupNode'),
+                'tags': 'bar_setup_nfs_server'
+            })
 
         if parsed_args.setup_rear is True or parsed_args.init == 'rear':
 
             LOG.debug(_('Installing ReaR on controller nodes'))
+            setup_playbooks.append({
+                'playbook': 'prepare-overcloud-backup.yaml',
+                'hosts': group_vars.get('tripleo_controller_group_name',
+                                        'Controller'),
+                'tags': 'bar_setup_rear'
+            })
+
+        if len(setup_playbooks) > 1:
+            # The NFS server and the controllers are set up concurrently
+            # when their groups are disjoint in the inventory.
+            with utils.TempDirs() as tmp:
+                utils.run_ansible_playbook_graph(
+                    playbooks=setup_playbooks,
+                    workdir=tmp,
+                    playbook_dir=constants.ANSIBLE_TRIPLEO_PLAYBOOKS,
+                    inventory=parsed_args.inventory,
+                    skip_tags=None,
+                    verbosity=utils.playbook_verbosity(self=self),
+                    extra_vars=extra_vars
+                )
+        elif setup_playbooks:
             self._run_ansible_playbook(
-                              playbook='prepare-overcloud-backup.yaml',
+                              playbook=setup_playbooks[0]['playbook'],
                               inventory=parsed_args.inventory,
-                              tags='bar_setup_rear',
+                              tags=setup_playbooks[0]['tags'],
                               skip_tags=None,
                               extra_vars=extra_vars
                               )
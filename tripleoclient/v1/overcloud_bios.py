@@ -22,6 +22,7 @@ import yaml
 from tripleoclient import command
 from tripleoclient import utils
 from tripleoclient.workflows import baremetal
+from tripleoclient import yaml_utils
 
 
 class ConfigureBIOS(command.Command):
@@ -53,10 +54,10 @@ class ConfigureBIOS(command.Command):
 
         if os.path.exists(parsed_args.configuration):
             with open(parsed_args.configuration, 'r') as fp:
-                configuration = yaml.safe_load(fp.read())
+                configuration = yaml_utils.safe_load(fp.read())
         else:
             try:
-                configuration = yaml.safe_load(parsed_args.configuration)
+                configuration = yaml_utils.safe_load(parsed_args.configuration)
             except yaml.YAMLError as exc:
                 raise RuntimeError(
                     _('Configuration is not an existing file and cannot be '
@@ -13,7 +13,6 @@
 from datetime import datetime
 import logging
 import os.path
-import yaml
 
 from osc_lib.i18n import _
 from osc_lib import utils
@@ -22,6 +21,7 @@ from tripleoclient import command
 from tripleoclient import constants
 from tripleoclient import exceptions
 from tripleoclient import export
+from tripleoclient import yaml_utils
 
 
 class ExportCell(command.Command):
@@ -104,7 +104,7 @@ class ExportCell(command.Command):
 
         # write the exported data
         with open(output_file, 'w') as f:
-            yaml.safe_dump(data, f, default_flow_style=False)
+            yaml_utils.safe_dump(data, f, default_flow_style=False)
 
         print("Cell input information exported to %s." % output_file)
 
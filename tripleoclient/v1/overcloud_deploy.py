@@ -15,6 +15,8 @@
 
 import argparse
 from collections import OrderedDict
+from concurrent import futures
+import datetime
 import os
 import os.path
 from oslo_config import cfg
@@ -27,7 +29,6 @@ import six
 import subprocess
 import tempfile
 import time
-import yaml
 
 from heatclient.common import template_utils
 from keystoneauth1.exceptions.catalog import EndpointNotFound
@@ -38,13 +39,16 @@ from tripleo_common.image import kolla_builder
 from tripleo_common import update
 from tripleo_common.utils import plan as plan_utils
 
+from tripleoclient import artifact_archive
 from tripleoclient import command
 from tripleoclient import constants
 from tripleoclient import exceptions
+from tripleoclient import phase_profiler
 from tripleoclient import utils
 from tripleoclient.workflows import deployment
 from tripleoclient.workflows import parameters as workflow_params
 from tripleoclient.workflows import roles
+from tripleoclient import yaml_utils
 
 CONF = cfg.CONF
 
@@ -54,6 +58,9 @@ class DeployOvercloud(command.Command):
 
     log = logging.getLogger(__name__ + ".DeployOvercloud")
 
+    # Replaced by the profiler of the phases in take_action
+    _profiler = phase_profiler.DISABLED
+
     def _setup_clients(self, parsed_args):
         self.clients = self.app.client_manager
         self.orchestration_client = self.clients.orchestration
@@ -69,7 +76,7 @@ class DeployOvercloud(command.Command):
     def _update_args_from_answers_file(self, args):
         if args.answers_file is not None:
             with open(args.answers_file, 'r') as answers_file:
-                answers = yaml.safe_load(answers_file)
+                answers = yaml_utils.safe_load(answers_file)
 
             if args.templates is None:
                 args.templates = answers['templates']
@@ -204,8 +211,17 @@ class DeployOvercloud(command.Command):
                                              % ctlplane_hostname)
         return self._cleanup_host_entry(out)
 
-    def _check_limit_skiplist_warning(self, env):
-        if env.get('parameter_defaults').get('DeploymentServerBlacklist'):
+    def _check_environments(self, parsed_args, env_index):
+        """Check the user environment files before they are deployed"""
+
+        # Throw warning if deprecated service is enabled and
+        # ask user if deployment should still be continued.
+        if parsed_args.environment_files:
+            utils.check_deprecated_service_is_enabled(
+                parsed_args.environment_files, index=env_index)
+
+    def _check_limit_skiplist_warning(self, env_index):
+        if env_index.get_parameter('DeploymentServerBlacklist'):
             msg = _('[WARNING] DeploymentServerBlacklist is defined and will '
                     'be ignored because --limit has been specified.')
             self.log.warning(msg)
@@ -215,7 +231,8 @@ class DeployOvercloud(command.Command):
                      run_validations,
                      roles_file,
                      env_files_tracker=None,
-                     deployment_options=None):
+                     deployment_options=None,
+                     force_stack_update=False):
         """Verify the Baremetal nodes are available and do a stack update"""
 
         if stack:
@@ -229,20 +246,126 @@ class DeployOvercloud(command.Command):
 
         self.log.debug("Getting template contents from plan %s" % stack_name)
 
-        template_files, template = template_utils.get_template_contents(
-            template_file=template_path)
-        files = dict(list(template_files.items()) + list(env_files.items()))
+        with self._profiler.phase('Build the files payload'):
+            template_files, template = template_utils.get_template_contents(
+                template_file=template_path)
+            files = utils.build_files_payload(
+                template, template_files, env_files, environment=env,
+                environment_files=env_files_tracker, log=self.log)
+
+        fingerprint = utils.build_stack_fingerprint(
+            template, files, env_files_tracker, tht_root)
+        if (stack and not force_stack_update and
+                utils.check_stack_fingerprint(stack, fingerprint)):
+            self.log.warning(
+                "The templates, environments and parameters of stack {0} "
+                "did not change since its last deployment, skipping the "
+                "Heat stack update. Use --force-stack-update to update the "
+                "stack anyway.".format(stack_name))
+            return
 
-        workflow_params.check_deprecated_parameters(
-            self.clients, stack_name, tht_root, template,
-            roles_file, files, env_files_tracker)
+        with self._profiler.phase('Check deprecated parameters'):
+            stack_data_cache = utils.get_stack_data_cache()
+            workflow_params.check_deprecated_parameters(
+                self.clients, stack_name, tht_root, template,
+                roles_file, files, env_files_tracker, cache=stack_data_cache)
+            stack_data_cache.close()
 
         self.log.info("Deploying templates in the directory {0}".format(
             os.path.abspath(tht_root)))
         deployment.deploy_without_plan(
             self.clients, stack, stack_name,
             template, files, env_files_tracker,
-            self.log)
+            self.log, profiler=self._profiler)
+        # Stored once the updated stack is fetched
+        self._stack_fingerprint = fingerprint
+
+    def _render_templates(self, parsed_args, tht_root, new_tht_root):
+        """Render the templates of tht_root in new_tht_root"""
+
+        with self._profiler.phase('Render templates'):
+            utils.render_templates(
+                self.log, tht_root, new_tht_root,
+                parsed_args.roles_file, parsed_args.networks_file,
+                workspace=utils.get_template_workspace(),
+                profiler=self._profiler)
+
+    def _process_environments(self, parsed_args, tht_root, user_tht_root,
+                              baremetal_env_files=None,
+                              parameter_env_files=None,
+                              stack_env_files=None,
+                              env_files_tracker=None, cache=None):
+        """Build the environment files list and merge the environments
+
+        The environment files are merged in this order: the resource
+        registry, the baremetal environments, the environment directories,
+        the parameters environments, the deployed server environment, the
+        user environment files and the stack environments. The user
+        environment files are then checked with the index of the merged
+        environments, see _check_environments.
+
+        :returns: tuple of the files of the environments, the merged
+                  environment and its EnvironmentIndex.
+        """
+
+        created_env_files = [
+            os.path.join(tht_root, constants.DEFAULT_RESOURCE_REGISTRY)]
+        created_env_files.extend(baremetal_env_files or [])
+        if parsed_args.environment_directories:
+            created_env_files.extend(utils.load_environment_directories(
+                parsed_args.environment_directories))
+        created_env_files.extend(parameter_env_files or [])
+        if parsed_args.deployed_server:
+            created_env_files.append(
+                os.path.join(tht_root, constants.DEPLOYED_SERVER_ENVIRONMENT))
+        if parsed_args.environment_files:
+            created_env_files.extend(parsed_args.environment_files)
+        created_env_files.extend(stack_env_files or [])
+
+        self.log.debug("Processing environment files %s" % created_env_files)
+        env_index = utils.EnvironmentIndex()
+        with self._profiler.phase('Process environments'):
+            env_files, env = utils.process_multiple_environments(
+                created_env_files, tht_root, user_tht_root,
+                env_files_tracker=env_files_tracker,
+                cleanup=(not parsed_args.no_cleanup),
+                cache=cache, index=env_index)
+        self._check_environments(parsed_args, env_index)
+        return env_files, env, env_index
+
+    def _build_environments(self, parsed_args, stack, tht_root,
+                            user_tht_root, baremetal_env_files=None,
+                            env_files_tracker=None, cache=None):
+        """Build the parameters and the environments of the deployment
+
+        Both the deployment and --explain-params use it, the parameters are
+        explained with the environments the deployment uses.
+
+        :returns: tuple of the parameters set by the client, the files of
+                  the environments, the merged environment and its
+                  EnvironmentIndex.
+        """
+
+        parameters = {}
+        with self._profiler.phase('Update parameters'):
+            parameters.update(self._update_parameters(
+                parsed_args, stack, tht_root, user_tht_root))
+        param_env = utils.create_parameters_env(
+            parameters, tht_root, parsed_args.stack)
+
+        stack_env_files = []
+        if stack:
+            stack_env_files.extend(utils.create_breakpoint_cleanup_env(
+                tht_root, parsed_args.stack))
+
+        self.log.debug("Creating Environment files")
+        env_files, env, env_index = self._process_environments(
+            parsed_args, tht_root, user_tht_root,
+            baremetal_env_files=baremetal_env_files,
+            parameter_env_files=param_env,
+            stack_env_files=stack_env_files,
+            env_files_tracker=env_files_tracker, cache=cache)
+        return parameters, env_files, env, env_index
 
     def _deploy_tripleo_heat_templates_tmpdir(self, stack, parsed_args):
         tht_root = os.path.abspath(parsed_args.templates)
@@ -251,17 +374,16 @@ class DeployOvercloud(command.Command):
         self.log.debug("Creating temporary templates tree in %s"
                        % new_tht_root)
         try:
-            shutil.copytree(tht_root, new_tht_root, symlinks=True)
-            utils.jinja_render_files(self.log, parsed_args.templates,
-                                     new_tht_root,
-                                     parsed_args.roles_file,
-                                     parsed_args.networks_file,
-                                     new_tht_root)
+            self._render_templates(parsed_args, tht_root, new_tht_root)
             self._deploy_tripleo_heat_templates(stack, parsed_args,
                                                 new_tht_root, tht_root)
         finally:
-            utils.archive_deploy_artifacts(self.log, parsed_args.stack,
-                                           new_tht_root)
+            with self._profiler.phase('Archive artifacts'):
+                utils.archive_deploy_artifacts(
+                    self.log, parsed_args.stack, new_tht_root,
+                    archive_format=parsed_args.artifact_archive_format,
+                    store=(utils.get_artifact_store()
+                           if parsed_args.artifact_store else None))
             if parsed_args.no_cleanup:
                 self.log.warning("Not cleaning temporary directory %s"
                                  % tht_tmp)
@@ -275,65 +397,46 @@ class DeployOvercloud(command.Command):
         self.log.info("Processing templates in the directory {0}".format(
             os.path.abspath(tht_root)))
 
-        self.log.debug("Creating Environment files")
-        created_env_files = []
-
-        created_env_files.append(
-            os.path.join(tht_root, constants.DEFAULT_RESOURCE_REGISTRY))
-        created_env_files.extend(
-            self._provision_baremetal(parsed_args, tht_root))
-
-        if parsed_args.environment_directories:
-            created_env_files.extend(utils.load_environment_directories(
-                parsed_args.environment_directories))
-
-        parameters = {}
-        parameters.update(self._update_parameters(
-            parsed_args, stack, tht_root, user_tht_root))
-        param_env = utils.create_parameters_env(
-            parameters, tht_root, parsed_args.stack)
-        created_env_files.extend(param_env)
-
-        if parsed_args.deployed_server:
-            created_env_files.append(
-                os.path.join(tht_root, constants.DEPLOYED_SERVER_ENVIRONMENT))
-
-        if parsed_args.environment_files:
-            created_env_files.extend(parsed_args.environment_files)
+        with self._profiler.phase('Provision baremetal'):
+            baremetal_env_files = self._provision_baremetal(parsed_args,
+                                                            tht_root)
 
         deployment_options = {}
         if parsed_args.deployment_python_interpreter:
             deployment_options['ansible_python_interpreter'] = \
                 parsed_args.deployment_python_interpreter
 
-        if stack:
-            env_path = utils.create_breakpoint_cleanup_env(
-                tht_root, parsed_args.stack)
-            created_env_files.extend(env_path)
-
-        self.log.debug("Processing environment files %s" % created_env_files)
+        env_cache = utils.get_environment_cache()
         env_files_tracker = []
-        env_files, env = utils.process_multiple_environments(
-            created_env_files, tht_root, user_tht_root,
-            env_files_tracker=env_files_tracker,
-            cleanup=(not parsed_args.no_cleanup))
+        parameters, env_files, env, env_index = self._build_environments(
+            parsed_args, stack, tht_root, user_tht_root,
+            baremetal_env_files=baremetal_env_files,
+            env_files_tracker=env_files_tracker, cache=env_cache)
 
         # Invokes the workflows specified in plan environment file
         if parsed_args.plan_environment_file:
             output_path = utils.build_user_env_path(
                 'derived_parameters.yaml', tht_root)
-            workflow_params.build_derived_params_environment(
-                self.clients, parsed_args.stack, tht_root, env_files,
-                env_files_tracker, parsed_args.roles_file,
-                parsed_args.plan_environment_file,
-                output_path, utils.playbook_verbosity(self=self))
-
-            created_env_files.append(output_path)
-            env_files_tracker = []
-            env_files, env = utils.process_multiple_environments(
-                created_env_files, tht_root, user_tht_root,
-                env_files_tracker=env_files_tracker,
-                cleanup=(not parsed_args.no_cleanup))
+            with self._profiler.phase('Derive parameters'):
+                stack_data_cache = utils.get_stack_data_cache()
+                workflow_params.build_derived_params_environment(
+                    self.clients, parsed_args.stack, tht_root, env_files,
+                    env_files_tracker, parsed_args.roles_file,
+                    parsed_args.plan_environment_file,
+                    output_path, utils.playbook_verbosity(self=self),
+                    cache=stack_data_cache)
+                stack_data_cache.close()
+
+            # The derived parameters are merged over the environments
+            # already in the index, which are not processed again.
+            with self._profiler.phase('Process environments'):
+                derived_files, env = utils.process_multiple_environments(
+                    [output_path], tht_root, user_tht_root,
+                    env_files_tracker=env_files_tracker,
+                    cleanup=(not parsed_args.no_cleanup),
+                    cache=env_cache, index=env_index)
+                env_files.update(derived_files)
+        env_cache.close()
 
         # Copy the env_files to tmp folder for archiving
         self._copy_env_files(env_files, tht_root)
@@ -341,7 +444,7 @@ class DeployOvercloud(command.Command):
         if parsed_args.limit:
             # check if skip list is defined while using --limit and throw a
             # warning if necessary
-            self._check_limit_skiplist_warning(env)
+            self._check_limit_skiplist_warning(env_index)
 
         if stack:
             if not parsed_args.disable_validations:
@@ -364,22 +467,57 @@ class DeployOvercloud(command.Command):
         # e.g part of the plan create/update workflow
         number_controllers = int(parameters.get('ControllerCount', 0))
         if number_controllers > 1:
-            if not env.get('parameter_defaults').get('NtpServer'):
+            if not env_index.get_parameter('NtpServer'):
                 raise exceptions.InvalidConfiguration(
                     'Specify --ntp-server as parameter or NtpServer in '
                     'environments when using multiple controllers '
                     '(with HA).')
 
-        self._try_overcloud_deploy_with_compat_yaml(
-            tht_root, stack,
-            parsed_args.stack, parameters, env_files,
-            parsed_args.timeout, env,
-            parsed_args.run_validations,
-            parsed_args.roles_file,
-            env_files_tracker=env_files_tracker,
-            deployment_options=deployment_options)
+        with self._profiler.phase('Heat stack'):
+            self._try_overcloud_deploy_with_compat_yaml(
+                tht_root, stack,
+                parsed_args.stack, parameters, env_files,
+                parsed_args.timeout, env,
+                parsed_args.run_validations,
+                parsed_args.roles_file,
+                env_files_tracker=env_files_tracker,
+                deployment_options=deployment_options,
+                force_stack_update=parsed_args.force_stack_update)
+
+        with self._profiler.phase('Unprovision baremetal'):
+            self._unprovision_baremetal(parsed_args)
 
-        self._unprovision_baremetal(parsed_args)
+    def _explain_parameters(self, stack, parsed_args):
+        """Show the environment file setting each parameter"""
+
+        user_tht_root = os.path.abspath(parsed_args.templates)
+        tht_tmp = tempfile.mkdtemp(prefix='tripleoclient-')
+        tht_root = "%s/tripleo-heat-templates" % tht_tmp
+        try:
+            self._render_templates(parsed_args, user_tht_root, tht_root)
+            env_cache = utils.get_environment_cache()
+            _, _, _, env_index = self._build_environments(
+                parsed_args, stack, tht_root, user_tht_root,
+                baremetal_env_files=self._get_baremetal_env_files(
+                    parsed_args),
+                cache=env_cache)
+            env_cache.close()
+        finally:
+            shutil.rmtree(tht_tmp)
+
+        table = PrettyTable(['Parameter', 'Section', 'Environment'])
+        table.align = 'l'
+        for section in ('parameter_defaults', 'parameters'):
+            for param, env_file in sorted(
+                    env_index.provenance.get(section, {}).items()):
+                if (parsed_args.explain_params
+                        and param not in parsed_args.explain_params):
+                    continue
+                if env_file.startswith(tht_root + '/'):
+                    env_file = os.path.join(user_tht_root,
+                                            env_file[len(tht_root) + 1:])
+                table.add_row([param, section, env_file])
+        print(table, file=self.app.stdout)
 
     def _copy_env_files(self, files_dict, tht_root):
         file_prefix = "file://"
@@ -405,7 +543,8 @@ class DeployOvercloud(command.Command):
                                                env, run_validations,
                                                roles_file,
                                                env_files_tracker=None,
-                                               deployment_options=None):
+                                               deployment_options=None,
+                                               force_stack_update=False):
         overcloud_yaml = os.path.join(tht_root, constants.OVERCLOUD_YAML_NAME)
         try:
             self._heat_deploy(stack, stack_name, overcloud_yaml,
@@ -414,7 +553,8 @@ class DeployOvercloud(command.Command):
                               run_validations,
                               roles_file,
                               env_files_tracker=env_files_tracker,
-                              deployment_options=deployment_options)
+                              deployment_options=deployment_options,
+                              force_stack_update=force_stack_update)
         except Exception as e:
             messages = 'Failed to deploy: %s' % str(e)
             raise ValueError(messages)
@@ -501,6 +641,11 @@ class DeployOvercloud(command.Command):
             self._validate_args_environment_directory(
                 parsed_args.environment_directories)
 
+        if (parsed_args.explain_params is not None
+                and not parsed_args.dry_run):
+            raise oscexc.CommandError(
+                "Error: --explain-params must be used with --dry-run")
+
     def _validate_args_environment_directory(self, directories):
         default = os.path.expanduser(constants.DEFAULT_ENV_DIRECTORY)
         nonexisting_dirs = []
@@ -519,8 +664,7 @@ class DeployOvercloud(command.Command):
         if not parsed_args.baremetal_deployment:
             return []
 
-        with open(parsed_args.baremetal_deployment, 'r') as fp:
-            roles = yaml.safe_load(fp)
+        roles = yaml_utils.load_file(parsed_args.baremetal_deployment)
 
         key = self.get_key_pair(parsed_args)
         with open('{}.pub'.format(key), 'rt') as fp:
@@ -549,7 +693,7 @@ class DeployOvercloud(command.Command):
             )
 
         with open(output_path, 'r') as fp:
-            parameter_defaults = yaml.safe_load(fp)
+            parameter_defaults = yaml_utils.safe_load(fp)
 
         utils.write_user_environment(
             parameter_defaults,
@@ -557,15 +701,38 @@ class DeployOvercloud(command.Command):
             tht_root,
             parsed_args.stack)
 
+        # --explain-params does not provision the nodes, it uses the
+        # environment of their last provisioning.
+        run_data_dir = utils.get_stack_run_data_dir(parsed_args.stack)
+        utils.makedirs(run_data_dir)
+        shutil.copy(output_path, os.path.join(
+            run_data_dir, constants.BAREMETAL_DEPLOYED_ENV_FILE))
+
         return [output_path]
 
+    def _get_baremetal_env_files(self, parsed_args):
+        """Return the environment of the last provisioning of the nodes"""
+
+        if not parsed_args.baremetal_deployment:
+            return []
+
+        env_path = os.path.join(
+            utils.get_stack_run_data_dir(parsed_args.stack),
+            constants.BAREMETAL_DEPLOYED_ENV_FILE)
+        if not os.path.exists(env_path):
+            self.log.warning(
+                "The nodes of %s were never provisioned, the parameters "
+                "set by their provisioning are not explained"
+                % parsed_args.stack)
+            return []
+        return [env_path]
+
     def _unprovision_baremetal(self, parsed_args):
 
         if not parsed_args.baremetal_deployment:
             return
 
-        with open(parsed_args.baremetal_deployment, 'r') as fp:
-            roles = yaml.safe_load(fp)
+        roles = yaml_utils.load_file(parsed_args.baremetal_deployment)
 
         with utils.TempDirs() as tmp:
             utils.run_ansible_playbook(
@@ -673,6 +840,32 @@ class DeployOvercloud(command.Command):
             '--no-cleanup', action='store_true',
             help=_('Don\'t cleanup temporary files, just log their location')
         )
+        parser.add_argument(
+            '--profile-phases', action='store_true', default=False,
+            help=_('Record the wall and CPU time of the phases of the '
+                   'deployment, print a summary table and write them to a '
+                   'JSON report in the %s directory of the default '
+                   'working directory of the stack.') %
+            constants.STACK_RUN_DATA_DIR
+        )
+        parser.add_argument(
+            '--artifact-archive-format',
+            choices=[artifact_archive.ARCHIVE_FORMAT_NONE] + sorted(
+                artifact_archive.ARCHIVE_FORMATS),
+            default=constants.ARTIFACT_ARCHIVE_FORMAT,
+            help=_('Compression of the tarball of the deployment '
+                   'artifacts created in the home directory. The '
+                   'tarball is compressed with multiple threads when '
+                   'lbzip2 or pbzip2, pigz, xz or zstd is installed. '
+                   '"none" does not create the tarball.')
+        )
+        parser.add_argument(
+            '--artifact-store', action='store_true', default=False,
+            help=_('Also store the deployment artifacts in '
+                   '~/.tripleo/artifacts, which keeps a single copy of '
+                   'the files unchanged between deployments and records '
+                   'a manifest of each run.')
+        )
         parser.add_argument(
             '--update-plan-only',
             action='store_true',
@@ -723,6 +916,15 @@ class DeployOvercloud(command.Command):
             default=False,
             help=_('Only run validations, but do not apply any changes.')
         )
+        parser.add_argument(
+            '--explain-params',
+            nargs='*',
+            metavar='<parameter>',
+            default=None,
+            help=_('With --dry-run, show the environment file setting each '
+                   'parameter once all the environments are merged. '
+                   'Defaults to all the parameters.')
+        )
         parser.add_argument(
             '--run-validations',
             action='store_true',
@@ -753,6 +955,15 @@ class DeployOvercloud(command.Command):
                    'that the software configuration does not need to be '
                    'run, such as when scaling out certain roles.')
         )
+        parser.add_argument(
+            '--force-stack-update',
+            action='store_true',
+            default=False,
+            help=_('Update the Heat stack even when the templates, '
+                   'environments and parameters did not change since the '
+                   'last deployment of the stack. The DeployIdentifier '
+                   'parameter is not taken into account.')
+        )
         parser.add_argument(
             '--answers-file',
             help=_('Path to a YAML file with arguments and parameters.')
@@ -863,6 +1074,28 @@ class DeployOvercloud(command.Command):
             help=_('The number of Ansible forks to use for the'
                    ' config-download ansible-playbook command.')
         )
+        parser.add_argument(
+            '--ssh-prewarm',
+            action='store_true',
+            default=False,
+            help=_('Open the SSH connections to all the hosts in parallel '
+                   'before running the config-download playbooks. The '
+                   'unreachable hosts are reported and excluded from the '
+                   'playbooks.')
+        )
+        parser.add_argument(
+            '--ansible-accelerated',
+            action='store_true',
+            default=False,
+            help=_('Run the config-download playbooks with an accelerated '
+                   'Ansible strategy, such as mitogen_linear, when one is '
+                   'installed. The default strategy is used otherwise. '
+                   'Plays declaring their own strategy can not be '
+                   'accelerated: this option has no effect, and a warning '
+                   'is logged, for a playbook with such plays, like the '
+                   'tripleo_free and tripleo_linear plays of the deploy '
+                   'steps playbook.')
+        )
         parser.add_argument(
             '--disable-container-prepare',
             action='store_true',
@@ -875,6 +1108,39 @@ class DeployOvercloud(command.Command):
         )
         return parser
 
+    def _create_overcloudrc(self, stack, parsed_args):
+        rc_params = utils.get_rc_params(
+            self.orchestration_client,
+            parsed_args.stack)
+        return deployment.create_overcloudrc(
+            stack, rc_params, parsed_args.no_proxy)
+
+    @staticmethod
+    def _post_stack_result(future):
+        """Return the result of a post stack step, None when it failed"""
+
+        if future is None or future.exception():
+            return None
+        return future.result()
+
+    def _write_phase_profile(self, parsed_args):
+        """Write the phase profile report and print its summary"""
+
+        if not self._profiler.enabled:
+            return
+        report = self._profiler.report()
+        path = os.path.join(
+            utils.get_stack_run_data_dir(parsed_args.stack),
+            constants.PHASE_PROFILE_FILE.format(
+                datetime.datetime.utcnow().strftime('%Y%m%d%H%M%S')))
+        try:
+            self._profiler.write(path, report=report)
+            self.log.info("Phase profile written to %s" % path)
+        except (IOError, OSError) as e:
+            self.log.warning("Unable to write the phase profile %s: %s"
+                             % (path, e))
+        print(self._profiler.table(report), file=self.app.stdout)
+
     def take_action(self, parsed_args):
         logging.register_options(CONF)
         logging.setup(CONF, '')
@@ -898,12 +1164,6 @@ class DeployOvercloud(command.Command):
 
         self._validate_args(parsed_args)
 
-        # Throw warning if deprecated service is enabled and
-        # ask user if deployment should still be continued.
-        if parsed_args.environment_files:
-            utils.check_deprecated_service_is_enabled(
-                parsed_args.environment_files)
-
         self._update_args_from_answers_file(parsed_args)
         stack = utils.get_stack(self.orchestration_client, parsed_args.stack)
         stack_create = stack is None
@@ -913,30 +1173,45 @@ class DeployOvercloud(command.Command):
             self.log.info("Stack found, will be doing a stack update")
 
         if parsed_args.dry_run:
+            if parsed_args.explain_params is not None:
+                self._explain_parameters(stack, parsed_args)
             self.log.info("Validation Finished")
             return
 
         start = time.time()
+        self._profiler = phase_profiler.PhaseProfiler(
+            enabled=parsed_args.profile_phases)
 
+        self._stack_fingerprint = None
         if not parsed_args.config_download_only:
-            self._deploy_tripleo_heat_templates_tmpdir(stack, parsed_args)
+            try:
+                with self._profiler.phase('Deploy templates'):
+                    self._deploy_tripleo_heat_templates_tmpdir(stack,
+                                                               parsed_args)
+            except Exception:
+                self._write_phase_profile(parsed_args)
+                raise
 
         # Get a new copy of the stack after stack update/create. If it was
         # a create then the previous stack object would be None.
         stack = utils.get_stack(self.orchestration_client, parsed_args.stack)
-
+        if self._stack_fingerprint:
+            utils.update_stack_fingerprint(stack, self._stack_fingerprint)
+
+        overcloud_endpoint = None
+        # The horizon URL and the overcloudrc are only reported once the
+        # deployment ends, config-download does not wait for them.
+        post_stack = futures.ThreadPoolExecutor(
+            max_workers=constants.POST_STACK_MAX_WORKERS)
+        post_stack_steps = {}
         try:
             # Force fetching of attributes
             stack.get()
             overcloud_endpoint = utils.get_overcloud_endpoint(stack)
-            horizon_url = deployment.get_horizon_url(
-                stack=stack.stack_name)
-            rc_params = utils.get_rc_params(
-                self.orchestration_client,
-                parsed_args.stack)
-
-            rcpath = deployment.create_overcloudrc(
-                stack, rc_params, parsed_args.no_proxy)
+            post_stack_steps['horizon_url'] = post_stack.submit(
+                deployment.get_horizon_url, stack=stack.stack_name)
+            post_stack_steps['rcpath'] = post_stack.submit(
+                self._create_overcloudrc, stack, parsed_args)
 
             if parsed_args.config_download:
                 self.log.info("Deploying overcloud configuration")
@@ -946,14 +1221,15 @@ class DeployOvercloud(command.Command):
                 )
 
                 if not parsed_args.config_download_only:
-                    deployment.get_hosts_and_enable_ssh_admin(
-                        stack,
-                        parsed_args.overcloud_ssh_network,
-                        parsed_args.overcloud_ssh_user,
-                        self.get_key_pair(parsed_args),
-                        parsed_args.overcloud_ssh_port_timeout,
-                        verbosity=utils.playbook_verbosity(self=self)
-                    )
+                    with self._profiler.phase('Enable ssh admin'):
+                        deployment.get_hosts_and_enable_ssh_admin(
+                            stack,
+                            parsed_args.overcloud_ssh_network,
+                            parsed_args.overcloud_ssh_user,
+                            self.get_key_pair(parsed_args),
+                            parsed_args.overcloud_ssh_port_timeout,
+                            verbosity=utils.playbook_verbosity(self=self)
+                        )
 
                 if parsed_args.config_download_timeout:
                     timeout = parsed_args.config_download_timeout
@@ -969,25 +1245,38 @@ class DeployOvercloud(command.Command):
                     deployment_options['ansible_python_interpreter'] = \
                         parsed_args.deployment_python_interpreter
 
-                deployment.config_download(
-                    self.log,
-                    self.clients,
-                    stack,
-                    parsed_args.overcloud_ssh_network,
-                    parsed_args.output_dir,
-                    parsed_args.override_ansible_cfg,
-                    timeout=parsed_args.overcloud_ssh_port_timeout,
-                    verbosity=utils.playbook_verbosity(self=self),
-                    deployment_options=deployment_options,
-                    in_flight_validations=parsed_args.inflight,
-                    deployment_timeout=timeout,
-                    tags=parsed_args.tags,
-                    skip_tags=parsed_args.skip_tags,
-                    limit_hosts=utils.playbook_limit_parse(
-                        limit_nodes=parsed_args.limit
-                    ),
-                    forks=parsed_args.ansible_forks
-                )
+                # Do not configure the overcloud when its rc file could not be
+                # written, the error of the step fails the deployment.
+                post_stack_steps['rcpath'].result()
+
+                with self._profiler.phase('Config download'):
+                    deployment.config_download(
+                        self.log,
+                        self.clients,
+                        stack,
+                        parsed_args.overcloud_ssh_network,
+                        parsed_args.output_dir,
+                        parsed_args.override_ansible_cfg,
+                        timeout=parsed_args.overcloud_ssh_port_timeout,
+                        verbosity=utils.playbook_verbosity(self=self),
+                        deployment_options=deployment_options,
+                        in_flight_validations=parsed_args.inflight,
+                        deployment_timeout=timeout,
+                        tags=parsed_args.tags,
+                        skip_tags=parsed_args.skip_tags,
+                        limit_hosts=utils.playbook_limit_parse(
+                            limit_nodes=parsed_args.limit
+                        ),
+                        forks=parsed_args.ansible_forks,
+                        ssh_prewarm=parsed_args.ssh_prewarm,
+                        accelerated=parsed_args.ansible_accelerated
+                    )
+
+            with self._profiler.phase('Wait for the post stack steps'):
+                for future in post_stack_steps.values():
+                    future.result()
+
+            if parsed_args.config_download:
                 deployment.set_deployment_status(
                     stack.stack_name,
                     status=deploy_status)
@@ -1000,11 +1289,18 @@ class DeployOvercloud(command.Command):
                 status=deploy_status
             )
         finally:
+            # The steps still running when the deployment failed end before
+            # the postconfig updates the environment.
+            post_stack.shutdown(wait=True)
+            horizon_url = self._post_stack_result(
+                post_stack_steps.get('horizon_url'))
+            rcpath = self._post_stack_result(post_stack_steps.get('rcpath'))
             # Run postconfig on create or force. Use force to makes sure
             # endpoints are created with deploy reruns and upgrades
             if (stack_create or parsed_args.force_postconfig
                     and not parsed_args.skip_postconfig):
-                self._deploy_postconfig(stack, parsed_args)
+                with self._profiler.phase('Postconfig'):
+                    self._deploy_postconfig(stack, parsed_args)
 
             # Copy clouds.yaml to the cloud user directory
             user = \
@@ -1016,6 +1312,7 @@ class DeployOvercloud(command.Command):
             print("Overcloud Horizon Dashboard URL: {0}".format(horizon_url))
             print("Overcloud rc file: {0}".format(rcpath))
             print("Overcloud Deployed {0}".format(deploy_message))
+            self._write_phase_profile(parsed_args)
 
             if deploy_status == 'DEPLOY_FAILED':
                 raise(deploy_trace)
@@ -1051,3 +1348,106 @@ class GetDeploymentStatus(command.Command):
             ['Stack Name', 'Deployment Status'])
         table.add_row([stack, status])
         print(table, file=self.app.stdout)
+
+
+class CompareDeploymentTiming(command.Lister):
+    """Compare the task timings of two config-download runs of a stack"""
+
+    log = logging.getLogger(__name__ + ".CompareDeploymentTiming")
+
+    def get_parser(self, prog_name):
+        parser = super(CompareDeploymentTiming, self).get_parser(prog_name)
+        parser.add_argument('--plan', '--stack',
+                            help=_('Name of the stack/plan. '
+                                   '(default: overcloud)'),
+                            default='overcloud')
+        parser.add_argument('--output-dir',
+                            action='store',
+                            default=constants.DEFAULT_WORK_DIR,
+                            help=_('Directory holding the config-download '
+                                   'working directory of the stack. '
+                                   '(default: %s)') %
+                            constants.DEFAULT_WORK_DIR)
+        parser.add_argument('--before',
+                            default=None,
+                            help=_('Run id, or timing file, of the reference '
+                                   'run. Defaults to the run preceding the '
+                                   'compared run.'))
+        parser.add_argument('--after',
+                            default=None,
+                            help=_('Run id, or timing file, of the compared '
+                                   'run. Defaults to the last run.'))
+        parser.add_argument('--group-by',
+                            choices=['task', 'role', 'host'],
+                            default='task',
+                            help=_('Compare the time spent in the tasks, '
+                                   'the roles or the hosts. '
+                                   '(default: task)'))
+        parser.add_argument('--top',
+                            type=int,
+                            default=20,
+                            help=_('Number of rows to show, 0 shows all '
+                                   'the rows. (default: 20)'))
+        return parser
+
+    def _timing_file(self, runs, run):
+        if os.path.isfile(run):
+            return run
+        paths = dict(runs)
+        if run not in paths:
+            raise oscexc.CommandError(
+                'No task timings found for run {}, available runs: {}'.format(
+                    run, ', '.join([i[0] for i in runs]) or 'none'
+                )
+            )
+        return paths[run]
+
+    def take_action(self, parsed_args):
+        self.log.debug("take_action(%s)" % parsed_args)
+        runs = utils.get_task_timing_runs(
+            os.path.join(parsed_args.output_dir, parsed_args.plan)
+        )
+        run_ids = [i[0] for i in runs]
+
+        if parsed_args.after:
+            after = self._timing_file(runs, parsed_args.after)
+        elif runs:
+            after = runs[-1][1]
+        else:
+            after = None
+
+        if parsed_args.before:
+            before = self._timing_file(runs, parsed_args.before)
+        elif parsed_args.after in run_ids:
+            index = run_ids.index(parsed_args.after)
+            before = runs[index - 1][1] if index > 0 else None
+        elif not parsed_args.after and len(runs) > 1:
+            before = runs[-2][1]
+        else:
+            before = None
+
+        if not before or not after:
+            raise oscexc.CommandError(
+                'Two runs with task timings are required for stack {}, '
+                'available runs: {}'.format(
+                    parsed_args.plan, ', '.join(run_ids) or 'none'
+                )
+            )
+
+        self.log.info('Comparing the task timings of %s with %s' %
+                      (after, before))
+        rows = utils.compare_task_timings(
+            before=utils.load_task_timings(before),
+            after=utils.load_task_timings(after),
+            group_by=parsed_args.group_by
+        )
+        if parsed_args.top > 0:
+            rows = rows[:parsed_args.top]
+
+        return (
+            (parsed_args.group_by.capitalize(), 'Before (s)', 'After (s)',
+             'Delta (s)', 'Change (%)'),
+            [(name, round(b, 2), round(a, 2), round(d, 2),
+              round(d * 100.0 / b, 1) if b else None)
+             for name, b, a, d in rows]
+        )
@@ -25,7 +25,6 @@ from osc_lib import exceptions as oscexc
 from osc_lib.i18n import _
 from osc_lib import utils
 import six
-import yaml
 
 from tripleoclient import command
 from tripleoclient import constants
@@ -33,6 +32,7 @@ from tripleoclient.exceptions import InvalidConfiguration
 from tripleoclient import utils as oooutils
 from tripleoclient.workflows import baremetal
 from tripleoclient.workflows import scale
+from tripleoclient import yaml_utils
 
 
 class DeleteNode(command.Command):
@@ -135,7 +135,7 @@ class DeleteNode(command.Command):
 
         if parsed_args.baremetal_deployment:
             with open(parsed_args.baremetal_deployment, 'r') as fp:
-                roles = yaml.safe_load(fp)
+                roles = yaml_utils.safe_load(fp)
 
             nodes_text, nodes = self._nodes_to_delete(parsed_args, roles)
             if nodes_text:
@@ -12,13 +12,13 @@
 
 import argparse
 import logging
-import yaml
 
 from osc_lib.i18n import _
 
 from tripleoclient import command
 from tripleoclient import utils
 from tripleoclient.workflows import parameters
+from tripleoclient import yaml_utils
 
 
 class GenerateFencingParameters(command.Command):
@@ -66,7 +66,8 @@ class GenerateFencingParameters(command.Command):
             ipmi_lanplus=parsed_args.ipmi_lanplus,
         )
 
-        fencing_parameters = yaml.safe_dump(result, default_flow_style=False)
+        fencing_parameters = yaml_utils.safe_dump(result,
+                                                  default_flow_style=False)
         if parsed_args.output:
             parsed_args.output.write(fencing_parameters)
             parsed_args.output.close()
@@ -73,12 +73,6 @@ class UpdatePrepare(DeployOvercloud):
             parsed_args.environment_files, templates_dir,
             constants.UPDATE_PREPARE_ENV)
 
-        # Throw deprecation warning if service is enabled and
-        # ask user if update should still be continued.
-        if parsed_args.environment_files:
-            oooutils.check_deprecated_service_is_enabled(
-                parsed_args.environment_files)
-
         super(UpdatePrepare, self).take_action(parsed_args)
         self.log.info("Update init on stack {0} complete.".format(
                       parsed_args.stack))
@@ -168,6 +162,25 @@ class UpdateRun(command.Command):
             help=_('The number of Ansible forks to use for the'
                    ' config-download ansible-playbook command.')
         )
+        parser.add_argument(
+            '--ssh-prewarm',
+            action='store_true',
+            default=False,
+            help=_('Open the SSH connections to all the hosts in parallel '
+                   'before running the config-download playbooks. The '
+                   'unreachable hosts are reported and excluded from the '
+                   'playbooks.')
+        )
+        parser.add_argument(
+            '--resume',
+            action='store_true',
+            default=False,
+            help=_('Resume the last failed run of the playbooks from the '
+                   'first playbook which did not complete, with the same '
+                   'inventory, limit and extra vars. All the playbooks are '
+                   'run when no failed run of the same playbooks is '
+                   'recorded.')
+        )
         return parser
 
     def take_action(self, parsed_args):
@@ -214,7 +227,9 @@ class UpdateRun(command.Command):
             ),
             skip_tags=parsed_args.skip_tags,
             tags=parsed_args.tags,
-            forks=parsed_args.ansible_forks
+            forks=parsed_args.ansible_forks,
+            resume=parsed_args.resume,
+            ssh_prewarm=parsed_args.ssh_prewarm
         )
         self.log.info("Completed Overcloud Minor Update Run.")
 
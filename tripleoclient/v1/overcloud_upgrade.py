@@ -56,6 +56,16 @@ class UpgradePrepare(DeployOvercloud):
                             )
         return parser
 
+    def _check_environments(self, parsed_args, env_index):
+        # Parse all environment files looking for undesired
+        # parameters
+        parameters.check_forbidden_params(self.log,
+                                          parsed_args.environment_files,
+                                          self.forbidden_params,
+                                          index=env_index)
+        super(UpgradePrepare, self)._check_environments(parsed_args,
+                                                        env_index)
+
     def take_action(self, parsed_args):
         logging.register_options(CONF)
         logging.setup(CONF, '')
@@ -67,12 +77,6 @@ class UpgradePrepare(DeployOvercloud):
                     constants.UPGRADE_PROMPT, self.log)):
             raise OvercloudUpgradeNotConfirmed(constants.UPGRADE_NO)
 
-        # Throw deprecation warning if service is enabled and
-        # ask user if upgrade should still be continued.
-        if parsed_args.environment_files:
-            oooutils.check_deprecated_service_is_enabled(
-                parsed_args.environment_files)
-
         clients = self.app.client_manager
 
         stack = oooutils.get_stack(clients.orchestration,
@@ -90,11 +94,6 @@ class UpgradePrepare(DeployOvercloud):
         parsed_args.environment_files = oooutils.prepend_environment(
             parsed_args.environment_files, templates_dir,
             self.template)
-        # Parse all environment files looking for undesired
-        # parameters
-        parameters.check_forbidden_params(self.log,
-                                          parsed_args.environment_files,
-                                          self.forbidden_params)
         super(UpgradePrepare, self).take_action(parsed_args)
 
         # enable ssh admin for Ansible-via-Mistral as that's done only
@@ -212,6 +211,16 @@ class UpgradeRun(command.Command):
             help=_('The number of Ansible forks to use for the'
                    ' config-download ansible-playbook command.')
         )
+        parser.add_argument(
+            '--resume',
+            action='store_true',
+            default=False,
+            help=_('Resume the last failed run of the playbooks from the '
+                   'first playbook which did not complete, with the same '
+                   'inventory, limit and extra vars. All the playbooks are '
+                   'run when no failed run of the same playbooks is '
+                   'recorded.')
+        )
         return parser
 
     def take_action(self, parsed_args):
@@ -259,7 +268,8 @@ class UpgradeRun(command.Command):
             limit_hosts=oooutils.playbook_limit_parse(
                 limit_nodes=parsed_args.limit
             ),
-            forks=parsed_args.ansible_forks
+            forks=parsed_args.ansible_forks,
+            resume=parsed_args.resume
         )
         self.log.info("Completed Overcloud Major Upgrade Run.")
 
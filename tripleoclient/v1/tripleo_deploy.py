@@ -27,17 +27,19 @@ import sys
 import tempfile
 import time
 import traceback
-import yaml
 
 from cliff import command
 from heatclient.common import template_utils
 from osc_lib.i18n import _
 from six.moves import configparser
 
+from tripleoclient import artifact_archive
 from tripleoclient import constants
 from tripleoclient import exceptions
 from tripleoclient import heat_launcher
 from tripleoclient import utils
+from tripleoclient.workflows import parameters as workflow_params
+from tripleoclient import yaml_utils
 
 from tripleo_common import constants as tc_constants
 from tripleo_common.image import kolla_builder
@@ -102,6 +104,8 @@ class Deploy(command.Command):
     python_version = sys.version_info[0]
     ansible_playbook_cmd = "ansible-playbook"
     python_cmd = "python{}".format(python_version)
+    # Index of the user environments, see _load_user_params
+    user_env_index = None
 
     def _is_undercloud_deploy(self, parsed_args):
         role = parsed_args.standalone_role
@@ -306,7 +310,7 @@ class Deploy(command.Command):
         if os.path.exists(pw_file):
             with open(pw_file) as pf:
                 stack_env['parameter_defaults'].update(
-                    yaml.safe_load(pf.read())['parameter_defaults'])
+                    yaml_utils.safe_load(pf.read())['parameter_defaults'])
 
         if upgrade:
             # Getting passwords that were managed by instack-undercloud so
@@ -386,7 +390,7 @@ class Deploy(command.Command):
         # Write out the password file in yaml for heat.
         # This contains sensitive data so ensure it's not world-readable
         with open(pw_file, 'w') as pf:
-            yaml.safe_dump(stack_env, pf, default_flow_style=False)
+            yaml_utils.safe_dump(stack_env, pf, default_flow_style=False)
         # TODO(cjeanner) drop that once using oslo.privsep
         # Do not forget to re-add os.chmod 0o600 on that one!
         self._set_data_rights(pw_file, user=user)
@@ -577,23 +581,18 @@ class Deploy(command.Command):
         return environments
 
     def _load_user_params(self, user_environments):
-        user_params = {}
-        for env_file in user_environments:
-            # undercloud and minion heat stack virtual state tracking is not
-            # available yet
-            if env_file.endswith('-stack-vstate-dropin.yaml'):
-                continue
-
-            with open(env_file, 'r') as f:
-                data = yaml.safe_load(f.read())
-
-            if data is None or data.get('parameter_defaults') is None:
-                continue
-
-            for k, v in data.get('parameter_defaults', {}).items():
-                user_params[k] = v
-
-        return user_params
+        # undercloud and minion heat stack virtual state tracking is not
+        # available yet
+        user_environments = [i for i in user_environments
+                             if not i.endswith('-stack-vstate-dropin.yaml')]
+        # The index is kept for the command, the heat environments are set
+        # up again with the same user environments when unused services
+        # are removed from the roles.
+        if (self.user_env_index is None or
+                [i[0] for i in self.user_env_index.environments] !=
+                user_environments):
+            self.user_env_index = utils.EnvironmentIndex(user_environments)
+        return self.user_env_index.environment.get('parameter_defaults') or {}
 
     def _setup_heat_environments(self, roles_file_path, networks_file_path,
                                  parsed_args):
@@ -636,7 +635,7 @@ class Deploy(command.Command):
         plan_env_path = utils.rel_or_abs_path(
             self._get_plan_env_file_path(parsed_args), self.tht_render)
         with open(plan_env_path, 'r') as f:
-            plan_env_data = yaml.safe_load(f)
+            plan_env_data = yaml_utils.safe_load(f)
         environments = [utils.rel_or_abs_path(e.get('path'), self.tht_render)
                         for e in plan_env_data.get('environments', {})]
 
@@ -701,8 +700,8 @@ class Deploy(command.Command):
         )
 
         with open(maps_file, 'w') as env_file:
-            yaml.safe_dump({'parameter_defaults': tmp_env}, env_file,
-                           default_flow_style=False)
+            yaml_utils.safe_dump({'parameter_defaults': tmp_env}, env_file,
+                                 default_flow_style=False)
         environments.append(maps_file)
 
         # NOTE(aschultz): this doesn't get copied into tht_root but
@@ -719,7 +718,7 @@ class Deploy(command.Command):
                                            '%s-stack-vstate-dropin.yaml' %
                                            parsed_args.stack)
         with open(stack_vstate_dropin, 'w') as dropin_file:
-            yaml.safe_dump(
+            yaml_utils.safe_dump(
                 {'parameter_defaults': {
                     'RootStackName': parsed_args.stack.lower(),
                     'StackAction': self.stack_action,
@@ -752,9 +751,10 @@ class Deploy(command.Command):
 
         # rewrite paths to consume t-h-t env files from the working dir
         self.log.debug(_("Processing environment files %s") % environments)
+        env_cache = utils.get_environment_cache()
         env_files, env = utils.process_multiple_environments(
             environments, self.tht_render, parsed_args.templates,
-            cleanup=parsed_args.cleanup)
+            cleanup=parsed_args.cleanup, cache=env_cache)
 
         roles_data = utils.fetch_roles_file(
             roles_file_path, parsed_args.templates)
@@ -778,13 +778,19 @@ class Deploy(command.Command):
             roles_file_path = os.path.join(
                 self.tht_render, 'roles-data-override.yaml')
             with open(roles_file_path, "w") as f:
-                f.write(yaml.safe_dump(roles_data))
+                f.write(yaml_utils.safe_dump(roles_data))
             # Redo the dance
             environments = self._setup_heat_environments(
                 roles_file_path, networks_file_path, parsed_args)
             env_files, env = utils.process_multiple_environments(
                 environments, self.tht_render, parsed_args.templates,
-                cleanup=parsed_args.cleanup)
+                cleanup=parsed_args.cleanup, cache=env_cache)
+        env_cache.close()
+
+        # check the parameters before any Heat call, against the parameter
+        # schema of the templates
+        workflow_params.check_parameters_offline(
+            self.tht_render, roles_data, env)
 
         if not parsed_args.disable_container_prepare:
             self._prepare_container_images(env, roles_data)
@@ -795,7 +801,9 @@ class Deploy(command.Command):
         template_files, template = \
             template_utils.get_template_contents(template_path)
 
-        files = dict(list(template_files.items()) + list(env_files.items()))
+        files = utils.build_files_payload(
+            template, template_files, env_files, environment=env,
+            log=self.log)
 
         stack_name = parsed_args.stack
 
@@ -894,7 +902,7 @@ class Deploy(command.Command):
         self._create_working_dirs(stack_name.lower())
         output = {'parameter_defaults': outputs}
         with open(endpointmap_file, 'w') as f:
-            yaml.safe_dump(output, f, default_flow_style=False)
+            yaml_utils.safe_dump(output, f, default_flow_style=False)
         return output
 
     def get_parser(self, prog_name):
@@ -1049,6 +1057,24 @@ class Deploy(command.Command):
                    'after the command is run.'),
 
         )
+        parser.add_argument(
+            '--artifact-archive-format',
+            choices=[artifact_archive.ARCHIVE_FORMAT_NONE] + sorted(
+                artifact_archive.ARCHIVE_FORMATS),
+            default=constants.ARTIFACT_ARCHIVE_FORMAT,
+            help=_('Compression of the tarball of the deployment '
+                   'artifacts created in the home directory. The '
+                   'tarball is compressed with multiple threads when '
+                   'lbzip2 or pbzip2, pigz, xz or zstd is installed. '
+                   '"none" does not create the tarball.')
+        )
+        parser.add_argument(
+            '--artifact-store', action='store_true', default=False,
+            help=_('Also store the deployment artifacts in '
+                   '~/.tripleo/artifacts, which keeps a single copy of '
+                   'the files unchanged between deployments and records '
+                   'a manifest of each run.')
+        )
         parser.add_argument(
             '--hieradata-override', nargs='?',
             help=_('Path to hieradata override file. When it points to a heat '
@@ -1099,6 +1125,14 @@ class Deploy(command.Command):
             help=_('The number of Ansible forks to use for the'
                    ' config-download ansible-playbook command.')
         )
+        parser.add_argument(
+            '--resume',
+            action='store_true',
+            default=False,
+            help=_('Skip the playbooks which completed during the last '
+                   'failed run of the deployment or upgrade playbooks and '
+                   'resume from the first one which did not complete.')
+        )
         parser.add_argument(
             '--disable-container-prepare',
             action='store_true',
@@ -1159,7 +1193,7 @@ class Deploy(command.Command):
             self.log.error(msg)
             raise exceptions.DeploymentError(msg)
 
-        hiera_data = yaml.safe_load(data)
+        hiera_data = yaml_utils.safe_load(data)
         if not hiera_data:
             msg = (_('Unsupported data format in hieradata override %s') %
                    target)
@@ -1177,7 +1211,7 @@ class Deploy(command.Command):
                           'legacy format into a file %s' %
                           hiera_override_file)
             with open(hiera_override_file, 'w') as override:
-                yaml.safe_dump(
+                yaml_utils.safe_dump(
                     {'parameter_defaults': {
                      extra_config_var: hiera_data}},
                     override,
@@ -1330,23 +1364,60 @@ class Deploy(command.Command):
                     operations.append(
                         constants.DEPLOY_ANSIBLE_ACTIONS['online-upgrade']
                     )
+                checkpoint = os.path.join(
+                    self.output_dir,
+                    constants.STACK_RUN_DATA_DIR,
+                    '{}-{}'.format(
+                        parsed_args.stack.lower(),
+                        constants.PLAYBOOK_CHECKPOINT_FILE
+                    )
+                )
+                offset = 0
+                if parsed_args.resume:
+                    offset = utils.get_playbook_checkpoint_offset(
+                        utils.load_playbook_checkpoint(checkpoint),
+                        [i['playbook'] for i in operations]
+                    ) or 0
+                playbooks_status = [
+                    {
+                        'playbook': operation['playbook'],
+                        'status': 'successful' if index < offset
+                        else 'pending'
+                    } for index, operation in enumerate(operations)
+                ]
                 with utils.Pushd(self.ansible_dir):
-                    for operation in operations:
+                    for index, operation in enumerate(operations):
+                        if index < offset:
+                            self.log.warning(
+                                _('Skipping %s, completed by the resumed '
+                                  'run') % operation['playbook'])
+                            continue
                         for k, v in extra_args.items():
                             if k in operation:
                                 operation[k] = ','.join([operation[k], v])
                             else:
                                 operation[k] = v
-                        utils.run_ansible_playbook(
-                            inventory=os.path.join(
-                                self.ansible_dir,
-                                'inventory.yaml'
-                            ),
-                            workdir=self.ansible_dir,
-                            verbosity=utils.playbook_verbosity(self=self),
-                            extra_env_variables=extra_env_var,
-                            forks=parsed_args.ansible_forks,
-                            **operation)
+                        playbooks_status[index]['status'] = 'running'
+                        utils.write_playbook_checkpoint(
+                            checkpoint, playbooks_status)
+                        try:
+                            utils.run_ansible_playbook(
+                                inventory=os.path.join(
+                                    self.ansible_dir,
+                                    'inventory.yaml'
+                                ),
+                                workdir=self.ansible_dir,
+                                verbosity=utils.playbook_verbosity(self=self),
+                                extra_env_variables=extra_env_var,
+                                forks=parsed_args.ansible_forks,
+                                **operation)
+                        except Exception:
+                            playbooks_status[index]['status'] = 'failed'
+                            utils.write_playbook_checkpoint(
+                                checkpoint, playbooks_status)
+                            raise
+                        playbooks_status[index]['status'] = 'successful'
+                    utils.remove_playbook_checkpoint(checkpoint)
             is_complete = True
         finally:
             if not parsed_args.keep_running:
@@ -1357,7 +1428,10 @@ class Deploy(command.Command):
                     parsed_args.stack.lower(),
                     self.tht_render,
                     self.tmp_ansible_dir,
-                    self.output_dir)
+                    self.output_dir,
+                    archive_format=parsed_args.artifact_archive_format,
+                    store=(utils.get_artifact_store()
+                           if parsed_args.artifact_store else None))
 
             if self.ansible_dir:
                 self._dump_ansible_errors(
@@ -23,6 +23,7 @@ from osc_lib.i18n import _
 
 from tripleoclient import constants
 from tripleoclient import utils
+from tripleoclient import yaml_utils
 
 LOG = logging.getLogger(__name__ + ".BackupUndercloud")
 
@@ -139,11 +140,11 @@ class BackupUndercloud(command.Command):
             return raw_extra_vars
         elif os.path.exists(raw_extra_vars):
             with open(raw_extra_vars, 'r') as fp:
-                extra_vars = yaml.safe_load(fp.read())
+                extra_vars = yaml_utils.safe_load(fp.read())
 
         else:
             try:
-                extra_vars = yaml.safe_load(raw_extra_vars)
+                extra_vars = yaml_utils.safe_load(raw_extra_vars)
             except yaml.YAMLError as exc:
                 raise RuntimeError(
                     _('--extra-vars is not an existing file and cannot be '
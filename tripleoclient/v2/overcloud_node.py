@@ -24,7 +24,6 @@ from cliff.formatters import table
 from osc_lib import exceptions as oscexc
 from osc_lib.i18n import _
 from osc_lib import utils
-import yaml
 
 from tripleoclient import command
 from tripleoclient import constants
@@ -38,6 +37,7 @@ from tripleoclient.v1.overcloud_node import ConfigureNode  # noqa
 from tripleoclient.v1.overcloud_node import DeleteNode  # noqa
 from tripleoclient.v1.overcloud_node import DiscoverNode  # noqa
 from tripleoclient.v1.overcloud_node import ProvideNode  # noqa
+from tripleoclient import yaml_utils
 
 
 class ImportNode(command.Command):
@@ -269,7 +269,7 @@ class ProvisionNode(command.Command):
         self.log.debug("take_action(%s)" % parsed_args)
 
         with open(parsed_args.input, 'r') as fp:
-            roles = yaml.safe_load(fp)
+            roles = yaml_utils.safe_load(fp)
 
         key = self.get_key_pair(parsed_args)
         with open('{}.pub'.format(key), 'rt') as fp:
@@ -344,7 +344,7 @@ class UnprovisionNode(command.Command):
         self.log.debug("take_action(%s)" % parsed_args)
 
         with open(parsed_args.input, 'r') as fp:
-            roles = yaml.safe_load(fp)
+            roles = yaml_utils.safe_load(fp)
 
         with oooutils.TempDirs() as tmp:
             unprovision_confirm = os.path.join(tmp, 'unprovision_confirm.json')
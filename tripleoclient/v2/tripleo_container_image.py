@@ -17,7 +17,6 @@ import collections
 import os
 import re
 import uuid
-import yaml
 
 import six
 
@@ -32,6 +31,7 @@ from tripleo_common.image.builder import buildah
 from tripleoclient import command
 from tripleoclient import constants
 from tripleoclient import utils
+from tripleoclient import yaml_utils
 
 
 CONF = cfg.CONF
@@ -303,8 +303,7 @@ class Build(command.Command):
                         self.log.debug(
                             "reading option file: {}".format(_option_file)
                         )
-                        with open(_option_file) as f:
-                            _options = yaml.safe_load(f)
+                        _options = yaml_utils.load_file(_option_file)
                         if _options:
                             container_vars.update(_options)
 
@@ -458,7 +457,7 @@ class Build(command.Command):
         )
         utils.makedirs(os.path.dirname(tree_file))
         with open(tree_file, "w") as f:
-            yaml.safe_dump(
+            yaml_utils.safe_dump(
                 images_tree, f, default_flow_style=False, width=4096
             )
 
@@ -477,7 +476,7 @@ class Build(command.Command):
                 "Configuration file found: {}".format(self.config_file)
             )
             with open(self.config_file, "r") as f:
-                containers_yaml = yaml.safe_load(f)
+                containers_yaml = yaml_utils.safe_load(f)
 
             for c in containers_yaml["container_images"]:
                 entry = dict(c)
@@ -617,7 +616,7 @@ class Build(command.Command):
             )
             utils.makedirs(os.path.dirname(var_file))
             with open(var_file, "w") as f:
-                yaml.safe_dump(
+                yaml_utils.safe_dump(
                     image_config, f, default_flow_style=False, width=4096
                 )
 
@@ -646,12 +645,12 @@ class Build(command.Command):
                     )
                 else:
                     with open(parsed_args.extra_config) as f:
-                        generation_playbook["vars"] = yaml.safe_load(f)
+                        generation_playbook["vars"] = yaml_utils.safe_load(f)
 
             playdata.append(generation_playbook)
 
             with open(playbook, "w") as f:
-                yaml.safe_dump(
+                yaml_utils.safe_dump(
                     playdata, f, default_flow_style=False, width=4096
                 )
 
@@ -660,9 +659,7 @@ class Build(command.Command):
                 inventory=tcib_inventory,
                 workdir=tmp,
                 playbook_dir=tmp,
-                extra_env_variables={
-                    "ANSIBLE_FORKS": len(tcib_inventory_hosts.keys())
-                },
+                connection="local",
                 verbosity=utils.playbook_verbosity(self=self),
             )
 
@@ -763,7 +760,7 @@ class HotFix(command.Command):
             }
 
             with open(playbook, "w") as f:
-                yaml.safe_dump(
+                yaml_utils.safe_dump(
                     [playdata], f, default_flow_style=False, width=4096
                 )
 
@@ -0,0 +1,116 @@
+#   Copyright 2020 Red Hat, Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+import logging
+import os
+
+from osc_lib.i18n import _
+from osc_lib import utils as osc_utils
+
+from tripleoclient import command
+from tripleoclient import constants
+from tripleoclient import exceptions
+from tripleoclient import utils
+from tripleoclient import yaml_utils
+
+
+class WarmFacts(command.Command):
+    """Gather the facts of the hosts of a stack into the fact cache."""
+
+    log = logging.getLogger(__name__ + ".WarmFacts")
+
+    def get_parser(self, prog_name):
+        parser = super(WarmFacts, self).get_parser(prog_name)
+        parser.add_argument('--stack',
+                            help=_('Name or ID of heat stack '
+                                   '(default=Env: OVERCLOUD_STACK_NAME)'),
+                            default=osc_utils.env('OVERCLOUD_STACK_NAME',
+                                                  default='overcloud'))
+        parser.add_argument('--inventory',
+                            default=None,
+                            help=_('Ansible inventory of the stack. Defaults '
+                                   'to the inventory of the stack working '
+                                   'directory.'))
+        parser.add_argument('--limit',
+                            dest='limit',
+                            default=None,
+                            help=_('A string that identifies a single node '
+                                   'or comma-separated list of nodes for '
+                                   'which the facts are gathered.'))
+        parser.add_argument('--ssh-user',
+                            dest='ssh_user',
+                            default='tripleo-admin',
+                            help=_('User used to connect to the hosts. '
+                                   'Defaults to: tripleo-admin'))
+        parser.add_argument('--ansible-forks',
+                            action='store',
+                            default=None,
+                            type=int,
+                            help=_('The number of Ansible forks to use to '
+                                   'gather the facts.'))
+        return parser
+
+    def take_action(self, parsed_args):
+        self.log.debug('take_action({})'.format(parsed_args))
+
+        inventory = parsed_args.inventory
+        if not inventory:
+            inventory = constants.ANSIBLE_INVENTORY.format(parsed_args.stack)
+        if not os.path.exists(inventory):
+            raise exceptions.InvalidConfiguration(
+                _('The inventory {} does not exist, run the deployment of '
+                  'the stack or use --inventory.').format(inventory)
+            )
+
+        playbook_data = [
+            {
+                'name': 'Warm the fact cache',
+                'hosts': 'all',
+                'gather_facts': False,
+                'strategy': 'free',
+                'tasks': [
+                    {
+                        # NOTE: The deployment playbooks skip the gathering
+                        # of the cached hosts, the facts are gathered with
+                        # the default subsets they would use.
+                        'name': 'Gather facts',
+                        'setup': {}
+                    }
+                ]
+            }
+        ]
+
+        with utils.TempDirs() as tmp:
+            playbook = os.path.join(tmp, 'tripleo-facts-warm.yaml')
+            with open(playbook, 'w') as f:
+                yaml_utils.safe_dump(playbook_data, f,
+                                     default_flow_style=False)
+
+            utils.run_ansible_playbook(
+                playbook=playbook,
+                inventory=inventory,
+                workdir=tmp,
+                playbook_dir=tmp,
+                ssh_user=parsed_args.ssh_user,
+                key=utils.get_key(parsed_args.stack),
+                limit_hosts=parsed_args.limit,
+                forks=parsed_args.ansible_forks,
+                gathering_policy='explicit',
+                verbosity=utils.playbook_verbosity(self=self)
+            )
+
+        self.log.info(
+            'Facts stored in {}'.format(utils.get_ansible_fact_cache())
+        )
@@ -11,9 +11,9 @@
 # under the License.
 
 import copy
+import datetime
 import getpass
 import os
-import yaml
 
 from heatclient.common import event_utils
 from heatclient import exc as heat_exc
@@ -21,11 +21,18 @@ from openstackclient import shell
 from tripleo_common.utils import overcloudrc as rc_utils
 from tripleo_common.utils.safe_import import git
 
+from tripleoclient.constants import ANSIBLE_EVENTS_FILE
+from tripleoclient.constants import ANSIBLE_FORKS_HISTORY_FILE
+from tripleoclient.constants import ANSIBLE_TIMING_FILE
 from tripleoclient.constants import ANSIBLE_TRIPLEO_PLAYBOOKS
 from tripleoclient.constants import CLOUD_HOME_DIR
 from tripleoclient.constants import DEFAULT_WORK_DIR
+from tripleoclient.constants import PLAYBOOK_CHECKPOINT_FILE
+from tripleoclient.constants import STACK_RUN_DATA_DIR
 from tripleoclient import exceptions
+from tripleoclient import phase_profiler
 from tripleoclient import utils
+from tripleoclient import yaml_utils
 
 
 _WORKFLOW_TIMEOUT = 360  # 6 * 60 seconds
@@ -46,7 +53,8 @@ def create_overcloudrc(stack, rc_params, no_proxy='',
 
 def deploy_without_plan(clients, stack, stack_name, template,
                         files, env_files,
-                        log):
+                        log, profiler=None):
+    profiler = profiler or phase_profiler.DISABLED
     orchestration_client = clients.orchestration
     if stack is None:
         log.info("Performing Heat stack create")
@@ -71,11 +79,12 @@ def deploy_without_plan(clients, stack, stack_name, template,
         'environment_files': env_files,
         'files': files}
     try:
-        if stack:
-            stack_args['existing'] = True
-            orchestration_client.stacks.update(stack.id, **stack_args)
-        else:
-            stack = orchestration_client.stacks.create(**stack_args)
+        with profiler.phase('Heat stack %s' % action.lower()):
+            if stack:
+                stack_args['existing'] = True
+                orchestration_client.stacks.update(stack.id, **stack_args)
+            else:
+                stack = orchestration_client.stacks.create(**stack_args)
 
         print("Success.")
     except Exception:
@@ -83,8 +92,9 @@ def deploy_without_plan(clients, stack, stack_name, template,
                               status='DEPLOY_FAILED')
         raise
 
-    create_result = utils.wait_for_stack_ready(
-        orchestration_client, stack_name, marker, action)
+    with profiler.phase('Wait for the stack'):
+        create_result = utils.wait_for_stack_ready(
+            orchestration_client, stack_name, marker, action)
     if not create_result:
         shell.OpenStackShell().run(["stack", "failures", "list", stack_name])
         set_deployment_status(
@@ -203,7 +213,7 @@ def enable_ssh_admin(stack, hosts, ssh_user, ssh_key, timeout,
             ssh_key
         )
     )
-    with utils.TempDirs() as tmp:
+    with utils.TempDirs(chdir=False) as tmp:
         utils.run_ansible_playbook(
             playbook='cli-enable-ssh-admin.yaml',
             inventory=','.join(hosts),
@@ -229,7 +239,9 @@ def config_download(log, clients, stack, ssh_network='ctlplane',
                     ansible_playbook_name='deploy_steps_playbook.yaml',
                     limit_hosts=None, extra_vars=None, inventory_path=None,
                     ssh_user='tripleo-admin', tags=None, skip_tags=None,
-                    deployment_timeout=None, forks=None):
+                    deployment_timeout=None, forks=None,
+                    timing_stream=None, resume=False, ssh_prewarm=False,
+                    accelerated=False):
     """Run config download.
 
     :param log: Logging object
@@ -288,6 +300,29 @@ def config_download(log, clients, stack, ssh_network='ctlplane',
     :param deployment_timeout: Deployment timeout in minutes.
     :type deployment_timeout: Integer
 
+    :param forks: Number of Ansible forks. When undefined, the fork count
+                  is picked from the inventory, the undercloud resources
+                  and the previous runs of the playbook.
+    :type forks: Integer
+
+    :param timing_stream: Path of the file where the task timings of the
+                          deployment playbook are streamed. Defaults to a
+                          new file in the run data directory of the stack.
+    :type timing_stream: String
+
+    :param resume: When several playbooks are run, resume the last failed
+                   run of the playbooks from its first incomplete playbook.
+    :type resume: Boolean
+
+    :param ssh_prewarm: Open the SSH connections to all the hosts before
+                        running the playbooks. The unreachable hosts are
+                        excluded from the playbooks.
+    :type ssh_prewarm: Boolean
+
+    :param accelerated: Run the playbooks with the accelerated ansible
+                        strategy when one is usable.
+    :type accelerated: Boolean
+
     """
 
     def _log_and_print(message, logger, level='info', print_msg=True):
@@ -324,7 +359,10 @@ def config_download(log, clients, stack, ssh_network='ctlplane',
         else:
             skip_tags = 'opendev-validation'
 
-    with utils.TempDirs() as tmp:
+    # The deploy command runs its post stack steps concurrently with
+    # config-download, no step of it may change the working directory of the
+    # process.
+    with utils.TempDirs(chdir=False) as tmp:
         utils.run_ansible_playbook(
             playbook='cli-grant-local-access.yaml',
             inventory='localhost,',
@@ -357,7 +395,7 @@ def config_download(log, clients, stack, ssh_network='ctlplane',
     key_file = utils.get_key(stack.stack_name)
     python_interpreter = deployment_options.get('ansible_python_interpreter')
 
-    with utils.TempDirs() as tmp:
+    with utils.TempDirs(chdir=False) as tmp:
         utils.run_ansible_playbook(
             playbook='cli-config-download.yaml',
             inventory='localhost,',
@@ -388,13 +426,52 @@ def config_download(log, clients, stack, ssh_network='ctlplane',
         inventory_path = os.path.join(stack_work_dir,
                                       'tripleo-ansible-inventory.yaml')
 
+    # The stack working directory may be a temporary directory, keep the
+    # data recorded about the runs in the default one so it outlives them.
+    run_data_dir = utils.get_stack_run_data_dir(stack.stack_name)
+    run_id = datetime.datetime.utcnow().strftime('%Y%m%d%H%M%S')
+    if not timing_stream:
+        timing_stream = os.path.join(
+            run_data_dir,
+            ANSIBLE_TIMING_FILE.format(run_id)
+        )
+
+    if ssh_prewarm:
+        with utils.TempDirs(chdir=False) as tmp:
+            unreachable = utils.prewarm_ssh_connections(
+                inventory=inventory_path,
+                workdir=tmp,
+                limit_hosts=limit_hosts,
+                ssh_user=ssh_user,
+                key=key_file,
+                ansible_timeout=timeout,
+                verbosity=verbosity,
+                forks=forks
+            )
+        if unreachable:
+            _log_and_print(
+                message=(
+                    'Unreachable hosts excluded from the playbooks: {}'.format(
+                        ', '.join(unreachable)
+                    )
+                ),
+                logger=log,
+                level='warning'
+            )
+            limit_hosts = ':'.join(
+                ([limit_hosts] if limit_hosts else []) +
+                ['!{}'.format(i) for i in unreachable]
+            )
+
+    checkpoint = None
     if isinstance(ansible_playbook_name, list):
         playbooks = [os.path.join(stack_work_dir, p)
                      for p in ansible_playbook_name]
+        checkpoint = os.path.join(run_data_dir, PLAYBOOK_CHECKPOINT_FILE)
     else:
         playbooks = os.path.join(stack_work_dir, ansible_playbook_name)
 
-    with utils.TempDirs() as tmp:
+    with utils.TempDirs(chdir=False) as tmp:
         utils.run_ansible_playbook(
             playbook=playbooks,
             inventory=inventory_path,
@@ -414,7 +491,19 @@ def config_download(log, clients, stack, ssh_network='ctlplane',
             },
             extra_vars=extra_vars,
             timeout=deployment_timeout,
-            forks=forks
+            forks=forks,
+            timing_stream=timing_stream,
+            forks_history=os.path.join(
+                run_data_dir,
+                ANSIBLE_FORKS_HISTORY_FILE
+            ),
+            checkpoint=checkpoint,
+            resume=resume,
+            events_archive=os.path.join(
+                run_data_dir,
+                ANSIBLE_EVENTS_FILE.format(run_id)
+            ),
+            accelerated=accelerated
         )
 
     _log_and_print(
@@ -439,8 +528,9 @@ def config_download(log, clients, stack, ssh_network='ctlplane',
             "user", "email", git_config_email
         ).release()
 
-        # Add and commit all files to the git repository
-        repo.git.add(".")
+        # Add and commit all files to the git repository, the run data of
+        # the client is kept out of it.
+        repo.git.add(".", ":!{}".format(STACK_RUN_DATA_DIR))
         repo.git.commit("--amend", "--no-edit")
 
 
@@ -452,7 +542,9 @@ def get_horizon_url(stack, verbosity=0):
     :returns: string
     """
 
-    with utils.TempDirs() as tmp:
+    # Run concurrently with config-download, it must not change the working
+    # directory of the process.
+    with utils.TempDirs(chdir=False) as tmp:
         horizon_tmp_file = os.path.join(tmp, 'horizon_url')
         utils.run_ansible_playbook(
             playbook='cli-undercloud-get-horizon-url.yaml',
@@ -463,7 +555,8 @@ def get_horizon_url(stack, verbosity=0):
             extra_vars={
                 'stack_name': stack,
                 'horizon_url_output_file': horizon_tmp_file
-            }
+            },
+            parallel_run=True
         )
 
         with open(horizon_tmp_file) as f:
@@ -481,7 +574,7 @@ def get_deployment_status(clients, stack_name):
     try:
         status_yaml = utils.get_status_yaml(stack_name)
         with open(status_yaml, 'r') as status_stream:
-            return yaml.safe_load(status_stream)['deployment_status']
+            return yaml_utils.safe_load(status_stream)['deployment_status']
     except Exception:
         return None
 
@@ -13,7 +13,7 @@
 import logging
 import os
 import re
-import yaml
+import six
 
 from heatclient.common import template_utils
 from tripleo_common.utils import stack_parameters as stk_parameters
@@ -22,8 +22,10 @@ from tripleoclient.constants import ANSIBLE_TRIPLEO_PLAYBOOKS
 from tripleoclient.constants import OVERCLOUD_YAML_NAME
 from tripleoclient.constants import UNUSED_PARAMETER_EXCLUDES_RE
 from tripleoclient import exceptions
+from tripleoclient import resource_tree
 from tripleoclient import utils
 from tripleoclient.workflows import roles
+from tripleoclient import yaml_utils
 
 
 LOG = logging.getLogger(__name__)
@@ -36,8 +38,7 @@ def invoke_plan_env_workflows(clients, stack_name, plan_env_file,
     """Invokes the workflows in plan environment file"""
 
     try:
-        with open(plan_env_file) as pf:
-            plan_env_data = yaml.safe_load(pf.read())
+        plan_env_data = yaml_utils.load_file(plan_env_file)
     except IOError as exc:
         raise exceptions.PlanEnvWorkflowError('File (%s) is not found: '
                                               '%s' % (plan_env_file, exc))
@@ -86,7 +87,8 @@ def build_derived_params_environment(clients, stack_name,
                                      roles_file,
                                      plan_env_file,
                                      derived_env_file,
-                                     verbosity):
+                                     verbosity,
+                                     cache=None):
     template_path = os.path.join(tht_root, OVERCLOUD_YAML_NAME)
     template_files, template = template_utils.get_template_contents(
         template_file=template_path)
@@ -95,13 +97,14 @@ def build_derived_params_environment(clients, stack_name,
     # Build stack_data
     stack_data = utils.build_stack_data(
         clients, stack_name, template,
-        files, env_files_tracker)
+        files, env_files_tracker, cache=cache,
+        tht_root=tht_root)
 
     # Get role list
     role_list = roles.get_roles(
         clients, roles_file, tht_root, stack_name,
         template, files, env_files_tracker,
-        detail=False, valid=True)
+        detail=False, valid=True, cache=cache)
 
     invoke_plan_env_workflows(
             clients,
@@ -115,7 +118,8 @@ def build_derived_params_environment(clients, stack_name,
 
 
 def check_deprecated_parameters(clients, stack_name, tht_root, template,
-                                roles_file, files, env_files_tracker):
+                                roles_file, files, env_files_tracker,
+                                cache=None):
     """Checks for deprecated parameters and adds warning if present.
 
     :param clients: application client object.
@@ -123,64 +127,78 @@ def check_deprecated_parameters(clients, stack_name, tht_root, template,
 
     :param container: Name of the stack container.
     :type container: String
+
+    :param cache: Cache of the stack data, the stack is validated once for
+                  the roles and the parameters when it is set.
+    :type cache: StackDataCache
     """
 
     # Get role list
     role_list = roles.get_roles(
         clients, roles_file, tht_root, stack_name,
         template, files, env_files_tracker,
-        detail=False, valid=True)
+        detail=False, valid=True, cache=cache)
 
     # Build stack_data
     stack_data = utils.build_stack_data(
         clients, stack_name, template,
-        files, env_files_tracker)
-    user_params = stack_data.get('environment_parameters', {})
-    heat_resource_tree = stack_data.get('heat_resource_tree', {})
-    heat_resource_tree_params = heat_resource_tree.get('parameters', {})
-    heat_resource_tree_resources = heat_resource_tree.get('resources', {})
-    all_params = heat_resource_tree_params.keys()
-    parameter_groups = [
-        i.get('parameter_groups')
-        for i in heat_resource_tree_resources.values()
-        if i.get('parameter_groups')
-    ]
-    params_role_specific_tag = [
-        i.get('name')
-        for i in heat_resource_tree_params.values()
-        if 'tags' in i and 'role_specific' in i['tags']
-    ]
+        files, env_files_tracker, cache=cache,
+        tht_root=tht_root)
+    user_params = stack_data.get('environment_parameters') or {}
+    tree = resource_tree.ResourceTree.from_stack_data(stack_data)
+    _check_parameters(user_params, tree, role_list)
 
-    r = re.compile(".*Count")
-    filtered_names = list(filter(r.match, all_params))
-    valid_role_name_list = list()
-    for name in filtered_names:
-        default = heat_resource_tree_params[name].get('default', 0)
-        if default and int(default) > 0:
-            role_name = name.rstrip('Count')
-            if [i for i in role_list if i == role_name]:
-                valid_role_name_list.append(role_name)
-
-    deprecated_params = [
-        i[0] for i in parameter_groups
-        if i[0].get('label') == 'deprecated'
-    ]
-    # We are setting a frozenset here because python 3 complains that dict is
-    # a unhashable type.
-    # On user_defined, we check if the size is higher than 0 because an empty
-    # frozenset still is a subset of a frozenset, so we can't use issubset
-    # here.
-    user_params_keys = frozenset(user_params.keys())
-    deprecated_result = [
-        {
-            'parameter': i,
-            'deprecated': True,
-            'user_defined': len(
-                [x for x in frozenset(i) if x in user_params_keys]) > 0
-        }
-        for i in deprecated_params
+
+def check_parameters_offline(tht_root, roles_data, environment,
+                             schema=None):
+    """Checks the parameters of an environment without Heat.
+
+    The parameters are checked against the parameter schema of the
+    templates directory instead of the validation of the stack, so the
+    unused parameters reported are the parameters which are not defined
+    by any template.
+
+    :param tht_root: The templates directory.
+    :type tht_root: String
+
+    :param roles_data: The roles of the deployment.
+    :type roles_data: List
+
+    :param environment: The processed environment of the deployment.
+    :type environment: Dictionary
+
+    :param schema: The parameter schema of the templates directory, see
+                   `utils.get_parameter_schema`.
+    :type schema: Dictionary
+    """
+
+    if schema is None:
+        schema = utils.get_parameter_schema(tht_root)
+    user_params = environment.get('parameter_defaults') or {}
+    tree = resource_tree.ResourceTree(schema)
+    role_list = []
+    for role in roles_data:
+        name = role.get('name')
+        count = user_params.get(
+            name + resource_tree.ROLE_COUNT_SUFFIX,
+            tree.get_role_count(name))
+        try:
+            if int(count) > 0:
+                role_list.append(name)
+        except (TypeError, ValueError):
+            role_list.append(name)
+    _check_parameters(user_params, tree, role_list)
+
+
+def _check_parameters(user_params, tree, role_list):
+    params_role_specific_tag = frozenset(
+        tree.get_tagged_parameters('role_specific'))
+
+    deprecated_parameters = [
+        i for i in tree.get_grouped_parameters('deprecated')
+        if i in user_params
     ]
-    unused_params = [i for i in user_params.keys() if i not in all_params]
+    unused_params = [i for i in user_params if i not in tree.parameters]
     user_provided_role_specific = [
         v for i in role_list
         for k, v in user_params.items()
@@ -188,11 +206,7 @@ def check_deprecated_parameters(clients, stack_name, tht_root, template,
     ]
     invalid_role_specific_params = [
         i for i in user_provided_role_specific
-        if i in params_role_specific_tag
-    ]
-    deprecated_parameters = [
-        param['parameter'] for param in deprecated_result
-        if param.get('user_defined')
+        if isinstance(i, six.string_types) and i in params_role_specific_tag
     ]
 
     if deprecated_parameters:
@@ -265,7 +279,7 @@ def generate_fencing_parameters(clients, nodes_json, delay, ipmi_level,
         ipmi_lanplus=ipmi_lanplus)
 
 
-def check_forbidden_params(log, env_files, forbidden):
+def check_forbidden_params(log, env_files, forbidden, index=None):
     """Looks for undesired parameters in the environment files.
 
     Each of the environment files pass in env_files will be parsed
@@ -283,7 +297,7 @@ def check_forbidden_params(log, env_files, forbidden):
               key312: value312
             key32: value32
 
-    Will be converted by get_all_keys into:
+    Will be indexed as:
     [key1, key2, key3, key31, key311, key312, key32]
 
     This list provides us with all the parameters used in the environment
@@ -304,40 +318,25 @@ def check_forbidden_params(log, env_files, forbidden):
     :type env_files: list of strings
     :param forbidden: list of the undesired parameters
     :type forbidden: list of strings
+    :param index: index of the environments, built from env_files when not
+                  provided. Only the environments of env_files are checked.
+    :type index: EnvironmentIndex
 
     :returns exception if some of the forbidden parameters are found in
     the environment files.
     """
 
-    # Iterates over a nested dict and returns all the
-    # keys from the dict in a list
+    if index is None:
+        index = utils.EnvironmentIndex(env_files)
+
+    # All the keys found in the parameter_defaults of the environments
     # example:
     #   * input: {'a': '1', 'b': ['c': '2', 'd': {'e': '3'}]}
     #   * output: ['a', 'b', 'c', 'd', 'e']
-    def get_all_keys(obj, keys_list):
-        if isinstance(obj, dict):
-            keys_list += obj.keys()
-            for value in obj.values():
-                get_all_keys(value, keys_list)
-        elif isinstance(obj, list):
-            for value in obj:
-                get_all_keys(value, keys_list)
-
-    matched_params = []
-
-    for file in env_files:
-        if os.path.exists(file):
-            with open(file, 'r') as env_file:
-                contents = yaml.safe_load(env_file)
-                pd = contents.get('parameter_defaults', {})
-                if pd:
-                    # Intersection of values and forbidden params
-                    list_of_keys = []
-                    get_all_keys(pd, list_of_keys)
-                    found_in_pd = list(set(list_of_keys) & set(forbidden))
-
-                    # Combine them without duplicates
-                    matched_params = list(set(matched_params + found_in_pd))
+    matched_params = [
+        key for key, files in index.parameter_keys.items()
+        if key in forbidden and any(i in env_files for i in files)
+    ]
 
     if matched_params:
         raise exceptions.BannedParameters("The following parameters should be "
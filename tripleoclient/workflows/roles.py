@@ -12,9 +12,9 @@
 
 import logging
 
-import yaml
-
+from tripleoclient import resource_tree
 from tripleoclient import utils
+from tripleoclient import yaml_utils
 
 LOG = logging.getLogger(__name__)
 
@@ -23,8 +23,7 @@ def get_roles_data(roles_file, tht_root):
     abs_roles_file = utils.get_roles_file_path(
         roles_file, tht_root)
     roles_data = None
-    with open(abs_roles_file, 'r') as fp:
-        roles_data = yaml.safe_load(fp)
+    roles_data = yaml_utils.load_file(abs_roles_file)
     return roles_data
 
 
@@ -33,7 +32,7 @@ def get_roles(clients, roles_file, tht_root,
               template,
               files,
               env_files,
-              detail=False, valid=False):
+              detail=False, valid=False, cache=None):
     roles_data = get_roles_data(roles_file, tht_root)
 
     if detail:
@@ -46,14 +45,12 @@ def get_roles(clients, roles_file, tht_root,
 
     stack_data = utils.build_stack_data(
         clients, stack_name, template,
-        files, env_files)
+        files, env_files, cache=cache, tht_root=tht_root)
 
+    tree = resource_tree.ResourceTree.from_stack_data(stack_data)
     valid_roles = []
     for name in role_names:
-        role_count = stack_data['heat_resource_tree'][
-            'parameters'].get(name + 'Count', {}).get(
-                'default', 0)
-        if role_count > 0:
+        if tree.get_role_count(name) > 0:
             valid_roles.append(name)
 
     return valid_roles
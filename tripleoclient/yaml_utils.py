@@ -0,0 +1,95 @@
+#   Copyright 2020 Red Hat, Inc.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+"""YAML loading and dumping helpers.
+
+The libyaml based loader and dumper are used when PyYAML was built with
+them, the pure Python ones otherwise. Both produce the same documents.
+"""
+
+import copy
+import os
+import threading
+
+import yaml
+
+
+SafeLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+SafeDumper = getattr(yaml, 'CSafeDumper', yaml.SafeDumper)
+
+# Parsed files, by absolute path, with the stat result they were parsed
+# from. The cache lives as long as the process, i.e. the command.
+_cache = dict()
+_cache_lock = threading.Lock()
+
+
+def safe_load(stream):
+    """Parse a YAML document, see yaml.safe_load"""
+
+    return yaml.load(stream, Loader=SafeLoader)
+
+
+def safe_dump(data, stream=None, **kwargs):
+    """Serialize an object as a YAML document, see yaml.safe_dump"""
+
+    return yaml.dump_all([data], stream, Dumper=SafeDumper, **kwargs)
+
+
+def _stat_key(path):
+    try:
+        stat = os.stat(path)
+    except (IOError, OSError):
+        return
+    return (stat.st_mtime_ns, stat.st_size, stat.st_ino, stat.st_dev)
+
+
+def load_file(path):
+    """Parse a YAML file, memoizing the result.
+
+    A file is only parsed again when its modification time, size or inode
+    changed since it was parsed. A copy of the memoized document is
+    returned so callers may modify it.
+
+    :param path: Path of the YAML file.
+    :type path: String
+
+    :returns: The parsed document.
+    """
+
+    path = os.path.abspath(path)
+    key = _stat_key(path)
+    if key is not None:
+        with _cache_lock:
+            cached = _cache.get(path)
+        if cached is not None and cached[0] == key:
+            return copy.deepcopy(cached[1])
+
+    with open(path, 'r') as f:
+        data = safe_load(f)
+
+    # Only memoize the document when the file was not modified while it
+    # was parsed.
+    if key is not None and key == _stat_key(path):
+        with _cache_lock:
+            _cache[path] = (key, data)
+        return copy.deepcopy(data)
+    return data
+
+
+def clear_cache():
+    """Forget all the memoized files."""
+
+    with _cache_lock:
+        _cache.clear()